@@ -15,6 +15,7 @@
 
 import os
 import sys
+import time
 
 import eventlet
 eventlet.monkey_patch()
@@ -24,8 +25,10 @@ from oslo.config import cfg
 
 from neutron.agent.common import config
 from neutron.agent.linux import dhcp
+from neutron.agent.linux import dhcp_server
 from neutron.agent.linux import external_process
 from neutron.agent.linux import interface
+from neutron.agent.linux import ip_lib
 from neutron.agent.linux import ovs_lib  # noqa
 from neutron.agent import rpc as agent_rpc
 from neutron.common import config as common_config
@@ -60,6 +63,11 @@ class DhcpAgent(manager.Manager):
                            "enable_isolated_metadata = True")),
         cfg.IntOpt('num_sync_threads', default=4,
                    help=_('Number of threads to use during sync process.')),
+        cfg.IntOpt('sync_chunk_size', default=100,
+                   help=_('Number of networks fetched per RPC call during '
+                          'the sync process. Networks are configured while '
+                          'the next chunk is fetched. 0 fetches all networks '
+                          'in a single call.')),
         cfg.StrOpt('metadata_proxy_socket',
                    default='$state_path/metadata_proxy',
                    help=_('Location of Metadata Proxy UNIX domain '
@@ -69,6 +77,7 @@ class DhcpAgent(manager.Manager):
     def __init__(self, host=None):
         super(DhcpAgent, self).__init__(host=host)
         self.needs_resync_reasons = []
+        self.sync_progress = None
         self.conf = cfg.CONF
         self.cache = NetworkCache()
         self.root_helper = config.get_root_helper(self.conf)
@@ -151,14 +160,27 @@ class DhcpAgent(manager.Manager):
 
     @utils.synchronized('dhcp-agent')
     def sync_state(self):
-        """Sync the local DHCP state with Neutron."""
+        """Sync the local DHCP state with Neutron.
+
+        Network details are fetched in chunks of sync_chunk_size and handed
+        to a pool of num_sync_threads workers as they arrive, so the pool
+        size also bounds the DHCP port RPCs issued by the workers. Networks
+        the agent does not serve yet are fetched first.
+        """
         LOG.info(_('Synchronizing state'))
         pool = eventlet.GreenPool(cfg.CONF.num_sync_threads)
         known_network_ids = set(self.cache.get_network_ids())
 
         try:
-            active_networks = self.plugin_rpc.get_active_networks_info()
-            active_network_ids = set(network.id for network in active_networks)
+            if self.conf.sync_chunk_size > 0:
+                active_network_ids = set(
+                    self.plugin_rpc.get_active_network_ids())
+                active_networks = self._iter_active_networks(
+                    sorted(active_network_ids,
+                           key=lambda n: (n in known_network_ids, n)))
+            else:
+                active_networks = self.plugin_rpc.get_active_networks_info()
+                active_network_ids = set(n.id for n in active_networks)
             for deleted_id in known_network_ids - active_network_ids:
                 try:
                     self.disable_dhcp_helper(deleted_id)
@@ -167,15 +189,39 @@ class DhcpAgent(manager.Manager):
                     LOG.exception(_('Unable to sync network state on deleted '
                                     'network %s'), deleted_id)
 
+            progress = SyncProgress(len(active_network_ids))
             for network in active_networks:
-                pool.spawn(self.safe_configure_dhcp_for_network, network)
+                pool.spawn(self._sync_network, network, progress)
             pool.waitall()
-            LOG.info(_('Synchronizing state complete'))
+            self.sync_progress = progress
+            LOG.info(_('Synchronizing state complete: %s'),
+                     progress.summary())
 
         except Exception as e:
             self.schedule_resync(e)
             LOG.exception(_('Unable to sync network state.'))
 
+    def _iter_active_networks(self, network_ids):
+        """Yield the details of the given networks one chunk at a time."""
+        chunk_size = self.conf.sync_chunk_size
+        for i in range(0, len(network_ids), chunk_size):
+            chunk = network_ids[i:i + chunk_size]
+            networks = self.plugin_rpc.get_active_networks_info(
+                network_ids=chunk)
+            for network in networks:
+                yield network
+            if len(networks) > len(chunk):
+                # An older server ignores network_ids and returns every
+                # active network at once.
+                return
+
+    def _sync_network(self, network, progress):
+        start = time.time()
+        try:
+            self.safe_configure_dhcp_for_network(network)
+        finally:
+            progress.network_done(time.time() - start)
+
     def _periodic_resync_helper(self):
         """Resync the dhcp state at the configured interval."""
         while True:
@@ -254,6 +300,12 @@ class DhcpAgent(manager.Manager):
             return
 
         old_cidrs = set(s.cidr for s in old_network.subnets if s.enable_dhcp)
+        self._reconfigure_dhcp(network, old_cidrs)
+
+    def _reconfigure_dhcp(self, network, old_cidrs):
+        """Reload, restart or disable DHCP after the subnets of a network
+        changed from old_cidrs to those of network.
+        """
         new_cidrs = set(s.cidr for s in network.subnets if s.enable_dhcp)
 
         if new_cidrs and old_cidrs == new_cidrs:
@@ -287,9 +339,19 @@ class DhcpAgent(manager.Manager):
 
     @utils.synchronized('dhcp-agent')
     def subnet_update_end(self, context, payload):
-        """Handle the subnet.update.end notification event."""
-        network_id = payload['subnet']['network_id']
-        self.refresh_dhcp_helper(network_id)
+        """Handle the subnet.update.end notification event.
+
+        The subnet in the payload is applied to the cached network, so the
+        network is only fetched from the plugin when it isn't cached yet.
+        """
+        subnet = dhcp.DictModel(payload['subnet'])
+        network = self.cache.get_network_by_id(subnet.network_id)
+        if not network:
+            return self.enable_dhcp_helper(subnet.network_id)
+
+        old_cidrs = set(s.cidr for s in network.subnets if s.enable_dhcp)
+        self.cache.put_subnet(subnet)
+        self._reconfigure_dhcp(network, old_cidrs)
 
     # Use the update handler for the subnet create event.
     subnet_create_end = subnet_update_end
@@ -300,16 +362,27 @@ class DhcpAgent(manager.Manager):
         subnet_id = payload['subnet_id']
         network = self.cache.get_network_by_subnet_id(subnet_id)
         if network:
-            self.refresh_dhcp_helper(network.id)
+            old_cidrs = set(s.cidr for s in network.subnets if s.enable_dhcp)
+            self.cache.remove_subnet(subnet_id)
+            self._reconfigure_dhcp(network, old_cidrs)
 
     @utils.synchronized('dhcp-agent')
     def port_update_end(self, context, payload):
         """Handle the port.update.end notification event."""
         updated_port = dhcp.DictModel(payload['port'])
         network = self.cache.get_network_by_id(updated_port.network_id)
-        if network:
-            self.cache.put_port(updated_port)
-            self.call_driver('reload_allocations', network)
+        if not network:
+            return
+        if any(not self.cache.get_network_by_subnet_id(ip.subnet_id)
+               for ip in updated_port.fixed_ips):
+            # The port is on a subnet this agent hasn't heard of yet, the
+            # cached network is behind the plugin's
+            LOG.debug(_("Port %(port)s has an address on a subnet that "
+                        "isn't cached, refreshing network %(net)s"),
+                      {'port': updated_port.id, 'net': network.id})
+            return self.refresh_dhcp_helper(network.id)
+        self.cache.put_port(updated_port)
+        self.call_driver('reload_allocations', network)
 
     # Use the update handler for the port create event.
     port_create_end = port_update_end
@@ -396,11 +469,24 @@ class DhcpPluginApi(n_rpc.RpcProxy):
         self.host = cfg.CONF.host
         self.use_namespaces = use_namespaces
 
-    def get_active_networks_info(self):
-        """Make a remote process call to retrieve all network info."""
+    def get_active_network_ids(self):
+        """Make a remote process call to retrieve the active network ids."""
+        return self.call(self.context,
+                         self.make_msg('get_active_networks',
+                                       host=self.host),
+                         topic=self.topic)
+
+    def get_active_networks_info(self, network_ids=None):
+        """Make a remote process call to retrieve all network info.
+
+        If network_ids is given, only those networks are returned.
+        """
+        kwargs = {'host': self.host}
+        if network_ids is not None:
+            kwargs['network_ids'] = network_ids
         networks = self.call(self.context,
                              self.make_msg('get_active_networks_info',
-                                           host=self.host),
+                                           **kwargs),
                              topic=self.topic)
         return [dhcp.NetModel(self.use_namespaces, n) for n in networks]
 
@@ -466,12 +552,49 @@ class DhcpPluginApi(n_rpc.RpcProxy):
                          topic=self.topic)
 
 
+class SyncProgress(object):
+    """Progress and latency of the networks configured by one sync."""
+
+    # Log progress every LOG_INTERVAL networks
+    LOG_INTERVAL = 100
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.start = time.time()
+
+    def network_done(self, latency):
+        self.done += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        if not self.done % self.LOG_INTERVAL:
+            LOG.info(_('Synchronized %(done)d of %(total)d networks in '
+                       '%(elapsed).2f seconds'),
+                     {'done': self.done, 'total': self.total,
+                      'elapsed': time.time() - self.start})
+
+    def summary(self):
+        avg_latency = self.done and self.total_latency / self.done
+        return (_('%(done)d networks in %(elapsed).2f seconds, '
+                  '%(avg).2f seconds average and %(max).2f seconds maximum '
+                  'per network') %
+                {'done': self.done, 'elapsed': time.time() - self.start,
+                 'avg': avg_latency, 'max': self.max_latency})
+
+
 class NetworkCache(object):
-    """Agent cache of the current network state."""
+    """Agent cache of the current network state.
+
+    Networks are fetched from the plugin in full and then kept up to date
+    with the ports and subnets carried by notifications.
+    """
     def __init__(self):
         self.cache = {}
         self.subnet_lookup = {}
         self.port_lookup = {}
+        self.port_index = {}
 
     def get_network_ids(self):
         return self.cache.keys()
@@ -496,6 +619,7 @@ class NetworkCache(object):
 
         for port in network.ports:
             self.port_lookup[port.id] = network.id
+            self.port_index[port.id] = port
 
     def remove(self, network):
         del self.cache[network.id]
@@ -505,17 +629,42 @@ class NetworkCache(object):
 
         for port in network.ports:
             del self.port_lookup[port.id]
+            self.port_index.pop(port.id, None)
+
+    def put_subnet(self, subnet):
+        network = self.get_network_by_id(subnet.network_id)
+        for index in range(len(network.subnets)):
+            if network.subnets[index].id == subnet.id:
+                network.subnets[index] = subnet
+                break
+        else:
+            network.subnets.append(subnet)
+
+        self.subnet_lookup[subnet.id] = network.id
+
+    def remove_subnet(self, subnet_id):
+        network = self.get_network_by_subnet_id(subnet_id)
+        network.subnets = [s for s in network.subnets if s.id != subnet_id]
+        del self.subnet_lookup[subnet_id]
+
+        # The plugin frees the addresses ports had on a deleted subnet
+        for port in network.ports:
+            port.fixed_ips = [ip for ip in port.fixed_ips
+                              if ip.subnet_id != subnet_id]
 
     def put_port(self, port):
         network = self.get_network_by_id(port.network_id)
-        for index in range(len(network.ports)):
-            if network.ports[index].id == port.id:
-                network.ports[index] = port
-                break
+        old_port = self.port_index.get(port.id)
+        if old_port is not None:
+            for index in range(len(network.ports)):
+                if network.ports[index] is old_port:
+                    network.ports[index] = port
+                    break
         else:
             network.ports.append(port)
 
         self.port_lookup[port.id] = network.id
+        self.port_index[port.id] = port
 
     def remove_port(self, port):
         network = self.get_network_by_port_id(port.id)
@@ -524,14 +673,11 @@ class NetworkCache(object):
             if network.ports[index] == port:
                 del network.ports[index]
                 del self.port_lookup[port.id]
+                self.port_index.pop(port.id, None)
                 break
 
     def get_port_by_id(self, port_id):
-        network = self.get_network_by_port_id(port_id)
-        if network:
-            for port in network.ports:
-                if port.id == port_id:
-                    return port
+        return self.port_index.get(port_id)
 
     def get_state(self):
         net_ids = self.get_network_ids()
@@ -572,6 +718,11 @@ class DhcpAgentWithStateReport(DhcpAgent):
         try:
             self.agent_state.get('configurations').update(
                 self.cache.get_state())
+            release_stats = getattr(self.dhcp_driver_cls,
+                                    'lease_release_stats', None)
+            if release_stats is not None:
+                self.agent_state['configurations']['lease_releases'] = (
+                    dict(release_stats))
             ctx = context.get_admin_context_without_session()
             self.state_rpc.report_state(ctx, self.agent_state, self.use_call)
             self.use_call = False
@@ -605,7 +756,9 @@ def register_options():
     config.register_agent_state_opts_helper(cfg.CONF)
     config.register_root_helper(cfg.CONF)
     cfg.CONF.register_opts(dhcp.OPTS)
+    cfg.CONF.register_opts(dhcp_server.OPTS)
     cfg.CONF.register_opts(interface.OPTS)
+    cfg.CONF.register_opts(ip_lib.OPTS)
 
 
 def main():
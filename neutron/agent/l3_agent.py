@@ -13,6 +13,7 @@
 #    under the License.
 #
 
+import hashlib
 import sys
 
 import eventlet
@@ -37,6 +38,7 @@ from neutron import context
 from neutron import manager
 from neutron.openstack.common import excutils
 from neutron.openstack.common import importutils
+from neutron.openstack.common import jsonutils
 from neutron.openstack.common import lockutils
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import loopingcall
@@ -52,6 +54,18 @@ INTERNAL_DEV_PREFIX = 'qr-'
 EXTERNAL_DEV_PREFIX = 'qg-'
 RPC_LOOP_INTERVAL = 1
 FLOATING_IP_CIDR_SUFFIX = '/32'
+# Maximum number of arping processes running at the same time
+GARP_POOL_SIZE = 16
+
+# Parts of a router which are fingerprinted separately, so that an update
+# only reconfigures what actually changed.  Keys not listed here make up
+# the 'other' section.
+ROUTER_SECTIONS = {
+    'gw_port': ('gw_port', 'enable_snat', 'external_gateway_info'),
+    'interfaces': (l3_constants.INTERFACE_KEY,),
+    'floatingips': (l3_constants.FLOATINGIP_KEY,),
+    'routes': ('routes',),
+}
 
 
 class L3PluginApi(n_rpc.RpcProxy):
@@ -118,6 +132,10 @@ class RouterInfo(object):
             #FIXME(danwent): use_ipv6=True,
             namespace=self.ns_name)
         self.routes = []
+        # Fingerprints of the router as it was last processed, and the
+        # sections changed by the update being processed (None means all).
+        self.fingerprints = {}
+        self.changed_sections = None
 
     @property
     def router(self):
@@ -145,6 +163,32 @@ class RouterInfo(object):
                           *args, action=self._snat_action)
         self._snat_action = None
 
+    @staticmethod
+    def _canonical(value):
+        # Status fields are set by the agent itself and don't change the
+        # configuration, and lists of resources come in arbitrary order.
+        if isinstance(value, dict):
+            return dict((k, RouterInfo._canonical(v))
+                        for k, v in value.iteritems() if k != 'status')
+        if isinstance(value, list):
+            items = [RouterInfo._canonical(v) for v in value]
+            return sorted(items, key=lambda v: jsonutils.dumps(v,
+                                                               sort_keys=True))
+        return value
+
+    def compute_fingerprints(self):
+        """Return a digest of each section of the current router dict."""
+        router = self._canonical(self._router or {})
+        sections = dict((name, {}) for name in ROUTER_SECTIONS)
+        sections['other'] = {}
+        owners = dict((key, name) for name, keys in ROUTER_SECTIONS.items()
+                      for key in keys)
+        for key, value in router.iteritems():
+            sections[owners.get(key, 'other')][key] = value
+        return dict((name, hashlib.sha1(jsonutils.dumps(
+                     section, sort_keys=True)).hexdigest())
+                    for name, section in sections.iteritems())
+
 
 class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
     """Manager for L3NatAgent
@@ -218,6 +262,8 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         self.updated_routers = set()
         self.removed_routers = set()
         self.sync_progress = False
+        self.router_stats = {'processed': 0, 'skipped': 0}
+        self._garp_pool = eventlet.GreenPool(GARP_POOL_SIZE)
 
         self._clean_stale_namespaces = self.conf.use_namespaces
 
@@ -419,7 +465,14 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         return [ip_dev.name for ip_dev in ip_devs]
 
     def process_router(self, ri):
-        ri.iptables_manager.defer_apply_on()
+        changes = ri.changed_sections
+
+        def changed(*sections):
+            return changes is None or bool(changes.intersection(sections))
+
+        iptables_changed = changed('interfaces', 'gw_port', 'floatingips')
+        if iptables_changed:
+            ri.iptables_manager.defer_apply_on()
         ex_gw_port = self._get_ex_gw_port(ri)
         internal_ports = ri.router.get(l3_constants.INTERFACE_KEY, [])
         existing_port_ids = set([p['id'] for p in ri.internal_ports])
@@ -440,7 +493,11 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             self.internal_network_removed(ri, p['id'], p['ip_cidr'])
             ri.internal_ports.remove(p)
 
-        existing_devices = self._get_existing_devices(ri)
+        # Listing the devices in the namespace is only needed to clean up
+        # after ports which were removed.
+        existing_devices = []
+        if changed('interfaces', 'gw_port'):
+            existing_devices = self._get_existing_devices(ri)
         current_internal_devs = set([n for n in existing_devices
                                      if n.startswith(INTERNAL_DEV_PREFIX)])
         current_port_devs = set([self.get_internal_device_name(id) for
@@ -464,8 +521,10 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         interface_name = None
         if ex_gw_port_id:
             interface_name = self.get_external_device_name(ex_gw_port_id)
-        if ex_gw_port and ex_gw_port != ri.ex_gw_port:
+        if ex_gw_port:
+            # Compare against the cached port with ip_cidr filled in
             self._set_subnet_info(ex_gw_port)
+        if ex_gw_port and ex_gw_port != ri.ex_gw_port:
             self.external_gateway_added(ri, ex_gw_port,
                                         interface_name, internal_cidrs)
         elif not ex_gw_port and ri.ex_gw_port:
@@ -486,13 +545,15 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         # Process static routes for router
         self.routes_updated(ri)
         # Process SNAT rules for external gateway
-        ri.perform_snat_action(self._handle_router_snat_rules,
-                               internal_cidrs, interface_name)
+        if changed('interfaces', 'gw_port'):
+            ri.perform_snat_action(self._handle_router_snat_rules,
+                                   internal_cidrs, interface_name)
 
         # Process SNAT/DNAT rules for floating IPs
         fip_statuses = {}
+        process_fips = ex_gw_port and changed('floatingips', 'gw_port')
         try:
-            if ex_gw_port:
+            if process_fips:
                 existing_floating_ips = ri.floating_ips
                 self.process_router_floating_ip_nat_rules(ri)
                 ri.iptables_manager.defer_apply_off()
@@ -500,13 +561,17 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                 # configure their addresses on the external gateway port
                 fip_statuses = self.process_router_floating_ip_addresses(
                     ri, ex_gw_port)
+            elif ex_gw_port and iptables_changed:
+                ri.iptables_manager.defer_apply_off()
         except Exception:
             # TODO(salv-orlando): Less broad catching
             # All floating IPs must be put in error state
             for fip in ri.router.get(l3_constants.FLOATINGIP_KEY, []):
                 fip_statuses[fip['id']] = l3_constants.FLOATINGIP_STATUS_ERROR
+            # Make sure the next update of this router retries
+            ri.fingerprints = {}
 
-        if ex_gw_port:
+        if process_fips:
             # Identify floating IPs which were disabled
             ri.floating_ips = set(fip_statuses.keys())
             for fip_id in existing_floating_ips - ri.floating_ips:
@@ -551,65 +616,68 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
 
         Configures iptables rules for the floating ips of the given router
         """
-        # Clear out all iptables rules for floating ips
-        ri.iptables_manager.ipv4['nat'].clear_rules_by_tag('floating_ip')
-
-        # Loop once to ensure that floating ips are configured.
+        rules = []
         for fip in ri.router.get(l3_constants.FLOATINGIP_KEY, []):
-            # Rebuild iptables rules for the floating ip.
-            fixed = fip['fixed_ip_address']
-            fip_ip = fip['floating_ip_address']
-            for chain, rule in self.floating_forward_rules(fip_ip, fixed):
-                ri.iptables_manager.ipv4['nat'].add_rule(chain, rule,
-                                                         tag='floating_ip')
+            rules.extend(self.floating_forward_rules(
+                fip['floating_ip_address'], fip['fixed_ip_address']))
 
+        # Only rules of added or removed floating ips are touched
+        ri.iptables_manager.ipv4['nat'].update_rules_by_tag('floating_ip',
+                                                            rules)
         ri.iptables_manager.apply()
 
     def process_router_floating_ip_addresses(self, ri, ex_gw_port):
         """Configure IP addresses on router's external gateway interface.
 
         Ensures addresses for existing floating IPs and cleans up
-        those that should not longer be configured.
+        those that should not longer be configured.  The device is only
+        listed once, whatever the number of floating IPs.
         """
         fip_statuses = {}
         interface_name = self.get_external_device_name(ex_gw_port['id'])
         device = ip_lib.IPDevice(interface_name, self.root_helper,
                                  namespace=ri.ns_name)
         existing_cidrs = set([addr['cidr'] for addr in device.addr.list()])
-        new_cidrs = set()
-
-        # Loop once to ensure that floating ips are configured.
-        for fip in ri.router.get(l3_constants.FLOATINGIP_KEY, []):
-            fip_ip = fip['floating_ip_address']
-            ip_cidr = str(fip_ip) + FLOATING_IP_CIDR_SUFFIX
-
-            new_cidrs.add(ip_cidr)
-
-            if ip_cidr not in existing_cidrs:
-                net = netaddr.IPNetwork(ip_cidr)
-                try:
-                    device.addr.add(net.version, ip_cidr, str(net.broadcast))
-                except (processutils.UnknownArgumentError,
-                        processutils.ProcessExecutionError):
-                    # any exception occurred here should cause the floating IP
-                    # to be set in error state
-                    fip_statuses[fip['id']] = (
-                        l3_constants.FLOATINGIP_STATUS_ERROR)
-                    LOG.warn(_("Unable to configure IP address for "
-                               "floating IP: %s"), fip['id'])
-                    continue
-                # As GARP is processed in a distinct thread the call below
-                # won't raise an exception to be handled.
-                self._send_gratuitous_arp_packet(
-                    ri, interface_name, fip_ip)
-            fip_statuses[fip['id']] = (
-                l3_constants.FLOATINGIP_STATUS_ACTIVE)
+        fips = ri.router.get(l3_constants.FLOATINGIP_KEY, [])
+        new_cidrs = [str(fip['floating_ip_address']) + FLOATING_IP_CIDR_SUFFIX
+                     for fip in fips]
+
+        added_cidrs = [cidr for cidr in new_cidrs
+                       if cidr not in existing_cidrs]
+        failed_cidrs = set()
+        if added_cidrs:
+            try:
+                device.addr.add_batch(added_cidrs)
+            except (RuntimeError, processutils.UnknownArgumentError,
+                    processutils.ProcessExecutionError):
+                # Find out which addresses did not make it; any of them
+                # should cause the floating IP to be set in error state
+                configured = set([addr['cidr']
+                                  for addr in device.addr.list()])
+                failed_cidrs = set(added_cidrs) - configured
+
+        for fip, ip_cidr in zip(fips, new_cidrs):
+            if ip_cidr in failed_cidrs:
+                fip_statuses[fip['id']] = (
+                    l3_constants.FLOATINGIP_STATUS_ERROR)
+                LOG.warn(_("Unable to configure IP address for "
+                           "floating IP: %s"), fip['id'])
+            else:
+                fip_statuses[fip['id']] = (
+                    l3_constants.FLOATINGIP_STATUS_ACTIVE)
+
+        # As GARP is processed in distinct threads the call below
+        # won't raise an exception to be handled.
+        self._send_gratuitous_arp_packets(
+            ri, interface_name,
+            [cidr.split('/')[0] for cidr in added_cidrs
+             if cidr not in failed_cidrs])
 
         # Clean up addresses that no longer belong on the gateway interface.
-        for ip_cidr in existing_cidrs - new_cidrs:
-            if ip_cidr.endswith(FLOATING_IP_CIDR_SUFFIX):
-                net = netaddr.IPNetwork(ip_cidr)
-                device.addr.delete(net.version, ip_cidr)
+        stale_cidrs = [cidr for cidr in existing_cidrs - set(new_cidrs)
+                       if cidr.endswith(FLOATING_IP_CIDR_SUFFIX)]
+        if stale_cidrs:
+            device.addr.delete_batch(stale_cidrs)
         return fip_statuses
 
     def _get_ex_gw_port(self, ri):
@@ -631,6 +699,23 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         if self.conf.send_arp_for_ha > 0:
             eventlet.spawn_n(self._arping, ri, interface_name, ip_address)
 
+    def _send_gratuitous_arp_packets(self, ri, interface_name, ip_addresses):
+        """Announce several addresses without blocking the caller.
+
+        The arping processes are spread over a pool shared by all
+        routers, so a router with many new floating IPs doesn't fork
+        hundreds of them at once.
+        """
+        if self.conf.send_arp_for_ha <= 0 or not ip_addresses:
+            return
+
+        def _schedule():
+            for ip_address in ip_addresses:
+                self._garp_pool.spawn_n(self._arping, ri, interface_name,
+                                        ip_address)
+
+        eventlet.spawn_n(_schedule)
+
     def get_internal_device_name(self, port_id):
         return (INTERNAL_DEV_PREFIX + port_id)[:self.driver.DEV_NAME_LEN]
 
@@ -794,11 +879,38 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                 self._router_added(r['id'], r)
             ri = self.router_info[r['id']]
             ri.router = r
-            pool.spawn_n(self.process_router, ri)
+            if all_routers:
+                # A full sync repairs what changed on the host behind the
+                # agent's back, e.g. deleted devices or flushed iptables,
+                # so unchanged routers are processed too
+                ri.fingerprints = {}
+            pool.spawn_n(self._process_router_if_changed, ri)
         # identify and remove routers that no longer exist
         for router_id in prev_router_ids - cur_router_ids:
             pool.spawn_n(self._router_removed, router_id)
         pool.waitall()
+        LOG.debug(_("Routers processed: %(processed)d, skipped as "
+                    "unchanged: %(skipped)d"), self.router_stats)
+
+    def _process_router_if_changed(self, ri):
+        fingerprints = ri.compute_fingerprints()
+        if ri.fingerprints:
+            changes = set(name for name, digest in fingerprints.iteritems()
+                          if ri.fingerprints.get(name) != digest)
+            if not changes:
+                LOG.debug(_("Router %s is unchanged, skipping"), ri.router_id)
+                self.router_stats['skipped'] += 1
+                return
+            ri.changed_sections = changes
+        ri.fingerprints = fingerprints
+        try:
+            self.process_router(ri)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                ri.fingerprints = {}
+        finally:
+            ri.changed_sections = None
+        self.router_stats['processed'] += 1
 
     @lockutils.synchronized('l3-agent', 'neutron-')
     def _rpc_loop(self):
@@ -980,6 +1092,7 @@ def main(manager='neutron.agent.l3_agent.L3NATAgentWithStateReport'):
     config.register_root_helper(conf)
     conf.register_opts(interface.OPTS)
     conf.register_opts(external_process.OPTS)
+    conf.register_opts(ip_lib.OPTS)
     common_config.init(sys.argv[1:])
     config.setup_logging(conf)
     server = neutron_service.Service.create(
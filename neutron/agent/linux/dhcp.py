@@ -163,6 +163,42 @@ class DhcpBase(object):
     def reload_allocations(self):
         """Force the DHCP server to reload the assignment database."""
 
+    def _enable_dhcp(self):
+        """check if there is a subnet within the network with dhcp enabled."""
+        for subnet in self.network.subnets:
+            if subnet.enable_dhcp:
+                return True
+        return False
+
+    def _enable_metadata(self, subnet):
+        '''Determine if the metadata route will be pushed to hosts on subnet.
+
+        If subnet has a Neutron router attached, we want the hosts to get
+        metadata from the router's proxy via their default route instead.
+        '''
+        if self.conf.enable_isolated_metadata and subnet.ip_version == 4:
+            if subnet.gateway_ip is None:
+                return True
+            else:
+                for port in self.network.ports:
+                    if port.device_owner == constants.DEVICE_OWNER_ROUTER_INTF:
+                        for alloc in port.fixed_ips:
+                            if alloc.subnet_id == subnet.id:
+                                return False
+                return True
+        else:
+            return False
+
+    def _delete_namespace(self):
+        if self.conf.dhcp_delete_namespaces and self.network.namespace:
+            ns_ip = ip_lib.IPWrapper(self.root_helper,
+                                     self.network.namespace)
+            try:
+                ns_ip.netns.delete(self.network.namespace)
+            except RuntimeError:
+                msg = _('Failed trying to delete namespace: %s')
+                LOG.exception(msg, self.network.namespace)
+
     @classmethod
     def existing_dhcp_networks(cls, conf, root_helper):
         """Return a list of existing networks ids that we have configs for."""
@@ -179,13 +215,6 @@ class DhcpBase(object):
 class DhcpLocalProcess(DhcpBase):
     PORTS = []
 
-    def _enable_dhcp(self):
-        """check if there is a subnet within the network with dhcp enabled."""
-        for subnet in self.network.subnets:
-            if subnet.enable_dhcp:
-                return True
-        return False
-
     def enable(self):
         """Enables DHCP for this network by spawning a local process."""
         interface_name = self.device_manager.setup(self.network)
@@ -216,14 +245,7 @@ class DhcpLocalProcess(DhcpBase):
         self._remove_config_files()
 
         if not retain_port:
-            if self.conf.dhcp_delete_namespaces and self.network.namespace:
-                ns_ip = ip_lib.IPWrapper(self.root_helper,
-                                         self.network.namespace)
-                try:
-                    ns_ip.netns.delete(self.network.namespace)
-                except RuntimeError:
-                    msg = _('Failed trying to delete namespace: %s')
-                    LOG.exception(msg, self.network.namespace)
+            self._delete_namespace()
 
     def _remove_config_files(self):
         confs_dir = os.path.abspath(os.path.normpath(self.conf.dhcp_confs))
@@ -303,6 +325,13 @@ class Dnsmasq(DhcpLocalProcess):
     NEUTRON_NETWORK_ID_KEY = 'NEUTRON_NETWORK_ID'
     NEUTRON_RELAY_SOCKET_PATH_KEY = 'NEUTRON_RELAY_SOCKET_PATH'
     MINIMUM_VERSION = 2.59
+    # Leases released per run of neutron-dhcp-release
+    RELEASES_PER_CALL = 500
+
+    # The (ip_address, mac_address) pairs of the hosts file last written
+    # for each network, driver instances don't outlive an agent call
+    _host_leases = {}
+    lease_release_stats = {'released': 0, 'helper_calls': 0}
 
     @classmethod
     def check_version(cls):
@@ -334,6 +363,10 @@ class Dnsmasq(DhcpLocalProcess):
             if uuidutils.is_uuid_like(c)
         ]
 
+    def _remove_config_files(self):
+        super(Dnsmasq, self)._remove_config_files()
+        self._host_leases.pop(self.network.id, None)
+
     def spawn_process(self):
         """Spawns a Dnsmasq process for the network."""
         env = {
@@ -408,12 +441,57 @@ class Dnsmasq(DhcpLocalProcess):
                                       self.network.namespace)
         ip_wrapper.netns.execute(cmd, addl_env=env)
 
-    def _release_lease(self, mac_address, ip):
-        """Release a DHCP lease."""
-        cmd = ['dhcp_release', self.interface_name, ip, mac_address]
+    def _release_leases(self, leases):
+        """Release DHCP leases, many per run of the release helper.
+
+        :param leases: (ip_address, mac_address) pairs
+        """
+        servers = [(netaddr.IPNetwork(cidr), ip)
+                   for cidr, ip in self._dhcp_server_ips().items()]
+        releases = []
+        for ip, mac in sorted(leases):
+            if not netaddr.valid_ipv4(ip):
+                # A DHCPv6 lease can't be released on behalf of the client,
+                # it expires instead
+                continue
+            for cidr, server_ip in servers:
+                if netaddr.IPAddress(ip) in cidr:
+                    releases.append('%s,%s,%s' % (ip, mac, server_ip))
+                    break
+            else:
+                LOG.debug(_('No DHCP address on the subnet of %(ip)s, not '
+                            'releasing its lease on network %(net_id)s'),
+                          {'ip': ip, 'net_id': self.network.id})
+
         ip_wrapper = ip_lib.IPWrapper(self.root_helper,
                                       self.network.namespace)
-        ip_wrapper.netns.execute(cmd)
+        for i in range(0, len(releases), self.RELEASES_PER_CALL):
+            chunk = releases[i:i + self.RELEASES_PER_CALL]
+            cmd = ['neutron-dhcp-release', self.interface_name] + chunk
+            ip_wrapper.netns.execute(cmd)
+            self.lease_release_stats['released'] += len(chunk)
+            self.lease_release_stats['helper_calls'] += 1
+        if releases:
+            LOG.debug(_('Released %(count)d leases on network %(net_id)s'),
+                      {'count': len(releases), 'net_id': self.network.id})
+
+    def _dhcp_server_ips(self):
+        """Return the addresses of this DHCP server by subnet cidr."""
+        device_id = self.device_manager.get_device_id(self.network)
+        cidrs = dict((subnet.id, subnet.cidr)
+                     for subnet in self.network.subnets)
+        retval = {}
+        for port in self.network.ports:
+            if getattr(port, 'device_id', None) == device_id:
+                for alloc in port.fixed_ips:
+                    if alloc.subnet_id in cidrs:
+                        retval[cidrs[alloc.subnet_id]] = alloc.ip_address
+                return retval
+        # The port isn't known yet, read the addresses from the device
+        for subnet_id, ip in self._make_subnet_interface_ip_map().items():
+            if subnet_id in cidrs:
+                retval[cidrs[subnet_id]] = ip
+        return retval
 
     def reload_allocations(self):
         """Rebuild the dnsmasq config and signal the dnsmasq to reload."""
@@ -483,10 +561,12 @@ class Dnsmasq(DhcpLocalProcess):
         """
         buf = six.StringIO()
         filename = self.get_conf_file_name('host')
+        leases = set()
 
         LOG.debug(_('Building host file: %s'), filename)
         for (port, alloc, hostname, name) in self._iter_hosts():
             set_tag = ''
+            leases.add((alloc.ip_address, port.mac_address))
             # (dzyu) Check if it is legal ipv6 address, if so, need wrap
             # it with '[]' to let dnsmasq to distinguish MAC address from
             # IPv6 address.
@@ -510,6 +590,7 @@ class Dnsmasq(DhcpLocalProcess):
                           (port.mac_address, name, ip_address))
 
         utils.replace_file(filename, buf.getvalue())
+        self._host_leases[self.network.id] = leases
         LOG.debug(_('Done building host file %s'), filename)
         return filename
 
@@ -523,16 +604,20 @@ class Dnsmasq(DhcpLocalProcess):
         return leases
 
     def _release_unused_leases(self):
-        filename = self.get_conf_file_name('host')
-        old_leases = self._read_hosts_file_leases(filename)
+        old_leases = self._host_leases.get(self.network.id)
+        if old_leases is None:
+            # Nothing written since the agent started
+            filename = self.get_conf_file_name('host')
+            old_leases = self._read_hosts_file_leases(filename)
 
         new_leases = set()
         for port in self.network.ports:
             for alloc in port.fixed_ips:
                 new_leases.add((alloc.ip_address, port.mac_address))
 
-        for ip, mac in old_leases - new_leases:
-            self._release_lease(mac, ip)
+        stale_leases = old_leases - new_leases
+        if stale_leases:
+            self._release_leases(stale_leases)
 
     def _output_addn_hosts_file(self):
         """Writes a dnsmasq compatible additional hosts file.
@@ -673,25 +758,6 @@ class Dnsmasq(DhcpLocalProcess):
 
         return ','.join((set_tag + tag, '%s' % option) + args)
 
-    def _enable_metadata(self, subnet):
-        '''Determine if the metadata route will be pushed to hosts on subnet.
-
-        If subnet has a Neutron router attached, we want the hosts to get
-        metadata from the router's proxy via their default route instead.
-        '''
-        if self.conf.enable_isolated_metadata and subnet.ip_version == 4:
-            if subnet.gateway_ip is None:
-                return True
-            else:
-                for port in self.network.ports:
-                    if port.device_owner == constants.DEVICE_OWNER_ROUTER_INTF:
-                        for alloc in port.fixed_ips:
-                            if alloc.subnet_id == subnet.id:
-                                return False
-                return True
-        else:
-            return False
-
     @classmethod
     def lease_update(cls):
         network_id = os.environ.get(cls.NEUTRON_NETWORK_ID_KEY)
@@ -0,0 +1,69 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Release many DHCP leases of a dnsmasq in one run.
+
+Usage: neutron-dhcp-release INTERFACE IP,MAC,SERVER_IP [IP,MAC,SERVER_IP ...]
+
+Like dhcp_release from dnsmasq, which takes a single lease, a DHCPRELEASE
+is sent to SERVER_IP on behalf of the client for every lease, from a socket
+bound to INTERFACE. Run it in the namespace of the dnsmasq.
+"""
+
+import random
+import socket
+import sys
+
+from neutron.agent.linux import dhcp
+from neutron.agent.linux import dhcp_server
+
+USAGE = ('Usage: %s INTERFACE IP,MAC,SERVER_IP [IP,MAC,SERVER_IP ...]\n')
+
+
+def release_leases(interface, leases):
+    """Send a DHCPRELEASE for each (ip, mac, server_ip) lease.
+
+    Returns the leases that could not be released.
+    """
+    failed = []
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, dhcp_server.SO_BINDTODEVICE,
+                        interface + '\0')
+        for ip_address, mac_address, server_ip in leases:
+            packet = dhcp_server.build_release(ip_address, mac_address,
+                                               server_ip,
+                                               random.getrandbits(32))
+            try:
+                sock.sendto(packet, (server_ip, dhcp.DHCPV4_PORT))
+            except socket.error:
+                failed.append((ip_address, mac_address, server_ip))
+    finally:
+        sock.close()
+    return failed
+
+
+def main():
+    args = sys.argv[1:]
+    leases = [arg.split(',') for arg in args[1:]]
+    if not leases or any(len(lease) != 3 for lease in leases):
+        sys.stderr.write(USAGE % sys.argv[0])
+        sys.exit(2)
+
+    failed = release_leases(args[0], leases)
+    for lease in failed:
+        sys.stderr.write('Unable to release %s\n' % ','.join(lease))
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,723 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""DHCP driver serving every network of an agent from a single process.
+
+The Dnsmasq driver runs one dnsmasq per network and rewrites its host and
+option files on every change. SharedDhcpServer instead hands the host
+table of each network to one neutron-dhcp-server process over a UNIX
+domain socket. The server keeps the tables in memory and answers DHCPv4
+requests from one socket per network, each opened inside the network's
+namespace and bound to its DHCP interface, all served by greenthreads.
+
+Only static DHCPv4 is served: ports get the address the plugin allocated
+and nothing else. The server does not forward or resolve DNS, so subnets
+without dns_nameservers hand out dhcp_server_dns_servers instead of the
+DHCP port address, and extra_dhcp_opts are not supported.
+"""
+
+import ctypes
+import os
+import socket
+import stat
+import struct
+import sys
+import time
+
+import eventlet
+import netaddr
+from oslo.config import cfg
+
+from neutron.agent.common import config
+from neutron.agent.linux import daemon
+from neutron.agent.linux import dhcp
+from neutron.agent.linux import external_process
+from neutron.agent.linux import ip_lib
+from neutron.common import config as common_config
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+OPTS = [
+    cfg.StrOpt('dhcp_server_socket',
+               default='$state_path/dhcp/server_sock',
+               help=_('Location of the UNIX domain socket the shared DHCP '
+                      'server is controlled through')),
+    cfg.ListOpt('dhcp_server_dns_servers',
+                default=[],
+                help=_('DNS servers handed out by the shared DHCP server '
+                       'on subnets without dns_nameservers')),
+]
+
+SERVER_NAME = 'neutron-dhcp-server'
+
+BOOTREQUEST = 1
+BOOTREPLY = 2
+DHCP_CLIENT_PORT = 68
+MAGIC_COOKIE = '\x63\x82\x53\x63'
+HEADER = struct.Struct('!BBBBIHH4s4s4s4s16s64s128s4s')
+
+DHCPDISCOVER = 1
+DHCPOFFER = 2
+DHCPREQUEST = 3
+DHCPDECLINE = 4
+DHCPACK = 5
+DHCPNAK = 6
+DHCPRELEASE = 7
+DHCPINFORM = 8
+
+OPT_PAD = 0
+OPT_SUBNET_MASK = 1
+OPT_ROUTER = 3
+OPT_DNS_SERVERS = 6
+OPT_HOSTNAME = 12
+OPT_DOMAIN_NAME = 15
+OPT_BROADCAST = 28
+OPT_REQUESTED_IP = 50
+OPT_LEASE_TIME = 51
+OPT_MESSAGE_TYPE = 53
+OPT_SERVER_ID = 54
+OPT_RENEWAL_TIME = 58
+OPT_REBINDING_TIME = 59
+OPT_CLASSLESS_ROUTES = 121
+OPT_END = 255
+
+INFINITE_LEASE = 0xffffffff
+ZERO_IP = '\x00' * 4
+
+CLONE_NEWNET = 0x40000000
+SO_BINDTODEVICE = 25
+NETNS_DIR = '/var/run/netns'
+RECV_BUFSIZE = 4096
+
+# Seconds to wait for a freshly spawned server to accept connections
+SERVER_START_TIMEOUT = 10
+
+
+class DhcpPacket(object):
+    """The fields of a DHCPv4 request that a reply is built from."""
+
+    def __init__(self, htype, hlen, xid, flags, ciaddr, giaddr, chaddr,
+                 options):
+        self.htype = htype
+        self.hlen = hlen
+        self.xid = xid
+        self.flags = flags
+        self.ciaddr = ciaddr
+        self.giaddr = giaddr
+        self.chaddr = chaddr
+        self.options = options
+
+    @property
+    def mac_address(self):
+        return ':'.join('%02x' % ord(c) for c in self.chaddr[:self.hlen])
+
+    @property
+    def message_type(self):
+        value = self.options.get(OPT_MESSAGE_TYPE)
+        return value and ord(value[0])
+
+
+def parse_packet(data):
+    """Parse a DHCPv4 request, raise ValueError if it isn't one."""
+    if len(data) < HEADER.size:
+        raise ValueError(_('Packet too short'))
+    (op, htype, hlen, hops, xid, secs, flags, ciaddr, yiaddr, siaddr,
+     giaddr, chaddr, sname, filename, cookie) = HEADER.unpack_from(data)
+    if op != BOOTREQUEST or cookie != MAGIC_COOKIE or hlen > 16:
+        raise ValueError(_('Not a DHCP request'))
+
+    options = {}
+    i = HEADER.size
+    while i < len(data):
+        code = ord(data[i])
+        if code == OPT_END:
+            break
+        if code == OPT_PAD:
+            i += 1
+            continue
+        if i + 1 >= len(data):
+            raise ValueError(_('Truncated option %d') % code)
+        length = ord(data[i + 1])
+        options[code] = data[i + 2:i + 2 + length]
+        i += 2 + length
+    return DhcpPacket(htype, hlen, xid, flags, ciaddr, giaddr, chaddr,
+                      options)
+
+
+def _option(code, value):
+    return chr(code) + chr(len(value)) + value
+
+
+def _pack_ip(ip_address):
+    return socket.inet_aton(ip_address)
+
+
+def _pack_routes(routes):
+    """Encode (destination cidr, nexthop) pairs as in RFC 3442."""
+    value = ''
+    for destination, nexthop in routes:
+        net = netaddr.IPNetwork(destination)
+        significant = (net.prefixlen + 7) // 8
+        value += (chr(net.prefixlen) + net.network.packed[:significant] +
+                  _pack_ip(nexthop))
+    return value
+
+
+def build_reply(request, message_type, yiaddr, options):
+    """Build the reply to a request from already encoded options."""
+    header = HEADER.pack(BOOTREPLY, request.htype, request.hlen, 0,
+                         request.xid, 0, request.flags, request.ciaddr,
+                         yiaddr, ZERO_IP, request.giaddr, request.chaddr,
+                         '\x00' * 64, '\x00' * 128, MAGIC_COOKIE)
+    return (header + _option(OPT_MESSAGE_TYPE, chr(message_type)) +
+            options + chr(OPT_END))
+
+
+def build_release(ip_address, mac_address, server_ip, xid=0):
+    """Build the DHCPRELEASE a client sends to give up its lease."""
+    chaddr = netaddr.EUI(mac_address).packed
+    header = HEADER.pack(BOOTREQUEST, 1, len(chaddr), 0, xid, 0, 0,
+                         _pack_ip(ip_address), ZERO_IP, ZERO_IP, ZERO_IP,
+                         chaddr.ljust(16, '\x00'), '\x00' * 64, '\x00' * 128,
+                         MAGIC_COOKIE)
+    return (header + _option(OPT_MESSAGE_TYPE, chr(DHCPRELEASE)) +
+            _option(OPT_SERVER_ID, _pack_ip(server_ip)) + chr(OPT_END))
+
+
+def reply_address(request, message_type):
+    """Where a reply goes, following RFC 2131 section 4.1."""
+    if request.giaddr != ZERO_IP:
+        return (socket.inet_ntoa(request.giaddr), dhcp.DHCPV4_PORT)
+    if request.ciaddr != ZERO_IP and message_type != DHCPNAK:
+        return (socket.inet_ntoa(request.ciaddr), DHCP_CLIENT_PORT)
+    return ('255.255.255.255', DHCP_CLIENT_PORT)
+
+
+class NetworkTable(object):
+    """In-memory DHCP state of a network.
+
+    Built from the dict the driver sends, see SharedDhcpServer._table().
+    The options of each subnet are encoded once here, so answering a
+    request is a dict lookup and a string concatenation.
+    """
+
+    __slots__ = ['id', 'namespace', 'interface', 'server_ids', 'options',
+                 'hosts']
+
+    def __init__(self, data):
+        self.id = data['id']
+        self.namespace = data.get('namespace')
+        self.interface = data['interface']
+        self.server_ids = {}
+        self.options = {}
+        lease_time = data['lease_time']
+        for subnet in data['subnets']:
+            if not subnet.get('server_ip'):
+                continue
+            self.server_ids[subnet['id']] = _pack_ip(subnet['server_ip'])
+            self.options[subnet['id']] = self._subnet_options(subnet,
+                                                              lease_time)
+        self.hosts = {}
+        for mac, ip_address, subnet_id, hostname in data['hosts']:
+            if subnet_id not in self.options:
+                continue
+            options = _option(OPT_HOSTNAME, str(hostname))
+            if data.get('domain'):
+                options += _option(OPT_DOMAIN_NAME, str(data['domain']))
+            self.hosts[mac.lower()] = (_pack_ip(ip_address), subnet_id,
+                                       options)
+
+    @staticmethod
+    def _subnet_options(subnet, lease_time):
+        net = netaddr.IPNetwork(subnet['cidr'])
+        options = (_option(OPT_SERVER_ID, _pack_ip(subnet['server_ip'])) +
+                   _option(OPT_SUBNET_MASK, net.netmask.packed) +
+                   _option(OPT_BROADCAST, net.broadcast.packed))
+        if lease_time == -1:
+            options += _option(OPT_LEASE_TIME,
+                               struct.pack('!I', INFINITE_LEASE))
+        else:
+            options += (_option(OPT_LEASE_TIME,
+                                struct.pack('!I', lease_time)) +
+                        _option(OPT_RENEWAL_TIME,
+                                struct.pack('!I', lease_time // 2)) +
+                        _option(OPT_REBINDING_TIME,
+                                struct.pack('!I', lease_time * 7 // 8)))
+        if subnet.get('gateway_ip'):
+            options += _option(OPT_ROUTER, _pack_ip(subnet['gateway_ip']))
+        if subnet.get('dns_servers'):
+            options += _option(OPT_DNS_SERVERS,
+                               ''.join(_pack_ip(ip)
+                                       for ip in subnet['dns_servers']))
+        if subnet.get('routes'):
+            options += _option(OPT_CLASSLESS_ROUTES,
+                               _pack_routes(subnet['routes']))
+        return options
+
+    def server_ip(self, subnet_id):
+        server_id = self.server_ids.get(subnet_id)
+        return server_id and socket.inet_ntoa(server_id)
+
+    def handle(self, request):
+        """Return the (reply, address) to send for a request, if any."""
+        host = self.hosts.get(request.mac_address)
+        if host is None:
+            # Like dnsmasq in static mode, unknown clients are ignored
+            return
+        ip_address, subnet_id, host_options = host
+        message_type = request.message_type
+        if message_type == DHCPDISCOVER:
+            reply_type = DHCPOFFER
+        elif message_type == DHCPREQUEST:
+            server_id = request.options.get(OPT_SERVER_ID)
+            if server_id and server_id != self.server_ids[subnet_id]:
+                # The client picked the offer of another server
+                return
+            requested = (request.options.get(OPT_REQUESTED_IP) or
+                         request.ciaddr)
+            if requested != ip_address:
+                reply = build_reply(
+                    request, DHCPNAK, ZERO_IP,
+                    _option(OPT_SERVER_ID, self.server_ids[subnet_id]))
+                return reply, reply_address(request, DHCPNAK)
+            reply_type = DHCPACK
+        elif message_type == DHCPINFORM:
+            reply = build_reply(request, DHCPACK, ZERO_IP,
+                                self.options[subnet_id] + host_options)
+            return reply, reply_address(request, DHCPACK)
+        else:
+            # Addresses are allocated by the plugin, a release or decline
+            # changes nothing here
+            return
+        reply = build_reply(request, reply_type, ip_address,
+                            self.options[subnet_id] + host_options)
+        return reply, reply_address(request, reply_type)
+
+
+_libc = None
+
+
+def _setns(fd):
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL('libc.so.6', use_errno=True)
+    if _libc.setns(fd, CLONE_NEWNET) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+def open_socket(interface, namespace=None):
+    """Open a DHCP server socket bound to interface in namespace.
+
+    The calling thread enters the namespace only while the socket is
+    created, a socket stays in the namespace it was created in.
+    """
+    own_ns = target_ns = None
+    try:
+        if namespace:
+            own_ns = open('/proc/self/ns/net')
+            target_ns = open(os.path.join(NETNS_DIR, namespace))
+            _setns(target_ns.fileno())
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE,
+                        str(interface) + '\0')
+        sock.bind(('', dhcp.DHCPV4_PORT))
+        return sock
+    finally:
+        if own_ns:
+            _setns(own_ns.fileno())
+            own_ns.close()
+        if target_ns:
+            target_ns.close()
+
+
+class DhcpServer(object):
+    """Serves the DHCP requests of many networks from one process."""
+
+    def __init__(self, socket_opener=open_socket):
+        self.networks = {}
+        self._sockets = {}
+        self._threads = {}
+        self._open_socket = socket_opener
+        self._pool = eventlet.GreenPool()
+
+    def set_network(self, network):
+        """Install or replace the table of a network.
+
+        An interface, namespace or server address the driver left out is
+        kept from the current table of the network.
+        """
+        old = self.networks.get(network['id'])
+        if old:
+            network.setdefault('interface', old.interface)
+            network.setdefault('namespace', old.namespace)
+            for subnet in network['subnets']:
+                if not subnet.get('server_ip'):
+                    subnet['server_ip'] = old.server_ip(subnet['id'])
+        table = NetworkTable(network)
+        if (not old or old.interface != table.interface or
+                old.namespace != table.namespace):
+            self._close(table.id)
+            self._listen(table)
+        self.networks[table.id] = table
+        return {'interface': table.interface}
+
+    def remove_network(self, network_id):
+        table = self.networks.pop(network_id, None)
+        self._close(network_id)
+        return table and {'interface': table.interface}
+
+    def get_network(self, network_id):
+        table = self.networks.get(network_id)
+        return table and {'interface': table.interface,
+                          'namespace': table.namespace}
+
+    def list_networks(self):
+        return self.networks.keys()
+
+    def _listen(self, table):
+        sock = self._open_socket(table.interface, table.namespace)
+        self._sockets[table.id] = sock
+        self._threads[table.id] = self._pool.spawn(self._serve, table.id,
+                                                   sock)
+
+    def _close(self, network_id):
+        thread = self._threads.pop(network_id, None)
+        if thread:
+            thread.kill()
+        sock = self._sockets.pop(network_id, None)
+        if sock:
+            sock.close()
+
+    def _serve(self, network_id, sock):
+        while True:
+            data, address = sock.recvfrom(RECV_BUFSIZE)
+            try:
+                request = parse_packet(data)
+            except ValueError as e:
+                LOG.debug(_('Ignoring packet from %(address)s on network '
+                            '%(net_id)s: %(reason)s'),
+                          {'address': address, 'net_id': network_id,
+                           'reason': e})
+                continue
+            table = self.networks.get(network_id)
+            reply = table and table.handle(request)
+            if reply:
+                try:
+                    sock.sendto(*reply)
+                except socket.error:
+                    LOG.exception(_('Unable to send DHCP reply on network '
+                                    '%s'), network_id)
+
+    def handle_command(self, command):
+        """Run a control command, see SharedDhcpServer._call()."""
+        name = command.get('command')
+        if name == 'set_network':
+            return self.set_network(command['network'])
+        elif name == 'remove_network':
+            return self.remove_network(command['network_id'])
+        elif name == 'get_network':
+            return self.get_network(command['network_id'])
+        elif name == 'list_networks':
+            return self.list_networks()
+        raise ValueError(_('Unknown command %s') % name)
+
+    def _handle_connection(self, conn):
+        try:
+            request = conn.makefile('r').readline()
+            try:
+                response = {'result': self.handle_command(
+                    jsonutils.loads(request))}
+            except Exception as e:
+                LOG.exception(_('DHCP server command failed'))
+                response = {'error': '%s' % e}
+            conn.sendall(jsonutils.dumps(response) + '\n')
+        finally:
+            conn.close()
+
+    def serve_control(self, path, uid=None):
+        if os.path.lexists(path):
+            # Only ever remove the socket a previous server left behind
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise RuntimeError(_('%s exists and is not a socket') % path)
+            os.unlink(path)
+        elif not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), 0o755)
+        listener = eventlet.listen(path, family=socket.AF_UNIX)
+        os.chmod(path, 0o600)
+        if uid is not None:
+            os.lchown(path, uid, -1)
+        while True:
+            conn, _addr = listener.accept()
+            self._pool.spawn_n(self._handle_connection, conn)
+
+
+class DhcpServerDaemon(daemon.Daemon):
+    def __init__(self, pidfile, socket_path, socket_uid=None):
+        super(DhcpServerDaemon, self).__init__(pidfile, uuid=SERVER_NAME)
+        self.socket_path = socket_path
+        self.socket_uid = socket_uid
+
+    def run(self):
+        DhcpServer().serve_control(self.socket_path, self.socket_uid)
+
+
+class SharedDhcpServer(dhcp.DhcpBase):
+    """DHCP driver handing networks to the shared neutron-dhcp-server."""
+
+    PORTS = {dhcp.IPV4: [(dhcp.UDP, dhcp.DHCPV4_PORT)],
+             dhcp.IPV6: []}
+
+    @classmethod
+    def check_version(cls):
+        return 0
+
+    @classmethod
+    def existing_dhcp_networks(cls, conf, root_helper):
+        try:
+            return _call(conf, 'list_networks')
+        except (socket.error, RuntimeError):
+            return []
+
+    @property
+    def active(self):
+        try:
+            return bool(self._call('get_network',
+                                   network_id=self.network.id))
+        except (socket.error, RuntimeError):
+            return False
+
+    def enable(self):
+        """Enables DHCP for this network in the shared server."""
+        interface_name = self.device_manager.setup(self.network)
+        if not self._enable_dhcp():
+            return
+        self._ensure_server()
+        self._call('set_network', network=self._table(interface_name))
+
+    def restart(self):
+        # set_network replaces the table of a network in one step
+        self.enable()
+
+    def disable(self, retain_port=False):
+        """Remove this network from the shared server."""
+        try:
+            removed = self._call('remove_network',
+                                 network_id=self.network.id)
+        except (socket.error, RuntimeError):
+            removed = None
+        if removed:
+            if not retain_port:
+                self.device_manager.destroy(self.network,
+                                            removed['interface'])
+        else:
+            LOG.debug(_('No DHCP started for %s'), self.network.id)
+
+        if not retain_port:
+            self._delete_namespace()
+
+    def reload_allocations(self):
+        """Replace the host table of the network in the shared server."""
+        if not self._enable_dhcp():
+            self.disable()
+            LOG.debug(_('Removing network %s from the DHCP server since all '
+                        'subnets have turned off DHCP'), self.network.id)
+            return
+
+        result = self._call('set_network', network=self._table())
+        LOG.debug(_('Reloading allocations for network: %s'),
+                  self.network.id)
+        self.device_manager.update(self.network, result['interface'])
+
+    def _table(self, interface_name=None):
+        """Return the network as sent to the server.
+
+        Server addresses of subnets the DHCP port isn't known to be on
+        are left empty, the server keeps those it already has.
+        """
+        server_ips = self._server_ips(interface_name)
+        subnets = []
+        for subnet in self.network.subnets:
+            if not subnet.enable_dhcp or subnet.ip_version != 4:
+                continue
+            server_ip = server_ips.get(subnet.id)
+            gateway = subnet.gateway_ip
+            routes = []
+            for hr in subnet.host_routes:
+                if hr.destination == '0.0.0.0/0':
+                    if not gateway:
+                        gateway = hr.nexthop
+                else:
+                    routes.append((hr.destination, hr.nexthop))
+            if server_ip and self._enable_metadata(subnet):
+                routes.append(('%s/32' % dhcp.METADATA_DEFAULT_IP,
+                               server_ip))
+            if routes and gateway:
+                routes.append(('0.0.0.0/0', gateway))
+            subnets.append({'id': subnet.id,
+                            'cidr': subnet.cidr,
+                            'server_ip': server_ip,
+                            'gateway_ip': gateway,
+                            'dns_servers': (subnet.dns_nameservers or
+                                            self.conf.dhcp_server_dns_servers),
+                            'routes': routes})
+
+        hosts = []
+        for port in self.network.ports:
+            for alloc in port.fixed_ips:
+                if not netaddr.valid_ipv4(alloc.ip_address):
+                    continue
+                hostname = 'host-%s' % alloc.ip_address.replace('.', '-')
+                hosts.append((port.mac_address, alloc.ip_address,
+                              alloc.subnet_id, hostname))
+
+        table = {'id': self.network.id,
+                 'subnets': subnets,
+                 'hosts': hosts,
+                 'lease_time': self.conf.dhcp_lease_duration,
+                 'domain': self.conf.dhcp_domain}
+        if interface_name:
+            table['interface'] = interface_name
+            table['namespace'] = self.network.namespace
+        return table
+
+    def _server_ips(self, interface_name=None):
+        """Return the addresses of the DHCP port by subnet id.
+
+        The port is looked up in the network, when it isn't there yet and
+        the interface is known its addresses are read from the device.
+        """
+        device_id = self.device_manager.get_device_id(self.network)
+        server_ips = {}
+        for port in self.network.ports:
+            if getattr(port, 'device_id', None) == device_id:
+                for alloc in port.fixed_ips:
+                    server_ips[alloc.subnet_id] = alloc.ip_address
+        if server_ips or not interface_name:
+            return server_ips
+
+        device = ip_lib.IPDevice(interface_name, self.root_helper,
+                                 self.network.namespace)
+        addresses = [netaddr.IPNetwork(addr['cidr'])
+                     for addr in device.addr.list(scope='global')]
+        for subnet in self.network.subnets:
+            cidr = netaddr.IPNetwork(subnet.cidr)
+            for address in addresses:
+                if address.ip in cidr:
+                    server_ips[subnet.id] = str(address.ip)
+                    break
+        return server_ips
+
+    def _ensure_server(self):
+        def callback(pid_file):
+            cmd = [SERVER_NAME,
+                   '--pid_file=%s' % pid_file,
+                   '--dhcp_server_socket=%s' % self.conf.dhcp_server_socket,
+                   '--socket_uid=%d' % os.getuid()]
+            cmd.extend(config.get_log_args(cfg.CONF,
+                                           '%s.log' % SERVER_NAME))
+            return cmd
+
+        pm = external_process.ProcessManager(self.conf, SERVER_NAME,
+                                             self.root_helper)
+        if pm.active:
+            return
+        pm.enable(callback)
+        deadline = time.time() + SERVER_START_TIMEOUT
+        while not os.path.exists(self.conf.dhcp_server_socket):
+            if time.time() > deadline:
+                raise RuntimeError(_('%s did not start') % SERVER_NAME)
+            eventlet.sleep(0.1)
+
+    def _call(self, command, **kwargs):
+        return _call(self.conf, command, **kwargs)
+
+
+def _call(conf, command, **kwargs):
+    """Run a command in the shared server and return its result.
+
+    Raises socket.error when the server isn't running and RuntimeError
+    when the command failed.
+    """
+    kwargs['command'] = command
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(conf.dhcp_server_socket)
+        sock.sendall(jsonutils.dumps(kwargs) + '\n')
+        response = jsonutils.loads(sock.makefile('r').readline())
+    finally:
+        sock.close()
+    if 'error' in response:
+        raise RuntimeError(response['error'])
+    return response['result']
+
+
+def configured_state_path():
+    """Return state_path as set in the configuration files.
+
+    The server runs as root with the arguments its caller picked, so the
+    directory it may create its control socket in must not come from the
+    command line.
+    """
+    conf = cfg.ConfigOpts()
+    conf.register_opts(common_config.core_cli_opts)
+    conf(args=[], project='neutron')
+    return conf.state_path
+
+
+def check_socket_path(path, state_path):
+    """Raise ValueError unless path is a file of $state_path/dhcp."""
+    socket_dir = os.path.join(os.path.realpath(state_path), 'dhcp')
+    if os.path.dirname(os.path.realpath(path)) != socket_dir:
+        raise ValueError(_('The control socket %(path)s is not in '
+                           '%(dir)s') % {'path': path, 'dir': socket_dir})
+
+
+def main():
+    eventlet.monkey_patch()
+    opts = [
+        cfg.StrOpt('pid_file',
+                   help=_('Location of pid file of this process.')),
+        cfg.BoolOpt('daemonize',
+                    default=True,
+                    help=_('Run as daemon.')),
+        cfg.IntOpt('socket_uid',
+                   help=_('Owner of the control socket, the user the DHCP '
+                          'agent runs as.')),
+    ]
+
+    cfg.CONF.register_cli_opts(opts)
+    cfg.CONF.register_cli_opts(OPTS)
+    # Don't get the default configuration file
+    cfg.CONF(project='neutron', default_config_files=[])
+    common_config.setup_logging(cfg.CONF)
+    try:
+        check_socket_path(cfg.CONF.dhcp_server_socket,
+                          configured_state_path())
+    except ValueError as e:
+        LOG.error(e)
+        sys.exit(1)
+    server = DhcpServerDaemon(cfg.CONF.pid_file,
+                              cfg.CONF.dhcp_server_socket,
+                              cfg.CONF.socket_uid)
+
+    if cfg.CONF.daemonize:
+        server.start()
+    else:
+        server.run()
@@ -16,6 +16,7 @@
 import netaddr
 from oslo.config import cfg
 
+from neutron.agent.linux import netlink_lib
 from neutron.agent.linux import utils
 from neutron.common import exceptions
 
@@ -24,6 +25,13 @@ OPTS = [
     cfg.BoolOpt('ip_lib_force_root',
                 default=False,
                 help=_('Force ip_lib calls to use the root helper')),
+    cfg.StrOpt('ip_lib_backend',
+               default='cli',
+               help=_("Backend used by ip_lib for device, link and address "
+                      "operations. 'cli' runs the ip command for every "
+                      "call, 'netlink' talks to the kernel in-process "
+                      "through pyroute2 and requires the agent to run as "
+                      "root. Other operations always use the ip command.")),
 ]
 
 
@@ -45,6 +53,7 @@ class SubProcessBase(object):
             # Only callers that need to force use of the root helper
             # need to register the option.
             self.force_root = False
+        self.netlink = _get_netlink()
 
     def _run(self, options, command, args):
         if self.namespace:
@@ -90,6 +99,11 @@ class IPWrapper(SubProcessBase):
         return IPDevice(name, self.root_helper, self.namespace)
 
     def get_devices(self, exclude_loopback=False):
+        if self.netlink:
+            return [IPDevice(name, self.root_helper, self.namespace)
+                    for name in self.netlink.get_device_names(self.namespace)
+                    if not (exclude_loopback and name == LOOPBACK_DEVNAME)]
+
         retval = []
         output = self._execute(['o', 'd'], 'link', ('list',),
                                self.root_helper, self.namespace)
@@ -245,9 +259,17 @@ class IpLinkCommand(IpDeviceCommandBase):
         self._as_root('set', self.name, 'mtu', mtu_size)
 
     def set_up(self):
+        if self._parent.netlink:
+            self._parent.netlink.set_link_state(self.name, 'up',
+                                                self._parent.namespace)
+            return
         self._as_root('set', self.name, 'up')
 
     def set_down(self):
+        if self._parent.netlink:
+            self._parent.netlink.set_link_state(self.name, 'down',
+                                                self._parent.namespace)
+            return
         self._as_root('set', self.name, 'down')
 
     def set_netns(self, namespace):
@@ -290,6 +312,9 @@ class IpLinkCommand(IpDeviceCommandBase):
 
     @property
     def attributes(self):
+        if self._parent.netlink:
+            return self._parent.netlink.get_link_attributes(
+                self.name, self._parent.namespace)
         return self._parse_line(self._run('show', self.name, options='o'))
 
     def _parse_line(self, value):
@@ -309,6 +334,10 @@ class IpAddrCommand(IpDeviceCommandBase):
     COMMAND = 'addr'
 
     def add(self, ip_version, cidr, broadcast, scope='global'):
+        if self._parent.netlink:
+            self._parent.netlink.add_address(self.name, cidr, broadcast,
+                                             scope, self._parent.namespace)
+            return
         self._as_root('add',
                       cidr,
                       'brd',
@@ -320,12 +349,46 @@ class IpAddrCommand(IpDeviceCommandBase):
                       options=[ip_version])
 
     def delete(self, ip_version, cidr):
+        if self._parent.netlink:
+            self._parent.netlink.delete_address(self.name, cidr,
+                                                self._parent.namespace)
+            return
         self._as_root('del',
                       cidr,
                       'dev',
                       self.name,
                       options=[ip_version])
 
+    def add_batch(self, cidrs, scope='global'):
+        """Add several addresses to the device.
+
+        The broadcast address of each cidr is derived from its prefix.
+        Every address is its own root helper call, so that the rootwrap
+        filters see each command; configure a root_helper_daemon to keep
+        the per-call cost down.  Raises RuntimeError if any address could
+        not be added, after trying all of them.
+        """
+        self._apply_all(self.add,
+                        [(netaddr.IPNetwork(cidr).version, cidr,
+                          str(netaddr.IPNetwork(cidr).broadcast), scope)
+                         for cidr in cidrs])
+
+    def delete_batch(self, cidrs):
+        """Remove several addresses from the device, see add_batch."""
+        self._apply_all(self.delete,
+                        [(netaddr.IPNetwork(cidr).version, cidr)
+                         for cidr in cidrs])
+
+    def _apply_all(self, method, calls):
+        errors = []
+        for args in calls:
+            try:
+                method(*args)
+            except RuntimeError as e:
+                errors.append(str(e))
+        if errors:
+            raise RuntimeError('\n'.join(errors))
+
     def flush(self):
         self._as_root('flush', self.name)
 
@@ -333,6 +396,11 @@ class IpAddrCommand(IpDeviceCommandBase):
         if filters is None:
             filters = []
 
+        if self._parent.netlink and filters in ([], ['permanent']):
+            return self._parent.netlink.list_addresses(
+                self.name, self._parent.namespace, scope=scope, to=to,
+                permanent_only=bool(filters))
+
         retval = []
 
         if scope:
@@ -514,6 +582,9 @@ class IpNetnsCommand(IpCommandBase):
         return IPWrapper(self._parent.root_helper, name)
 
     def delete(self, name):
+        if self._parent.netlink:
+            # The netlink helper pins the namespace while it is alive.
+            self._parent.netlink.release(name)
         self._as_root('delete', name, use_root_namespace=True)
 
     def execute(self, cmds, addl_env={}, check_exit_code=True):
@@ -541,6 +612,16 @@ class IpNetnsCommand(IpCommandBase):
         return False
 
 
+def _get_netlink():
+    try:
+        backend = cfg.CONF.ip_lib_backend
+    except cfg.NoSuchOptError:
+        # Only agents that register ip_lib.OPTS can switch backend.
+        return None
+    if backend == 'netlink':
+        return netlink_lib.get_backend()
+
+
 def device_exists(device_name, root_helper=None, namespace=None):
     try:
         address = IPDevice(device_name, root_helper, namespace).link.address
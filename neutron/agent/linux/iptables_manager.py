@@ -247,9 +247,40 @@ class IptablesTable(object):
     def clear_rules_by_tag(self, tag):
         if not tag:
             return
-        rules = [rule for rule in self.rules if rule.tag == tag]
-        for rule in rules:
-            self.rules.remove(rule)
+        self.rules = [rule for rule in self.rules if rule.tag != tag]
+
+    def update_rules_by_tag(self, tag, rules):
+        """Make the wrapped rules carrying tag match a list of rules.
+
+        rules is a list of (chain, rule) tuples as accepted by add_rule.
+        Only the difference with the current tagged rules is applied, so
+        unchanged rules keep their position.  Returns True if the table
+        was modified.
+
+        """
+        wanted = []
+        for chain, rule in rules:
+            chain = get_chain_name(chain)
+            if chain not in self.chains:
+                raise LookupError(_('Unknown chain: %r') % chain)
+            if '$' in rule:
+                rule = ' '.join(
+                    self._wrap_target_chain(e, True) for e in rule.split(' '))
+            wanted.append((chain, rule))
+
+        current = set((r.chain, r.rule) for r in self.rules if r.tag == tag)
+        wanted_set = set(wanted)
+        if current == wanted_set:
+            return False
+
+        self.rules = [r for r in self.rules
+                      if r.tag != tag or (r.chain, r.rule) in wanted_set]
+        for chain, rule in wanted:
+            if (chain, rule) not in current:
+                current.add((chain, rule))
+                self.rules.append(IptablesRule(chain, rule, True, False,
+                                               self.wrap_name, tag))
+        return True
 
 
 class IptablesManager(object):
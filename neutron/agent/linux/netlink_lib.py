@@ -0,0 +1,243 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-process netlink backend for ip_lib.
+
+The backend talks rtnetlink directly through pyroute2 instead of forking
+a rootwrapped 'ip' process for every call.  Operations inside a network
+namespace go through a pyroute2 NetNS object, which forks a small helper
+that enters the namespace with setns() and relays netlink messages.  The
+helper is kept open while the namespace is in use, so repeated calls
+against the same router or network namespace cost a socket round trip.
+A helper pins its namespace, so the ones left unused are closed and only
+the most recently used ones are kept open.  Calls on the same namespace
+are serialized, as a netlink socket can't be shared by concurrent calls.
+
+Every method raises RuntimeError on failure, like utils.execute() does,
+so ip_lib callers don't need to care which backend served them.
+"""
+
+import collections
+import os
+import threading
+import time
+import weakref
+
+import netaddr
+
+from neutron.openstack.common import log as logging
+
+try:
+    import pyroute2
+except ImportError:
+    pyroute2 = None
+
+
+LOG = logging.getLogger(__name__)
+
+# Address flags and scopes, from linux/if_addr.h and linux/rtnetlink.h
+IFA_F_PERMANENT = 0x80
+SCOPES = {0: 'global', 200: 'site', 253: 'link', 254: 'host', 255: 'nowhere'}
+SCOPE_IDS = dict((v, k) for k, v in SCOPES.items())
+
+# RFC 2863 operational states as reported in IFLA_OPERSTATE
+OPERSTATES = {0: 'UNKNOWN', 1: 'NOTPRESENT', 2: 'DOWN', 3: 'LOWERLAYERDOWN',
+              4: 'TESTING', 5: 'DORMANT', 6: 'UP'}
+
+# Most namespace helpers kept open, the least recently used are closed first
+MAX_NAMESPACE_HELPERS = 32
+# Seconds after which an unused namespace helper is closed
+HELPER_IDLE_TIMEOUT = 60
+
+_backend = None
+
+
+def get_backend():
+    """Return the shared netlink backend, or None if it can't be used.
+
+    The backend needs pyroute2 and CAP_NET_ADMIN/CAP_SYS_ADMIN, which in
+    practice means the agent has to run as root.
+    """
+    global _backend
+    if _backend is None:
+        if pyroute2 is None:
+            LOG.warning(_('pyroute2 is not installed, falling back to the '
+                          'ip command for ip_lib calls'))
+            _backend = False
+        elif os.geteuid() != 0:
+            LOG.warning(_('The netlink ip_lib backend requires the agent to '
+                          'run as root, falling back to the ip command'))
+            _backend = False
+        else:
+            _backend = NetlinkBackend()
+    return _backend or None
+
+
+class NetlinkBackend(object):
+    """Subset of ip_lib operations implemented over rtnetlink."""
+
+    def __init__(self):
+        # namespace -> [socket, last use], least recently used first
+        self._sockets = collections.OrderedDict()
+        # Only namespaces with a call in progress keep their semaphore
+        self._semaphores = weakref.WeakValueDictionary()
+
+    def _semaphore(self, namespace):
+        return self._semaphores.setdefault(namespace, threading.Semaphore())
+
+    def _socket(self, namespace):
+        """Return the socket of a namespace, its semaphore must be held."""
+        now = time.time()
+        entry = self._sockets.pop(namespace, None)
+        self._close_unused(now)
+        if entry is None:
+            try:
+                if namespace:
+                    sock = pyroute2.NetNS(namespace)
+                else:
+                    sock = pyroute2.IPRoute()
+            except Exception as e:
+                raise RuntimeError(_('Unable to open netlink socket in '
+                                     'namespace %(ns)s: %(err)s') %
+                                   {'ns': namespace, 'err': e})
+            entry = [sock, now]
+        entry[1] = now
+        self._sockets[namespace] = entry
+        return entry[0]
+
+    def _close_unused(self, now):
+        """Close idle helpers and the least recently used extra ones."""
+        helpers = len(self._sockets) - (None in self._sockets)
+        for namespace, (_sock, last_use) in self._sockets.items():
+            if namespace is None:
+                continue
+            if (helpers < MAX_NAMESPACE_HELPERS and
+                now - last_use < HELPER_IDLE_TIMEOUT):
+                break
+            sem = self._semaphore(namespace)
+            # A helper in use by another call is left alone
+            if sem.acquire(False):
+                try:
+                    self._close(namespace)
+                finally:
+                    sem.release()
+                helpers -= 1
+
+    def _close(self, namespace):
+        entry = self._sockets.pop(namespace, None)
+        if entry is not None:
+            try:
+                entry[0].close()
+            except Exception:
+                LOG.debug(_('Failed to close netlink socket for namespace '
+                            '%s'), namespace)
+
+    def release(self, namespace):
+        """Close the helper for a namespace that is going away."""
+        with self._semaphore(namespace):
+            self._close(namespace)
+
+    def _call(self, namespace, method, *args, **kwargs):
+        with self._semaphore(namespace):
+            sock = self._socket(namespace)
+            try:
+                return getattr(sock, method)(*args, **kwargs)
+            except Exception as e:
+                # A broken helper (e.g. the namespace was deleted behind our
+                # back) is dropped so that the next call reconnects.
+                self._close(namespace)
+                raise RuntimeError(_('Netlink %(method)s failed in namespace '
+                                     '%(ns)s: %(err)s') %
+                                   {'method': method, 'ns': namespace,
+                                    'err': e})
+
+    def _get_index(self, namespace, name):
+        indexes = self._call(namespace, 'link_lookup', ifname=name)
+        if not indexes:
+            raise RuntimeError(_('Device %(dev)s does not exist in namespace '
+                                 '%(ns)s') % {'dev': name, 'ns': namespace})
+        return indexes[0]
+
+    def get_device_names(self, namespace=None):
+        return [link.get_attr('IFLA_IFNAME')
+                for link in self._call(namespace, 'get_links')]
+
+    def get_link_attributes(self, name, namespace=None):
+        """Return the attributes 'ip -o link show' would report."""
+        index = self._get_index(namespace, name)
+        link = self._call(namespace, 'get_links', index)[0]
+        state = link.get_attr('IFLA_OPERSTATE')
+        state = OPERSTATES.get(state, state)
+        attributes = {'link/ether': link.get_attr('IFLA_ADDRESS'),
+                      'state': state,
+                      'mtu': link.get_attr('IFLA_MTU'),
+                      'qdisc': link.get_attr('IFLA_QDISC'),
+                      'qlen': link.get_attr('IFLA_TXQLEN'),
+                      'alias': link.get_attr('IFLA_IFALIAS')}
+        return dict((k, v) for k, v in attributes.items() if v is not None)
+
+    def set_link_state(self, name, state, namespace=None):
+        index = self._get_index(namespace, name)
+        self._call(namespace, 'link', 'set', index=index, state=state)
+
+    def list_addresses(self, name, namespace=None, scope=None, to=None,
+                       permanent_only=False):
+        """Return addresses in the format of IpAddrCommand.list()."""
+        index = self._get_index(namespace, name)
+        if to:
+            to = netaddr.IPNetwork(to)
+        retval = []
+        for msg in self._call(namespace, 'get_addr', index=index):
+            addr_scope = SCOPES.get(msg['scope'], str(msg['scope']))
+            if scope and addr_scope != scope:
+                continue
+            dynamic = not msg['flags'] & IFA_F_PERMANENT
+            if permanent_only and dynamic:
+                continue
+            address = msg.get_attr('IFA_ADDRESS')
+            if to and netaddr.IPAddress(address) not in to:
+                continue
+            cidr = '%s/%s' % (address, msg['prefixlen'])
+            if msg['family'] == 10:
+                version = 6
+                broadcast = '::'
+            else:
+                version = 4
+                broadcast = (msg.get_attr('IFA_BROADCAST') or
+                             str(netaddr.IPNetwork(cidr).broadcast))
+            retval.append(dict(cidr=cidr,
+                               broadcast=broadcast,
+                               scope=addr_scope,
+                               ip_version=version,
+                               dynamic=dynamic))
+        return retval
+
+    def add_address(self, name, cidr, broadcast, scope='global',
+                    namespace=None):
+        index = self._get_index(namespace, name)
+        net = netaddr.IPNetwork(cidr)
+        kwargs = {'index': index,
+                  'address': str(net.ip),
+                  'mask': net.prefixlen,
+                  'scope': SCOPE_IDS.get(scope, 0)}
+        if net.version == 4 and broadcast:
+            kwargs['broadcast'] = broadcast
+        self._call(namespace, 'addr', 'add', **kwargs)
+
+    def delete_address(self, name, cidr, namespace=None):
+        index = self._get_index(namespace, name)
+        net = netaddr.IPNetwork(cidr)
+        self._call(namespace, 'addr', 'delete', index=index,
+                   address=str(net.ip), mask=net.prefixlen)
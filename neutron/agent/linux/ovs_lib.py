@@ -13,6 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
+import re
+
 from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
@@ -37,6 +40,12 @@ cfg.CONF.register_opts(OPTS)
 
 LOG = logging.getLogger(__name__)
 
+FLOW_COOKIE_RE = re.compile(r'cookie=(0x[0-9a-fA-F]+)')
+
+# Maximum number of ports created or deleted by a single ovs-vsctl
+# transaction
+PORTS_PER_TRANSACTION = 500
+
 
 class VifPort:
     def __init__(self, port_name, ofport, vif_id, vif_mac, switch):
@@ -100,12 +109,77 @@ class BaseOVS(object):
         return bool(self.get_bridge_name_for_port_name(port_name))
 
 
+class FlowCache(object):
+    """Model of the flows an agent wants on a bridge, keyed by cookie.
+
+    The cookie of a flow is computed from its definition, so the flows
+    installed on the bridge can be compared with the model by cookie
+    alone, without parsing the matches and actions ovs-ofctl prints back.
+    """
+
+    def __init__(self):
+        self.flows = {}
+
+    @staticmethod
+    def _normalize(flow_dict):
+        flow = dict((k, str(v)) for k, v in flow_dict.iteritems())
+        flow.setdefault('table', '0')
+        flow.setdefault('priority', '1')
+        return flow
+
+    @staticmethod
+    def _cookie(flow):
+        definition = ','.join('%s=%s' % item for item in sorted(flow.items()))
+        return int(hashlib.sha1(definition).hexdigest()[:15], 16) or 1
+
+    @staticmethod
+    def _matches(flow, match):
+        # Same semantics as a non-strict ovs-ofctl match
+        for key, value in match.iteritems():
+            if flow.get(key) != str(value):
+                return False
+        return True
+
+    def add(self, flow_dict):
+        """Record a flow and return its ovs-ofctl definition."""
+        flow = self._normalize(flow_dict)
+        cookie = self._cookie(flow)
+        flow_str = _build_flow_expr_str(
+            dict(flow, cookie='0x%x' % cookie), 'add')
+        self.flows[cookie] = (flow, flow_str)
+        return flow_str
+
+    def modify(self, flow_dict):
+        """Change the actions of the matching flows.
+
+        Returns the new definitions of the flows, which need to be added
+        again to the bridge as their cookie changes with the actions.
+        """
+        match = dict(flow_dict)
+        actions = match.pop('actions')
+        flows = self._pop_matching(match)
+        return [self.add(dict(flow, actions=actions)) for flow in flows]
+
+    def delete(self, match):
+        self._pop_matching(match)
+
+    def _pop_matching(self, match):
+        cookies = [cookie for cookie, (flow, _flow_str) in
+                   self.flows.iteritems() if self._matches(flow, match)]
+        return [self.flows.pop(cookie)[0] for cookie in cookies]
+
+    def clear(self):
+        self.flows.clear()
+
+
 class OVSBridge(BaseOVS):
     def __init__(self, br_name, root_helper):
         super(OVSBridge, self).__init__(root_helper)
         self.br_name = br_name
         self.defer_apply_flows = False
         self.deferred_flows = {'add': '', 'mod': '', 'del': ''}
+        self.flow_cache = None
+        self.flow_resync = False
 
     def set_controller(self, controller_names):
         vsctl_command = ['--', 'set-controller', self.br_name]
@@ -173,6 +247,10 @@ class OVSBridge(BaseOVS):
         return len(flow_list) - 1
 
     def remove_all_flows(self):
+        if self.flow_cache is not None:
+            self.flow_cache.clear()
+            if self.flow_resync:
+                return
         self.run_ofctl("del-flows", [])
 
     def get_port_ofport(self, port_name):
@@ -185,19 +263,59 @@ class OVSBridge(BaseOVS):
         except ValueError:
             return constants.INVALID_OFPORT
 
+    def get_ports_ofports(self, port_names):
+        """Return a dict mapping port names to ofports in one query."""
+        ofports = dict((name, constants.INVALID_OFPORT)
+                       for name in port_names)
+        if not port_names:
+            return ofports
+        # Listing every interface doesn't fail on missing ports, unlike
+        # listing the requested ones
+        args = ['--format=json', '--', '--columns=name,ofport',
+                'list', 'Interface']
+        result = self.run_vsctl(args)
+        if not result:
+            return ofports
+        for name, ofport in jsonutils.loads(result)['data']:
+            if name not in ofports:
+                continue
+            # ofport is ["set", []] while the port is not ready
+            try:
+                int(ofport)
+            except (ValueError, TypeError):
+                continue
+            ofports[name] = str(ofport)
+        return ofports
+
     def get_datapath_id(self):
         return self.db_get_val('Bridge',
                                self.br_name, 'datapath_id').strip('"')
 
     def add_flow(self, **kwargs):
-        flow_str = _build_flow_expr_str(kwargs, 'add')
+        if self.flow_cache is not None:
+            flow_str = self.flow_cache.add(kwargs)
+            if self.flow_resync:
+                return
+        else:
+            flow_str = _build_flow_expr_str(kwargs, 'add')
         if self.defer_apply_flows:
             self.deferred_flows['add'] += flow_str + '\n'
         else:
             self.run_ofctl("add-flow", [flow_str])
 
     def mod_flow(self, **kwargs):
-        flow_str = _build_flow_expr_str(kwargs, 'mod')
+        flow_str = _build_flow_expr_str(dict(kwargs), 'mod')
+        if self.flow_cache is not None:
+            flows = self.flow_cache.modify(kwargs)
+            if self.flow_resync:
+                return
+            if flows:
+                flow_str = '\n'.join(flows)
+                if self.defer_apply_flows:
+                    self.deferred_flows['add'] += flow_str + '\n'
+                else:
+                    self.run_ofctl("add-flows", ['-'], flow_str + '\n')
+                return
         if self.defer_apply_flows:
             self.deferred_flows['mod'] += flow_str + '\n'
         else:
@@ -205,6 +323,10 @@ class OVSBridge(BaseOVS):
 
     def delete_flows(self, **kwargs):
         flow_expr_str = _build_flow_expr_str(kwargs, 'del')
+        if self.flow_cache is not None:
+            self.flow_cache.delete(kwargs)
+            if self.flow_resync:
+                return
         if self.defer_apply_flows:
             self.deferred_flows['del'] += flow_expr_str + '\n'
         else:
@@ -219,6 +341,68 @@ class OVSBridge(BaseOVS):
                                if 'NXST' not in item)
         return retval
 
+    def dump_flow_cookies(self):
+        """Return the cookies of the flows installed on the bridge.
+
+        Flows with a timeout, like the ones set up by learn actions, are
+        not managed by agents and are left out. Returns None if the flows
+        can't be dumped.
+        """
+        flows = self.run_ofctl("dump-flows", [])
+        if flows is None:
+            return None
+        cookies = set()
+        for line in flows.splitlines():
+            match = FLOW_COOKIE_RE.search(line)
+            if match and '_timeout=' not in line:
+                cookies.add(int(match.group(1), 16))
+        return cookies
+
+    def start_flow_resync(self):
+        """Rebuild the flow cache without touching the installed flows.
+
+        Until finish_flow_resync() is called flow changes are only recorded
+        in the cache, which is then compared with the flows on the bridge.
+        """
+        if self.flow_cache is None:
+            self.flow_cache = FlowCache()
+        self.flow_cache.clear()
+        self.flow_resync = True
+
+    def reset_flow_cache(self):
+        """Remove all flows and apply the following flows right away.
+
+        Used when the bridge has lost its flows, e.g. when OVS restarted,
+        so there is nothing to compare with. The cache is still kept up
+        to date for the next resync.
+        """
+        if self.flow_cache is None:
+            self.flow_cache = FlowCache()
+        self.flow_resync = False
+        self.remove_all_flows()
+
+    def finish_flow_resync(self):
+        """Apply the missing flows and remove the stale ones in a batch."""
+        if not self.flow_resync:
+            return
+        self.flow_resync = False
+        installed = self.dump_flow_cookies()
+        flows = self.flow_cache.flows
+        missing = [flow_str for cookie, (_flow, flow_str) in
+                   flows.iteritems() if not installed or
+                   cookie not in installed]
+        stale = set(installed or []) - set(flows)
+        LOG.info(_("Resynchronizing flows on bridge %(br)s: %(missing)d "
+                   "missing, %(stale)d stale, %(total)d expected"),
+                 {'br': self.br_name, 'missing': len(missing),
+                  'stale': len(stale), 'total': len(flows)})
+        if missing:
+            self.run_ofctl('add-flows', ['-'], '\n'.join(missing) + '\n')
+        if stale:
+            self.run_ofctl('del-flows', ['-'],
+                           ''.join('cookie=0x%x/-1\n' % cookie
+                                   for cookie in stale))
+
     def defer_apply_on(self):
         LOG.debug(_('defer_apply_on'))
         self.defer_apply_flows = True
@@ -241,10 +425,8 @@ class OVSBridge(BaseOVS):
                               {'action': action, 'flow': line})
                 self.run_ofctl('%s-flows' % action, ['-'], flows)
 
-    def add_tunnel_port(self, port_name, remote_ip, local_ip,
-                        tunnel_type=p_const.TYPE_GRE,
-                        vxlan_udp_port=constants.VXLAN_UDP_PORT,
-                        dont_fragment=True):
+    def _tunnel_port_args(self, port_name, remote_ip, local_ip,
+                          tunnel_type, vxlan_udp_port, dont_fragment):
         vsctl_command = ["--", "--may-exist", "add-port", self.br_name,
                          port_name]
         vsctl_command.extend(["--", "set", "Interface", port_name,
@@ -259,6 +441,15 @@ class OVSBridge(BaseOVS):
                               "options:local_ip=%s" % local_ip,
                               "options:in_key=flow",
                               "options:out_key=flow"])
+        return vsctl_command
+
+    def add_tunnel_port(self, port_name, remote_ip, local_ip,
+                        tunnel_type=p_const.TYPE_GRE,
+                        vxlan_udp_port=constants.VXLAN_UDP_PORT,
+                        dont_fragment=True):
+        vsctl_command = self._tunnel_port_args(port_name, remote_ip,
+                                               local_ip, tunnel_type,
+                                               vxlan_udp_port, dont_fragment)
         self.run_vsctl(vsctl_command)
         ofport = self.get_port_ofport(port_name)
         if (tunnel_type == p_const.TYPE_VXLAN and
@@ -268,6 +459,31 @@ class OVSBridge(BaseOVS):
                         'installed.'))
         return ofport
 
+    def add_tunnel_ports(self, remote_ips, local_ip,
+                         tunnel_type=p_const.TYPE_GRE,
+                         vxlan_udp_port=constants.VXLAN_UDP_PORT,
+                         dont_fragment=True):
+        """Create tunnel ports in bulk.
+
+        :param remote_ips: a dict mapping port names to remote IPs.
+        :returns: a dict mapping port names to ofports.
+        """
+        port_names = sorted(remote_ips)
+        for i in range(0, len(port_names), PORTS_PER_TRANSACTION):
+            vsctl_command = []
+            for port_name in port_names[i:i + PORTS_PER_TRANSACTION]:
+                vsctl_command.extend(self._tunnel_port_args(
+                    port_name, remote_ips[port_name], local_ip, tunnel_type,
+                    vxlan_udp_port, dont_fragment))
+            self.run_vsctl(vsctl_command)
+        ofports = self.get_ports_ofports(port_names)
+        if (tunnel_type == p_const.TYPE_VXLAN and port_names and
+                constants.INVALID_OFPORT in ofports.values()):
+            LOG.error(_('Unable to create VXLAN tunnel port. Please ensure '
+                        'that an openvswitch version that supports VXLAN is '
+                        'installed.'))
+        return ofports
+
     def add_patch_port(self, local_name, remote_name):
         self.run_vsctl(["add-port", self.br_name, local_name,
                         "--", "set", "Interface", local_name,
@@ -457,8 +673,19 @@ class OVSBridge(BaseOVS):
         else:
             port_names = (port.port_name for port in self.get_vif_ports())
 
-        for port_name in port_names:
-            self.delete_port(port_name)
+        self.delete_port_list(port_names)
+
+    def delete_port_list(self, port_names):
+        """Delete ports with one ovs-vsctl transaction per
+        PORTS_PER_TRANSACTION ports.
+        """
+        port_names = list(port_names)
+        for i in range(0, len(port_names), PORTS_PER_TRANSACTION):
+            vsctl_command = []
+            for port_name in port_names[i:i + PORTS_PER_TRANSACTION]:
+                vsctl_command.extend(["--", "--if-exists", "del-port",
+                                      self.br_name, port_name])
+            self.run_vsctl(vsctl_command)
 
     def get_local_port_mac(self):
         """Retrieve the mac of the bridge's local port."""
@@ -21,9 +21,13 @@ import shlex
 import socket
 import struct
 import tempfile
+import threading
+import time
 
 from eventlet.green import subprocess
 from eventlet import greenthread
+from oslo.config import cfg
+from oslo.rootwrap import client
 
 from neutron.common import constants
 from neutron.common import utils
@@ -58,19 +62,126 @@ def create_process(cmd, root_helper=None, addl_env=None):
     return obj, cmd
 
 
+# Log a summary of the rootwrap daemon statistics every so many commands
+ROOTWRAP_DAEMON_STATS_LOG_INTERVAL = 1000
+
+# Client of the rootwrap daemon, shared by every root command of the
+# process.  The daemon is spawned through AGENT.root_helper_daemon on first
+# use and then serves the commands over a unix socket, so the rootwrap
+# interpreter start-up and filter parsing are paid once.
+_rootwrap_client = None
+_rootwrap_client_lock = threading.Lock()
+_rootwrap_stats = None
+_rootwrap_stats_lock = threading.Lock()
+
+
+def _get_rootwrap_client():
+    global _rootwrap_client
+    with _rootwrap_client_lock:
+        if _rootwrap_client is None:
+            _rootwrap_client = client.Client(
+                shlex.split(cfg.CONF.AGENT.root_helper_daemon))
+        return _rootwrap_client
+
+
+def _new_rootwrap_stats():
+    return {'started_at': time.time(),
+            'commands': 0,
+            'errors': 0,
+            'total_time': 0.0,
+            'max_latency': 0.0}
+
+
+def _summarize_rootwrap_stats(stats):
+    stats = dict(stats)
+    started_at = stats.pop('started_at')
+    commands = stats['commands']
+    uptime = time.time() - started_at
+    stats['avg_latency'] = commands and stats['total_time'] / commands
+    stats['commands_per_second'] = uptime and commands / uptime
+    return stats
+
+
+def _record_rootwrap_command(elapsed, failed):
+    global _rootwrap_stats
+    summary = None
+    with _rootwrap_stats_lock:
+        if _rootwrap_stats is None:
+            _rootwrap_stats = _new_rootwrap_stats()
+        stats = _rootwrap_stats
+        stats['commands'] += 1
+        stats['errors'] += int(failed)
+        stats['total_time'] += elapsed
+        stats['max_latency'] = max(stats['max_latency'], elapsed)
+        if not stats['commands'] % ROOTWRAP_DAEMON_STATS_LOG_INTERVAL:
+            summary = _summarize_rootwrap_stats(stats)
+    if summary:
+        LOG.info(_('Rootwrap daemon statistics: %s'), summary)
+
+
+def _execute_rootwrap_daemon(cmd, process_input=None):
+    start = time.time()
+    failed = True
+    try:
+        result = _get_rootwrap_client().execute(cmd, None, process_input)
+        failed = False
+        return result
+    finally:
+        _record_rootwrap_command(time.time() - start, failed)
+
+
+def reset_rootwrap_daemon_stats():
+    global _rootwrap_stats
+    with _rootwrap_stats_lock:
+        _rootwrap_stats = _new_rootwrap_stats()
+
+
+def get_rootwrap_daemon_stats():
+    """Return latency and throughput of commands run by the daemon."""
+    global _rootwrap_stats
+    with _rootwrap_stats_lock:
+        if _rootwrap_stats is None:
+            _rootwrap_stats = _new_rootwrap_stats()
+        return _summarize_rootwrap_stats(_rootwrap_stats)
+
+
+def _use_rootwrap_daemon():
+    try:
+        return bool(cfg.CONF.AGENT.root_helper_daemon)
+    except (cfg.NoSuchOptError, cfg.NoSuchGroupError):
+        # Only agents that register the root helper options can use it.
+        return False
+
+
+def addl_env_args(addl_env):
+    """Build arguments for adding additional environment vars with env."""
+    if not addl_env:
+        return []
+    return ['env'] + ['%s=%s' % pair for pair in addl_env.items()]
+
+
 def execute(cmd, root_helper=None, process_input=None, addl_env=None,
             check_exit_code=True, return_stderr=False):
     try:
-        obj, cmd = create_process(cmd, root_helper=root_helper,
-                                  addl_env=addl_env)
-        _stdout, _stderr = (process_input and
-                            obj.communicate(process_input) or
-                            obj.communicate())
-        obj.stdin.close()
+        if root_helper and _use_rootwrap_daemon():
+            # The daemon applies the rootwrap filters itself, so the
+            # configured root_helper command line is not used here.
+            cmd = map(str, addl_env_args(addl_env) + cmd)
+            LOG.debug(_("Running command (rootwrap daemon): %s"), cmd)
+            returncode, _stdout, _stderr = _execute_rootwrap_daemon(
+                cmd, process_input)
+        else:
+            obj, cmd = create_process(cmd, root_helper=root_helper,
+                                      addl_env=addl_env)
+            _stdout, _stderr = (process_input and
+                                obj.communicate(process_input) or
+                                obj.communicate())
+            obj.stdin.close()
+            returncode = obj.returncode
         m = _("\nCommand: %(cmd)s\nExit code: %(code)s\nStdout: %(stdout)r\n"
-              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': obj.returncode,
+              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': returncode,
                                        'stdout': _stdout, 'stderr': _stderr}
-        if obj.returncode:
+        if returncode:
             LOG.error(m)
             if check_exit_code:
                 raise RuntimeError(m)
@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import itertools
 import re
 
 import eventlet
@@ -57,6 +58,10 @@ def setup_conf():
         cfg.BoolOpt('force',
                     default=False,
                     help=_('Delete the namespace by removing all devices.')),
+        cfg.IntOpt('workers',
+                   default=8,
+                   help=_('Number of namespaces checked and destroyed '
+                          'concurrently.')),
     ]
 
     conf = cfg.CONF
@@ -162,13 +167,27 @@ def main():
     config.setup_logging(conf)
 
     root_helper = agent_config.get_root_helper(conf)
+    pool = eventlet.GreenPool(conf.workers)
     # Identify namespaces that are candidates for deletion.
-    candidates = [ns for ns in
-                  ip_lib.IPWrapper.get_namespaces(root_helper)
-                  if eligible_for_deletion(conf, ns, conf.force)]
+    namespaces = ip_lib.IPWrapper.get_namespaces(root_helper)
+    eligible = pool.imap(eligible_for_deletion, itertools.repeat(conf),
+                         namespaces, itertools.repeat(conf.force))
+    candidates = [ns for ns, is_eligible in zip(namespaces, eligible)
+                  if is_eligible]
 
     if candidates:
+        LOG.info(_('Destroying %(candidates)d of %(namespaces)d '
+                   'namespaces'),
+                 {'candidates': len(candidates),
+                  'namespaces': len(namespaces)})
         eventlet.sleep(2)
 
-        for namespace in candidates:
-            destroy_namespace(conf, namespace, conf.force)
+        total = len(candidates)
+        # Report progress every tenth of the way
+        step = max(total // 10, 1)
+        destroyed = pool.imap(destroy_namespace, itertools.repeat(conf),
+                              candidates, itertools.repeat(conf.force))
+        for count, _result in enumerate(destroyed, 1):
+            if count % step == 0 or count == total:
+                LOG.info(_('Destroyed %(count)d of %(total)d namespaces'),
+                         {'count': count, 'total': total})
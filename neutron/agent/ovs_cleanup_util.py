@@ -66,11 +66,14 @@ def delete_neutron_ports(ports, root_helper):
 
     Non-internal OVS ports need to be removed manually.
     """
+    devices = set(device.name for device in
+                  ip_lib.IPWrapper(root_helper).get_devices())
+    ports = [port for port in ports if port in devices]
+    LOG.info(_("Deleting %d remaining devices"), len(ports))
     for port in ports:
-        if ip_lib.device_exists(port):
-            device = ip_lib.IPDevice(port, root_helper)
-            device.link.delete()
-            LOG.info(_("Delete %s"), port)
+        device = ip_lib.IPDevice(port, root_helper)
+        device.link.delete()
+        LOG.info(_("Delete %s"), port)
 
 
 def main():
@@ -17,32 +17,150 @@
 """Cron script to generate usage notifications for networks, ports and
 subnets.
 
+Resources are read a page at a time, in id order, so the memory used does
+not grow with the size of the cloud.
 """
 
 import sys
+import time
 
 from oslo.config import cfg
 
 from neutron.common import config
+from neutron.common import exceptions as n_exc
 from neutron.common import rpc as n_rpc
 from neutron import context
 from neutron import manager
+from neutron.openstack.common import log as logging
+from neutron.plugins.common import constants
+
+LOG = logging.getLogger(__name__)
+
+RESOURCES = ('network', 'subnet', 'port', 'router', 'floatingip')
+L3_RESOURCES = ('router', 'floatingip')
+
+OPTS = [
+    cfg.IntOpt('audit_page_size', default=1000,
+               help=_("Number of resources read from the database at "
+                      "once.")),
+    cfg.IntOpt('audit_batch_size', default=1,
+               help=_("Number of resources reported by each .exists "
+                      "notification. With the default of 1 the payload "
+                      "holds a single resource, e.g. {'network': {...}}; "
+                      "otherwise it holds a list, e.g. "
+                      "{'networks': [...]}.")),
+    cfg.FloatOpt('audit_rate_limit', default=0,
+                 help=_("Maximum number of notifications sent per second, "
+                        "0 for no limit.")),
+]
+
+
+def _supports_pagination(plugin):
+    name = plugin.__class__.__name__
+    return (getattr(plugin, '_%s__native_pagination_support' % name, False)
+            and getattr(plugin, '_%s__native_sorting_support' % name, False))
+
+
+def iter_resources(cxt, getter, page_size):
+    """Yield all the resources returned by a plugin getter, page by page.
+
+    Pages are sorted by id and each page starts after the last resource of
+    the previous one. If that resource was deleted in the meantime, the
+    page starts after an earlier one instead and the resources already
+    yielded are skipped.
+    """
+    last_id = None
+    markers = [None]
+    while True:
+        for marker in reversed(markers):
+            try:
+                page = getter(cxt, sorts=[('id', True)], limit=page_size,
+                              marker=marker)
+                break
+            except n_exc.NotFound:
+                continue
+        for resource in page:
+            if last_id is None or resource['id'] > last_id:
+                last_id = resource['id']
+                yield resource
+        if len(page) < page_size:
+            return
+        markers = [None] + [resource['id'] for resource in page]
+
+
+class AuditNotifier(object):
+    """Sends .exists notifications in batches, within a rate limit."""
+
+    def __init__(self, cxt, notifier, batch_size, rate_limit):
+        self.cxt = cxt
+        self.notifier = notifier
+        self.batch_size = max(batch_size, 1)
+        self.interval = 1.0 / rate_limit if rate_limit > 0 else 0
+        self.last_sent = 0
+        self.notifications = 0
+
+    def _send(self, event_type, payload):
+        if self.interval:
+            delay = self.last_sent + self.interval - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self.last_sent = time.time()
+        self.notifier.info(self.cxt, event_type, payload)
+        self.notifications += 1
+
+    def _send_batch(self, resource, batch):
+        if self.batch_size == 1:
+            payload = {resource: batch[0]}
+        else:
+            payload = {resource + 's': batch}
+        self._send('%s.exists' % resource, payload)
+
+    def audit(self, resource, resources):
+        """Notify the existence of resources, return how many there were."""
+        count = 0
+        batch = []
+        for obj in resources:
+            batch.append(obj)
+            count += 1
+            if len(batch) == self.batch_size:
+                self._send_batch(resource, batch)
+                batch = []
+        if batch:
+            self._send_batch(resource, batch)
+        return count
 
 
 def main():
+    cfg.CONF.register_cli_opts(OPTS)
     config.init(sys.argv[1:])
     config.setup_logging(cfg.CONF)
 
     cxt = context.get_admin_context()
     plugin = manager.NeutronManager.get_plugin()
-    notifier = n_rpc.get_notifier('network')
-    for network in plugin.get_networks(cxt):
-        notifier.info(cxt, 'network.exists', {'network': network})
-    for subnet in plugin.get_subnets(cxt):
-        notifier.info(cxt, 'subnet.exists', {'subnet': subnet})
-    for port in plugin.get_ports(cxt):
-        notifier.info(cxt, 'port.exists', {'port': port})
-    for router in plugin.get_routers(cxt):
-        notifier.info(cxt, 'router.exists', {'router': router})
-    for floatingip in plugin.get_floatingips(cxt):
-        notifier.info(cxt, 'floatingip.exists', {'floatingip': floatingip})
+    l3_plugin = manager.NeutronManager.get_service_plugins().get(
+        constants.L3_ROUTER_NAT, plugin)
+    notifier = AuditNotifier(cxt, n_rpc.get_notifier('network'),
+                             cfg.CONF.audit_batch_size,
+                             cfg.CONF.audit_rate_limit)
+    for resource in RESOURCES:
+        source = l3_plugin if resource in L3_RESOURCES else plugin
+        getter = getattr(source, 'get_%ss' % resource)
+        if _supports_pagination(source):
+            resources = iter_resources(cxt, getter,
+                                       cfg.CONF.audit_page_size)
+        else:
+            LOG.info(_("%(plugin)s does not support pagination, all the "
+                       "%(resource)ss are read at once"),
+                     {'plugin': source.__class__.__name__,
+                      'resource': resource})
+            resources = getter(cxt)
+        start = time.time()
+        sent = notifier.notifications
+        count = notifier.audit(resource, resources)
+        elapsed = time.time() - start
+        LOG.info(_("Audited %(count)d %(resource)ss in %(elapsed).1f "
+                   "seconds (%(rate).1f per second), %(sent)d "
+                   "notifications"),
+                 {'count': count, 'resource': resource, 'elapsed': elapsed,
+                  'rate': count / elapsed if elapsed else 0,
+                  'sent': notifier.notifications - sent})
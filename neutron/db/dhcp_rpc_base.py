@@ -87,11 +87,21 @@ class DhcpRpcCallbackMixin(object):
         return [net['id'] for net in nets]
 
     def get_active_networks_info(self, context, **kwargs):
-        """Returns all the networks/subnets/ports in system."""
+        """Returns all the networks/subnets/ports in system.
+
+        If network_ids is given, only those networks are returned. The DHCP
+        agent uses this to fetch the ids returned by get_active_networks in
+        chunks.
+        """
         host = kwargs.get('host')
+        network_ids = kwargs.get('network_ids')
         LOG.debug(_('get_active_networks_info from %s'), host)
-        networks = self._get_active_networks(context, **kwargs)
         plugin = manager.NeutronManager.get_plugin()
+        if network_ids is None:
+            networks = self._get_active_networks(context, **kwargs)
+        else:
+            filters = dict(id=network_ids, admin_state_up=[True])
+            networks = plugin.get_networks(context, filters=filters)
         filters = {'network_id': [network['id'] for network in networks]}
         ports = plugin.get_ports(context, filters=filters)
         filters['enable_dhcp'] = [True]
@@ -518,18 +518,92 @@ class LoadBalancerPluginDb(loadbalancer.LoadBalancerPluginBase,
                 if stats_status:
                     self.update_status(context, Member, member, stats_status)
 
+    def update_pools_stats(self, context, pools_stats):
+        """Update the stats of several pools at once.
+
+        pools_stats maps pool ids to the structure taken by
+        update_pool_stats.  Statistics rows are written with a single
+        executemany UPDATE and member statuses with one UPDATE per status.
+        Pools which are gone or being deleted are skipped.
+        """
+        if not pools_stats:
+            return
+        with context.session.begin(subtransactions=True):
+            pools = (context.session.query(Pool.id, Pool.status).
+                     filter(Pool.id.in_(pools_stats.keys())))
+            pool_ids = set(pool.id for pool in pools
+                           if pool.status != constants.PENDING_DELETE)
+            if not pool_ids:
+                return
+            existing = set(row.pool_id for row in
+                           context.session.query(PoolStatistics.pool_id).
+                           filter(PoolStatistics.pool_id.in_(pool_ids)))
+
+            table = PoolStatistics.__table__
+            updates = []
+            inserts = []
+            for pool_id in list(pool_ids):
+                values = self._pool_stats_values(pool_id, pools_stats[pool_id])
+                try:
+                    valid = all(int(v) >= 0 for k, v in values.items()
+                                if k != 'pool_id')
+                except (TypeError, ValueError):
+                    valid = False
+                if not valid:
+                    LOG.warn(_('Ignoring invalid statistics for pool '
+                               '%(pool)s: %(stats)s'),
+                             {'pool': pool_id, 'stats': values})
+                    pool_ids.remove(pool_id)
+                    continue
+                if pool_id in existing:
+                    updates.append(dict(('b_' + k, v)
+                                        for k, v in values.items()))
+                else:
+                    inserts.append(values)
+            if updates:
+                columns = [c.name for c in table.columns
+                           if c.name != 'pool_id']
+                stmt = (table.update().
+                        where(table.c.pool_id == sa.bindparam('b_pool_id')).
+                        values(dict((c, sa.bindparam('b_' + c))
+                                    for c in columns)))
+                context.session.execute(stmt, updates)
+            if inserts:
+                context.session.execute(table.insert(), inserts)
+
+            members_by_status = {}
+            for pool_id in pool_ids:
+                members = pools_stats[pool_id].get('members', {})
+                for member_id, stats in members.items():
+                    status = stats.get(lb_const.STATS_STATUS)
+                    if status:
+                        members_by_status.setdefault(status, []).append(
+                            member_id)
+            for status, member_ids in members_by_status.items():
+                (context.session.query(Member).
+                 filter(Member.id.in_(member_ids),
+                        Member.pool_id.in_(pool_ids),
+                        sa.or_(Member.status != status,
+                               Member.status_description.isnot(None))).
+                 update({'status': status, 'status_description': None},
+                        synchronize_session=False))
+
+    def _pool_stats_values(self, pool_id, data):
+        return {
+            'pool_id': pool_id,
+            'bytes_in': data.get(lb_const.STATS_IN_BYTES, 0),
+            'bytes_out': data.get(lb_const.STATS_OUT_BYTES, 0),
+            'active_connections': data.get(lb_const.STATS_ACTIVE_CONNECTIONS,
+                                           0),
+            'total_connections': data.get(lb_const.STATS_TOTAL_CONNECTIONS, 0)
+        }
+
     def _create_pool_stats(self, context, pool_id, data=None):
         # This is internal method to add pool statistics. It won't
         # be exposed to API
         if not data:
             data = {}
-        stats_db = PoolStatistics(
-            pool_id=pool_id,
-            bytes_in=data.get(lb_const.STATS_IN_BYTES, 0),
-            bytes_out=data.get(lb_const.STATS_OUT_BYTES, 0),
-            active_connections=data.get(lb_const.STATS_ACTIVE_CONNECTIONS, 0),
-            total_connections=data.get(lb_const.STATS_TOTAL_CONNECTIONS, 0)
-        )
+        stats_db = PoolStatistics(**self._pool_stats_values(pool_id, data))
         return stats_db
 
     def _delete_pool_stats(self, context, pool_id):
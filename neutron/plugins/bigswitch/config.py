@@ -66,6 +66,12 @@ restproxy_opts = [
     cfg.IntOpt('server_timeout', default=10,
                help=_("Maximum number of seconds to wait for proxy request "
                       "to connect and complete.")),
+    cfg.IntOpt('server_max_connections', default=4,
+               help=_("Maximum number of concurrent requests sent to each "
+                      "controller. With cache_connections, up to that many "
+                      "connections are kept open for reuse. Requests to "
+                      "controllers checking consistency are always sent "
+                      "one at a time.")),
     cfg.IntOpt('thread_pool_size', default=4,
                help=_("Maximum number of threads to spawn to handle large "
                       "volumes of port creations.")),
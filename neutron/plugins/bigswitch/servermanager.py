@@ -28,6 +28,8 @@ The following functionality is handled by this module:
 - Automatic failover between controllers
 - SSL Certificate enforcement
 - HTTP Authentication
+- Pooling of concurrent connections to each controller
+- Background topology synchronization after consistency conflicts
 
 """
 import base64
@@ -37,11 +39,11 @@ import socket
 import ssl
 
 import eventlet
+from eventlet import semaphore
 from oslo.config import cfg
 
 from neutron.common import exceptions
 from neutron.common import utils
-from neutron.openstack.common import excutils
 from neutron.openstack.common import jsonutils as json
 from neutron.openstack.common import log as logging
 from neutron.plugins.bigswitch.db import consistency_db as cdb
@@ -87,7 +89,7 @@ class ServerProxy(object):
     """REST server proxy to a network controller."""
 
     def __init__(self, server, port, ssl, auth, neutron_id, timeout,
-                 base_uri, name, mypool, combined_cert):
+                 base_uri, name, mypool, combined_cert, max_connections=1):
         self.server = server
         self.port = port
         self.ssl = ssl
@@ -101,8 +103,11 @@ class ServerProxy(object):
         self.capabilities = []
         # enable server to reference parent pool
         self.mypool = mypool
-        # cache connection here to avoid a SSL handshake for every connection
-        self.currentconn = None
+        # idle connections by timeout, cached to avoid a SSL handshake for
+        # every request
+        self.idle_conns = {}
+        # bounds the number of requests in flight to this server
+        self.conn_slots = semaphore.Semaphore(max_connections)
         if auth:
             self.auth = 'Basic ' + base64.encodestring(auth).strip()
         self.combined_cert = combined_cert
@@ -119,12 +124,12 @@ class ServerProxy(object):
                                                 'cap': self.capabilities})
         return self.capabilities
 
-    def rest_call(self, action, resource, data='', headers={}, timeout=False,
-                  reconnect=False):
+    def rest_call(self, action, resource, data='', headers=None,
+                  timeout=False, reconnect=False):
         uri = self.base_uri + resource
         body = json.dumps(data)
-        if not headers:
-            headers = {}
+        # callers may share the dict they pass, so never modify it
+        headers = dict(headers or {})
         headers['Content-type'] = 'application/json'
         headers['Accept'] = 'application/json'
         headers['NeutronProxy-Agent'] = self.name
@@ -151,63 +156,9 @@ class ServerProxy(object):
         if timeout is False:
             timeout = self.timeout
 
-        if timeout != self.timeout:
-            # need a new connection if timeout has changed
-            reconnect = True
-
-        if not self.currentconn or reconnect:
-            if self.currentconn:
-                self.currentconn.close()
-            if self.ssl:
-                self.currentconn = HTTPSConnectionWithValidation(
-                    self.server, self.port, timeout=timeout)
-                if self.currentconn is None:
-                    LOG.error(_('ServerProxy: Could not establish HTTPS '
-                                'connection'))
-                    return 0, None, None, None
-                self.currentconn.combined_cert = self.combined_cert
-            else:
-                self.currentconn = httplib.HTTPConnection(
-                    self.server, self.port, timeout=timeout)
-                if self.currentconn is None:
-                    LOG.error(_('ServerProxy: Could not establish HTTP '
-                                'connection'))
-                    return 0, None, None, None
-
-        try:
-            self.currentconn.request(action, uri, body, headers)
-            response = self.currentconn.getresponse()
-            newhash = response.getheader(HASH_MATCH_HEADER)
-            if newhash:
-                self._put_consistency_hash(newhash)
-            respstr = response.read()
-            respdata = respstr
-            if response.status in self.success_codes:
-                try:
-                    respdata = json.loads(respstr)
-                except ValueError:
-                    # response was not JSON, ignore the exception
-                    pass
-            ret = (response.status, response.reason, respstr, respdata)
-        except httplib.HTTPException:
-            # If we were using a cached connection, try again with a new one.
-            with excutils.save_and_reraise_exception() as ctxt:
-                self.currentconn.close()
-                if reconnect:
-                    # if reconnect is true, this was on a fresh connection so
-                    # reraise since this server seems to be broken
-                    ctxt.reraise = True
-                else:
-                    # if reconnect is false, it was a cached connection so
-                    # try one more time before re-raising
-                    ctxt.reraise = False
-            return self.rest_call(action, resource, data, headers,
-                                  timeout=timeout, reconnect=True)
-        except (socket.timeout, socket.error) as e:
-            self.currentconn.close()
-            LOG.error(_('ServerProxy: %(action)s failure, %(e)r'),
-                      {'action': action, 'e': e})
-            ret = 0, None, None, None
+        with self.conn_slots:
+            ret = self._send_request(action, uri, body, headers, timeout,
+                                     reconnect)
         LOG.debug(_("ServerProxy: status=%(status)d, reason=%(reason)r, "
                     "ret=%(ret)s, data=%(data)r"), {'status': ret[0],
                                                     'reason': ret[1],
@@ -215,6 +166,67 @@ class ServerProxy(object):
                                                     'data': ret[3]})
         return ret
 
+    def _get_connection(self, timeout, reconnect):
+        idle = self.idle_conns.get(timeout)
+        if idle and not reconnect:
+            return idle.pop()
+        if self.ssl:
+            conn = HTTPSConnectionWithValidation(
+                self.server, self.port, timeout=timeout)
+            if conn is None:
+                LOG.error(_('ServerProxy: Could not establish HTTPS '
+                            'connection'))
+                return None
+            conn.combined_cert = self.combined_cert
+        else:
+            conn = httplib.HTTPConnection(
+                self.server, self.port, timeout=timeout)
+            if conn is None:
+                LOG.error(_('ServerProxy: Could not establish HTTP '
+                            'connection'))
+                return None
+        return conn
+
+    def _send_request(self, action, uri, body, headers, timeout, reconnect):
+        while True:
+            conn = self._get_connection(timeout, reconnect)
+            if conn is None:
+                return 0, None, None, None
+            try:
+                conn.request(action, uri, body, headers)
+                response = conn.getresponse()
+                newhash = response.getheader(HASH_MATCH_HEADER)
+                if newhash:
+                    self._put_consistency_hash(newhash)
+                respstr = response.read()
+                respdata = respstr
+                if response.status in self.success_codes:
+                    try:
+                        respdata = json.loads(respstr)
+                    except ValueError:
+                        # response was not JSON, ignore the exception
+                        pass
+            except httplib.HTTPException:
+                conn.close()
+                # if reconnect is true, this was on a fresh connection so
+                # reraise since this server seems to be broken
+                if reconnect:
+                    raise
+                # otherwise it was a cached connection so try one more time
+                # with a new one before re-raising
+                reconnect = True
+                continue
+            except (socket.timeout, socket.error) as e:
+                conn.close()
+                LOG.error(_('ServerProxy: %(action)s failure, %(e)r'),
+                          {'action': action, 'e': e})
+                return 0, None, None, None
+            if reconnect:
+                conn.close()
+            else:
+                self.idle_conns.setdefault(timeout, []).append(conn)
+            return response.status, response.reason, respstr, respdata
+
     def _put_consistency_hash(self, newhash):
         self.mypool.consistency_hash = newhash
         cdb.put_consistency_hash(newhash)
@@ -236,6 +248,7 @@ class ServerPool(object):
         self.name = name
         self.timeout = cfg.CONF.RESTPROXY.server_timeout
         self.always_reconnect = not cfg.CONF.RESTPROXY.cache_connections
+        self.max_connections = cfg.CONF.RESTPROXY.server_max_connections
         default_port = 8000
         if timeout is not False:
             self.timeout = timeout
@@ -245,6 +258,10 @@ class ServerPool(object):
         self.get_topo_function = None
         self.get_topo_function_args = {}
 
+        # State of the background topology sync, see schedule_topology_sync
+        self.sync_thread = None
+        self.sync_pending = False
+
         # Hash to send to backend with request as expected previous
         # state to verify consistency.
         self.consistency_hash = cdb.get_consistency_hash()
@@ -284,7 +301,8 @@ class ServerPool(object):
         combined_cert = self._get_combined_cert_for_server(server, port)
         return ServerProxy(server, port, self.ssl, self.auth, self.neutron_id,
                            self.timeout, self.base_uri, self.name, mypool=self,
-                           combined_cert=combined_cert)
+                           combined_cert=combined_cert,
+                           max_connections=self.max_connections)
 
     def _get_combined_cert_for_server(self, server, port):
         # The ssl library requires a combined file with all trusted certs
@@ -390,23 +408,32 @@ class ServerPool(object):
         """
         return resp[0] in SUCCESS_CODES
 
-    @utils.synchronized('bsn-rest-call')
     def rest_call(self, action, resource, data, headers, ignore_codes,
                   timeout=False):
+        if 'consistency' in self.get_capabilities():
+            # Every request sends the hash the previous response left and
+            # every response replaces it, so requests to a backend checking
+            # consistency have to go one at a time.
+            return self._serialized_rest_call(action, resource, data,
+                                              headers, ignore_codes, timeout)
+        return self._rest_call(action, resource, data, headers, ignore_codes,
+                               timeout)
+
+    @utils.synchronized('bsn-rest-call')
+    def _serialized_rest_call(self, *args, **kwargs):
+        return self._rest_call(*args, **kwargs)
+
+    def _rest_call(self, action, resource, data, headers, ignore_codes,
+                   timeout=False):
         good_first = sorted(self.servers, key=lambda x: x.failed)
         first_response = None
         for active_server in good_first:
             ret = active_server.rest_call(action, resource, data, headers,
                                           timeout,
                                           reconnect=self.always_reconnect)
-            # If inconsistent, do a full synchronization
-            if ret[0] == httplib.CONFLICT:
-                if not self.get_topo_function:
-                    raise cfg.Error(_('Server requires synchronization, '
-                                      'but no topology function was defined.'))
-                data = self.get_topo_function(**self.get_topo_function_args)
-                active_server.rest_call('PUT', TOPOLOGY_PATH, data,
-                                        timeout=None)
+            # If inconsistent, do a full synchronization in the background
+            if ret[0] == httplib.CONFLICT and resource != TOPOLOGY_PATH:
+                self.schedule_topology_sync()
             # Store the first response as the error to be bubbled up to the
             # user since it was a good server. Subsequent servers will most
             # likely be cluster slaves and won't have a useful error for the
@@ -438,7 +465,7 @@ class ServerPool(object):
         return first_response
 
     def rest_action(self, action, resource, data='', errstr='%s',
-                    ignore_codes=[], headers={}, timeout=False):
+                    ignore_codes=[], headers=None, timeout=False):
         """
         Wrapper for rest_call that verifies success and raises a
         RemoteRestError on failure with a provided error string
@@ -544,6 +571,38 @@ class ServerPool(object):
         errstr = _("Unable to delete floating IP: %s")
         self.rest_action('DELETE', resource, errstr=errstr)
 
+    def schedule_topology_sync(self):
+        """Synchronize the controllers with Neutron in the background.
+
+        Conflicts reported while a sync is pending or running are folded
+        into it, so a burst of conflicting requests costs a single sync.
+        """
+        if not self.get_topo_function:
+            raise cfg.Error(_('Server requires synchronization, '
+                              'but no topology function was defined.'))
+        self.sync_pending = True
+        if not self.sync_thread:
+            self.sync_thread = eventlet.spawn(self._topology_sync_worker)
+
+    def _topology_sync_worker(self):
+        try:
+            while self.sync_pending:
+                self.sync_pending = False
+                try:
+                    self._sync_topology()
+                except Exception:
+                    LOG.exception(_("Topology synchronization with the "
+                                    "backend controller failed."))
+        finally:
+            self.sync_thread = None
+
+    def _sync_topology(self):
+        """Replace the topology of the controllers with Neutron's."""
+        LOG.info(_("Sending the full topology to the backend controller"))
+        data = self.get_topo_function(**self.get_topo_function_args)
+        errstr = _("Unable to update remote topology: %s")
+        self.rest_action('PUT', TOPOLOGY_PATH, data, errstr, timeout=None)
+
     def _consistency_watchdog(self, polling_interval=60):
         if 'consistency' not in self.get_capabilities():
             LOG.warning(_("Backend server(s) do not support automated "
@@ -30,6 +30,48 @@ ml2_opts = [
                 help=_("An ordered list of networking mechanism driver "
                        "entrypoints to be loaded from the "
                        "neutron.ml2.mechanism_drivers namespace.")),
+    cfg.ListOpt('async_postcommit_drivers',
+                default=[],
+                help=_("Mechanism drivers whose postcommit calls are recorded "
+                       "in a journal within the API transaction and "
+                       "dispatched by background workers, instead of being "
+                       "made while the API request waits. A failed call is "
+                       "retried but no longer rolls the resource back.")),
+    cfg.IntOpt('journal_workers',
+               default=4,
+               help=_("Number of journaled postcommit calls dispatched "
+                      "concurrently by each neutron server.")),
+    cfg.IntOpt('journal_batch_size',
+               default=50,
+               help=_("Number of journal entries claimed per database "
+                      "round trip.")),
+    cfg.IntOpt('journal_max_retries',
+               default=5,
+               help=_("Number of times a failed journaled postcommit call is "
+                      "retried before it is marked as failed. A failed "
+                      "entry blocks the later calls for the same driver "
+                      "and network until it is deleted from the "
+                      "ml2_postcommit_journal table.")),
+    cfg.IntOpt('journal_poll_interval',
+               default=2,
+               help=_("Seconds between journal polls when the journal is "
+                      "empty, also the base of the retry backoff.")),
+    cfg.BoolOpt('bulk_network_delete',
+                default=False,
+                help=_("Delete a network along with its auto-deleted ports "
+                       "and its subnets in a single transaction, rather "
+                       "than deleting each port and subnet separately "
+                       "first.")),
+    cfg.IntOpt('endpoint_cache_ttl',
+               default=60,
+               help=_("Seconds a cached tunnel endpoint list is served to "
+                      "agents before it is read from the database again. "
+                      "Endpoints registered through other neutron servers "
+                      "are only seen after a reload.")),
+    cfg.IntOpt('tunnel_update_delay',
+               default=1,
+               help=_("Seconds new tunnel endpoints are collected before "
+                      "they are announced to the agents.")),
 ]
 
 
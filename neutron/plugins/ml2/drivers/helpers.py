@@ -0,0 +1,148 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import random
+
+from six import moves
+import sqlalchemy as sa
+
+from neutron.openstack.common import log
+
+LOG = log.getLogger(__name__)
+
+# Segmentation ids reconciled per query, which bounds the number of ids
+# held in memory and the size of each bulk insert
+SYNC_CHUNK_SIZE = 10000
+
+# Free rows read by each attempt to allocate a segment, one of which is
+# claimed at random so concurrent allocations rarely go for the same row
+ALLOCATION_CANDIDATES = 64
+# Attempts to claim a free row before giving up
+MAX_ALLOCATION_ATTEMPTS = 10
+
+
+def merge_ranges(ranges):
+    """Return sorted, non-overlapping (min, max) ranges."""
+    merged = []
+    for seg_min, seg_max in sorted(ranges):
+        if merged and seg_min <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], seg_max))
+        else:
+            merged.append((seg_min, seg_max))
+    return merged
+
+
+def _in_ranges(column, ranges):
+    return sa.or_(*[column.between(seg_min, seg_max)
+                    for seg_min, seg_max in ranges])
+
+
+def sync_allocations(session, model, column, ranges, **fields):
+    """Reconcile an allocation table with the configured id ranges.
+
+    Unallocated rows outside the ranges are removed with a single DELETE.
+    Missing rows are found a chunk of ids at a time: a chunk is only read
+    back when a COUNT shows it is incomplete, so a table that is already
+    in sync costs one COUNT per range. The missing ids are added with
+    bulk INSERTs, without building ORM objects.
+
+    :param model: allocation model with an 'allocated' column
+    :param column: the segmentation id column of the model
+    :param ranges: list of (min, max) tuples, bounds included
+    :param fields: columns restricting the sync, e.g. physical_network,
+                   which are also set on inserted rows
+    :returns: tuple of the number of rows added and removed
+    """
+    ranges = merge_ranges(ranges)
+    query = session.query(model).filter_by(**fields)
+
+    stale = query.filter_by(allocated=False)
+    if ranges:
+        stale = stale.filter(~_in_ranges(column, ranges))
+    removed = stale.delete(synchronize_session=False)
+
+    added = 0
+    for seg_min, seg_max in ranges:
+        if (query.filter(column.between(seg_min, seg_max)).count() ==
+                seg_max - seg_min + 1):
+            continue
+        for start in moves.xrange(seg_min, seg_max + 1, SYNC_CHUNK_SIZE):
+            end = min(start + SYNC_CHUNK_SIZE - 1, seg_max)
+            existing = set(
+                row[0] for row in
+                session.query(column).filter_by(**fields).
+                filter(column.between(start, end)).with_lockmode('update'))
+            if len(existing) == end - start + 1:
+                continue
+            rows = [dict(fields, allocated=False, **{column.name: seg_id})
+                    for seg_id in moves.xrange(start, end + 1)
+                    if seg_id not in existing]
+            session.execute(model.__table__.insert(), rows)
+            added += len(rows)
+
+    if added or removed:
+        LOG.debug(_("Synchronized %(table)s %(fields)s: added %(added)d, "
+                    "removed %(removed)d"),
+                  {'table': model.__tablename__, 'fields': fields,
+                   'added': added, 'removed': removed})
+    return added, removed
+
+
+def allocate_unallocated(session, model, **filters):
+    """Allocate a random unallocated row of an allocation table.
+
+    A free row is picked at random among ALLOCATION_CANDIDATES read without
+    locks, then claimed with an UPDATE conditional on the row still being
+    free. An allocation losing the race for its row tries another one, up
+    to MAX_ALLOCATION_ATTEMPTS times, rather than waiting on row locks
+    held by the others. The rows already lost are left out of the next
+    read: in a REPEATABLE READ transaction every read sees the same
+    snapshot, where rows claimed by others since still look free.
+
+    :param model: allocation model with an 'allocated' column
+    :param filters: columns restricting the rows considered, e.g.
+                    physical_network
+    :returns: the allocated row, or None if none could be allocated
+    """
+    primary_key = model.__table__.primary_key.columns
+    lost = []
+    with session.begin(subtransactions=True):
+        for attempt in moves.xrange(MAX_ALLOCATION_ATTEMPTS):
+            query = session.query(model).filter_by(allocated=False,
+                                                   **filters)
+            if lost:
+                query = query.filter(~sa.or_(*[
+                    sa.and_(*[column == value
+                              for column, value in zip(primary_key, key)])
+                    for key in lost]))
+            candidates = query.limit(ALLOCATION_CANDIDATES).all()
+            if not candidates:
+                return
+            alloc = random.choice(candidates)
+            key = dict((column.name, getattr(alloc, column.name))
+                       for column in primary_key)
+            count = (session.query(model).
+                     filter_by(allocated=False, **key).
+                     update({'allocated': True}))
+            if count:
+                return alloc
+            lost.append([key[column.name] for column in primary_key])
+            LOG.debug(_("%(table)s %(key)s was allocated concurrently, "
+                        "attempt %(attempt)d"),
+                      {'table': model.__tablename__, 'key': key,
+                       'attempt': attempt + 1})
+    LOG.warning(_("Failed to allocate a row of %(table)s %(filters)s in "
+                  "%(attempts)d attempts"),
+                {'table': model.__tablename__, 'filters': filters,
+                 'attempts': MAX_ALLOCATION_ATTEMPTS})
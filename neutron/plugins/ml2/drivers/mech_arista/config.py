@@ -64,7 +64,14 @@ ARISTA_DRIVER_OPTS = [
                       'with the region name registered (or known) to keystone '
                       'service. Authentication with Keysotne is performed by '
                       'EOS. This is optional. If not set, a value of '
-                      '"RegionOne" is assumed.'))
+                      '"RegionOne" is assumed.')),
+    cfg.IntOpt('max_batched_operations',
+               default=50,
+               help=_('Maximum number of queued network and port operations '
+                      'of a tenant that are sent to EOS in a single eAPI '
+                      'call. Operations of different tenants are sent '
+                      'concurrently. This is optional. If not set, a value '
+                      'of 50 is assumed.'))
 ]
 
 cfg.CONF.register_opts(ARISTA_DRIVER_OPTS, "ml2_arista")
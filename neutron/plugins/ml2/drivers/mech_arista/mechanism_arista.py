@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
 import threading
 
 import jsonrpclib
@@ -20,6 +21,7 @@ from oslo.config import cfg
 
 from neutron.common import constants as n_const
 from neutron.extensions import portbindings
+from neutron.openstack.common import lockutils
 from neutron.openstack.common import log as logging
 from neutron.plugins.ml2.common import exceptions as ml2_exc
 from neutron.plugins.ml2 import driver_api
@@ -131,8 +133,14 @@ class AristaRPCWrapper(object):
         :param tenant_id: globally unique neutron tenant identifier
         :param port_name: Name of the port - for display purposes
         """
-        cmds = ['tenant %s' % tenant_id,
-                'vm id %s hostid %s' % (vm_id, host)]
+        cmds = ['tenant %s' % tenant_id]
+        cmds.extend(self._plug_host_cmds(vm_id, host, port_id, network_id,
+                                         port_name))
+        cmds.append('exit')
+        self._run_openstack_cmds(cmds)
+
+    def _plug_host_cmds(self, vm_id, host, port_id, network_id, port_name):
+        cmds = ['vm id %s hostid %s' % (vm_id, host)]
         if port_name:
             cmds.append('port id %s name "%s" network-id %s' %
                         (port_id, port_name, network_id))
@@ -140,8 +148,7 @@ class AristaRPCWrapper(object):
             cmds.append('port id %s network-id %s' %
                         (port_id, network_id))
         cmds.append('exit')
-        cmds.append('exit')
-        self._run_openstack_cmds(cmds)
+        return cmds
 
     def plug_dhcp_port_into_network(self, dhcp_id, host, port_id,
                                     network_id, tenant_id, port_name):
@@ -154,8 +161,14 @@ class AristaRPCWrapper(object):
         :param tenant_id: globally unique neutron tenant identifier
         :param port_name: Name of the port - for display purposes
         """
-        cmds = ['tenant %s' % tenant_id,
-                'network id %s' % network_id]
+        cmds = ['tenant %s' % tenant_id]
+        cmds.extend(self._plug_dhcp_port_cmds(dhcp_id, host, port_id,
+                                              network_id, port_name))
+        self._run_openstack_cmds(cmds)
+
+    def _plug_dhcp_port_cmds(self, dhcp_id, host, port_id, network_id,
+                             port_name):
+        cmds = ['network id %s' % network_id]
         if port_name:
             cmds.append('dhcp id %s hostid %s port-id %s name "%s"' %
                         (dhcp_id, host, port_id, port_name))
@@ -163,7 +176,7 @@ class AristaRPCWrapper(object):
             cmds.append('dhcp id %s hostid %s port-id %s' %
                         (dhcp_id, host, port_id))
         cmds.append('exit')
-        self._run_openstack_cmds(cmds)
+        return cmds
 
     def unplug_host_from_network(self, vm_id, host, port_id,
                                  network_id, tenant_id):
@@ -175,12 +188,15 @@ class AristaRPCWrapper(object):
         :param network_id: globally unique neutron network identifier
         :param tenant_id: globally unique neutron tenant identifier
         """
-        cmds = ['tenant %s' % tenant_id,
-                'vm id %s hostid %s' % (vm_id, host),
+        cmds = ['tenant %s' % tenant_id]
+        cmds.extend(self._unplug_host_cmds(vm_id, host, port_id))
+        cmds.append('exit')
+        self._run_openstack_cmds(cmds)
+
+    def _unplug_host_cmds(self, vm_id, host, port_id):
+        return ['vm id %s hostid %s' % (vm_id, host),
                 'no port id %s' % port_id,
-                'exit',
                 'exit']
-        self._run_openstack_cmds(cmds)
 
     def unplug_dhcp_port_from_network(self, dhcp_id, host, port_id,
                                       network_id, tenant_id):
@@ -192,11 +208,60 @@ class AristaRPCWrapper(object):
         :param network_id: globally unique neutron network identifier
         :param tenant_id: globally unique neutron tenant identifier
         """
-        cmds = ['tenant %s' % tenant_id,
-                'network id %s' % network_id,
+        cmds = ['tenant %s' % tenant_id]
+        cmds.extend(self._unplug_dhcp_port_cmds(dhcp_id, port_id,
+                                                network_id))
+        self._run_openstack_cmds(cmds)
+
+    def _unplug_dhcp_port_cmds(self, dhcp_id, port_id, network_id):
+        return ['network id %s' % network_id,
                 'no dhcp id %s port-id %s' % (dhcp_id, port_id),
                 'exit']
-        self._run_openstack_cmds(cmds)
+
+    def plug_port_cmds(self, vm_id, host_id, port_id, net_id, port_name,
+                       device_owner):
+        """Returns the tenant mode commands plugging a port into a network.
+
+        The commands return to tenant mode, so that the commands of
+        several operations on a tenant can be sent with run_tenant_cmds.
+        See plug_port_into_network for the parameters.
+        """
+        if device_owner == n_const.DEVICE_OWNER_DHCP:
+            return self._plug_dhcp_port_cmds(vm_id, host_id, port_id,
+                                             net_id, port_name)
+        elif device_owner.startswith('compute'):
+            return self._plug_host_cmds(vm_id, host_id, port_id, net_id,
+                                        port_name)
+        return []
+
+    def unplug_port_cmds(self, vm_id, host_id, port_id, net_id,
+                         device_owner):
+        """Returns the tenant mode commands unplugging a port."""
+        if device_owner == n_const.DEVICE_OWNER_DHCP:
+            return self._unplug_dhcp_port_cmds(vm_id, port_id, net_id)
+        return self._unplug_host_cmds(vm_id, host_id, port_id)
+
+    def create_network_cmds(self, network):
+        """Returns the tenant mode commands creating a network.
+
+        :param network: dict containing network_id, network_name and
+                        segmentation_id
+        """
+        cmds = self._network_cmds(network)
+        cmds.extend(self._get_exit_mode_cmds(['segment', 'network']))
+        return cmds
+
+    def delete_network_cmds(self, network_id):
+        """Returns the tenant mode command deleting a network."""
+        return ['no network id %s' % network_id]
+
+    def run_tenant_cmds(self, tenant_id, cmds):
+        """Runs commands built by the *_cmds methods for a tenant.
+
+        :param tenant_id: globally unique neutron tenant identifier
+        :param cmds: tenant mode commands, possibly of several operations
+        """
+        self._run_openstack_cmds(['tenant %s' % tenant_id] + cmds + ['exit'])
 
     def create_network(self, tenant_id, network):
         """Creates a single network on Arista hardware
@@ -215,20 +280,21 @@ class AristaRPCWrapper(object):
                              and segmentation_id
         """
         cmds = ['tenant %s' % tenant_id]
-        # Create a reference to function to avoid name lookups in the loop
-        append_cmd = cmds.append
         for network in network_list:
-            try:
-                append_cmd('network id %s name "%s"' %
-                           (network['network_id'], network['network_name']))
-            except KeyError:
-                append_cmd('network id %s' % network['network_id'])
-            # Enter segment mode without exiting out of network mode
-            append_cmd('segment 1 type vlan id %d' %
-                       network['segmentation_id'])
+            cmds.extend(self._network_cmds(network))
         cmds.extend(self._get_exit_mode_cmds(['segment', 'network', 'tenant']))
         self._run_openstack_cmds(cmds)
 
+    def _network_cmds(self, network):
+        try:
+            cmds = ['network id %s name "%s"' %
+                    (network['network_id'], network['network_name'])]
+        except KeyError:
+            cmds = ['network id %s' % network['network_id']]
+        # Enter segment mode without exiting out of network mode
+        cmds.append('segment 1 type vlan id %d' % network['segmentation_id'])
+        return cmds
+
     def create_network_segments(self, tenant_id, network_id,
                                 network_name, segments):
         """Creates a network on Arista Hardware
@@ -653,6 +719,151 @@ class SyncService(object):
         return vms
 
 
+class SharedLock(object):
+    """Lock that is either held shared or held exclusively.
+
+    Driver operations hold it shared, so that they only exclude each other
+    per tenant, and the sync thread holds it exclusively while it compares
+    Neutron and EOS. A waiting exclusive holder blocks new shared holders,
+    so the sync can't be starved.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._shared = 0
+        self._exclusive = False
+        self._exclusive_waiting = 0
+
+    @contextlib.contextmanager
+    def shared(self):
+        with self._cond:
+            while self._exclusive or self._exclusive_waiting:
+                self._cond.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._shared -= 1
+                if not self._shared:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._exclusive_waiting += 1
+            while self._exclusive or self._shared:
+                self._cond.wait()
+            self._exclusive_waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+class _QueuedCommands(object):
+
+    def __init__(self, cmds):
+        self.cmds = cmds
+        self.error = None
+        self.sent = False
+        # Set once the commands are sent, or when the operation becomes
+        # the sender of its tenant's queue
+        self.wakeup = threading.Event()
+
+
+class TenantCommandBatcher(object):
+    """Sends the EOS commands of concurrent operations per tenant.
+
+    Operations queue their tenant mode commands. The first operation to
+    find its tenant idle sends everything queued for the tenant in one
+    eAPI call, while the other operations wait for the outcome of the call
+    that carried their commands. The sender then returns and hands the
+    sender role over to the first operation still queued, so an API
+    request only ever waits for a single call. A tenant has at most one
+    call in flight, so its operations reach EOS in order, and different
+    tenants don't wait for each other. When a batched call fails, its
+    operations are resent one by one, so only the operations whose own
+    commands fail get the error.
+    """
+
+    def __init__(self, rpc, max_batch):
+        self._rpc = rpc
+        self._max_batch = max_batch
+        self._lock = threading.Lock()
+        self._queues = {}
+
+    def run(self, tenant_id, cmds):
+        """Sends the commands of an operation on a tenant to EOS.
+
+        :raises: AristaRpcError if the commands could not be applied
+        """
+        if not cmds:
+            return
+        op = _QueuedCommands(cmds)
+        with self._lock:
+            sender = tenant_id not in self._queues
+            self._queues.setdefault(tenant_id, []).append(op)
+        if not sender:
+            op.wakeup.wait()
+        if not op.sent:
+            # The tenant was idle, or the previous sender handed over
+            self._send(tenant_id)
+        if op.error:
+            raise op.error
+
+    def _send(self, tenant_id):
+        # The operation of the caller is the first one of the queue
+        with self._lock:
+            queue = self._queues[tenant_id]
+            batch = queue[:self._max_batch]
+            del queue[:self._max_batch]
+        completed = False
+        try:
+            self._send_batch(tenant_id, batch)
+            completed = True
+        finally:
+            with self._lock:
+                for op in batch:
+                    if not completed:
+                        op.error = arista_exc.AristaRpcError(
+                            msg=_('Sending the tenant commands was '
+                                  'interrupted'))
+                    op.sent = True
+                    op.wakeup.set()
+                if queue:
+                    queue[0].wakeup.set()
+                else:
+                    del self._queues[tenant_id]
+
+    def _send_batch(self, tenant_id, batch):
+        cmds = []
+        for op in batch:
+            cmds.extend(op.cmds)
+        try:
+            self._rpc.run_tenant_cmds(tenant_id, cmds)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].error = e
+            else:
+                self._send_one_by_one(tenant_id, batch)
+
+    def _send_one_by_one(self, tenant_id, batch):
+        # EOS stops at the first failing command of a call, so operations
+        # queued before the bad one are already applied and the eAPI error
+        # doesn't say which command failed. Resending each operation alone
+        # finds the ones that really fail; the tenant commands set state,
+        # so applying them twice is harmless.
+        for op in batch:
+            try:
+                self._rpc.run_tenant_cmds(tenant_id, op.cmds)
+            except Exception as e:
+                op.error = e
+
+
 class AristaDriver(driver_api.MechanismDriver):
     """Ml2 Mechanism driver for Arista networking hardware.
 
@@ -673,7 +884,22 @@ class AristaDriver(driver_api.MechanismDriver):
         self.timer = None
         self.eos = SyncService(self.rpc, self.ndb)
         self.sync_timeout = confg['sync_interval']
-        self.eos_sync_lock = threading.Lock()
+        # Operations of different tenants run concurrently, the sync
+        # thread excludes all of them
+        self.sync_lock = SharedLock()
+        self.batcher = TenantCommandBatcher(self.rpc,
+                                            confg['max_batched_operations'])
+
+    @contextlib.contextmanager
+    def _tenant_lock(self, tenant_id):
+        """Serializes the DB updates of operations on a tenant."""
+        with self.sync_lock.shared():
+            with lockutils.lock('arista-tenant-%s' % tenant_id):
+                yield
+
+    def _run_tenant_cmds(self, tenant_id, cmds):
+        with self.sync_lock.shared():
+            self.batcher.run(tenant_id, cmds)
 
     def initialize(self):
         self.rpc.register_with_eos()
@@ -692,7 +918,7 @@ class AristaDriver(driver_api.MechanismDriver):
         network_id = network['id']
         tenant_id = network['tenant_id']
         segmentation_id = segments[0]['segmentation_id']
-        with self.eos_sync_lock:
+        with self._tenant_lock(tenant_id):
             db.remember_tenant(tenant_id)
             db.remember_network(tenant_id,
                                 network_id,
@@ -707,21 +933,21 @@ class AristaDriver(driver_api.MechanismDriver):
         tenant_id = network['tenant_id']
         segments = context.network_segments
         vlan_id = segments[0]['segmentation_id']
-        with self.eos_sync_lock:
-            if db.is_network_provisioned(tenant_id, network_id):
-                try:
-                    network_dict = {
-                        'network_id': network_id,
-                        'segmentation_id': vlan_id,
-                        'network_name': network_name}
-                    self.rpc.create_network(tenant_id, network_dict)
-                except arista_exc.AristaRpcError:
-                    LOG.info(EOS_UNREACHABLE_MSG)
-                    raise ml2_exc.MechanismDriverError()
-            else:
-                msg = _('Network %s is not created as it is not found in'
-                        'Arista DB') % network_id
-                LOG.info(msg)
+        if db.is_network_provisioned(tenant_id, network_id):
+            try:
+                network_dict = {
+                    'network_id': network_id,
+                    'segmentation_id': vlan_id,
+                    'network_name': network_name}
+                self._run_tenant_cmds(
+                    tenant_id, self.rpc.create_network_cmds(network_dict))
+            except arista_exc.AristaRpcError:
+                LOG.info(EOS_UNREACHABLE_MSG)
+                raise ml2_exc.MechanismDriverError()
+        else:
+            msg = _('Network %s is not created as it is not found in'
+                    'Arista DB') % network_id
+            LOG.info(msg)
 
     def update_network_precommit(self, context):
         """At the moment we only support network name change
@@ -749,28 +975,28 @@ class AristaDriver(driver_api.MechanismDriver):
             network_name = new_network['name']
             tenant_id = new_network['tenant_id']
             vlan_id = new_network['provider:segmentation_id']
-            with self.eos_sync_lock:
-                if db.is_network_provisioned(tenant_id, network_id):
-                    try:
-                        network_dict = {
-                            'network_id': network_id,
-                            'segmentation_id': vlan_id,
-                            'network_name': network_name}
-                        self.rpc.create_network(tenant_id, network_dict)
-                    except arista_exc.AristaRpcError:
-                        LOG.info(EOS_UNREACHABLE_MSG)
-                        raise ml2_exc.MechanismDriverError()
-                else:
-                    msg = _('Network %s is not updated as it is not found in'
-                            'Arista DB') % network_id
-                    LOG.info(msg)
+            if db.is_network_provisioned(tenant_id, network_id):
+                try:
+                    network_dict = {
+                        'network_id': network_id,
+                        'segmentation_id': vlan_id,
+                        'network_name': network_name}
+                    self._run_tenant_cmds(
+                        tenant_id, self.rpc.create_network_cmds(network_dict))
+                except arista_exc.AristaRpcError:
+                    LOG.info(EOS_UNREACHABLE_MSG)
+                    raise ml2_exc.MechanismDriverError()
+            else:
+                msg = _('Network %s is not updated as it is not found in'
+                        'Arista DB') % network_id
+                LOG.info(msg)
 
     def delete_network_precommit(self, context):
         """Delete the network infromation from the DB."""
         network = context.current
         network_id = network['id']
         tenant_id = network['tenant_id']
-        with self.eos_sync_lock:
+        with self._tenant_lock(tenant_id):
             if db.is_network_provisioned(tenant_id, network_id):
                 db.forget_network(tenant_id, network_id)
             # if necessary, delete tenant as well.
@@ -781,16 +1007,16 @@ class AristaDriver(driver_api.MechanismDriver):
         network = context.current
         network_id = network['id']
         tenant_id = network['tenant_id']
-        with self.eos_sync_lock:
 
-            # Succeed deleting network in case EOS is not accessible.
-            # EOS state will be updated by sync thread once EOS gets
-            # alive.
-            try:
-                self.rpc.delete_network(tenant_id, network_id)
-            except arista_exc.AristaRpcError:
-                LOG.info(EOS_UNREACHABLE_MSG)
-                raise ml2_exc.MechanismDriverError()
+        # Succeed deleting network in case EOS is not accessible.
+        # EOS state will be updated by sync thread once EOS gets
+        # alive.
+        try:
+            self._run_tenant_cmds(tenant_id,
+                                  self.rpc.delete_network_cmds(network_id))
+        except arista_exc.AristaRpcError:
+            LOG.info(EOS_UNREACHABLE_MSG)
+            raise ml2_exc.MechanismDriverError()
 
     def create_port_precommit(self, context):
         """Remember the infromation about a VM and its ports
@@ -809,7 +1035,7 @@ class AristaDriver(driver_api.MechanismDriver):
             port_id = port['id']
             network_id = port['network_id']
             tenant_id = port['tenant_id']
-            with self.eos_sync_lock:
+            with self._tenant_lock(tenant_id):
                 db.remember_vm(device_id, host, port_id,
                                network_id, tenant_id)
 
@@ -831,31 +1057,21 @@ class AristaDriver(driver_api.MechanismDriver):
             port_name = port['name']
             network_id = port['network_id']
             tenant_id = port['tenant_id']
-            with self.eos_sync_lock:
-                hostname = self._host_name(host)
-                vm_provisioned = db.is_vm_provisioned(device_id,
-                                                      host,
-                                                      port_id,
-                                                      network_id,
-                                                      tenant_id)
-                net_provisioned = db.is_network_provisioned(tenant_id,
-                                                            network_id)
-                if vm_provisioned and net_provisioned:
-                    try:
-                        self.rpc.plug_port_into_network(device_id,
-                                                        hostname,
-                                                        port_id,
-                                                        network_id,
-                                                        tenant_id,
-                                                        port_name,
-                                                        device_owner)
-                    except arista_exc.AristaRpcError:
-                        LOG.info(EOS_UNREACHABLE_MSG)
-                        raise ml2_exc.MechanismDriverError()
-                else:
-                    msg = _('VM %s is not created as it is not found in '
-                            'Arista DB') % device_id
-                    LOG.info(msg)
+            hostname = self._host_name(host)
+            vm_provisioned = db.is_vm_provisioned(device_id,
+                                                  host,
+                                                  port_id,
+                                                  network_id,
+                                                  tenant_id)
+            net_provisioned = db.is_network_provisioned(tenant_id,
+                                                        network_id)
+            if vm_provisioned and net_provisioned:
+                self._plug_port(device_id, hostname, port_id, network_id,
+                                tenant_id, port_name, device_owner)
+            else:
+                msg = _('VM %s is not created as it is not found in '
+                        'Arista DB') % device_id
+                LOG.info(msg)
 
     def update_port_precommit(self, context):
         """Update the name of a given port.
@@ -893,34 +1109,34 @@ class AristaDriver(driver_api.MechanismDriver):
             port_name = port['name']
             network_id = port['network_id']
             tenant_id = port['tenant_id']
-            with self.eos_sync_lock:
-                hostname = self._host_name(host)
-                segmentation_id = db.get_segmentation_id(tenant_id,
-                                                         network_id)
-                vm_provisioned = db.is_vm_provisioned(device_id,
-                                                      host,
-                                                      port_id,
-                                                      network_id,
-                                                      tenant_id)
-                net_provisioned = db.is_network_provisioned(tenant_id,
-                                                            network_id,
-                                                            segmentation_id)
-                if vm_provisioned and net_provisioned:
-                    try:
-                        self.rpc.plug_port_into_network(device_id,
-                                                        hostname,
-                                                        port_id,
+            hostname = self._host_name(host)
+            segmentation_id = db.get_segmentation_id(tenant_id,
+                                                     network_id)
+            vm_provisioned = db.is_vm_provisioned(device_id,
+                                                  host,
+                                                  port_id,
+                                                  network_id,
+                                                  tenant_id)
+            net_provisioned = db.is_network_provisioned(tenant_id,
                                                         network_id,
-                                                        tenant_id,
-                                                        port_name,
-                                                        device_owner)
-                    except arista_exc.AristaRpcError:
-                        LOG.info(EOS_UNREACHABLE_MSG)
-                        raise ml2_exc.MechanismDriverError()
-                else:
-                    msg = _('VM %s is not updated as it is not found in '
-                            'Arista DB') % device_id
-                    LOG.info(msg)
+                                                        segmentation_id)
+            if vm_provisioned and net_provisioned:
+                self._plug_port(device_id, hostname, port_id, network_id,
+                                tenant_id, port_name, device_owner)
+            else:
+                msg = _('VM %s is not updated as it is not found in '
+                        'Arista DB') % device_id
+                LOG.info(msg)
+
+    def _plug_port(self, device_id, hostname, port_id, network_id,
+                   tenant_id, port_name, device_owner):
+        cmds = self.rpc.plug_port_cmds(device_id, hostname, port_id,
+                                       network_id, port_name, device_owner)
+        try:
+            self._run_tenant_cmds(tenant_id, cmds)
+        except arista_exc.AristaRpcError:
+            LOG.info(EOS_UNREACHABLE_MSG)
+            raise ml2_exc.MechanismDriverError()
 
     def delete_port_precommit(self, context):
         """Delete information about a VM and host from the DB."""
@@ -931,7 +1147,7 @@ class AristaDriver(driver_api.MechanismDriver):
         tenant_id = port['tenant_id']
         network_id = port['network_id']
         port_id = port['id']
-        with self.eos_sync_lock:
+        with self._tenant_lock(tenant_id):
             if db.is_vm_provisioned(device_id, host_id, port_id,
                                     network_id, tenant_id):
                 db.forget_vm(device_id, host_id, port_id,
@@ -953,21 +1169,11 @@ class AristaDriver(driver_api.MechanismDriver):
         tenant_id = port['tenant_id']
         device_owner = port['device_owner']
 
+        hostname = self._host_name(host)
+        cmds = self.rpc.unplug_port_cmds(device_id, hostname, port_id,
+                                         network_id, device_owner)
         try:
-            with self.eos_sync_lock:
-                hostname = self._host_name(host)
-                if device_owner == n_const.DEVICE_OWNER_DHCP:
-                    self.rpc.unplug_dhcp_port_from_network(device_id,
-                                                           hostname,
-                                                           port_id,
-                                                           network_id,
-                                                           tenant_id)
-                else:
-                    self.rpc.unplug_host_from_network(device_id,
-                                                      hostname,
-                                                      port_id,
-                                                      network_id,
-                                                      tenant_id)
+            self._run_tenant_cmds(tenant_id, cmds)
         except arista_exc.AristaRpcError:
             LOG.info(EOS_UNREACHABLE_MSG)
             raise ml2_exc.MechanismDriverError()
@@ -988,7 +1194,7 @@ class AristaDriver(driver_api.MechanismDriver):
         return hostname if fqdns_used else hostname.split('.')[0]
 
     def _synchronization_thread(self):
-        with self.eos_sync_lock:
+        with self.sync_lock.exclusive():
             self.eos.synchronize()
 
         self.timer = threading.Timer(self.sync_timeout,
@@ -15,14 +15,17 @@
 # @author: Kyle Mestery, Cisco Systems, Inc.
 # @author: Dave Tucker, Hewlett-Packard Development Company L.P.
 
+import copy
 import time
 
+from eventlet import greenthread
 from oslo.config import cfg
 import requests
 
 from neutron.common import constants as n_const
 from neutron.common import exceptions as n_exc
 from neutron.common import utils
+from neutron import context as n_context
 from neutron.extensions import portbindings
 from neutron.openstack.common import excutils
 from neutron.openstack.common import jsonutils
@@ -54,6 +57,12 @@ odl_opts = [
                help=_("HTTP timeout in seconds.")),
     cfg.IntOpt('session_timeout', default=30,
                help=_("Tomcat session timeout in minutes.")),
+    cfg.IntOpt('sync_page_size', default=500,
+               help=_("Number of objects fetched from OpenDaylight per "
+                      "request during a full resync.")),
+    cfg.IntOpt('sync_batch_size', default=100,
+               help=_("Maximum number of objects created in OpenDaylight "
+                      "by a single bulk request during a full resync.")),
 ]
 
 cfg.CONF.register_opts(odl_opts, "ml2_odl")
@@ -135,6 +144,8 @@ class OpenDaylightMechanismDriver(api.MechanismDriver):
     """
     auth = None
     out_of_sync = True
+    _sync_thread = None
+    _resync_requested = False
 
     def initialize(self):
         self.url = cfg.CONF.ml2_odl.url
@@ -146,6 +157,11 @@ class OpenDaylightMechanismDriver(api.MechanismDriver):
             if not getattr(self, opt):
                 raise cfg.RequiredOptError(opt, 'ml2_odl')
         self.auth = JsessionId(self.url, self.username, self.password)
+        self.page_size = cfg.CONF.ml2_odl.sync_page_size
+        self.batch_size = cfg.CONF.ml2_odl.sync_batch_size
+        # A single session keeps the connection to ODL alive across
+        # requests.
+        self.session = requests.Session()
         self.vif_type = portbindings.VIF_TYPE_OVS
         self.vif_details = {portbindings.CAP_PORT_FILTER: True}
 
@@ -181,7 +197,7 @@ class OpenDaylightMechanismDriver(api.MechanismDriver):
     def synchronize(self, operation, object_type, context):
         """Synchronize ODL with Neutron following a configuration change."""
         if self.out_of_sync:
-            self.sync_full(context)
+            self.schedule_full_sync(context)
         else:
             self.sync_object(operation, object_type, context)
 
@@ -201,30 +217,108 @@ class OpenDaylightMechanismDriver(api.MechanismDriver):
         port['mac_address'] = port['mac_address'].upper()
         try_del(port, ['status'])
 
+    def schedule_full_sync(self, context):
+        """Resync the entire database to ODL in the background.
+
+        The operation which noticed the desync is picked up by the resync,
+        which reads the Neutron DB after it has been committed. Requests
+        made while a resync is running get it to run once more.
+        """
+        self._resync_requested = True
+        if self._sync_thread is None:
+            self._sync_thread = greenthread.spawn(self._full_sync_loop,
+                                                  context)
+
+    def _full_sync_loop(self, context):
+        try:
+            while self._resync_requested:
+                self._resync_requested = False
+                try:
+                    self.sync_full(context)
+                except Exception:
+                    # The next operation schedules another attempt.
+                    LOG.exception(_("Full resync to OpenDaylight failed"))
+                    self.out_of_sync = True
+                    break
+        finally:
+            self._sync_thread = None
+
+    def get_resources(self, collection_name):
+        """Return all the objects of a collection from ODL, by id.
+
+        Objects are fetched page_size at a time, using the id of the last
+        object received as the marker of the next page. Controllers which
+        don't paginate return the whole collection at once.
+        """
+        resources = {}
+        marker = None
+        while True:
+            urlpath = '%s?limit=%d' % (collection_name, self.page_size)
+            if marker:
+                urlpath += '&marker=%s' % marker
+            r = self.sendjson('get', urlpath, None)
+            page = jsonutils.loads(r.content).get(collection_name) or []
+            new = [obj for obj in page if obj['id'] not in resources]
+            for obj in new:
+                resources[obj['id']] = obj
+            if len(page) < self.page_size or not new:
+                return resources
+            marker = page[-1]['id']
+
+    @staticmethod
+    def _differs(resource, odl_resource):
+        """Check whether ODL has other values than Neutron for a resource.
+
+        Only attributes known to ODL are compared. Security groups are
+        compared by id.
+        """
+        for key, value in resource.iteritems():
+            if key not in odl_resource:
+                continue
+            odl_value = odl_resource[key]
+            if key == 'security_groups':
+                value = sorted(sg['id'] for sg in value)
+                odl_value = sorted(sg['id'] if isinstance(sg, dict) else sg
+                                   for sg in odl_value or [])
+            if value != odl_value:
+                return True
+        return False
+
     def sync_resources(self, resource_name, collection_name, resources,
-                       context, dbcontext, attr_filter):
+                       odl_resources, context, dbcontext, attr_filter_create,
+                       attr_filter_update):
         """Sync objects from Neutron over to OpenDaylight.
 
         This will handle syncing networks, subnets, and ports from Neutron to
-        OpenDaylight. It also filters out the requisite items which are not
-        valid for create API operations.
+        OpenDaylight. ODL's copy of the collection, as returned by
+        get_resources, is diffed against the Neutron one: missing objects
+        are created by bulk requests of up to batch_size objects and objects
+        with stale attributes are updated. Returns the ids of the objects
+        ODL has and Neutron doesn't.
         """
-        to_be_synced = []
+        odl_resources = dict(odl_resources)
+        to_be_created = []
         for resource in resources:
-            try:
+            odl_resource = odl_resources.pop(resource['id'], None)
+            if odl_resource is None:
+                attr_filter_create(self, resource, context, dbcontext)
+                to_be_created.append(resource)
+                continue
+            update = copy.deepcopy(resource)
+            attr_filter_update(self, update, context, dbcontext)
+            if self._differs(update, odl_resource):
                 urlpath = collection_name + '/' + resource['id']
-                self.sendjson('get', urlpath, None)
-            except requests.exceptions.HTTPError as e:
-                with excutils.save_and_reraise_exception() as ctx:
-                    if e.response.status_code == 404:
-                        attr_filter(resource, context, dbcontext)
-                        to_be_synced.append(resource)
-                        ctx.reraise = False
-
-        key = resource_name if len(to_be_synced) == 1 else collection_name
+                self.sendjson('put', urlpath, {resource_name: update})
 
-        # 400 errors are returned if an object exists, which we ignore.
-        self.sendjson('post', collection_name, {key: to_be_synced}, [400])
+        for i in range(0, len(to_be_created), self.batch_size):
+            batch = to_be_created[i:i + self.batch_size]
+            if len(batch) == 1:
+                obj = {resource_name: batch[0]}
+            else:
+                obj = {collection_name: batch}
+            # 400 errors are returned if an object exists, which we ignore.
+            self.sendjson('post', collection_name, obj, [400])
+        return odl_resources.keys()
 
     @utils.synchronized('odl-sync-full')
     def sync_full(self, context):
@@ -233,22 +327,26 @@ class OpenDaylightMechanismDriver(api.MechanismDriver):
         Transition to the in-sync state on success.
         Note: we only allow a single thead in here at a time.
         """
-        if not self.out_of_sync:
-            return
-        dbcontext = context._plugin_context
-        networks = context._plugin.get_networks(dbcontext)
-        subnets = context._plugin.get_subnets(dbcontext)
-        ports = context._plugin.get_ports(dbcontext)
-
-        self.sync_resources(ODL_NETWORK, ODL_NETWORKS, networks,
-                            context, dbcontext,
-                            self.filter_create_network_attributes)
-        self.sync_resources(ODL_SUBNET, ODL_SUBNETS, subnets,
-                            context, dbcontext,
-                            self.filter_create_subnet_attributes)
-        self.sync_resources(ODL_PORT, ODL_PORTS, ports,
-                            context, dbcontext,
-                            self.filter_create_port_attributes)
+        dbcontext = n_context.get_admin_context()
+        # ODL's state is fetched before Neutron's so an object deleted in
+        # the meantime is seen as stale rather than recreated.
+        stale = {}
+        for resource_name, collection_name in ((ODL_NETWORK, ODL_NETWORKS),
+                                               (ODL_SUBNET, ODL_SUBNETS),
+                                               (ODL_PORT, ODL_PORTS)):
+            getter = getattr(context._plugin, 'get_%s' % collection_name)
+            odl_resources = self.get_resources(collection_name)
+            stale[collection_name] = self.sync_resources(
+                resource_name, collection_name, getter(dbcontext),
+                odl_resources, context, dbcontext,
+                self.create_object_map[collection_name],
+                self.update_object_map[collection_name])
+
+        # Dependent objects go first.
+        for collection_name in (ODL_PORTS, ODL_SUBNETS, ODL_NETWORKS):
+            for obj_id in stale[collection_name]:
+                self.sendjson('delete', collection_name + '/' + obj_id,
+                              None, [404])
         self.out_of_sync = False
 
     def filter_update_network_attributes(self, network, context, dbcontext):
@@ -332,14 +430,15 @@ class OpenDaylightMechanismDriver(api.MechanismDriver):
         url = '/'.join([self.url, urlpath])
         LOG.debug(_('ODL-----> sending URL (%s) <-----ODL') % url)
         LOG.debug(_('ODL-----> sending JSON (%s) <-----ODL') % obj)
-        r = requests.request(method, url=url,
-                             headers=headers, data=data,
-                             auth=self.auth, timeout=self.timeout)
+        r = self.session.request(method, url=url,
+                                 headers=headers, data=data,
+                                 auth=self.auth, timeout=self.timeout)
 
         # ignorecodes contains a list of HTTP error codes to ignore.
         if r.status_code in ignorecodes:
             return
         r.raise_for_status()
+        return r
 
     def bind_port(self, context):
         LOG.debug(_("Attempting to bind port %(port)s on "
@@ -13,11 +13,18 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 import abc
+import time
+
+from eventlet import greenthread
+from eventlet import semaphore
+from oslo.config import cfg
 import six
 
 from neutron.common import exceptions as exc
 from neutron.common import topics
+from neutron import context as n_context
 from neutron.openstack.common import log
+from neutron.plugins.ml2 import config  # noqa
 from neutron.plugins.ml2 import driver_api as api
 
 LOG = log.getLogger(__name__)
@@ -85,17 +92,117 @@ class TunnelTypeDriver(api.TypeDriver):
                 raise exc.InvalidInput(error_message=msg)
 
 
+class EndpointCache(object):
+    """In-memory copy of the endpoints of one tunnel type.
+
+    The version is bumped whenever the set of endpoints changes.  The
+    endpoint list is replaced rather than modified, so a list handed out
+    to an RPC reply stays consistent with the version it was read at.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.tunnels = []
+        self.ips = set()
+        self.loaded_at = None
+        # Number of loads, and the load each endpoint was last served
+        self.loads = 0
+        self.synced = {}
+
+    def expired(self, ttl):
+        return self.loaded_at is None or time.time() - self.loaded_at > ttl
+
+    def fresh_for(self, tunnel_ip, ttl):
+        """Whether the list can be served to an endpoint without a reload.
+
+        The list must have been reloaded since the last sync of the
+        endpoint: an agent that restarts may have missed the announcements
+        of the endpoints registered through other servers meanwhile.
+        """
+        return (tunnel_ip in self.ips and not self.expired(ttl) and
+                self.loads > self.synced.get(tunnel_ip, self.loads))
+
+    def load(self, tunnels):
+        ips = set(tunnel['ip_address'] for tunnel in tunnels)
+        if ips != self.ips:
+            self.version += 1
+        self.tunnels = tunnels
+        self.ips = ips
+        self.loaded_at = time.time()
+        self.loads += 1
+
+    def served(self, tunnel_ip):
+        self.synced[tunnel_ip] = self.loads
+
+
 class TunnelRpcCallbackMixin(object):
 
     def __init__(self, notifier, type_manager):
         self.notifier = notifier
         self.type_manager = type_manager
+        self.endpoint_cache_ttl = cfg.CONF.ml2.endpoint_cache_ttl
+        self.tunnel_update_delay = cfg.CONF.ml2.tunnel_update_delay
+        self._endpoint_caches = {}
+        self._endpoint_lock = semaphore.Semaphore()
+        self._pending_tunnel_updates = {}
+        self._tunnel_update_scheduled = False
+
+    def _register_endpoint(self, tunnel_type, driver, tunnel_ip):
+        cache = self._endpoint_caches.setdefault(tunnel_type, EndpointCache())
+        if cache.fresh_for(tunnel_ip, self.endpoint_cache_ttl):
+            cache.served(tunnel_ip)
+            return cache, False
+        with self._endpoint_lock:
+            # Another sync may have reloaded the list meanwhile. The list
+            # is reloaded anyway once an unknown endpoint is added.
+            if (cache.expired(self.endpoint_cache_ttl) or
+                    (tunnel_ip in cache.ips and
+                     not cache.fresh_for(tunnel_ip,
+                                         self.endpoint_cache_ttl))):
+                cache.load(driver.obj.get_endpoints())
+            if tunnel_ip in cache.ips:
+                cache.served(tunnel_ip)
+                return cache, False
+            driver.obj.add_endpoint(tunnel_ip)
+            cache.load(driver.obj.get_endpoints())
+            cache.served(tunnel_ip)
+            LOG.debug(_("Added %(type)s endpoint %(ip)s, endpoint list is now "
+                        "at version %(version)s"),
+                      {'type': tunnel_type, 'ip': tunnel_ip,
+                       'version': cache.version})
+            return cache, True
+
+    def _queue_tunnel_update(self, tunnel_ip, tunnel_type):
+        pending = self._pending_tunnel_updates.setdefault(tunnel_type, [])
+        if tunnel_ip not in pending:
+            pending.append(tunnel_ip)
+        if not self._tunnel_update_scheduled:
+            self._tunnel_update_scheduled = True
+            greenthread.spawn_after(self.tunnel_update_delay,
+                                    self._send_tunnel_updates)
+
+    def _send_tunnel_updates(self):
+        pending = self._pending_tunnel_updates
+        self._pending_tunnel_updates = {}
+        self._tunnel_update_scheduled = False
+        context = n_context.get_admin_context_without_session()
+        for tunnel_type, tunnel_ips in pending.items():
+            LOG.debug(_("Announcing %(count)d new %(type)s endpoints"),
+                      {'count': len(tunnel_ips), 'type': tunnel_type})
+            for tunnel_ip in tunnel_ips:
+                self.notifier.tunnel_update(context, tunnel_ip, tunnel_type)
 
     def tunnel_sync(self, rpc_context, **kwargs):
         """Update new tunnel.
 
         Updates the database with the tunnel IP. All listening agents will also
         be notified about the new tunnel IP.
+
+        Endpoints are served from an in-memory cache, which is reloaded
+        unless it was already reloaded since the last sync of the agent.
+        An agent that restarts with an already known IP then costs no
+        fanout, and mostly no database read. New endpoints are announced
+        in batches.
         """
         tunnel_ip = kwargs.get('tunnel_ip')
         tunnel_type = kwargs.get('tunnel_type')
@@ -104,14 +211,13 @@ class TunnelRpcCallbackMixin(object):
             raise exc.InvalidInput(error_message=msg)
         driver = self.type_manager.drivers.get(tunnel_type)
         if driver:
-            tunnel = driver.obj.add_endpoint(tunnel_ip)
-            tunnels = driver.obj.get_endpoints()
-            entry = {'tunnels': tunnels}
-            # Notify all other listening agents
-            self.notifier.tunnel_update(rpc_context, tunnel.ip_address,
-                                        tunnel_type)
+            cache, added = self._register_endpoint(tunnel_type, driver,
+                                                   tunnel_ip)
+            if added:
+                # Notify all other listening agents
+                self._queue_tunnel_update(tunnel_ip, tunnel_type)
             # Return the list of tunnels IP's to the agent
-            return entry
+            return {'tunnels': cache.tunnels}
         else:
             msg = _("network_type value '%s' not supported") % tunnel_type
             raise exc.InvalidInput(error_message=msg)
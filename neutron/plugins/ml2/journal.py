@@ -0,0 +1,339 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Journal of postcommit calls dispatched in the background.
+
+Mechanism drivers listed in [ml2] async_postcommit_drivers don't get their
+*_postcommit calls while the API request waits. Instead the precommit step
+records what the call needs in the ml2_postcommit_journal table, in the
+same transaction as the operation itself, and a PostcommitJournal running
+in every neutron server replays the calls against rebuilt driver contexts.
+
+Calls for the same driver and network are dispatched one at a time in the
+order they were recorded, so a port is never created on a backend before
+its network. A call that failed for good blocks the later calls on its
+network until its entry is removed from the journal. Calls for different
+networks are dispatched concurrently.
+"""
+
+import datetime
+
+import eventlet
+from eventlet import greenthread
+from oslo.config import cfg
+import sqlalchemy as sa
+
+from neutron import context as n_context
+from neutron.db import api as db_api
+from neutron import manager
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log
+from neutron.openstack.common import timeutils
+from neutron.plugins.ml2 import driver_api as api
+from neutron.plugins.ml2 import models
+
+LOG = log.getLogger(__name__)
+
+PENDING = 'pending'
+PROCESSING = 'processing'
+FAILED = 'failed'
+
+# Seconds after which an entry claimed by a server that went away is
+# dispatched again
+PROCESSING_TIMEOUT = 300
+# Upper bound of the retry backoff, in seconds
+MAX_RETRY_INTERVAL = 300
+
+
+def _network_dict(context):
+    return {'current': context.current,
+            'original': context.original,
+            'network_segments': context.network_segments}
+
+
+def _context_data(resource, context):
+    if resource == 'network':
+        return _network_dict(context)
+    elif resource == 'subnet':
+        return {'current': context.current,
+                'original': context.original}
+    return {'current': context.current,
+            'original': context.original,
+            'network': _network_dict(context.network),
+            'bound_segment': context.bound_segment,
+            'original_bound_segment': context.original_bound_segment,
+            'bound_driver': context.bound_driver,
+            'original_bound_driver': context.original_bound_driver}
+
+
+def record(context, operation, drivers):
+    """Journal a postcommit call for each driver.
+
+    Must be called within the transaction of the operation.
+
+    :param context: the driver context passed to the precommit call
+    :param operation: postcommit method name, without the suffix,
+                      e.g. 'create_port'
+    :param drivers: names of the drivers to journal the call for
+    """
+    resource = operation.split('_', 1)[1]
+    current = context.current
+    if resource == 'network':
+        network_id = current['id']
+    else:
+        network_id = current['network_id']
+    data = jsonutils.dumps(_context_data(resource, context))
+    now = timeutils.utcnow()
+    session = context._plugin_context.session
+    with session.begin(subtransactions=True):
+        for driver in drivers:
+            session.add(models.JournalEntry(driver=driver,
+                                            operation=operation,
+                                            resource_id=current['id'],
+                                            network_id=network_id,
+                                            data=data,
+                                            state=PENDING,
+                                            retry_count=0,
+                                            created_at=now,
+                                            next_attempt=now))
+
+
+class JournalContext(object):
+    """Driver context rebuilt from a journal entry."""
+
+    def __init__(self, data):
+        self._data = data
+        self._plugin = manager.NeutronManager.get_plugin()
+        self._plugin_context = n_context.get_admin_context()
+
+    @property
+    def current(self):
+        return self._data['current']
+
+    @property
+    def original(self):
+        return self._data['original']
+
+
+class NetworkContext(JournalContext, api.NetworkContext):
+
+    @property
+    def network_segments(self):
+        return self._data['network_segments']
+
+
+class SubnetContext(JournalContext, api.SubnetContext):
+    pass
+
+
+class PortContext(JournalContext, api.PortContext):
+
+    @property
+    def network(self):
+        return NetworkContext(self._data['network'])
+
+    @property
+    def bound_segment(self):
+        return self._data['bound_segment']
+
+    @property
+    def original_bound_segment(self):
+        return self._data['original_bound_segment']
+
+    @property
+    def bound_driver(self):
+        return self._data['bound_driver']
+
+    @property
+    def original_bound_driver(self):
+        return self._data['original_bound_driver']
+
+    def host_agents(self, agent_type):
+        host = self.current.get('binding:host_id')
+        return self._plugin.get_agents(self._plugin_context,
+                                       filters={'agent_type': [agent_type],
+                                                'host': [host]})
+
+    def set_binding(self, segment_id, vif_type, vif_details,
+                    status=None):
+        raise RuntimeError(_("Ports can not be bound from a journaled "
+                             "postcommit call"))
+
+
+CONTEXTS = {'network': NetworkContext,
+            'subnet': SubnetContext,
+            'port': PortContext}
+
+
+class PostcommitJournal(object):
+    """Dispatches journaled postcommit calls to mechanism drivers."""
+
+    def __init__(self, drivers):
+        """
+        :param drivers: dict of mechanism driver extensions by name
+        """
+        self.drivers = drivers
+        self.workers = cfg.CONF.ml2.journal_workers
+        self.batch_size = cfg.CONF.ml2.journal_batch_size
+        self.max_retries = cfg.CONF.ml2.journal_max_retries
+        self.poll_interval = cfg.CONF.ml2.journal_poll_interval
+        self._pool = eventlet.GreenPool(self.workers)
+        self._thread = None
+        self._stats = dict((name, {'dispatched': 0,
+                                   'retried': 0,
+                                   'failed': 0,
+                                   'latency': 0.0,
+                                   'max_latency': 0.0})
+                           for name in drivers)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = greenthread.spawn(self._run)
+
+    def stop(self):
+        if self._thread is not None:
+            self._thread.kill()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                dispatched = self.process()
+            except Exception:
+                LOG.exception(_("Failed to process the postcommit journal"))
+                dispatched = 0
+            if not dispatched:
+                greenthread.sleep(self.poll_interval)
+
+    def _claim(self, session, entries, now):
+        """Claim entries that no other server is dispatching."""
+        claimed = []
+        for entry in entries:
+            with session.begin(subtransactions=True):
+                count = (session.query(models.JournalEntry).
+                         filter_by(id=entry.id, state=entry.state,
+                                   next_attempt=entry.next_attempt).
+                         update({'state': PROCESSING,
+                                 'next_attempt': now + datetime.timedelta(
+                                     seconds=PROCESSING_TIMEOUT)},
+                                synchronize_session=False))
+            if count:
+                claimed.append(entry)
+        return claimed
+
+    def _next_batch(self, session):
+        """Return the entries that can be dispatched now.
+
+        Only the oldest entry of each driver and network is eligible, so
+        calls on a network reach a driver in order. A failed entry keeps
+        blocking the calls recorded after it on its network.
+        """
+        now = timeutils.utcnow()
+        heads = (session.query(
+            sa.func.min(models.JournalEntry.id).label('id')).
+            group_by(models.JournalEntry.driver,
+                     models.JournalEntry.network_id).
+            subquery())
+        batch = (session.query(models.JournalEntry).
+                 join(heads, models.JournalEntry.id == heads.c.id).
+                 filter(models.JournalEntry.state != FAILED,
+                        models.JournalEntry.next_attempt <= now).
+                 order_by(models.JournalEntry.id).
+                 limit(self.batch_size).all())
+        return self._claim(session, batch, now)
+
+    def process(self):
+        """Dispatch one batch of entries, return how many were claimed."""
+        session = db_api.get_session()
+        batch = self._next_batch(session)
+        for entry in batch:
+            self._pool.spawn_n(self._dispatch, entry.id, entry.driver,
+                               entry.operation, entry.data, entry.created_at,
+                               entry.retry_count)
+        self._pool.waitall()
+        return len(batch)
+
+    def _dispatch(self, entry_id, driver_name, operation, data, created_at,
+                  retry_count):
+        session = db_api.get_session()
+        query = session.query(models.JournalEntry).filter_by(id=entry_id)
+        driver = self.drivers.get(driver_name)
+        if driver is None:
+            LOG.error(_("Mechanism driver '%(name)s' of journal entry "
+                        "%(id)s is not loaded"),
+                      {'name': driver_name, 'id': entry_id})
+            query.update({'state': FAILED}, synchronize_session=False)
+            return
+        resource = operation.split('_', 1)[1]
+        context = CONTEXTS[resource](jsonutils.loads(data))
+        method_name = '%s_postcommit' % operation
+        stats = self._stats[driver_name]
+        try:
+            getattr(driver.obj, method_name)(context)
+        except Exception:
+            retry_count += 1
+            if retry_count > self.max_retries:
+                LOG.exception(_("Mechanism driver '%(name)s' failed in "
+                                "%(method)s for %(id)s, giving up"),
+                              {'name': driver_name, 'method': method_name,
+                               'id': context.current['id']})
+                stats['failed'] += 1
+                query.update({'state': FAILED, 'retry_count': retry_count},
+                             synchronize_session=False)
+                return
+            delay = min(self.poll_interval * 2 ** retry_count,
+                        MAX_RETRY_INTERVAL)
+            LOG.warning(_("Mechanism driver '%(name)s' failed in "
+                          "%(method)s for %(id)s, retrying in %(delay)s "
+                          "seconds"),
+                        {'name': driver_name, 'method': method_name,
+                         'id': context.current['id'], 'delay': delay})
+            stats['retried'] += 1
+            query.update({'state': PENDING,
+                          'retry_count': retry_count,
+                          'next_attempt': timeutils.utcnow() +
+                          datetime.timedelta(seconds=delay)},
+                         synchronize_session=False)
+            return
+        query.delete(synchronize_session=False)
+        latency = timeutils.delta_seconds(created_at, timeutils.utcnow())
+        stats['dispatched'] += 1
+        stats['latency'] += latency
+        stats['max_latency'] = max(stats['max_latency'], latency)
+
+    def get_stats(self):
+        """Return journal queue depth and dispatch figures by driver.
+
+        queue_depth and failed_entries are read from the journal table and
+        cover every server. The other figures are for this server only:
+        latency is the total seconds from the API operation to a
+        successful dispatch, max_latency the worst case.
+        """
+        session = db_api.get_session()
+        stats = dict((name, dict(values, queue_depth=0, failed_entries=0))
+                     for name, values in self._stats.iteritems())
+        rows = (session.query(models.JournalEntry.driver,
+                              models.JournalEntry.state,
+                              sa.func.count(models.JournalEntry.id)).
+                group_by(models.JournalEntry.driver,
+                         models.JournalEntry.state))
+        for driver, state, count in rows:
+            if driver not in stats:
+                continue
+            if state == FAILED:
+                stats[driver]['failed_entries'] += count
+            else:
+                stats[driver]['queue_depth'] += count
+        return stats
@@ -21,6 +21,7 @@ from neutron.extensions import portbindings
 from neutron.openstack.common import log
 from neutron.plugins.ml2.common import exceptions as ml2_exc
 from neutron.plugins.ml2 import driver_api as api
+from neutron.plugins.ml2 import journal
 
 
 LOG = log.getLogger(__name__)
@@ -120,6 +121,9 @@ class MechanismManager(stevedore.named.NamedExtensionManager):
         # Ordered list of mechanism drivers, defining
         # the order in which the drivers are called.
         self.ordered_mech_drivers = []
+        # Names of the drivers whose postcommit calls are journaled
+        self.async_drivers = []
+        self.journal = None
 
         LOG.info(_("Configured mechanism driver names: %s"),
                  cfg.CONF.ml2.mechanism_drivers)
@@ -150,6 +154,22 @@ class MechanismManager(stevedore.named.NamedExtensionManager):
             driver.obj.initialize()
             self.native_bulk_support &= getattr(driver.obj,
                                                 'native_bulk_support', True)
+        self._initialize_journal()
+
+    def _initialize_journal(self):
+        for name in cfg.CONF.ml2.async_postcommit_drivers:
+            if name in self.mech_drivers:
+                self.async_drivers.append(name)
+            else:
+                LOG.error(_("Mechanism driver '%s' listed in "
+                            "async_postcommit_drivers is not loaded"), name)
+        if self.async_drivers:
+            LOG.info(_("Journaling postcommit calls of mechanism drivers: "
+                       "%s"), self.async_drivers)
+            self.journal = journal.PostcommitJournal(
+                dict((name, self.mech_drivers[name])
+                     for name in self.async_drivers))
+            self.journal.start()
 
     def _call_on_drivers(self, method_name, context,
                          continue_on_failure=False):
@@ -161,9 +181,15 @@ class MechanismManager(stevedore.named.NamedExtensionManager):
         all mechanism drivers once one has raised an exception
         :raises: neutron.plugins.ml2.common.MechanismDriverError
         if any mechanism driver call fails.
+
+        Postcommit calls of the drivers in async_drivers are skipped, they
+        are journaled by the precommit call and dispatched by the journal.
         """
         error = False
+        postcommit = method_name.endswith('_postcommit')
         for driver in self.ordered_mech_drivers:
+            if postcommit and driver.name in self.async_drivers:
+                continue
             try:
                 getattr(driver.obj, method_name)(context)
             except Exception:
@@ -178,6 +204,9 @@ class MechanismManager(stevedore.named.NamedExtensionManager):
             raise ml2_exc.MechanismDriverError(
                 method=method_name
             )
+        if self.async_drivers and method_name.endswith('_precommit'):
+            journal.record(context, method_name[:-len('_precommit')],
+                           self.async_drivers)
 
     def create_network_precommit(self, context):
         """Notify all mechanism drivers during network creation.
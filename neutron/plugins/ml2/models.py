@@ -74,3 +74,27 @@ class PortBinding(model_base.BASEV2):
         backref=orm.backref("port_binding",
                             lazy='joined', uselist=False,
                             cascade='delete'))
+
+
+class JournalEntry(model_base.BASEV2):
+    """Represent a postcommit call waiting to be dispatched to a driver.
+
+    Entries are written in the transaction of the API operation, so a
+    call is journaled if and only if the operation commits. Entries of a
+    driver sharing a network_id are dispatched in id order.
+    """
+
+    __tablename__ = 'ml2_postcommit_journal'
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    driver = sa.Column(sa.String(64), nullable=False)
+    operation = sa.Column(sa.String(36), nullable=False)
+    resource_id = sa.Column(sa.String(36), nullable=False)
+    network_id = sa.Column(sa.String(36), nullable=False)
+    data = sa.Column(sa.Text, nullable=False)
+    state = sa.Column(sa.Enum('pending', 'processing', 'failed',
+                              name='ml2_journal_states'),
+                      nullable=False, default='pending')
+    retry_count = sa.Column(sa.Integer, nullable=False, default=0)
+    created_at = sa.Column(sa.DateTime, nullable=False)
+    next_attempt = sa.Column(sa.DateTime, nullable=False)
@@ -39,6 +39,7 @@ from neutron.extensions import extra_dhcp_opt as edo_ext
 from neutron.extensions import multiprovidernet as mpnet
 from neutron.extensions import portbindings
 from neutron.extensions import providernet as provider
+from neutron.extensions import securitygroup as ext_sg
 from neutron import manager
 from neutron.openstack.common import db as os_db
 from neutron.openstack.common import excutils
@@ -454,6 +455,8 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
         # when the API layer is reworked during icehouse.
 
         LOG.debug(_("Deleting network %s"), id)
+        if cfg.CONF.ml2.bulk_network_delete:
+            return self._delete_network_bulk(context, id)
         session = context.session
         while True:
             try:
@@ -533,6 +536,121 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             LOG.error(_("mechanism_manager.delete_network_postcommit failed"))
         self.notifier.network_delete(context, id)
 
+    def _delete_network_bulk(self, context, id):
+        """Delete a network, its auto-deleted ports and its subnets at once.
+
+        The ports and subnets are removed by one DELETE statement each in
+        the transaction deleting the network, their dependent rows going
+        with them by cascade. The precommit calls of every port, subnet
+        and the network are made in that transaction and the postcommit
+        calls once it is committed.
+        """
+        session = context.session
+        l3plugin = manager.NeutronManager.get_service_plugins().get(
+            service_constants.L3_ROUTER_NAT)
+        while True:
+            try:
+                with session.begin(subtransactions=True):
+                    self._process_l3_delete(context, id)
+
+                    ports = (session.query(models_v2.Port).
+                             enable_eagerloads(False).
+                             filter_by(network_id=id).
+                             with_lockmode('update').all())
+                    LOG.debug(_("Ports to auto-delete: %s"), ports)
+                    if not all(p.device_owner in
+                               db_base_plugin_v2.AUTO_DELETE_PORT_OWNERS
+                               for p in ports):
+                        LOG.debug(_("Tenant-owned ports exist"))
+                        raise exc.NetworkInUse(net_id=id)
+                    subnets = (session.query(models_v2.Subnet).
+                               enable_eagerloads(False).
+                               filter_by(network_id=id).
+                               with_lockmode('update').all())
+                    LOG.debug(_("Subnets to auto-delete: %s"), subnets)
+
+                    network = self.get_network(context, id)
+                    port_contexts = [
+                        driver_context.PortContext(
+                            self, context, self._make_port_dict(port),
+                            network)
+                        for port in ports]
+                    subnet_contexts = [
+                        driver_context.SubnetContext(
+                            self, context, self._make_subnet_dict(subnet))
+                        for subnet in subnets]
+                    mech_context = driver_context.NetworkContext(self,
+                                                                 context,
+                                                                 network)
+                    for port_context in port_contexts:
+                        self.mechanism_manager.delete_port_precommit(
+                            port_context)
+                    for subnet_context in subnet_contexts:
+                        self.mechanism_manager.delete_subnet_precommit(
+                            subnet_context)
+                    self.mechanism_manager.delete_network_precommit(
+                        mech_context)
+
+                    if l3plugin:
+                        for port in ports:
+                            l3plugin.disassociate_floatingips(context,
+                                                              port.id)
+                    # IP allocations, bindings, segments and the other
+                    # dependent rows are removed by cascade.
+                    record = self._get_network(context, id)
+                    LOG.debug(_("Deleting network record %s"), record)
+                    for model, column in ((models_v2.Port, 'network_id'),
+                                          (models_v2.Subnet, 'network_id'),
+                                          (models_v2.Network, 'id')):
+                        (session.query(model).
+                         filter_by(**{column: id}).
+                         delete(synchronize_session=False))
+                    for obj in ports + subnets + [record]:
+                        session.expunge(obj)
+                    for segment in mech_context.network_segments:
+                        self.type_manager.release_segment(session, segment)
+                    LOG.debug(_("Committing transaction"))
+                break
+            except os_db.exception.DBError as e:
+                with excutils.save_and_reraise_exception() as ctxt:
+                    if isinstance(e.inner_exception, sql_exc.IntegrityError):
+                        ctxt.reraise = False
+                        msg = _("A concurrent port creation has occurred")
+                        LOG.warning(msg)
+
+        for port_context in port_contexts:
+            try:
+                self.mechanism_manager.delete_port_postcommit(port_context)
+            except ml2_exc.MechanismDriverError:
+                LOG.error(_("mechanism_manager.delete_port_postcommit "
+                            "failed for port %s"), port_context.current['id'])
+        for subnet_context in subnet_contexts:
+            try:
+                self.mechanism_manager.delete_subnet_postcommit(
+                    subnet_context)
+            except ml2_exc.MechanismDriverError:
+                LOG.error(_("mechanism_manager.delete_subnet_postcommit "
+                            "failed for subnet %s"),
+                          subnet_context.current['id'])
+        try:
+            self.mechanism_manager.delete_network_postcommit(mech_context)
+        except ml2_exc.MechanismDriverError:
+            LOG.error(_("mechanism_manager.delete_network_postcommit failed"))
+
+        # One security group notification covers all the deleted ports.
+        ports = [port_context.current for port_context in port_contexts]
+        if any(port['device_owner'] == const.DEVICE_OWNER_DHCP
+               for port in ports):
+            self.notifier.security_groups_provider_updated(context)
+        security_groups = set()
+        for port in ports:
+            if port['device_owner'] != const.DEVICE_OWNER_DHCP:
+                security_groups.update(port.get(ext_sg.SECURITYGROUPS) or [])
+        if security_groups:
+            self.notifier.security_groups_member_updated(
+                context, list(security_groups))
+        self.notifier.network_delete(context, id)
+
     def create_subnet(self, context, subnet):
         session = context.session
         with session.begin(subtransactions=True):
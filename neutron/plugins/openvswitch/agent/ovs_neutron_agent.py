@@ -177,6 +177,10 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         # Keep track of int_br's device count for use by _report_state()
         self.int_br_device_count = 0
 
+        # Rebuild flows by diffing them with the bridges instead of
+        # dropping them when the agent starts or OVS restarts
+        self.drop_flows_on_start = cfg.CONF.AGENT.drop_flows_on_start
+
         self.int_br = ovs_lib.OVSBridge(integ_br, self.root_helper)
         self.setup_integration_br()
         # Stores port update notifications for processing in main rpc loop
@@ -714,12 +718,12 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
             self.int_br.add_flow(priority=2, in_port=port.ofport,
                                  actions="drop")
 
-    def setup_integration_br(self):
+    def setup_integration_br(self, ovs_restarted=False):
         '''Setup the integration bridge.
 
         Create patch ports and remove all existing flows.
 
-        :param bridge_name: the name of the integration bridge.
+        :param ovs_restarted: indicates if this is called for an OVS restart.
         :returns: the integration bridge
         '''
         # Ensure the integration bridge is created.
@@ -729,8 +733,9 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         self.int_br.create()
         self.int_br.set_secure_mode()
 
-        self.int_br.delete_port(cfg.CONF.OVS.int_peer_patch_port)
-        self.int_br.remove_all_flows()
+        if self.drop_flows_on_start or not self.tunnel_types:
+            self.int_br.delete_port(cfg.CONF.OVS.int_peer_patch_port)
+        self._reset_flows(self.int_br, ovs_restarted)
         # switch all traffic using L2 learning
         self.int_br.add_flow(priority=1, actions="normal")
         # Add a canary flow to int_br to track OVS restarts
@@ -763,29 +768,36 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
             ancillary_bridges.append(br)
         return ancillary_bridges
 
-    def setup_tunnel_br(self, tun_br=None):
+    def setup_tunnel_br(self, tun_br=None, ovs_restarted=False):
         '''Setup the tunnel bridge.
 
         Creates tunnel bridge, and links it to the integration bridge
         using a patch port.
 
         :param tun_br: the name of the tunnel bridge.
+        :param ovs_restarted: indicates if this is called for an OVS restart.
         '''
         if not self.tun_br:
             self.tun_br = ovs_lib.OVSBridge(tun_br, self.root_helper)
 
-        self.tun_br.reset_bridge()
-        self.patch_tun_ofport = self.int_br.add_patch_port(
-            cfg.CONF.OVS.int_peer_patch_port, cfg.CONF.OVS.tun_peer_patch_port)
-        self.patch_int_ofport = self.tun_br.add_patch_port(
-            cfg.CONF.OVS.tun_peer_patch_port, cfg.CONF.OVS.int_peer_patch_port)
+        if self.drop_flows_on_start:
+            self.tun_br.reset_bridge()
+        else:
+            # Keep tunnel ports and patch ports, which carry traffic
+            self.tun_br.create()
+        self.patch_tun_ofport = self._add_patch_port(
+            self.int_br, cfg.CONF.OVS.int_peer_patch_port,
+            cfg.CONF.OVS.tun_peer_patch_port)
+        self.patch_int_ofport = self._add_patch_port(
+            self.tun_br, cfg.CONF.OVS.tun_peer_patch_port,
+            cfg.CONF.OVS.int_peer_patch_port)
         if int(self.patch_tun_ofport) < 0 or int(self.patch_int_ofport) < 0:
             LOG.error(_("Failed to create OVS patch port. Cannot have "
                         "tunneling enabled on this agent, since this version "
                         "of OVS does not support tunnels or patch ports. "
                         "Agent terminated!"))
             exit(1)
-        self.tun_br.remove_all_flows()
+        self._reset_flows(self.tun_br, ovs_restarted)
 
         # Table 0 (default) will sort incoming traffic depending on in_port
         self.tun_br.add_flow(priority=1,
@@ -858,6 +870,36 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                              priority=0,
                              actions="drop")
 
+    def _reset_flows(self, br, ovs_restarted):
+        if self.drop_flows_on_start:
+            br.remove_all_flows()
+        elif ovs_restarted:
+            # The bridge has no flows left, so there is nothing to keep:
+            # install the flows right away instead of at the end of the sync
+            br.reset_flow_cache()
+        else:
+            br.start_flow_resync()
+
+    def _add_patch_port(self, br, local_name, remote_name):
+        if not self.drop_flows_on_start:
+            ofport = br.get_port_ofport(local_name)
+            if ofport != constants.INVALID_OFPORT:
+                return ofport
+        return br.add_patch_port(local_name, remote_name)
+
+    def finish_flow_resync(self, tunnels_synced=True):
+        '''Apply the flows rebuilt since the agent started.
+
+        The tunnel bridge is only resynchronized once the tunnels are in
+        sync as well, the other bridges don't wait for it.
+        '''
+        if self.drop_flows_on_start:
+            return
+        for br in [self.int_br] + self.phys_brs.values():
+            br.finish_flow_resync()
+        if self.tun_br and tunnels_synced:
+            self.tun_br.finish_flow_resync()
+
     def get_veth_name(self, prefix, name):
         """Construct a veth name based on the prefix and name that does not
            exceed the maximum length allowed for a linux device. Longer names
@@ -880,13 +922,14 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                      'new_name': new_name})
         return new_name
 
-    def setup_physical_bridges(self, bridge_mappings):
+    def setup_physical_bridges(self, bridge_mappings, ovs_restarted=False):
         '''Setup the physical network bridges.
 
         Creates physical network bridges and links them to the
         integration bridge using veths.
 
         :param bridge_mappings: map physical network names to bridge names.
+        :param ovs_restarted: indicates if this is called for an OVS restart.
         '''
         self.phys_brs = {}
         self.int_ofports = {}
@@ -906,7 +949,7 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                            'bridge': bridge})
                 sys.exit(1)
             br = ovs_lib.OVSBridge(bridge, self.root_helper)
-            br.remove_all_flows()
+            self._reset_flows(br, ovs_restarted)
             br.add_flow(priority=1, actions="normal")
             self.phys_brs[physical_network] = br
 
@@ -1047,6 +1090,41 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                       {'type': tunnel_type, 'ip': remote_ip})
             return 0
 
+        self._add_tunnel_port_flow(ofport, remote_ip, tunnel_type)
+        if not self.l2_pop:
+            self._update_flood_flows(tunnel_type)
+        return ofport
+
+    def setup_tunnel_ports(self, tunnel_type, remote_ips):
+        '''Set up tunnel ports to several remote IPs at once.
+
+        Ports are created in bulk, and their flows and the flooding flows
+        of the tunnel networks are written in a single deferred batch.
+
+        :param tunnel_type: the type of the tunnels.
+        :param remote_ips: a dict mapping port names to remote IPs.
+        '''
+        ofports = self.tun_br.add_tunnel_ports(remote_ips,
+                                               self.local_ip,
+                                               tunnel_type,
+                                               self.vxlan_udp_port,
+                                               self.dont_fragment)
+        self.tun_br.defer_apply_on()
+        try:
+            for port_name, ofport in ofports.iteritems():
+                remote_ip = remote_ips[port_name]
+                if int(ofport) < 0:
+                    LOG.error(_("Failed to set-up %(type)s tunnel port to "
+                                "%(ip)s"), {'type': tunnel_type,
+                                            'ip': remote_ip})
+                    continue
+                self._add_tunnel_port_flow(ofport, remote_ip, tunnel_type)
+            if not self.l2_pop:
+                self._update_flood_flows(tunnel_type)
+        finally:
+            self.tun_br.defer_apply_off()
+
+    def _add_tunnel_port_flow(self, ofport, remote_ip, tunnel_type):
         self.tun_br_ofports[tunnel_type][remote_ip] = ofport
         # Add flow in default table to resubmit to the right
         # tunnelling table (lvid will be set in the latter)
@@ -1055,9 +1133,10 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                              actions="resubmit(,%s)" %
                              constants.TUN_TABLE[tunnel_type])
 
+    def _update_flood_flows(self, tunnel_type):
         ofports = ','.join(self.tun_br_ofports[tunnel_type].values())
-        if ofports and not self.l2_pop:
-            # Update flooding flows to include the new tunnel
+        if ofports:
+            # Update flooding flows to include the new tunnels
             for network_id, vlan_mapping in self.local_vlan_map.iteritems():
                 if vlan_mapping.network_type == tunnel_type:
                     self.tun_br.mod_flow(table=constants.FLOOD_TO_TUN,
@@ -1066,7 +1145,6 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                                          "set_tunnel:%s,output:%s" %
                                          (vlan_mapping.segmentation_id,
                                           ofports))
-        return ofport
 
     def cleanup_tunnel_port(self, tun_ofport, tunnel_type):
         # Check if this tunnel port is still used
@@ -1273,6 +1351,7 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                                                       tunnel_type)
                 if not self.l2_pop:
                     tunnels = details['tunnels']
+                    remote_ips = {}
                     for tunnel in tunnels:
                         if self.local_ip != tunnel['ip_address']:
                             tunnel_id = tunnel.get('id')
@@ -1285,9 +1364,9 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                                 continue
                             tun_name = '%s-%s' % (tunnel_type,
                                                   tunnel_id or remote_ip_hex)
-                            self.setup_tunnel_port(tun_name,
-                                                   tunnel['ip_address'],
-                                                   tunnel_type)
+                            remote_ips[tun_name] = remote_ip
+                    if remote_ips:
+                        self.setup_tunnel_ports(tunnel_type, remote_ips)
         except Exception as e:
             LOG.debug(_("Unable to sync tunnel IP %(local_ip)s: %(e)s"),
                       {'local_ip': self.local_ip, 'e': e})
@@ -1336,10 +1415,11 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                 polling_manager.force_polling()
             ovs_restarted = self.check_ovs_restart()
             if ovs_restarted:
-                self.setup_integration_br()
-                self.setup_physical_bridges(self.bridge_mappings)
+                self.setup_integration_br(ovs_restarted)
+                self.setup_physical_bridges(self.bridge_mappings,
+                                            ovs_restarted)
                 if self.enable_tunneling:
-                    self.setup_tunnel_br()
+                    self.setup_tunnel_br(ovs_restarted=ovs_restarted)
                     tunnel_sync = True
             # Notify the plugin of tunnel IP
             if self.enable_tunneling and tunnel_sync:
@@ -1421,6 +1501,13 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                     self.updated_ports |= updated_ports_copy
                     sync = True
 
+            # Flows are complete once ports, and tunnels for the tunnel
+            # bridge, are in sync
+            if not sync:
+                self.finish_flow_resync(
+                    tunnels_synced=not (self.enable_tunneling and
+                                        tunnel_sync))
+
             # sleep till end of polling interval
             elapsed = (time.time() - start)
             LOG.debug(_("Agent rpc_loop - iteration:%(iter_num)d "
@@ -83,6 +83,13 @@ agent_opts = [
     cfg.BoolOpt('dont_fragment', default=True,
                 help=_("Set or un-set the don't fragment (DF) bit on "
                        "outgoing IP packet carrying GRE/VXLAN tunnel")),
+    cfg.BoolOpt('drop_flows_on_start', default=True,
+                help=_("Reset the flow tables when the agent starts or OVS "
+                       "restarts. When disabled, the agent keeps a model of "
+                       "its flows and only applies the flows missing from "
+                       "the bridges and removes the stale ones, without "
+                       "disrupting traffic. After an OVS restart the flows "
+                       "are installed right away")),
 ]
 
 
@@ -97,7 +97,12 @@ sync_opts = [
                 deprecated_group='NVP_SYNC',
                 help=_('Always read operational status from backend on show '
                        'operations. Enabling this option might slow down '
-                       'the system.'))
+                       'the system.')),
+    cfg.BoolOpt('state_sync_leases', default=False,
+                help=_('Split the state synchronization task across all the '
+                       'API workers and servers sharing the database. Each '
+                       'resource type is synchronized by a single process '
+                       'holding a lease on it.'))
 ]
 
 connection_opts = [
@@ -150,6 +155,7 @@ cluster_opts = [
 ]
 
 DEFAULT_STATUS_CHECK_INTERVAL = 2000
+DEFAULT_TASK_WORKERS = 16
 
 vcns_opts = [
     cfg.StrOpt('user',
@@ -177,7 +183,13 @@ vcns_opts = [
                help=_('Network ID for physical network connectivity')),
     cfg.IntOpt('task_status_check_interval',
                default=DEFAULT_STATUS_CHECK_INTERVAL,
-               help=_("Task status check interval"))
+               help=_("Task status check interval")),
+    cfg.IntOpt('task_workers',
+               default=DEFAULT_TASK_WORKERS,
+               help=_("Maximum number of task callbacks running "
+                      "concurrently. Tasks for different resources are "
+                      "processed in parallel, tasks for the same resource "
+                      "in order"))
 ]
 
 # Register the configuration options
@@ -13,10 +13,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+import os
 import random
 
+from sqlalchemy import sql
+
 from neutron.common import constants
 from neutron.common import exceptions
+from neutron.common import utils
 from neutron import context
 from neutron.db import external_net_db
 from neutron.db import l3_db
@@ -29,6 +34,7 @@ from neutron.openstack.common import timeutils
 from neutron.plugins.vmware.api_client import exception as api_exc
 from neutron.plugins.vmware.common import exceptions as nsx_exc
 from neutron.plugins.vmware.common import nsx_utils
+from neutron.plugins.vmware.dbexts import db as nsx_db
 from neutron.plugins.vmware import nsxlib
 from neutron.plugins.vmware.nsxlib import router as routerlib
 from neutron.plugins.vmware.nsxlib import switch as switchlib
@@ -37,6 +43,15 @@ from neutron.plugins.vmware.nsxlib import switch as switchlib
 # NOTE(salv-orlando): This might become a version-dependent map should the
 # limit be raised in future versions
 MAX_PAGE_SIZE = 5000
+# Maximum number of resources whose status is set by a single UPDATE
+STATUS_UPDATE_BATCH = 500
+# Resource types the synchronization work is split on when leases are
+# enabled, along with their page cursor in SyncParameters
+SYNC_SHARDS = (('lswitches', 'ls_cursor'),
+               ('lrouters', 'lr_cursor'),
+               ('lswitchports', 'lp_cursor'))
+# Number of synchronization intervals a lease lasts without being renewed
+LEASE_INTERVALS = 3
 
 LOG = log.getLogger(__name__)
 
@@ -126,6 +141,13 @@ class NsxCache(object):
                     if v.get('changed')]
         return resources.keys()
 
+    def clear(self, resource_type):
+        """Forget every resource of a type, e.g. 'lswitchports'."""
+        resources = getattr(self, '_%s' % resource_type)
+        for uuid in resources:
+            del self._uuid_dict_mappings[uuid]
+        resources.clear()
+
     def get_lswitches(self, changed_only=False):
         return self._get_resource_ids(self._lswitches, changed_only)
 
@@ -173,6 +195,7 @@ class SyncParameters():
     Page cursors: markers for the next resource to fetch.
                  'start' means page cursor unset for fetching 1st page
     init_sync_performed: True if the initial synchronization concluded
+    shards: resource types this process holds a synchronization lease on
     """
 
     def __init__(self, min_chunk_size):
@@ -184,6 +207,7 @@ class SyncParameters():
         self.lp_cursor = 'start'
         self.init_sync_performed = False
         self.total_size = 0
+        self.shards = set()
 
 
 def _start_loopingcall(min_chunk_size, state_sync_interval, func):
@@ -216,7 +240,8 @@ class NsxSynchronizer():
         relations='LogicalPortStatus')
 
     def __init__(self, plugin, cluster, state_sync_interval,
-                 req_delay, min_chunk_size, max_rand_delay=0):
+                 req_delay, min_chunk_size, max_rand_delay=0,
+                 use_leases=False):
         random.seed()
         self._nsx_cache = NsxCache()
         # Store parameters as instance members
@@ -226,6 +251,7 @@ class NsxSynchronizer():
         self._req_delay = req_delay
         self._sync_interval = state_sync_interval
         self._max_rand_delay = max_rand_delay
+        self._use_leases = use_leases
         # Validate parameters
         if self._sync_interval < self._req_delay:
             err_msg = (_("Minimum request delay:%(req_delay)s must not "
@@ -252,21 +278,44 @@ class NsxSynchronizer():
         network is mapped to multiple lswitches.
         """
         if not lswitches:
-            # Try to get logical switches from nsx
+            lswitches = self._fetch_lswitches(context,
+                                              neutron_network_data['id'])
+        status = self._get_network_status(lswitches)
+        # Update db object
+        if status == neutron_network_data['status']:
+            # do nothing
+            return
+
+        with context.session.begin(subtransactions=True):
             try:
-                lswitches = nsx_utils.fetch_nsx_switches(
-                    context.session, self._cluster,
-                    neutron_network_data['id'])
+                network = self._plugin._get_network(context,
+                                                    neutron_network_data['id'])
             except exceptions.NetworkNotFound:
-                # TODO(salv-orlando): We should be catching
-                # api_exc.ResourceNotFound here
-                # The logical switch was not found
-                LOG.warning(_("Logical switch for neutron network %s not "
-                              "found on NSX."), neutron_network_data['id'])
-                lswitches = []
+                pass
             else:
-                for lswitch in lswitches:
-                    self._nsx_cache.update_lswitch(lswitch)
+                network.status = status
+                LOG.debug(_("Updating status for neutron resource %(q_id)s to:"
+                            " %(status)s"),
+                          {'q_id': neutron_network_data['id'],
+                           'status': status})
+
+    def _fetch_lswitches(self, context, network_id):
+        # Try to get logical switches from nsx
+        try:
+            lswitches = nsx_utils.fetch_nsx_switches(
+                context.session, self._cluster, network_id)
+        except exceptions.NetworkNotFound:
+            # TODO(salv-orlando): We should be catching
+            # api_exc.ResourceNotFound here
+            # The logical switch was not found
+            LOG.warning(_("Logical switch for neutron network %s not "
+                          "found on NSX."), network_id)
+            return []
+        for lswitch in lswitches:
+            self._nsx_cache.update_lswitch(lswitch)
+        return lswitches
+
+    def _get_network_status(self, lswitches):
         # By default assume things go wrong
         status = constants.NET_STATUS_ERROR
         # In most cases lswitches will contain a single element
@@ -283,22 +332,20 @@ class NsxSynchronizer():
             # there were no switches in the first place!
             if lswitches:
                 status = constants.NET_STATUS_ACTIVE
-        # Update db object
-        if status == neutron_network_data['status']:
-            # do nothing
-            return
-
-        with context.session.begin(subtransactions=True):
-            try:
-                network = self._plugin._get_network(context,
-                                                    neutron_network_data['id'])
-            except exceptions.NetworkNotFound:
-                pass
-            else:
-                network.status = status
-                LOG.debug(_("Updating status for neutron resource %(q_id)s to:"
-                            " %(status)s"),
-                          {'q_id': neutron_network_data['id'],
+        return status
+
+    def _update_status(self, ctx, model, updates):
+        """Apply {status: [ids]} with one UPDATE per status and batch."""
+        with ctx.session.begin(subtransactions=True):
+            for status, ids in updates.iteritems():
+                for i in range(0, len(ids), STATUS_UPDATE_BATCH):
+                    (ctx.session.query(model).
+                     filter(model.id.in_(ids[i:i + STATUS_UPDATE_BATCH])).
+                     update({'status': status}, synchronize_session=False))
+                LOG.debug(_("Updated status for %(count)d %(resource)s "
+                            "resources to: %(status)s"),
+                          {'count': len(ids),
+                           'resource': model.__tablename__,
                            'status': status})
 
     def _synchronize_lswitches(self, ctx, ls_uuids, scan_missing=False):
@@ -318,53 +365,37 @@ class NsxSynchronizer():
             neutron_nsx_mappings[neutron_id] = (
                 neutron_nsx_mappings.get(neutron_id, []) +
                 [self._nsx_cache[ls_uuid]])
-        # Fetch neutron networks from database
-        filters = {'router:external': [False]}
+        # Fetch the status of internal neutron networks from database
+        query = ctx.session.query(
+            models_v2.Network.id, models_v2.Network.status).outerjoin(
+                external_net_db.ExternalNetwork,
+                (models_v2.Network.id ==
+                 external_net_db.ExternalNetwork.network_id)).filter(
+                     external_net_db.ExternalNetwork.network_id == sql.null())
         if not scan_missing:
-            filters['id'] = neutron_net_ids
-
-        networks = self._plugin._get_collection(
-            ctx, models_v2.Network, self._plugin._make_network_dict,
-            filters=filters)
-
-        for network in networks:
-            lswitches = neutron_nsx_mappings.get(network['id'], [])
-            lswitches = [lswitch.get('data') for lswitch in lswitches]
-            self.synchronize_network(ctx, network, lswitches)
+            query = query.filter(models_v2.Network.id.in_(neutron_net_ids))
+        updates = {}
+        for net_id, net_status in query:
+            if net_id in neutron_nsx_mappings:
+                lswitches = [lswitch.get('data') for lswitch in
+                             neutron_nsx_mappings[net_id]]
+            else:
+                # Not in the cache yet, e.g. created after it was filled
+                lswitches = self._fetch_lswitches(ctx, net_id)
+            status = self._get_network_status(lswitches)
+            if status != net_status:
+                updates.setdefault(status, []).append(net_id)
+        self._update_status(ctx, models_v2.Network, updates)
 
     def synchronize_router(self, context, neutron_router_data,
                            lrouter=None):
         """Synchronize a neutron router with its NSX counterpart."""
         if not lrouter:
-            # Try to get router from nsx
-            try:
-                # This query will return the logical router status too
-                nsx_router_id = nsx_utils.get_nsx_router_id(
-                    context.session, self._cluster, neutron_router_data['id'])
-                if nsx_router_id:
-                    lrouter = routerlib.get_lrouter(
-                        self._cluster, nsx_router_id)
-            except exceptions.NotFound:
-                # NOTE(salv-orlando): We should be catching
-                # api_exc.ResourceNotFound here
-                # The logical router was not found
-                LOG.warning(_("Logical router for neutron router %s not "
-                              "found on NSX."), neutron_router_data['id'])
-            if lrouter:
-                # Update the cache
-                self._nsx_cache.update_lrouter(lrouter)
+            lrouter = self._fetch_lrouter(context, neutron_router_data['id'])
 
         # Note(salv-orlando): It might worth adding a check to verify neutron
         # resource tag in nsx entity matches a Neutron id.
-        # By default assume things go wrong
-        status = constants.NET_STATUS_ERROR
-        if lrouter:
-            lr_status = (lrouter['_relations']
-                         ['LogicalRouterStatus']
-                         ['fabric_status'])
-            status = (lr_status and
-                      constants.NET_STATUS_ACTIVE
-                      or constants.NET_STATUS_DOWN)
+        status = self._get_router_status(lrouter)
         # Update db object
         if status == neutron_router_data['status']:
             # do nothing
@@ -383,6 +414,39 @@ class NsxSynchronizer():
                           {'q_id': neutron_router_data['id'],
                            'status': status})
 
+    def _fetch_lrouter(self, context, router_id):
+        # Try to get router from nsx
+        lrouter = None
+        try:
+            # This query will return the logical router status too
+            nsx_router_id = nsx_utils.get_nsx_router_id(
+                context.session, self._cluster, router_id)
+            if nsx_router_id:
+                lrouter = routerlib.get_lrouter(
+                    self._cluster, nsx_router_id)
+        except exceptions.NotFound:
+            # NOTE(salv-orlando): We should be catching
+            # api_exc.ResourceNotFound here
+            # The logical router was not found
+            LOG.warning(_("Logical router for neutron router %s not "
+                          "found on NSX."), router_id)
+        if lrouter:
+            # Update the cache
+            self._nsx_cache.update_lrouter(lrouter)
+        return lrouter
+
+    def _get_router_status(self, lrouter):
+        # By default assume things go wrong
+        status = constants.NET_STATUS_ERROR
+        if lrouter:
+            lr_status = (lrouter['_relations']
+                         ['LogicalRouterStatus']
+                         ['fabric_status'])
+            status = (lr_status and
+                      constants.NET_STATUS_ACTIVE
+                      or constants.NET_STATUS_DOWN)
+        return status
+
     def _synchronize_lrouters(self, ctx, lr_uuids, scan_missing=False):
         if not lr_uuids and not scan_missing:
             return
@@ -400,16 +464,22 @@ class NsxSynchronizer():
             else:
                 LOG.warn(_("Unable to find Neutron router id for "
                            "NSX logical router: %s"), lr_uuid)
-        # Fetch neutron routers from database
-        filters = ({} if scan_missing else
-                   {'id': neutron_router_mappings.keys()})
-        routers = self._plugin._get_collection(
-            ctx, l3_db.Router, self._plugin._make_router_dict,
-            filters=filters)
-        for router in routers:
-            lrouter = neutron_router_mappings.get(router['id'])
-            self.synchronize_router(
-                ctx, router, lrouter and lrouter.get('data'))
+        # Fetch the status of neutron routers from database
+        query = ctx.session.query(l3_db.Router.id, l3_db.Router.status)
+        if not scan_missing:
+            query = query.filter(
+                l3_db.Router.id.in_(neutron_router_mappings.keys()))
+        updates = {}
+        for router_id, router_status in query:
+            if router_id in neutron_router_mappings:
+                lrouter = neutron_router_mappings[router_id].get('data')
+            else:
+                # Not in the cache yet, e.g. created after it was filled
+                lrouter = self._fetch_lrouter(ctx, router_id)
+            status = self._get_router_status(lrouter)
+            if status != router_status:
+                updates.setdefault(status, []).append(router_id)
+        self._update_status(ctx, l3_db.Router, updates)
 
     def synchronize_port(self, context, neutron_port_data,
                          lswitchport=None, ext_networks=None):
@@ -427,38 +497,11 @@ class NsxSynchronizer():
                 return
 
         if not lswitchport:
-            # Try to get port from nsx
-            try:
-                ls_uuid, lp_uuid = nsx_utils.get_nsx_switch_and_port_id(
-                    context.session, self._cluster, neutron_port_data['id'])
-                if lp_uuid:
-                    lswitchport = switchlib.get_port(
-                        self._cluster, ls_uuid, lp_uuid,
-                        relations='LogicalPortStatus')
-            except (exceptions.PortNotFoundOnNetwork):
-                # NOTE(salv-orlando): We should be catching
-                # api_exc.ResourceNotFound here instead
-                # of PortNotFoundOnNetwork when the id exists but
-                # the logical switch port was not found
-                LOG.warning(_("Logical switch port for neutron port %s "
-                              "not found on NSX."), neutron_port_data['id'])
-                lswitchport = None
-            else:
-                # If lswitchport is not None, update the cache.
-                # It could be none if the port was deleted from the backend
-                if lswitchport:
-                    self._nsx_cache.update_lswitchport(lswitchport)
+            lswitchport = self._fetch_lswitchport(context,
+                                                  neutron_port_data['id'])
         # Note(salv-orlando): It might worth adding a check to verify neutron
         # resource tag in nsx entity matches Neutron id.
-        # By default assume things go wrong
-        status = constants.PORT_STATUS_ERROR
-        if lswitchport:
-            lp_status = (lswitchport['_relations']
-                         ['LogicalPortStatus']
-                         ['fabric_status_up'])
-            status = (lp_status and
-                      constants.PORT_STATUS_ACTIVE
-                      or constants.PORT_STATUS_DOWN)
+        status = self._get_port_status(lswitchport)
 
         # Update db object
         if status == neutron_port_data['status']:
@@ -478,6 +521,42 @@ class NsxSynchronizer():
                           {'q_id': neutron_port_data['id'],
                            'status': status})
 
+    def _fetch_lswitchport(self, context, port_id):
+        # Try to get port from nsx
+        lswitchport = None
+        try:
+            ls_uuid, lp_uuid = nsx_utils.get_nsx_switch_and_port_id(
+                context.session, self._cluster, port_id)
+            if lp_uuid:
+                lswitchport = switchlib.get_port(
+                    self._cluster, ls_uuid, lp_uuid,
+                    relations='LogicalPortStatus')
+        except (exceptions.PortNotFoundOnNetwork):
+            # NOTE(salv-orlando): We should be catching
+            # api_exc.ResourceNotFound here instead
+            # of PortNotFoundOnNetwork when the id exists but
+            # the logical switch port was not found
+            LOG.warning(_("Logical switch port for neutron port %s "
+                          "not found on NSX."), port_id)
+            return None
+        # If lswitchport is not None, update the cache.
+        # It could be none if the port was deleted from the backend
+        if lswitchport:
+            self._nsx_cache.update_lswitchport(lswitchport)
+        return lswitchport
+
+    def _get_port_status(self, lswitchport):
+        # By default assume things go wrong
+        status = constants.PORT_STATUS_ERROR
+        if lswitchport:
+            lp_status = (lswitchport['_relations']
+                         ['LogicalPortStatus']
+                         ['fabric_status_up'])
+            status = (lp_status and
+                      constants.PORT_STATUS_ACTIVE
+                      or constants.PORT_STATUS_DOWN)
+        return status
+
     def _synchronize_lswitchports(self, ctx, lp_uuids, scan_missing=False):
         if not lp_uuids and not scan_missing:
             return
@@ -494,25 +573,28 @@ class NsxSynchronizer():
             if neutron_port_id:
                 neutron_port_mappings[neutron_port_id] = (
                     self._nsx_cache[lp_uuid])
-        # Fetch neutron ports from database
-        # At the first sync we need to fetch all ports
-        filters = ({} if scan_missing else
-                   {'id': neutron_port_mappings.keys()})
-        # TODO(salv-orlando): Work out a solution for avoiding
-        # this query
-        ext_nets = [net['id'] for net in ctx.session.query(
-            models_v2.Network).join(
+        # Fetch the status of neutron ports from database, skipping ports
+        # on external networks. At the first sync we need all ports.
+        query = ctx.session.query(
+            models_v2.Port.id, models_v2.Port.status).outerjoin(
                 external_net_db.ExternalNetwork,
-                (models_v2.Network.id ==
-                 external_net_db.ExternalNetwork.network_id))]
-        ports = self._plugin._get_collection(
-            ctx, models_v2.Port, self._plugin._make_port_dict,
-            filters=filters)
-        for port in ports:
-            lswitchport = neutron_port_mappings.get(port['id'])
-            self.synchronize_port(
-                ctx, port, lswitchport and lswitchport.get('data'),
-                ext_networks=ext_nets)
+                (models_v2.Port.network_id ==
+                 external_net_db.ExternalNetwork.network_id)).filter(
+                     external_net_db.ExternalNetwork.network_id == sql.null())
+        if not scan_missing:
+            query = query.filter(
+                models_v2.Port.id.in_(neutron_port_mappings.keys()))
+        updates = {}
+        for port_id, port_status in query:
+            if port_id in neutron_port_mappings:
+                lswitchport = neutron_port_mappings[port_id].get('data')
+            else:
+                # Not in the cache yet, e.g. created after it was filled
+                lswitchport = self._fetch_lswitchport(ctx, port_id)
+            status = self._get_port_status(lswitchport)
+            if status != port_status:
+                updates.setdefault(status, []).append(port_id)
+        self._update_status(ctx, models_v2.Port, updates)
 
     def _get_chunk_size(self, sp):
         # NOTE(salv-orlando): Try to use __future__ for this routine only?
@@ -598,6 +680,45 @@ class NsxSynchronizer():
                    'num_lrouters': len(lrouters)})
         return (lswitches, lrouters, lswitchports)
 
+    def _lease_holder(self):
+        # Not cached, as API workers fork after the plugin is loaded
+        return '%s:%d' % (utils.get_hostname(), os.getpid())
+
+    def _update_leases(self, ctx, sp):
+        """Renew the synchronization leases held by this process.
+
+        At the start of every run this process also tries to take the lease
+        on one more resource type, so that the resource types spread across
+        the processes sharing the database.
+        """
+        holder = self._lease_holder()
+        now = timeutils.utcnow()
+        expires = now + datetime.timedelta(
+            seconds=LEASE_INTERVALS * (self._sync_interval +
+                                       self._max_rand_delay))
+        for shard, _cursor in SYNC_SHARDS:
+            if (shard in sp.shards and
+                not nsx_db.renew_sync_lease(ctx.session, shard,
+                                            holder, expires)):
+                LOG.info(_("Lost the state synchronization lease for %s"),
+                         shard)
+                sp.shards.discard(shard)
+                self._nsx_cache.clear(shard)
+        if sp.current_chunk == 0:
+            for shard, _cursor in SYNC_SHARDS:
+                if (shard not in sp.shards and
+                    nsx_db.acquire_sync_lease(ctx.session, shard,
+                                              holder, expires, now)):
+                    LOG.info(_("Acquired the state synchronization lease "
+                               "for %s"), shard)
+                    sp.shards.add(shard)
+                    # The new resource type needs a full scan
+                    sp.init_sync_performed = False
+                    break
+        for shard, cursor in SYNC_SHARDS:
+            if shard not in sp.shards:
+                setattr(sp, cursor, None)
+
     def _synchronize_state(self, sp):
         # If the plugin has been destroyed, stop the LoopingCall
         if not self._plugin:
@@ -606,6 +727,18 @@ class NsxSynchronizer():
         # Reset page cursor variables if necessary
         if sp.current_chunk == 0:
             sp.ls_cursor = sp.lr_cursor = sp.lp_cursor = 'start'
+        # Get an admin context
+        ctx = context.get_admin_context()
+        if self._use_leases:
+            self._update_leases(ctx, sp)
+            if not sp.shards:
+                LOG.debug(_("State synchronization is performed by "
+                            "other processes"))
+                sp.current_chunk = 0
+                return self._sync_interval
+            shards = sp.shards
+        else:
+            shards = [shard for shard, _cursor in SYNC_SHARDS]
         LOG.info(_("Running state synchronization task. Chunk: %s"),
                  sp.current_chunk)
         # Fetch chunk_size data from NSX
@@ -647,15 +780,16 @@ class NsxSynchronizer():
                 changed_only=not scan_missing)
         LOG.debug(_("Time elapsed hashing data: %s"),
                   timeutils.utcnow() - start)
-        # Get an admin context
-        ctx = context.get_admin_context()
         # Synchronize with database
-        self._synchronize_lswitches(ctx, ls_uuids,
-                                    scan_missing=scan_missing)
-        self._synchronize_lrouters(ctx, lr_uuids,
-                                   scan_missing=scan_missing)
-        self._synchronize_lswitchports(ctx, lp_uuids,
+        if 'lswitches' in shards:
+            self._synchronize_lswitches(ctx, ls_uuids,
+                                        scan_missing=scan_missing)
+        if 'lrouters' in shards:
+            self._synchronize_lrouters(ctx, lr_uuids,
                                        scan_missing=scan_missing)
+        if 'lswitchports' in shards:
+            self._synchronize_lswitchports(ctx, lp_uuids,
+                                           scan_missing=scan_missing)
         # Increase chunk counter
         LOG.info(_("Synchronization for chunk %(chunk_num)d of "
                    "%(total_chunks)d performed"),
@@ -191,3 +191,30 @@ def is_multiprovider_network(session, network_id):
         return bool(
             session.query(models.MultiProviderNetworks).filter_by(
                 network_id=network_id).first())
+
+
+def renew_sync_lease(session, shard, holder, expires):
+    """Extend a lease currently held by holder. Returns False if lost."""
+    with session.begin(subtransactions=True):
+        return bool(session.query(models.NsxSyncLease).filter_by(
+            shard=shard, holder=holder).update(
+                {'expires': expires}, synchronize_session=False))
+
+
+def acquire_sync_lease(session, shard, holder, expires, now):
+    """Take a lease which is free or expired. Returns False if taken."""
+    with session.begin(subtransactions=True):
+        if session.query(models.NsxSyncLease).filter(
+            models.NsxSyncLease.shard == shard,
+            models.NsxSyncLease.expires < now).update(
+                {'holder': holder, 'expires': expires},
+                synchronize_session=False):
+            return True
+    try:
+        with session.begin(subtransactions=True):
+            session.add(models.NsxSyncLease(shard=shard, holder=holder,
+                                            expires=expires))
+    except db_exc.DBDuplicateEntry:
+        # Somebody else holds it
+        return False
+    return True
@@ -15,8 +15,9 @@
 #    under the License.
 
 
-from sqlalchemy import Boolean, Column, Enum, ForeignKey, Integer, String
 from sqlalchemy import orm
+from sqlalchemy import (Boolean, Column, DateTime, Enum, ForeignKey,
+                        Integer, String)
 
 from neutron.db import l3_db
 from neutron.db import model_base
@@ -133,3 +134,16 @@ class NSXRouterExtAttributes(model_base.BASEV2):
         l3_db.Router,
         backref=orm.backref("nsx_attributes", lazy='joined',
                             uselist=False, cascade='delete'))
+
+
+class NsxSyncLease(model_base.BASEV2):
+    """Lease on a share of the NSX state synchronization work.
+
+    Only the holder of an unexpired lease synchronizes the corresponding
+    resource type, so that API workers and servers sharing the database
+    do not repeat each other's work.
+    """
+    __tablename__ = 'nsx_sync_leases'
+    shard = Column(String(36), primary_key=True)
+    holder = Column(String(255), nullable=False)
+    expires = Column(DateTime, nullable=False)
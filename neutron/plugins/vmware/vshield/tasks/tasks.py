@@ -14,17 +14,19 @@
 #    under the License.
 
 import collections
+import time
 import uuid
 
 from eventlet import event
 from eventlet import greenthread
+from eventlet import semaphore
 
 from neutron.common import exceptions
 from neutron.openstack.common import log as logging
-from neutron.openstack.common import loopingcall
 from neutron.plugins.vmware.vshield.tasks import constants
 
 DEFAULT_INTERVAL = 1000
+DEFAULT_WORKERS = 16
 
 LOG = logging.getLogger(__name__)
 
@@ -61,6 +63,8 @@ class Task():
         self.userdata = userdata
         self.id = None
         self.status = None
+        self._queued_at = None
+        self._started_at = None
 
         self._monitors = {
             constants.TaskState.START: [],
@@ -148,12 +152,22 @@ class Task():
 
 
 class TaskManager():
+    """Run tasks for different resources concurrently.
+
+    Tasks for the same resource are processed in the order they were added
+    by a green thread dedicated to that resource, which then polls the
+    status of a pending task every interval milliseconds. At most 'workers'
+    callbacks run at the same time across all resources, so that a burst of
+    operations on many Edges does not flood vShield Manager.
+    """
 
     _instance = None
     _default_interval = DEFAULT_INTERVAL
+    _default_workers = DEFAULT_WORKERS
 
-    def __init__(self, interval=None):
+    def __init__(self, interval=None, workers=None):
         self._interval = interval or TaskManager._default_interval
+        self._workers = workers or TaskManager._default_workers
 
         # A queue to pass tasks from other threads
         self._tasks_queue = collections.deque()
@@ -161,8 +175,14 @@ class TaskManager():
         # A dict to store resource -> resource's tasks
         self._tasks = {}
 
-        # Current task being executed in main thread
-        self._main_thread_exec_task = None
+        # A dict to store resource -> thread processing resource's tasks
+        self._resource_threads = {}
+
+        # Limits the number of callbacks running at the same time
+        self._slots = semaphore.Semaphore(self._workers)
+
+        # Queue depth and timings by task type
+        self._stats = {}
 
         # New request event
         self._req = event.Event()
@@ -170,17 +190,28 @@ class TaskManager():
         # TaskHandler stopped event
         self._stopped = False
 
-        # Periodic function trigger
-        self._monitor = None
-        self._monitor_busy = False
-
         # Thread handling the task request
         self._thread = None
 
+    def _task_stats(self, task):
+        # Tasks are classified by the operation they perform
+        task_type = getattr(task._execute_callback, '__name__',
+                            str(task._execute_callback)).strip('_')
+        stats = self._stats.get(task_type)
+        if stats is None:
+            stats = self._stats[task_type] = {
+                'queue_depth': 0,
+                'completed': 0,
+                'wait_time': 0.0,
+                'execution_time': 0.0
+            }
+        return stats
+
     def _execute(self, task):
         """Execute task."""
         msg = _("Start task %s") % str(task)
         LOG.debug(msg)
+        task._started_at = time.time()
         task._start()
         try:
             status = task._execute_callback(task)
@@ -200,6 +231,19 @@ class TaskManager():
 
         return status
 
+    def _check_status(self, task):
+        """Check the status of an executed task."""
+        try:
+            status = task._status_callback(task)
+        except Exception:
+            msg = _("Task %(task)s encountered exception in %(cb)s") % {
+                'task': str(task),
+                'cb': str(task._status_callback)}
+            LOG.exception(msg)
+            status = constants.TaskStatus.ERROR
+        task._update_status(status)
+        return status
+
     def _result(self, task):
         """Notify task execution result."""
         try:
@@ -213,29 +257,51 @@ class TaskManager():
         LOG.debug(_("Task %(task)s return %(status)s"),
                   {'task': str(task), 'status': task.status})
 
-        task._finished()
+        stats = self._task_stats(task)
+        stats['queue_depth'] -= 1
+        if task._started_at is not None:
+            stats['completed'] += 1
+            stats['wait_time'] += task._started_at - task._queued_at
+            stats['execution_time'] += time.time() - task._started_at
 
-    def _check_pending_tasks(self):
-        """Check all pending tasks status."""
-        for resource_id in self._tasks.keys():
-            if self._stopped:
-                # Task manager is stopped, return now
-                return
+        task._finished()
 
-            tasks = self._tasks[resource_id]
-            # only the first task is executed and pending
-            task = tasks[0]
-            try:
-                status = task._status_callback(task)
-            except Exception:
-                msg = _("Task %(task)s encountered exception in %(cb)s") % {
-                    'task': str(task),
-                    'cb': str(task._status_callback)}
-                LOG.exception(msg)
-                status = constants.TaskStatus.ERROR
-            task._update_status(status)
-            if status != constants.TaskStatus.PENDING:
-                self._dequeue(task, True)
+    def _process_task(self, task):
+        with self._slots:
+            status = self._execute(task)
+        while status == constants.TaskStatus.PENDING:
+            greenthread.sleep(self._interval / 1000.0)
+            with self._slots:
+                status = self._check_status(task)
+        with self._slots:
+            self._result(task)
+
+    def _process_resource(self, resource_id):
+        """Run the tasks queued for a resource one after the other."""
+        tasks = self._tasks[resource_id]
+        try:
+            while tasks:
+                task = tasks[0]
+                try:
+                    self._process_task(task)
+                except Exception:
+                    LOG.exception(_("Processing of task %s failed"), task)
+                    self._fail(task)
+                tasks.popleft()
+        finally:
+            if not tasks:
+                del self._tasks[resource_id]
+            self._resource_threads.pop(resource_id, None)
+
+    def _fail(self, task):
+        """Finish a task whose processing raised, with an ERROR status."""
+        if task._state == constants.TaskState.RESULT:
+            return
+        task._update_status(constants.TaskStatus.ERROR)
+        try:
+            self._result(task)
+        except Exception:
+            LOG.exception(_("Task %s could not be finished"), task)
 
     def _enqueue(self, task):
         if task.resource_id in self._tasks:
@@ -247,24 +313,6 @@ class TaskManager():
             tasks.append(task)
             self._tasks[task.resource_id] = tasks
 
-    def _dequeue(self, task, run_next):
-        self._result(task)
-        tasks = self._tasks[task.resource_id]
-        tasks.remove(task)
-        if not tasks:
-            # no more tasks for this resource
-            del self._tasks[task.resource_id]
-            return
-
-        if run_next:
-            # process next task for this resource
-            while tasks:
-                task = tasks[0]
-                status = self._execute(task)
-                if status == constants.TaskStatus.PENDING:
-                    break
-                self._dequeue(task, False)
-
     def _abort(self):
         """Abort all tasks."""
         # put all tasks haven't been received by main thread to queue
@@ -274,10 +322,10 @@ class TaskManager():
         self._tasks_queue.clear()
 
         for resource_id in self._tasks.keys():
-            tasks = list(self._tasks[resource_id])
+            tasks = self._tasks.pop(resource_id)
             for task in tasks:
                 task._update_status(constants.TaskStatus.ABORT)
-                self._dequeue(task, False)
+                self._result(task)
 
     def _get_task(self):
         """Get task request."""
@@ -296,27 +344,12 @@ class TaskManager():
                     LOG.info(_("Stopping TaskManager"))
                     break
 
-                # get a task from queue, or timeout for periodic status check
                 task = self._get_task()
-                if task.resource_id in self._tasks:
-                    # this resource already has some tasks under processing,
-                    # append the task to same queue for ordered processing
-                    self._enqueue(task)
-                    continue
-
-                try:
-                    self._main_thread_exec_task = task
-                    self._execute(task)
-                finally:
-                    self._main_thread_exec_task = None
-                    if task.status is None:
-                        # The thread is killed during _execute(). To guarantee
-                        # the task been aborted correctly, put it to the queue.
-                        self._enqueue(task)
-                    elif task.status != constants.TaskStatus.PENDING:
-                        self._result(task)
-                    else:
-                        self._enqueue(task)
+                self._enqueue(task)
+                if task.resource_id not in self._resource_threads:
+                    self._resource_threads[task.resource_id] = (
+                        greenthread.spawn(self._process_resource,
+                                          task.resource_id))
             except Exception:
                 LOG.exception(_("TaskManager terminating because "
                                 "of an exception"))
@@ -324,6 +357,8 @@ class TaskManager():
 
     def add(self, task):
         task.id = uuid.uuid1()
+        task._queued_at = time.time()
+        self._task_stats(task)['queue_depth'] += 1
         self._tasks_queue.append(task)
         if not self._req.ready():
             self._req.send()
@@ -335,15 +370,15 @@ class TaskManager():
         self._stopped = True
         self._thread.kill()
         self._thread = None
-        # Stop looping call and abort running tasks
-        self._monitor.stop()
-        if self._monitor_busy:
-            self._monitor.wait()
+        # Stop resource threads and abort running tasks
+        for thread in self._resource_threads.values():
+            thread.kill()
+        self._resource_threads.clear()
         self._abort()
         LOG.info(_("TaskManager terminated"))
 
     def has_pending_task(self):
-        if self._tasks_queue or self._tasks or self._main_thread_exec_task:
+        if self._tasks_queue or self._tasks:
             return True
         else:
             return False
@@ -354,8 +389,6 @@ class TaskManager():
         for resource, tasks in self._tasks.iteritems():
             for task in tasks:
                 LOG.info(str(task))
-        if self._main_thread_exec_task:
-            LOG.info(str(self._main_thread_exec_task))
 
     def count(self):
         count = 0
@@ -363,30 +396,28 @@ class TaskManager():
             count += len(tasks)
         return count
 
+    def get_stats(self):
+        """Return queue depth and timings of tasks by task type.
+
+        wait_time and execution_time are the total seconds completed tasks
+        spent in the queue and from execution to result respectively.
+        """
+        return dict((task_type, dict(stats))
+                    for task_type, stats in self._stats.iteritems())
+
     def start(self, interval=None):
         def _inner():
             self.run()
 
-        def _loopingcall_callback():
-            self._monitor_busy = True
-            try:
-                self._check_pending_tasks()
-            except Exception:
-                LOG.exception(_("Exception in _check_pending_tasks"))
-            self._monitor_busy = False
-
         if self._thread is not None:
             return self
 
         if interval is None or interval == 0:
             interval = self._interval
+        self._interval = interval
 
         self._stopped = False
         self._thread = greenthread.spawn(_inner)
-        self._monitor = loopingcall.FixedIntervalLoopingCall(
-            _loopingcall_callback)
-        self._monitor.start(interval / 1000.0,
-                            interval / 1000.0)
         # To allow the created thread start running
         greenthread.sleep(0)
 
@@ -395,3 +426,7 @@ class TaskManager():
     @classmethod
     def set_default_interval(cls, interval):
         cls._default_interval = interval
+
+    @classmethod
+    def set_default_workers(cls, workers):
+        cls._default_workers = workers
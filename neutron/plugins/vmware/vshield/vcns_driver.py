@@ -46,6 +46,7 @@ class VcnsDriver(edge_appliance_driver.EdgeApplianceDriver,
         self.datastore_id = cfg.CONF.vcns.datastore_id
         self.external_network = cfg.CONF.vcns.external_network
         interval = cfg.CONF.vcns.task_status_check_interval
-        self.task_manager = tasks.TaskManager(interval)
+        workers = cfg.CONF.vcns.task_workers
+        self.task_manager = tasks.TaskManager(interval, workers)
         self.task_manager.start()
         self.vcns = vcns.Vcns(self.vcns_uri, self.vcns_user, self.vcns_passwd)
@@ -26,6 +26,7 @@ class LbaasAgentApi(n_rpc.RpcProxy):
     #   2.0 Generic API for agent based drivers
     #       - get_logical_device() handling changed on plugin side;
     #       - pool_deployed() and update_status() methods added;
+    #   2.1 update_pools_stats() added
 
     def __init__(self, topic, context, host):
         super(LbaasAgentApi, self).__init__(topic, self.API_VERSION)
@@ -96,3 +97,15 @@ class LbaasAgentApi(n_rpc.RpcProxy):
             ),
             topic=self.topic
         )
+
+    def update_pools_stats(self, stats):
+        return self.call(
+            self.context,
+            self.make_msg(
+                'update_pools_stats',
+                stats=stats,
+                host=self.host
+            ),
+            topic=self.topic,
+            version='2.1'
+        )
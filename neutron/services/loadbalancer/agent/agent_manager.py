@@ -14,6 +14,7 @@
 #
 # @author: Mark McClain, DreamHost
 
+import eventlet
 from oslo.config import cfg
 
 from neutron.agent import rpc as agent_rpc
@@ -41,6 +42,10 @@ OPTS = [
 ]
 
 
+# Number of pools whose stats are read at the same time
+STATS_POOL_SIZE = 32
+
+
 class DeviceNotFoundOnAgent(n_exc.NotFound):
     msg = _('Unknown device with pool_id %(pool_id)s')
 
@@ -80,6 +85,9 @@ class LbaasAgentManager(n_rpc.RpcCallback, periodic_task.PeriodicTasks):
         self.needs_resync = False
         # pool_id->device_driver_name mapping used to store known instances
         self.instance_mapping = {}
+        # pool_id->stats last reported to the plugin
+        self.reported_stats = {}
+        self.batch_stats_supported = True
 
     def _load_drivers(self):
         self.device_drivers = {}
@@ -129,20 +137,54 @@ class LbaasAgentManager(n_rpc.RpcCallback, periodic_task.PeriodicTasks):
             self.needs_resync = False
             self.sync_state()
 
+    def _get_pool_stats(self, pool_id, driver_name):
+        try:
+            return pool_id, self.device_drivers[driver_name].get_stats(pool_id)
+        except Exception:
+            LOG.exception(_('Error updating statistics on pool %s'), pool_id)
+            self.needs_resync = True
+            return pool_id, None
+
     @periodic_task.periodic_task(spacing=6)
     def collect_stats(self, context):
-        for pool_id, driver_name in self.instance_mapping.items():
-            driver = self.device_drivers[driver_name]
+        pool = eventlet.GreenPool(STATS_POOL_SIZE)
+        changed = {}
+        for pool_id, stats in pool.starmap(self._get_pool_stats,
+                                           self.instance_mapping.items()):
+            # Only stats which changed since the last cycle are reported
+            if stats and stats != self.reported_stats.get(pool_id):
+                changed[pool_id] = stats
+        for pool_id in set(self.reported_stats) - set(self.instance_mapping):
+            del self.reported_stats[pool_id]
+        if not changed:
+            return
+
+        try:
+            self._update_pools_stats(changed)
+        except Exception:
+            LOG.exception(_('Error updating statistics on pools %s'),
+                          ', '.join(changed))
+            self.needs_resync = True
+            return
+        self.reported_stats.update(changed)
+
+    def _update_pools_stats(self, pools_stats):
+        if self.batch_stats_supported:
             try:
-                stats = driver.get_stats(pool_id)
-                if stats:
-                    self.plugin_rpc.update_pool_stats(pool_id, stats)
-            except Exception:
-                LOG.exception(_('Error updating statistics on pool %s'),
-                              pool_id)
-                self.needs_resync = True
+                self.plugin_rpc.update_pools_stats(pools_stats)
+                return
+            except n_rpc.RemoteError as e:
+                if e.exc_type != 'UnsupportedVersion':
+                    raise
+                LOG.info(_('The plugin does not support batched statistics '
+                           'updates, reporting them pool by pool'))
+                self.batch_stats_supported = False
+        for pool_id, stats in pools_stats.items():
+            self.plugin_rpc.update_pool_stats(pool_id, stats)
 
     def sync_state(self):
+        # report the stats of every pool again after a resync
+        self.reported_stats.clear()
         known_instances = set(self.instance_mapping.keys())
         try:
             ready_instances = set(self.plugin_rpc.get_ready_devices())
@@ -210,6 +252,11 @@ class LbaasAgentManager(n_rpc.RpcCallback, periodic_task.PeriodicTasks):
                        'id': obj_id, 'driver': driver})
         self.plugin_rpc.update_status(obj_type, obj_id, constants.ERROR)
 
+    def _forget_reported_stats(self, pool_id):
+        # Statuses were just written by the agent, so the next stats cycle
+        # must report the member statuses even if haproxy's didn't change
+        self.reported_stats.pop(pool_id, None)
+
     def create_vip(self, context, vip):
         driver = self._get_driver(vip['pool_id'])
         try:
@@ -219,6 +266,7 @@ class LbaasAgentManager(n_rpc.RpcCallback, periodic_task.PeriodicTasks):
                                             driver.get_name())
         else:
             self.plugin_rpc.update_status('vip', vip['id'], constants.ACTIVE)
+        self._forget_reported_stats(vip['pool_id'])
 
     def update_vip(self, context, old_vip, vip):
         driver = self._get_driver(vip['pool_id'])
@@ -229,10 +277,12 @@ class LbaasAgentManager(n_rpc.RpcCallback, periodic_task.PeriodicTasks):
                                             driver.get_name())
         else:
             self.plugin_rpc.update_status('vip', vip['id'], constants.ACTIVE)
+        self._forget_reported_stats(vip['pool_id'])
 
     def delete_vip(self, context, vip):
         driver = self._get_driver(vip['pool_id'])
         driver.delete_vip(vip)
+        self._forget_reported_stats(vip['pool_id'])
 
     def create_pool(self, context, pool, driver_name):
         if driver_name not in self.device_drivers:
@@ -249,6 +299,7 @@ class LbaasAgentManager(n_rpc.RpcCallback, periodic_task.PeriodicTasks):
         else:
             self.instance_mapping[pool['id']] = driver_name
             self.plugin_rpc.update_status('pool', pool['id'], constants.ACTIVE)
+        self._forget_reported_stats(pool['id'])
 
     def update_pool(self, context, old_pool, pool):
         driver = self._get_driver(pool['id'])
@@ -259,11 +310,13 @@ class LbaasAgentManager(n_rpc.RpcCallback, periodic_task.PeriodicTasks):
                                             driver.get_name())
         else:
             self.plugin_rpc.update_status('pool', pool['id'], constants.ACTIVE)
+        self._forget_reported_stats(pool['id'])
 
     def delete_pool(self, context, pool):
         driver = self._get_driver(pool['id'])
         driver.delete_pool(pool)
         del self.instance_mapping[pool['id']]
+        self._forget_reported_stats(pool['id'])
 
     def create_member(self, context, member):
         driver = self._get_driver(member['pool_id'])
@@ -275,6 +328,7 @@ class LbaasAgentManager(n_rpc.RpcCallback, periodic_task.PeriodicTasks):
         else:
             self.plugin_rpc.update_status('member', member['id'],
                                           constants.ACTIVE)
+        self._forget_reported_stats(member['pool_id'])
 
     def update_member(self, context, old_member, member):
         driver = self._get_driver(member['pool_id'])
@@ -286,10 +340,12 @@ class LbaasAgentManager(n_rpc.RpcCallback, periodic_task.PeriodicTasks):
         else:
             self.plugin_rpc.update_status('member', member['id'],
                                           constants.ACTIVE)
+        self._forget_reported_stats(member['pool_id'])
 
     def delete_member(self, context, member):
         driver = self._get_driver(member['pool_id'])
         driver.delete_member(member)
+        self._forget_reported_stats(member['pool_id'])
 
     def create_pool_health_monitor(self, context, health_monitor, pool_id):
         driver = self._get_driver(pool_id)
@@ -302,6 +358,7 @@ class LbaasAgentManager(n_rpc.RpcCallback, periodic_task.PeriodicTasks):
         else:
             self.plugin_rpc.update_status(
                 'health_monitor', assoc_id, constants.ACTIVE)
+        self._forget_reported_stats(pool_id)
 
     def update_pool_health_monitor(self, context, old_health_monitor,
                                    health_monitor, pool_id):
@@ -317,10 +374,12 @@ class LbaasAgentManager(n_rpc.RpcCallback, periodic_task.PeriodicTasks):
         else:
             self.plugin_rpc.update_status(
                 'health_monitor', assoc_id, constants.ACTIVE)
+        self._forget_reported_stats(pool_id)
 
     def delete_pool_health_monitor(self, context, health_monitor, pool_id):
         driver = self._get_driver(pool_id)
         driver.delete_pool_health_monitor(health_monitor, pool_id)
+        self._forget_reported_stats(pool_id)
 
     def agent_updated(self, context, payload):
         """Handle the agent_updated notification event."""
@@ -51,12 +51,13 @@ class DriverNotSpecified(n_exc.NeutronException):
 
 class LoadBalancerCallbacks(n_rpc.RpcCallback):
 
-    RPC_API_VERSION = '2.0'
+    RPC_API_VERSION = '2.1'
     # history
     #   1.0 Initial version
     #   2.0 Generic API for agent based drivers
     #       - get_logical_device() handling changed;
     #       - pool_deployed() and update_status() methods added;
+    #   2.1 update_pools_stats() added
 
     def __init__(self, plugin):
         super(LoadBalancerCallbacks, self).__init__()
@@ -231,6 +232,9 @@ class LoadBalancerCallbacks(n_rpc.RpcCallback):
     def update_pool_stats(self, context, pool_id=None, stats=None, host=None):
         self.plugin.update_pool_stats(context, pool_id, data=stats)
 
+    def update_pools_stats(self, context, stats=None, host=None):
+        self.plugin.update_pools_stats(context, stats or {})
+
 
 class LoadBalancerAgentApi(n_rpc.RpcProxy):
     """Plugin side of plugin to agent RPC API."""
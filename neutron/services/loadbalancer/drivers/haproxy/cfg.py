@@ -15,6 +15,8 @@
 # @author: Mark McClain, DreamHost
 
 import itertools
+import os
+
 from six import moves
 
 from neutron.agent.linux import utils
@@ -73,7 +75,10 @@ def _build_global(config, socket_path=None, user_group='nogroup'):
     ]
 
     if socket_path:
-        opts.append('stats socket %s mode 0666 level user' % socket_path)
+        # The admin level lets the driver change member weights and states
+        # without a reload, so the socket is only open to the agent's user.
+        opts.append('stats socket %s mode 0600 level admin uid %d' %
+                    (socket_path, os.geteuid()))
 
     return itertools.chain(['global'], ('\t' + o for o in opts))
 
@@ -136,15 +141,17 @@ def _build_backend(config):
     persist_opts = _get_session_persistence(config)
     opts.extend(persist_opts)
 
-    # add the members
+    # add the members; administratively down members are kept in
+    # maintenance mode so that they can be enabled at runtime
     for member in config['members']:
-        if ((member['status'] in ACTIVE_PENDING_STATUSES or
-             member['status'] == INACTIVE)
-            and member['admin_state_up']):
+        if (member['status'] in ACTIVE_PENDING_STATUSES or
+                member['status'] == INACTIVE):
             server = (('server %(id)s %(address)s:%(protocol_port)s '
                        'weight %(weight)s') % member) + server_addon
             if _has_http_cookie_persistence(config):
                 server += ' cookie %d' % config['members'].index(member)
+            if not member['admin_state_up']:
+                server += ' disabled'
             opts.append(server)
 
     return itertools.chain(
@@ -24,9 +24,9 @@ from neutron.agent.common import config
 from neutron.agent.linux import ip_lib
 from neutron.agent.linux import utils
 from neutron.common import exceptions
-from neutron.common import utils as n_utils
 from neutron.openstack.common import excutils
 from neutron.openstack.common import importutils
+from neutron.openstack.common import lockutils
 from neutron.openstack.common import log as logging
 from neutron.plugins.common import constants
 from neutron.services.loadbalancer.agent import agent_device_driver
@@ -38,6 +38,9 @@ NS_PREFIX = 'qlbaas-'
 DRIVER_NAME = 'haproxy_ns'
 
 STATE_PATH_DEFAULT = '$state_path/lbaas'
+# Member attributes haproxy can change at runtime through its admin
+# socket; changing anything else requires a reload.
+RUNTIME_MEMBER_ATTRS = ('weight', 'admin_state_up')
 USER_GROUP_DEFAULT = 'nogroup'
 OPTS = [
     cfg.StrOpt(
@@ -99,15 +102,21 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
         extra_args.extend(p.strip() for p in open(pid_path, 'r'))
         self._spawn(logical_config, extra_args)
 
-    def _spawn(self, logical_config, extra_cmd_args=()):
+    def _save_config(self, logical_config):
         pool_id = logical_config['pool']['id']
-        namespace = get_ns_name(pool_id)
         conf_path = self._get_state_file_path(pool_id, 'conf')
-        pid_path = self._get_state_file_path(pool_id, 'pid')
         sock_path = self._get_state_file_path(pool_id, 'sock')
         user_group = self.conf.haproxy.user_group
 
         hacfg.save_config(conf_path, logical_config, sock_path, user_group)
+        return conf_path
+
+    def _spawn(self, logical_config, extra_cmd_args=()):
+        pool_id = logical_config['pool']['id']
+        namespace = get_ns_name(pool_id)
+        pid_path = self._get_state_file_path(pool_id, 'pid')
+
+        conf_path = self._save_config(logical_config)
         cmd = ['haproxy', '-f', conf_path, '-p', pid_path]
         cmd.extend(extra_cmd_args)
 
@@ -117,8 +126,16 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
         # remember the pool<>port mapping
         self.pool_to_port_id[pool_id] = logical_config['vip']['port']['id']
 
-    @n_utils.synchronized('haproxy-driver')
+    def _pool_lock(self, pool_id):
+        # Every pool runs its own haproxy, so only operations on the same
+        # pool need to wait for each other.
+        return lockutils.lock('haproxy-driver-%s' % pool_id)
+
     def undeploy_instance(self, pool_id, cleanup_namespace=False):
+        with self._pool_lock(pool_id):
+            self._undeploy_instance(pool_id, cleanup_namespace)
+
+    def _undeploy_instance(self, pool_id, cleanup_namespace=False):
         namespace = get_ns_name(pool_id)
         ns = ip_lib.IPWrapper(self.root_helper, namespace)
         pid_path = self._get_state_file_path(pool_id, 'pid')
@@ -186,6 +203,9 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
         res = {}
         for stats in parsed_stats:
             if stats.get('type') == TYPE_SERVER_RESPONSE:
+                if stats['status'].startswith('MAINT'):
+                    # administratively down member
+                    continue
                 res[stats['svname']] = {
                     lb_const.STATS_STATUS: (constants.INACTIVE
                                             if stats['status'] == 'DOWN'
@@ -213,6 +233,34 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
             LOG.warn(_('Error while connecting to stats socket: %s'), e)
             return {}
 
+    def _run_socket_commands(self, pool_id, commands):
+        """Run admin commands on the pool's haproxy, return success."""
+        socket_path = self._get_state_file_path(pool_id, 'sock')
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(socket_path)
+            s.sendall('%s\n' % ';'.join(commands))
+            # haproxy answers successful commands with empty lines and
+            # closes the connection when it's done
+            response = ''
+            while True:
+                chunk = s.recv(1024)
+                if not chunk:
+                    break
+                response += chunk
+        except socket.error as e:
+            LOG.warn(_('Error while connecting to stats socket: %s'), e)
+            return False
+        finally:
+            s.close()
+
+        if response.strip():
+            LOG.warn(_('haproxy rejected runtime update of pool %(pool)s: '
+                       '%(error)s'), {'pool': pool_id,
+                                      'error': response.strip()})
+            return False
+        return True
+
     def _parse_stats(self, raw_stats):
         stat_lines = raw_stats.splitlines()
         if len(stat_lines) < 2:
@@ -292,17 +340,25 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
         interface_name = self.vif_driver.get_device_name(Wrap(port_stub))
         self.vif_driver.unplug(interface_name, namespace=namespace)
 
-    @n_utils.synchronized('haproxy-driver')
     def deploy_instance(self, logical_config):
+        if not logical_config:
+            return
+        with self._pool_lock(logical_config['pool']['id']):
+            self._deploy_instance(logical_config)
+
+    def _is_deployable(self, logical_config):
         # do actual deploy only if vip and pool are configured and active
-        if (not logical_config or
-                'vip' not in logical_config or
-                (logical_config['vip']['status'] not in
-                 constants.ACTIVE_PENDING_STATUSES) or
-                not logical_config['vip']['admin_state_up'] or
-                (logical_config['pool']['status'] not in
-                 constants.ACTIVE_PENDING_STATUSES) or
-                not logical_config['pool']['admin_state_up']):
+        return not (not logical_config or
+                    'vip' not in logical_config or
+                    (logical_config['vip']['status'] not in
+                     constants.ACTIVE_PENDING_STATUSES) or
+                    not logical_config['vip']['admin_state_up'] or
+                    (logical_config['pool']['status'] not in
+                     constants.ACTIVE_PENDING_STATUSES) or
+                    not logical_config['pool']['admin_state_up'])
+
+    def _deploy_instance(self, logical_config):
+        if not self._is_deployable(logical_config):
             return
 
         if self.exists(logical_config['pool']['id']):
@@ -311,8 +367,37 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
             self.create(logical_config)
 
     def _refresh_device(self, pool_id):
-        logical_config = self.plugin_rpc.get_logical_device(pool_id)
-        self.deploy_instance(logical_config)
+        # The logical device is fetched under the lock so that concurrent
+        # refreshes of a pool can't deploy an older configuration last.
+        with self._pool_lock(pool_id):
+            logical_config = self.plugin_rpc.get_logical_device(pool_id)
+            self._deploy_instance(logical_config)
+
+    def _update_member_runtime(self, member):
+        """Apply a member's weight and admin state without a reload.
+
+        Returns False if the change couldn't be applied this way, in which
+        case the caller falls back to a full refresh.
+        """
+        pool_id = member['pool_id']
+        with self._pool_lock(pool_id):
+            if not self.exists(pool_id):
+                return False
+            logical_config = self.plugin_rpc.get_logical_device(pool_id)
+            if not self._is_deployable(logical_config):
+                return False
+            members = dict((m['id'], m) for m in logical_config['members'])
+            member = members.get(member['id'])
+            if not member:
+                return False
+
+            # Keep the configuration in line for the next reload
+            self._save_config(logical_config)
+            server = '%s/%s' % (pool_id, member['id'])
+            commands = ['set weight %s %s' % (server, member['weight']),
+                        '%s server %s' % ('enable' if member['admin_state_up']
+                                          else 'disable', server)]
+            return self._run_socket_commands(pool_id, commands)
 
     def create_vip(self, vip):
         self._refresh_device(vip['pool_id'])
@@ -340,6 +425,12 @@ class HaproxyNSDriver(agent_device_driver.AgentDeviceDriver):
         self._refresh_device(member['pool_id'])
 
     def update_member(self, old_member, member):
+        changed = set(key for key, value in member.items()
+                      if old_member.get(key) != value)
+        changed -= set(['status', 'status_description'])
+        if (changed.issubset(RUNTIME_MEMBER_ATTRS) and
+                self._update_member_runtime(member)):
+            return
         self._refresh_device(member['pool_id'])
 
     def delete_member(self, member):
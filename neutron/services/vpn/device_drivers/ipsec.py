@@ -14,10 +14,12 @@
 #    under the License.
 import abc
 import copy
+import hashlib
 import os
 import re
 import shutil
 
+import eventlet
 import jinja2
 import netaddr
 from oslo.config import cfg
@@ -28,6 +30,7 @@ from neutron.agent.linux import ip_lib
 from neutron.agent.linux import utils
 from neutron.common import rpc as n_rpc
 from neutron import context
+from neutron.openstack.common import jsonutils
 from neutron.openstack.common import lockutils
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import loopingcall
@@ -76,6 +79,9 @@ STATUS_MAP = {
 
 IPSEC_CONNS = 'ipsec_site_connections'
 
+# Upper bound on concurrent 'ipsec whack --status' calls per report cycle
+STATUS_POOL_SIZE = 16
+
 
 def _get_template(template_file):
     global JINJA_ENV
@@ -133,6 +139,9 @@ class BaseSwanProcess():
         self.updated_pending_status = False
         self.namespace = namespace
         self.connection_status = {}
+        # Fingerprint of the vpnservice the running pluto was configured
+        # with, or None if the config has not been applied (successfully).
+        self.applied_fingerprint = None
         self.config_dir = os.path.join(
             cfg.CONF.ipsec.config_base_dir, self.id)
         self.etc_dir = os.path.join(self.config_dir, 'etc')
@@ -154,6 +163,21 @@ class BaseSwanProcess():
         self.vpnservice = vpnservice
         self.translate_dialect()
 
+    def config_fingerprint(self):
+        """Digest of the vpnservice, ignoring the status fields.
+
+        Statuses are rewritten by the server and by update() all the time
+        but never end up in the generated config files.
+        """
+        if not self.vpnservice:
+            return None
+        vpnservice = copy.deepcopy(self.vpnservice)
+        vpnservice.pop('status', None)
+        for ipsec_site_conn in vpnservice.get(IPSEC_CONNS, []):
+            ipsec_site_conn.pop('status', None)
+        return hashlib.sha1(
+            jsonutils.dumps(vpnservice, sort_keys=True)).hexdigest()
+
     def _dialect(self, obj, key):
         obj[key] = self.DIALECT_MAP.get(obj[key], obj[key])
 
@@ -216,15 +240,22 @@ class BaseSwanProcess():
 
     def update(self):
         """Update Status based on vpnservice configuration."""
+        status = None
         if self.vpnservice and not self.vpnservice['admin_state_up']:
             self.disable()
+        elif (self.applied_fingerprint is not None and
+              self.applied_fingerprint == self.config_fingerprint() and
+              self.active):
+            # The running process already has this configuration, so
+            # there is nothing to regenerate or restart.
+            status = constants.ACTIVE
         else:
             self.enable()
 
         if plugin_utils.in_pending_status(self.vpnservice['status']):
             self.updated_pending_status = True
 
-        self.vpnservice['status'] = self.status
+        self.vpnservice['status'] = status or self.status
         for ipsec_site_conn in self.vpnservice['ipsec_site_connections']:
             if plugin_utils.in_pending_status(ipsec_site_conn['status']):
                 conn_id = ipsec_site_conn['id']
@@ -242,13 +273,16 @@ class BaseSwanProcess():
                 self.restart()
             else:
                 self.start()
+            self.applied_fingerprint = self.config_fingerprint()
         except RuntimeError:
+            self.applied_fingerprint = None
             LOG.exception(
                 _("Failed to enable vpn process on router %s"),
                 self.id)
 
     def disable(self):
         """Disabling the process."""
+        self.applied_fingerprint = None
         try:
             if self.active:
                 self.stop()
@@ -501,6 +535,8 @@ class IPsecDriver(device_drivers.DeviceDriver):
 
         self.processes = {}
         self.process_status_cache = {}
+        # NAT rules currently installed for each router, see _sync_nat()
+        self.nat_rules = {}
 
         self.endpoints = [self]
         self.conn.create_consumer(node_topic, self.endpoints, fanout=False)
@@ -518,18 +554,39 @@ class IPsecDriver(device_drivers.DeviceDriver):
         :param vpnservice: vpnservices
         :param func: self.add_nat_rule or self.remove_nat_rule
         """
+        router_id = vpnservice['router_id']
+        for rule in self._get_nat_rules(vpnservice):
+            func(router_id, 'POSTROUTING', rule, top=True)
+        self.agent.iptables_apply(router_id)
+
+    def _get_nat_rules(self, vpnservice):
         local_cidr = vpnservice['subnet']['cidr']
+        return ['-s %s -d %s -m policy '
+                '--dir out --pol ipsec '
+                '-j ACCEPT ' % (local_cidr, peer_cidr)
+                for ipsec_site_connection in vpnservice[IPSEC_CONNS]
+                for peer_cidr in ipsec_site_connection['peer_cidrs']]
+
+    def _sync_nat(self, vpnservice):
+        """Bring the NAT rules of a vpnservice up to date.
+
+        Only the rules that changed since the previous sync are added or
+        removed, and iptables is not touched at all when nothing changed.
+        """
         router_id = vpnservice['router_id']
-        for ipsec_site_connection in vpnservice['ipsec_site_connections']:
-            for peer_cidr in ipsec_site_connection['peer_cidrs']:
-                func(
-                    router_id,
-                    'POSTROUTING',
-                    '-s %s -d %s -m policy '
-                    '--dir out --pol ipsec '
-                    '-j ACCEPT ' % (local_cidr, peer_cidr),
-                    top=True)
+        rules = self._get_nat_rules(vpnservice)
+        applied = self.nat_rules.get(router_id, [])
+        added = [rule for rule in rules if rule not in applied]
+        removed = [rule for rule in applied if rule not in rules]
+        if not added and not removed:
+            return
+        for rule in removed:
+            self.agent.remove_nat_rule(router_id, 'POSTROUTING', rule,
+                                       top=True)
+        for rule in added:
+            self.agent.add_nat_rule(router_id, 'POSTROUTING', rule, top=True)
         self.agent.iptables_apply(router_id)
+        self.nat_rules[router_id] = rules
 
     def vpnservice_updated(self, context, **kwargs):
         """Vpnservice updated rpc handler
@@ -572,7 +629,11 @@ class IPsecDriver(device_drivers.DeviceDriver):
             # In case of vpnservice is created
             # before router's namespace
             process = self.processes[process_id]
+            # The router has a fresh iptables manager, so every rule
+            # has to be added again.
             self._update_nat(process.vpnservice, self.agent.add_nat_rule)
+            self.nat_rules[process_id] = self._get_nat_rules(
+                process.vpnservice)
             process.enable()
 
     def destroy_router(self, process_id):
@@ -581,12 +642,17 @@ class IPsecDriver(device_drivers.DeviceDriver):
         Agent calls this method, when the process namespace
         is deleted.
         """
+        # The rules installed may come from an older configuration than
+        # the current vpnservice, so the cached ones are removed.
+        rules = self.nat_rules.pop(process_id, [])
         if process_id in self.processes:
             process = self.processes[process_id]
             process.disable()
-            vpnservice = process.vpnservice
-            if vpnservice:
-                self._update_nat(vpnservice, self.agent.remove_nat_rule)
+            for rule in rules:
+                self.agent.remove_nat_rule(process_id, 'POSTROUTING', rule,
+                                           top=True)
+            if rules:
+                self.agent.iptables_apply(process_id)
             del self.processes[process_id]
 
     def get_process_status_cache(self, process):
@@ -598,10 +664,10 @@ class IPsecDriver(device_drivers.DeviceDriver):
                 'ipsec_site_connections': {}}
         return self.process_status_cache[process.id]
 
-    def is_status_updated(self, process, previous_status):
+    def is_status_updated(self, process, previous_status, status=None):
         if process.updated_pending_status:
             return True
-        if process.status != previous_status['status']:
+        if (status or process.status) != previous_status['status']:
             return True
         if (process.connection_status !=
             previous_status['ipsec_site_connections']):
@@ -612,10 +678,10 @@ class IPsecDriver(device_drivers.DeviceDriver):
         for connection_status in process.connection_status.values():
             connection_status['updated_pending_status'] = False
 
-    def copy_process_status(self, process):
+    def copy_process_status(self, process, status=None):
         return {
             'id': process.vpnservice['id'],
-            'status': process.status,
+            'status': status or process.status,
             'updated_pending_status': process.updated_pending_status,
             'ipsec_site_connections': copy.deepcopy(process.connection_status)
         }
@@ -636,16 +702,36 @@ class IPsecDriver(device_drivers.DeviceDriver):
                         'updated_pending_status': True
                     }
 
+    def remove_unchanged_connections(self, previous_status, new_status):
+        """Drop connections whose status was already reported."""
+        connections = new_status[IPSEC_CONNS]
+        for conn_id, conn_status in connections.items():
+            if conn_status['updated_pending_status']:
+                continue
+            previous = previous_status[IPSEC_CONNS].get(conn_id)
+            if previous and previous['status'] == conn_status['status']:
+                del connections[conn_id]
+
+    def _poll_status(self, process):
+        # Reading the status runs 'ipsec whack --status' in the router
+        # namespace and refreshes process.connection_status as well.
+        return process.status
+
     def report_status(self, context):
         status_changed_vpn_services = []
-        for process in self.processes.values():
+        processes = self.processes.values()
+        pool = eventlet.GreenPool(STATUS_POOL_SIZE)
+        statuses = list(pool.imap(self._poll_status, processes))
+        for process, status in zip(processes, statuses):
             previous_status = self.get_process_status_cache(process)
-            if self.is_status_updated(process, previous_status):
-                new_status = self.copy_process_status(process)
+            if self.is_status_updated(process, previous_status, status):
+                new_status = self.copy_process_status(process, status)
                 self.update_downed_connections(process.id, new_status)
+                self.remove_unchanged_connections(previous_status,
+                                                  new_status)
                 status_changed_vpn_services.append(new_status)
                 self.process_status_cache[process.id] = (
-                    self.copy_process_status(process))
+                    self.copy_process_status(process, status))
                 # We need unset updated_pending status after it
                 # is reported to the server side
                 self.unset_updated_pending_status(process)
@@ -679,7 +765,7 @@ class IPsecDriver(device_drivers.DeviceDriver):
         for vpnservice in vpnservices:
             process = self.ensure_process(vpnservice['router_id'],
                                           vpnservice=vpnservice)
-            self._update_nat(vpnservice, self.agent.add_nat_rule)
+            self._sync_nat(vpnservice)
             process.update()
 
         # Delete any IPSec processes that are
@@ -0,0 +1,149 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the shared DHCP server against one dnsmasq per network.
+
+The memory a network costs in the shared server is the growth of this
+process while it loads the tables of many networks. A dnsmasq costs at
+least the resident size of an idle dnsmasq, which is measured when the
+binary is installed. Lease latency is the time the server takes to answer
+a DISCOVER and the following REQUEST.
+"""
+
+import socket
+import subprocess
+import time
+
+from neutron.agent.linux import dhcp_server
+from neutron.openstack.common import log as logging
+from neutron.tests import base
+
+LOG = logging.getLogger(__name__)
+
+NETWORKS = 1000
+HOSTS_PER_NETWORK = 20
+LEASES = 2000
+
+
+def _rss_kb(pid='self'):
+    with open('/proc/%s/status' % pid) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+
+def _table(index):
+    net = '10.%d.%d' % (index // 256, index % 256)
+    subnet_id = 'subnet-%d' % index
+    return {'id': 'network-%d' % index,
+            'namespace': 'qdhcp-network-%d' % index,
+            'interface': 'tap%d' % index,
+            'lease_time': 86400,
+            'domain': 'openstacklocal',
+            'subnets': [{'id': subnet_id,
+                         'cidr': '%s.0/24' % net,
+                         'server_ip': '%s.2' % net,
+                         'gateway_ip': '%s.1' % net,
+                         'dns_servers': ['8.8.8.8'],
+                         'routes': []}],
+            'hosts': [('fa:16:3e:%02x:%02x:%02x' % (index // 256,
+                                                    index % 256, i),
+                       '%s.%d' % (net, i + 3), subnet_id,
+                       'host-%s-%d' % (net.replace('.', '-'), i + 3))
+                      for i in range(HOSTS_PER_NETWORK)]}
+
+
+def _request(message_type, mac, options=None):
+    chaddr = ''.join(chr(int(b, 16)) for b in mac.split(':'))
+    data = dhcp_server.HEADER.pack(
+        dhcp_server.BOOTREQUEST, 1, 6, 0, 1, 0, 0, dhcp_server.ZERO_IP,
+        dhcp_server.ZERO_IP, dhcp_server.ZERO_IP, dhcp_server.ZERO_IP,
+        chaddr.ljust(16, '\x00'), '\x00' * 64, '\x00' * 128,
+        dhcp_server.MAGIC_COOKIE)
+    data += dhcp_server._option(dhcp_server.OPT_MESSAGE_TYPE,
+                                chr(message_type))
+    for code, value in (options or {}).items():
+        data += dhcp_server._option(code, value)
+    return data + chr(dhcp_server.OPT_END)
+
+
+class TestSharedDhcpServerBenchmark(base.BaseTestCase):
+
+    def _dnsmasq_rss_kb(self):
+        try:
+            proc = subprocess.Popen(['dnsmasq', '--keep-in-foreground',
+                                     '--port=0', '--conf-file=/dev/null',
+                                     '--pid-file=', '--leasefile-ro',
+                                     '--no-hosts', '--no-resolv'],
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+        except OSError:
+            return None
+        try:
+            time.sleep(0.5)
+            if proc.poll() is not None:
+                return None
+            return _rss_kb(proc.pid)
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+
+    def test_memory_per_network(self):
+        tables = []
+        before = _rss_kb()
+        for i in range(NETWORKS):
+            tables.append(dhcp_server.NetworkTable(_table(i)))
+        per_network = float(_rss_kb() - before) / NETWORKS
+        LOG.info(_('Shared DHCP server: %(kb).1f KB per network of '
+                   '%(hosts)d hosts'),
+                 {'kb': per_network, 'hosts': HOSTS_PER_NETWORK})
+
+        dnsmasq = self._dnsmasq_rss_kb()
+        if dnsmasq is None:
+            self.skipTest('dnsmasq is needed to compare against')
+        LOG.info(_('dnsmasq: %d KB per network'), dnsmasq)
+        self.assertLess(per_network, dnsmasq)
+
+    def test_lease_latency(self):
+        tables = [dhcp_server.NetworkTable(_table(i)) for i in range(10)]
+        requests = []
+        for i in range(LEASES):
+            table = _table(i % len(tables))
+            mac, ip_address = table['hosts'][i % HOSTS_PER_NETWORK][:2]
+            server_ip = table['subnets'][0]['server_ip']
+            requests.append((tables[i % len(tables)],
+                             _request(dhcp_server.DHCPDISCOVER, mac),
+                             _request(dhcp_server.DHCPREQUEST, mac, {
+                                 dhcp_server.OPT_REQUESTED_IP:
+                                 socket.inet_aton(ip_address),
+                                 dhcp_server.OPT_SERVER_ID:
+                                 socket.inet_aton(server_ip)})))
+
+        max_latency = 0
+        start = time.time()
+        for table, discover, request in requests:
+            lease_start = time.time()
+            self.assertIsNotNone(
+                table.handle(dhcp_server.parse_packet(discover)))
+            self.assertIsNotNone(
+                table.handle(dhcp_server.parse_packet(request)))
+            max_latency = max(max_latency, time.time() - lease_start)
+        average = (time.time() - start) / LEASES
+        LOG.info(_('Shared DHCP server lease latency: %(avg).1f us average, '
+                   '%(max).1f us maximum'),
+                 {'avg': average * 1e6, 'max': max_latency * 1e6})
+        # dnsmasq answers in the order of a millisecond
+        self.assertLess(average, 0.001)
@@ -0,0 +1,78 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare router wiring time between the cli and netlink ip_lib backends.
+
+Each iteration does what the L3 agent does for a router with a handful of
+internal ports: create the namespace, plug veth pairs into it, add
+addresses, bring the links up and read everything back.  Run with
+OS_SUDO_TESTING=1 as root to get the netlink numbers.
+"""
+
+import os
+import time
+
+from oslo.config import cfg
+
+from neutron.agent.linux import ip_lib
+from neutron.agent.linux import netlink_lib
+from neutron.openstack.common import log as logging
+from neutron.tests.functional.agent.linux import base
+
+LOG = logging.getLogger(__name__)
+
+PORTS_PER_ROUTER = 4
+
+
+class TestIpLibBackendBenchmark(base.BaseLinuxTestCase):
+    def setUp(self):
+        super(TestIpLibBackendBenchmark, self).setUp()
+        self.check_sudo_enabled()
+        cfg.CONF.register_opts(ip_lib.OPTS)
+        self.addCleanup(cfg.CONF.reset)
+
+    def _wire_router(self):
+        ns_name = self.get_rand_name(32, 'bench-ns-')
+        ip = ip_lib.IPWrapper(self.root_helper)
+        ns_ip = ip.ensure_namespace(ns_name)
+        self.addCleanup(ip.netns.delete, ns_name)
+        for i in range(PORTS_PER_ROUTER):
+            name = self.get_rand_name(14, 'bqr-')
+            outer, inner = ip.add_veth(name, name + 'i', ns_name)
+            self.addCleanup(outer.link.delete)
+            outer.link.set_up()
+            inner.link.set_up()
+            inner.addr.add(4, '10.%d.0.1/24' % i, '10.%d.0.255' % i)
+            self.assertTrue(ip_lib.device_exists(inner.name,
+                                                 self.root_helper, ns_name))
+            inner.addr.list(scope='global', filters=['permanent'])
+        ns_ip.get_devices(exclude_loopback=True)
+
+    def _time_backend(self, backend, iterations=5):
+        cfg.CONF.set_override('ip_lib_backend', backend)
+        start = time.time()
+        for _i in range(iterations):
+            self._wire_router()
+        elapsed = (time.time() - start) / iterations
+        LOG.info(_('ip_lib %(backend)s backend: %(elapsed).3fs per router'),
+                 {'backend': backend, 'elapsed': elapsed})
+        return elapsed
+
+    def test_router_wiring_time(self):
+        if os.geteuid() != 0 or netlink_lib.pyroute2 is None:
+            self.skipTest('netlink backend needs root and pyroute2')
+        cli = self._time_backend('cli')
+        netlink = self._time_backend('netlink')
+        self.assertLess(netlink, cli)
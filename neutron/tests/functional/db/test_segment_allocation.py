@@ -0,0 +1,118 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare tenant segment allocation throughput under concurrency.
+
+Each worker thread stands for an API worker creating networks: it
+allocates a VXLAN segment in a transaction of its own, over its own
+connection, as many times as it can. The locking allocator the type
+drivers used to have is timed against helpers.allocate_unallocated.
+SQLite serializes writers, so set OS_TEST_DBAPI_CONNECTION to a MySQL or
+PostgreSQL database to get meaningful numbers.
+"""
+
+import os
+import threading
+import time
+
+from neutron.openstack.common.db.sqlalchemy import session as db_session
+from neutron.openstack.common import log as logging
+from neutron.plugins.ml2.drivers import helpers
+from neutron.plugins.ml2.drivers import type_vxlan
+from neutron.tests import base
+
+LOG = logging.getLogger(__name__)
+
+WORKERS = 32
+NETWORKS_PER_WORKER = 50
+
+
+def _locking_allocate(session, model):
+    alloc = (session.query(model).
+             filter_by(allocated=False).
+             with_lockmode('update').
+             first())
+    if alloc:
+        alloc.allocated = True
+    return alloc
+
+
+class TestSegmentAllocationBenchmark(base.BaseTestCase):
+    def setUp(self):
+        super(TestSegmentAllocationBenchmark, self).setUp()
+        connection = os.environ.get('OS_TEST_DBAPI_CONNECTION')
+        if not connection or connection.startswith('sqlite'):
+            self.skipTest('OS_TEST_DBAPI_CONNECTION is not set to a MySQL '
+                          'or PostgreSQL database')
+        self.facade = db_session.EngineFacade(connection,
+                                              max_pool_size=WORKERS)
+        self.model = type_vxlan.VxlanAllocation
+        table = self.model.__table__
+        engine = self.facade.get_engine()
+        table.create(engine, checkfirst=True)
+        self.addCleanup(table.drop, engine)
+
+    def _reset(self):
+        session = self.facade.get_session()
+        with session.begin():
+            session.query(self.model).delete()
+            helpers.sync_allocations(
+                session, self.model, self.model.vxlan_vni,
+                [(1, WORKERS * NETWORKS_PER_WORKER)])
+
+    def _worker(self, allocate, results):
+        session = self.facade.get_session()
+        allocated = []
+        errors = 0
+        for _i in range(NETWORKS_PER_WORKER):
+            try:
+                with session.begin():
+                    alloc = allocate(session, self.model)
+                    if alloc:
+                        allocated.append(alloc.vxlan_vni)
+            except Exception:
+                # A deadlock or lock wait timeout, which the API would
+                # have retried or failed
+                errors += 1
+        results.append((allocated, errors))
+
+    def _time_allocator(self, name, allocate):
+        self._reset()
+        results = []
+        threads = [threading.Thread(target=self._worker,
+                                    args=(allocate, results))
+                   for _i in range(WORKERS)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        vnis = [vni for allocated, _errors in results for vni in allocated]
+        errors = sum(errors for _allocated, errors in results)
+        # No segment is ever handed out twice
+        self.assertEqual(len(vnis), len(set(vnis)))
+        rate = len(vnis) / elapsed
+        LOG.info(_('%(name)s allocator: %(rate).1f networks/s with '
+                   '%(workers)d workers, %(errors)d failed allocations'),
+                 {'name': name, 'rate': rate, 'workers': WORKERS,
+                  'errors': errors})
+
+    def test_network_create_throughput(self):
+        # The rates are only logged: wall clock times depend too much on
+        # the machine and the database to be asserted on
+        self._time_allocator('locking', _locking_allocate)
+        self._time_allocator('compare-and-swap',
+                             helpers.allocate_unallocated)
@@ -495,6 +495,81 @@ class OVS_Lib_Test(base.BaseTestCase):
             mock.call('mod-flows', ['-'], 'modified_flow_2\n')
         ])
 
+    def _flow_cookie(self, **match):
+        for cookie, (flow, _flow_str) in self.br.flow_cache.flows.items():
+            if all(flow.get(k) == str(v) for k, v in match.items()):
+                return cookie
+
+    def test_flow_resync_applies_differences_only(self):
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        self.br.start_flow_resync()
+        self.br.add_flow(priority=1, actions='normal')
+        self.br.add_flow(table=22, priority=0, actions='drop')
+        self.br.add_flow(table=23, priority=0, actions='drop')
+        self.br.delete_flows(table=23)
+        self.assertFalse(run_ofctl.called)
+
+        installed = self._flow_cookie(actions='normal')
+        missing = self._flow_cookie(table=22)
+        dump = '\n'.join([
+            "NXST_FLOW reply (xid=0x4):",
+            " cookie=0x%x, duration=5.1s, table=0, n_packets=6, "
+            "n_bytes=468, idle_age=3, priority=1 actions=NORMAL" % installed,
+            " cookie=0x5, duration=5.2s, table=0, n_packets=0, "
+            "n_bytes=0, idle_age=5, priority=2,in_port=1 actions=drop",
+            " cookie=0x0, duration=3.2s, table=20, n_packets=0, "
+            "n_bytes=0, hard_timeout=300, idle_age=3, priority=1,"
+            "vlan_tci=0x0001/0x0fff,dl_dst=fa:16:3e:00:00:01 "
+            "actions=output:2"])
+        run_ofctl.side_effect = [dump, None, None]
+        self.br.finish_flow_resync()
+        run_ofctl.assert_has_calls([
+            mock.call('dump-flows', []),
+            mock.call('add-flows', ['-'],
+                      'hard_timeout=0,idle_timeout=0,priority=0,'
+                      'table=22,cookie=0x%x,actions=drop\n' % missing),
+            mock.call('del-flows', ['-'], 'cookie=0x5/-1\n')])
+        self.assertEqual(3, run_ofctl.call_count)
+        self.assertFalse(self.br.flow_resync)
+
+    def test_flow_resync_without_dump_adds_everything(self):
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        self.br.start_flow_resync()
+        self.br.add_flow(priority=1, actions='normal')
+        run_ofctl.side_effect = [None, None]
+        self.br.finish_flow_resync()
+        run_ofctl.assert_called_with('add-flows', ['-'], mock.ANY)
+        self.assertEqual(2, run_ofctl.call_count)
+
+    def test_reset_flow_cache_applies_flows_right_away(self):
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        self.br.reset_flow_cache()
+        self.br.add_flow(priority=1, actions='normal')
+        cookie = self._flow_cookie(actions='normal')
+        run_ofctl.assert_has_calls([
+            mock.call('del-flows', []),
+            mock.call('add-flow',
+                      ['hard_timeout=0,idle_timeout=0,priority=1,'
+                       'table=0,cookie=0x%x,actions=normal' % cookie])])
+        self.assertFalse(self.br.flow_resync)
+
+    def test_flow_cache_tracks_changes(self):
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        self.br.flow_cache = ovs_lib.FlowCache()
+        self.br.add_flow(table=21, priority=1, dl_vlan=3, actions='output:2')
+        old_cookie = self._flow_cookie(dl_vlan=3)
+        self.br.mod_flow(table=21, dl_vlan=3, actions='output:2,3')
+        new_cookie = self._flow_cookie(dl_vlan=3)
+        self.assertNotEqual(old_cookie, new_cookie)
+        # The modified flow is added again with its new cookie
+        run_ofctl.assert_called_with(
+            'add-flows', ['-'],
+            'hard_timeout=0,idle_timeout=0,priority=1,table=21,dl_vlan=3,'
+            'cookie=0x%x,actions=output:2,3\n' % new_cookie)
+        self.br.delete_flows(table=21, dl_vlan=3)
+        self.assertEqual({}, self.br.flow_cache.flows)
+        run_ofctl.assert_called_with('del-flows', ['table=21,dl_vlan=3'])
+
     def test_add_tunnel_port(self):
         pname = "tap99"
         local_ip = "1.1.1.1"
@@ -559,6 +634,33 @@ class OVS_Lib_Test(base.BaseTestCase):
 
         tools.verify_mock_calls(self.execute, expected_calls_and_values)
 
+    def test_add_tunnel_ports(self):
+        remote_ips = {'vxlan-1': '10.0.0.1', 'vxlan-2': '10.0.0.2'}
+        interfaces = {'data': [['vxlan-1', 5], ['vxlan-2', ['set', []]],
+                               ['tap1', 7]]}
+        self.execute.side_effect = [None, jsonutils.dumps(interfaces)]
+        ofports = self.br.add_tunnel_ports(remote_ips, '1.1.1.1',
+                                           p_const.TYPE_VXLAN)
+        self.assertEqual({'vxlan-1': '5',
+                          'vxlan-2': const.INVALID_OFPORT}, ofports)
+        self.assertEqual(2, self.execute.call_count)
+        command = self.execute.call_args_list[0][0][0]
+        for name, remote_ip in remote_ips.items():
+            self.assertIn(name, command)
+            self.assertIn('options:remote_ip=%s' % remote_ip, command)
+        self.execute.assert_called_with(
+            ['ovs-vsctl', self.TO, '--format=json', '--',
+             '--columns=name,ofport', 'list', 'Interface'],
+            root_helper=self.root_helper)
+
+    def test_add_tunnel_ports_transactions(self):
+        remote_ips = dict(('gre-%d' % i, '10.0.%d.%d' % (i / 256, i % 256))
+                          for i in range(ovs_lib.PORTS_PER_TRANSACTION + 1))
+        with mock.patch.object(self.br, 'get_ports_ofports') as ofports:
+            self.br.add_tunnel_ports(remote_ips, '1.1.1.1')
+        self.assertEqual(2, self.execute.call_count)
+        ofports.assert_called_once_with(sorted(remote_ips))
+
     def test_add_patch_port(self):
         pname = "tap99"
         peer = "bar10"
@@ -810,10 +912,10 @@ class OVS_Lib_Test(base.BaseTestCase):
     def test_delete_all_ports(self):
         with mock.patch.object(self.br, 'get_port_name_list',
                                return_value=['port1']) as get_port:
-            with mock.patch.object(self.br, 'delete_port') as delete_port:
+            with mock.patch.object(self.br, 'delete_port_list') as delete:
                 self.br.delete_ports(all_ports=True)
         get_port.assert_called_once_with()
-        delete_port.assert_called_once_with('port1')
+        delete.assert_called_once_with(['port1'])
 
     def test_delete_neutron_ports(self):
         port1 = ovs_lib.VifPort('tap1234', 1, uuidutils.generate_uuid(),
@@ -822,13 +924,25 @@ class OVS_Lib_Test(base.BaseTestCase):
                                 'ca:ee:de:ad:be:ef', 'br')
         with mock.patch.object(self.br, 'get_vif_ports',
                                return_value=[port1, port2]) as get_ports:
-            with mock.patch.object(self.br, 'delete_port') as delete_port:
+            with mock.patch.object(self.br, 'delete_port_list') as delete:
                 self.br.delete_ports(all_ports=False)
         get_ports.assert_called_once_with()
-        delete_port.assert_has_calls([
-            mock.call('tap1234'),
-            mock.call('tap5678')
-        ])
+        self.assertEqual(['tap1234', 'tap5678'],
+                         list(delete.call_args[0][0]))
+
+    def test_delete_port_list(self):
+        with mock.patch.object(ovs_lib, 'PORTS_PER_TRANSACTION', 2):
+            self.br.delete_port_list(['p1', 'p2', 'p3'])
+
+        def del_port(port_name):
+            return ['--', '--if-exists', 'del-port', self.BR_NAME, port_name]
+
+        self.execute.assert_has_calls([
+            mock.call(['ovs-vsctl', self.TO] + del_port('p1') +
+                      del_port('p2'), root_helper=self.root_helper),
+            mock.call(['ovs-vsctl', self.TO] + del_port('p3'),
+                      root_helper=self.root_helper)])
+        self.assertEqual(2, self.execute.call_count)
 
     def test_delete_neutron_ports_list_error(self):
         expected_calls_and_values = [
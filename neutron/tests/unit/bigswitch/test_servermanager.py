@@ -106,10 +106,12 @@ class ServerManagerTests(test_rp.BigSwitchProxyPluginV2TestCase):
             pl.servers.capabilities = ['consistency']
             self.assertRaises(KeyError,
                               pl.servers._consistency_watchdog)
-            rmock.assert_called_with('GET', '/health', '', {}, [], False)
+            rmock.assert_called_with('GET', '/health', '', None, [], False)
             self.assertEqual(1, len(lmock.mock_calls))
 
     def test_consistency_hash_header(self):
+        pl = manager.NeutronManager.get_plugin()
+        pl.servers.capabilities = ['consistency']
         # mock HTTP class instead of rest_call so we can see headers
         with mock.patch(HTTPCON) as conmock:
             rv = conmock.return_value
@@ -354,18 +356,26 @@ class ServerManagerTests(test_rp.BigSwitchProxyPluginV2TestCase):
 
     def test_conflict_triggers_sync(self):
         pl = manager.NeutronManager.get_plugin()
-        with mock.patch(
-            SERVERMANAGER + '.ServerProxy.rest_call',
-            return_value=(httplib.CONFLICT, 0, 0, 0)
-        ) as srestmock:
-            # making a call should trigger a conflict sync
+        pl.servers.capabilities = []
+        with contextlib.nested(
+            mock.patch(SERVERMANAGER + '.ServerProxy.rest_call',
+                       return_value=(httplib.CONFLICT, 0, 0, 0)),
+            mock.patch(SERVERMANAGER + '.eventlet.spawn')
+        ) as (srestmock, spawnmock):
+            # conflicting calls schedule a single background sync
             pl.servers.rest_call('GET', '/', '', None, [])
-            srestmock.assert_has_calls([
-                mock.call('GET', '/', '', None, False, reconnect=True),
-                mock.call('PUT', '/topology',
-                          {'routers': [], 'networks': []},
-                          timeout=None)
-            ])
+            pl.servers.rest_call('GET', '/', '', None, [])
+            spawnmock.assert_called_once_with(
+                pl.servers._topology_sync_worker)
+            self.assertEqual(2, srestmock.call_count)
+
+            srestmock.return_value = (200, 'OK', '', '')
+            pl.servers._topology_sync_worker()
+            srestmock.assert_called_with('PUT', '/topology',
+                                         {'routers': [], 'networks': []},
+                                         None, None, reconnect=True)
+            self.assertIsNone(pl.servers.sync_thread)
+            self.assertFalse(pl.servers.sync_pending)
 
     def test_conflict_sync_raises_error_without_topology(self):
         pl = manager.NeutronManager.get_plugin()
@@ -382,6 +392,75 @@ class ServerManagerTests(test_rp.BigSwitchProxyPluginV2TestCase):
                 *('GET', '/', '', None, [])
             )
 
+    def test_topology_conflict_doesnt_trigger_sync(self):
+        pl = manager.NeutronManager.get_plugin()
+        with contextlib.nested(
+            mock.patch(SERVERMANAGER + '.ServerProxy.rest_call',
+                       return_value=(httplib.CONFLICT, 0, 0, 0)),
+            mock.patch(SERVERMANAGER + '.ServerPool.schedule_topology_sync')
+        ) as (srestmock, schedmock):
+            pl.servers.rest_call('PUT', '/topology', {}, None, [])
+            self.assertFalse(schedmock.called)
+
+    def test_failed_sync_stops_worker(self):
+        pl = manager.NeutronManager.get_plugin()
+        pl.servers.sync_pending = True
+        with mock.patch(SERVERMANAGER + '.ServerPool.rest_action',
+                        side_effect=servermanager.RemoteRestError(
+                            reason='down')) as ramock:
+            pl.servers._topology_sync_worker()
+        self.assertEqual(1, ramock.call_count)
+        self.assertIsNone(pl.servers.sync_thread)
+
+    def test_consistency_checked_calls_are_serialized(self):
+        pl = manager.NeutronManager.get_plugin()
+        pl.servers.capabilities = ['consistency']
+        with contextlib.nested(
+            mock.patch(SERVERMANAGER + '.ServerPool._serialized_rest_call'),
+            mock.patch(SERVERMANAGER + '.ServerPool._rest_call')
+        ) as (sermock, restmock):
+            pl.servers.rest_call('GET', '/', '', None, [])
+            sermock.assert_called_once_with('GET', '/', '', None, [], False)
+            pl.servers.capabilities = []
+            pl.servers.rest_call('GET', '/', '', None, [])
+            restmock.assert_called_once_with('GET', '/', '', None, [], False)
+            self.assertEqual(1, sermock.call_count)
+
+    def test_headers_argument_not_modified(self):
+        sp = servermanager.ServerPool()
+        headers = {'EXTRA-HEADER': 'HI'}
+        with mock.patch(HTTPCON) as conmock:
+            rv = conmock.return_value
+            rv.getresponse.return_value.getheader.return_value = 'HASH'
+            sp.servers[0].rest_call('GET', '/', headers=headers)
+        self.assertEqual({'EXTRA-HEADER': 'HI'}, headers)
+
+    def test_concurrent_requests_use_separate_connections(self):
+        sp = servermanager.ServerPool()
+        server = sp.servers[0]
+        server.capabilities = ['keep-alive']
+        sp.always_reconnect = False
+        conns = [mock.Mock(), mock.Mock()]
+        for conn in conns:
+            conn.getresponse.return_value.getheader.return_value = 'HASH'
+            conn.getresponse.return_value.status = 200
+            conn.getresponse.return_value.read.return_value = '{}'
+        # the second request is issued while the first one is in flight
+        conns[0].request.side_effect = (
+            lambda *args: server.rest_call('GET', '/second'))
+        with mock.patch(HTTPCON, side_effect=conns) as conmock:
+            server.rest_call('GET', '/first')
+            self.assertEqual(2, conmock.call_count)
+            self.assertEqual(2, len(server.idle_conns[server.timeout]))
+            conns[0].request.side_effect = None
+            server.rest_call('GET', '/third')
+            self.assertEqual(2, conmock.call_count)
+
+    def test_max_connections(self):
+        cfg.CONF.set_override('server_max_connections', 2, 'RESTPROXY')
+        sp = servermanager.ServerPool()
+        self.assertEqual(2, sp.servers[0].conn_slots.balance)
+
     def test_floating_calls(self):
         pl = manager.NeutronManager.get_plugin()
         with mock.patch(SERVERMANAGER + '.ServerPool.rest_action') as ramock:
@@ -1160,6 +1160,56 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                 member = self.plugin.get_member(ctx, member_id)
                 self.assertEqual('INACTIVE', member['status'])
 
+    def _get_pool_stats_row(self, ctx, pool_id):
+        return ctx.session.query(ldb.PoolStatistics).filter_by(
+            pool_id=pool_id).one()
+
+    def test_update_pools_stats(self):
+        with contextlib.nested(
+            self.pool(name='p1'),
+            self.pool(name='p2')
+        ) as (pool1, pool2):
+            pool1_id = pool1['pool']['id']
+            pool2_id = pool2['pool']['id']
+            with self.member(pool_id=pool1_id) as member:
+                member_id = member['member']['id']
+                ctx = context.get_admin_context()
+                # pool2 lost its statistics row, it is created again
+                self.plugin._delete_pool_stats(ctx, pool2_id)
+                stats = {
+                    pool1_id: {'bytes_in': 1, 'bytes_out': 2,
+                               'active_connections': 3,
+                               'total_connections': 4,
+                               'members': {member_id: {'status': 'ACTIVE'}}},
+                    pool2_id: {'bytes_in': 5},
+                    'unknown': {'bytes_in': 6}}
+                self.plugin.update_pools_stats(ctx, stats)
+
+                stats1 = self._get_pool_stats_row(ctx, pool1_id)
+                for k in ('bytes_in', 'bytes_out', 'active_connections',
+                          'total_connections'):
+                    self.assertEqual(stats[pool1_id][k], stats1[k])
+                stats2 = self._get_pool_stats_row(ctx, pool2_id)
+                self.assertEqual(5, stats2['bytes_in'])
+                self.assertEqual(0, stats2['bytes_out'])
+                member = self.plugin.get_member(ctx, member_id)
+                self.assertEqual('ACTIVE', member['status'])
+
+    def test_update_pools_stats_skips_invalid(self):
+        with contextlib.nested(
+            self.pool(name='p1'),
+            self.pool(name='p2')
+        ) as (pool1, pool2):
+            pool1_id = pool1['pool']['id']
+            pool2_id = pool2['pool']['id']
+            ctx = context.get_admin_context()
+            self.plugin.update_pools_stats(ctx, {pool1_id: {'bytes_in': -1},
+                                                 pool2_id: {'bytes_in': 7}})
+            self.assertEqual(
+                0, self._get_pool_stats_row(ctx, pool1_id)['bytes_in'])
+            self.assertEqual(
+                7, self._get_pool_stats_row(ctx, pool2_id)['bytes_in'])
+
     def test_get_pool_stats(self):
         keys = [("bytes_in", 0),
                 ("bytes_out", 0),
@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+
 import mock
 from oslo.config import cfg
 
@@ -507,6 +509,217 @@ class PositiveRPCWrapperValidConfigTestCase(base.BaseTestCase):
         cmds = ['show openstack config region RegionOne timestamp']
         self.drv._server.runCmds.assert_called_once_with(version=1, cmds=cmds)
 
+    def test_run_tenant_cmds(self):
+        network = {'network_id': 'net-id',
+                   'network_name': 'net-name',
+                   'segmentation_id': 123}
+        cmds = (self.drv.create_network_cmds(network) +
+                self.drv.plug_port_cmds('dhcp-1', 'host', 123, 'net-id',
+                                        '', n_const.DEVICE_OWNER_DHCP) +
+                self.drv.plug_port_cmds('vm-1', 'host', 124, 'net-id',
+                                        'p', 'compute:nova') +
+                self.drv.unplug_port_cmds('vm-2', 'host', 125, 'net-id',
+                                          'compute:nova') +
+                self.drv.delete_network_cmds('net-2'))
+        self.drv.run_tenant_cmds('ten-1', cmds)
+        cmds = ['enable', 'configure', 'cvx', 'service openstack',
+                'region RegionOne',
+                'tenant ten-1',
+                'network id net-id name "net-name"',
+                'segment 1 type vlan id 123', 'exit', 'exit',
+                'network id net-id',
+                'dhcp id dhcp-1 hostid host port-id 123', 'exit',
+                'vm id vm-1 hostid host',
+                'port id 124 name "p" network-id net-id', 'exit',
+                'vm id vm-2 hostid host', 'no port id 125', 'exit',
+                'no network id net-2',
+                'exit', 'exit', 'exit', 'exit']
+        self.drv._server.runCmds.assert_called_once_with(version=1, cmds=cmds)
+
+    def test_plug_port_cmds_unknown_owner(self):
+        self.assertEqual([], self.drv.plug_port_cmds('vm-1', 'host', 123,
+                                                     'net-id', '',
+                                                     'network:router'))
+
+
+class TenantCommandBatcherTestCase(base.BaseTestCase):
+    """Test cases for the per tenant batching of EOS commands."""
+
+    def setUp(self):
+        super(TenantCommandBatcherTestCase, self).setUp()
+        self.rpc = mock.Mock()
+        self.batcher = arista.TenantCommandBatcher(self.rpc, 2)
+
+    def _run_in_thread(self, tenant_id, cmds, errors=None):
+        def run():
+            try:
+                self.batcher.run(tenant_id, cmds)
+            except Exception as e:
+                errors.append(e)
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread
+
+    def _wait_for_queue(self, tenant_id, length):
+        for _i in range(500):
+            with self.batcher._lock:
+                if len(self.batcher._queues.get(tenant_id, [])) == length:
+                    return
+            threading.Event().wait(0.01)
+        self.fail('operations were not queued')
+
+    def test_single_operation(self):
+        self.batcher.run('ten-1', ['a'])
+        self.rpc.run_tenant_cmds.assert_called_once_with('ten-1', ['a'])
+        self.assertEqual({}, self.batcher._queues)
+
+    def test_empty_operation_is_not_sent(self):
+        self.batcher.run('ten-1', [])
+        self.assertFalse(self.rpc.run_tenant_cmds.called)
+
+    def test_queued_operations_are_coalesced_in_order(self):
+        sending = threading.Event()
+        release = threading.Event()
+
+        def run_tenant_cmds(tenant_id, cmds):
+            if cmds == ['first']:
+                sending.set()
+                release.wait(5)
+        self.rpc.run_tenant_cmds.side_effect = run_tenant_cmds
+
+        threads = [self._run_in_thread('ten-1', ['first'])]
+        sending.wait(5)
+        for cmd in ('second', 'third', 'fourth'):
+            threads.append(self._run_in_thread('ten-1', [cmd]))
+            self._wait_for_queue('ten-1', len(threads) - 1)
+        # Another tenant is not held back by the call in flight
+        self.batcher.run('ten-2', ['other'])
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual([mock.call('ten-1', ['first']),
+                          mock.call('ten-2', ['other']),
+                          mock.call('ten-1', ['second', 'third']),
+                          mock.call('ten-1', ['fourth'])],
+                         self.rpc.run_tenant_cmds.call_args_list)
+
+    def test_failed_call_fails_its_operations(self):
+        self.rpc.run_tenant_cmds.side_effect = arista_exc.AristaRpcError(
+            msg='down')
+        self.assertRaises(arista_exc.AristaRpcError,
+                          self.batcher.run, 'ten-1', ['a'])
+        self.assertEqual({}, self.batcher._queues)
+        self.rpc.run_tenant_cmds.side_effect = None
+        self.batcher.run('ten-1', ['b'])
+
+    def test_failed_batch_is_resent_one_by_one(self):
+        sending = threading.Event()
+        release = threading.Event()
+
+        def run_tenant_cmds(tenant_id, cmds):
+            if cmds == ['first']:
+                sending.set()
+                release.wait(5)
+            elif 'bad' in cmds:
+                raise arista_exc.AristaRpcError(msg='bad')
+        self.rpc.run_tenant_cmds.side_effect = run_tenant_cmds
+
+        errors = {'good': [], 'bad': []}
+        threads = [self._run_in_thread('ten-1', ['first'])]
+        sending.wait(5)
+        for cmd in ('good', 'bad'):
+            threads.append(self._run_in_thread('ten-1', [cmd], errors[cmd]))
+            self._wait_for_queue('ten-1', len(threads) - 1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual([mock.call('ten-1', ['first']),
+                          mock.call('ten-1', ['good', 'bad']),
+                          mock.call('ten-1', ['good']),
+                          mock.call('ten-1', ['bad'])],
+                         self.rpc.run_tenant_cmds.call_args_list)
+        self.assertEqual([], errors['good'])
+        self.assertEqual(1, len(errors['bad']))
+        self.assertIsInstance(errors['bad'][0], arista_exc.AristaRpcError)
+
+    def test_sender_returns_once_its_operation_is_sent(self):
+        sending = {'first': threading.Event(), 'second': threading.Event()}
+        release = {'first': threading.Event(), 'second': threading.Event()}
+
+        def run_tenant_cmds(tenant_id, cmds):
+            sending[cmds[0]].set()
+            release[cmds[0]].wait(10)
+        self.rpc.run_tenant_cmds.side_effect = run_tenant_cmds
+
+        first = self._run_in_thread('ten-1', ['first'])
+        sending['first'].wait(5)
+        second = self._run_in_thread('ten-1', ['second'])
+        self._wait_for_queue('ten-1', 1)
+        release['first'].set()
+        # The second operation took over, the first request is done
+        sending['second'].wait(5)
+        first.join(5)
+        self.assertFalse(first.is_alive())
+        release['second'].set()
+        second.join(5)
+        self.assertEqual({}, self.batcher._queues)
+
+    def test_interrupted_sender_hands_over(self):
+        class Interrupt(BaseException):
+            pass
+
+        sending = threading.Event()
+        release = threading.Event()
+
+        def run_tenant_cmds(tenant_id, cmds):
+            if cmds == ['first']:
+                sending.set()
+                release.wait(5)
+                raise Interrupt()
+        self.rpc.run_tenant_cmds.side_effect = run_tenant_cmds
+
+        errors = []
+        sender = threading.Thread(target=self.assertRaises,
+                                  args=(Interrupt, self.batcher.run, 'ten-1',
+                                        ['first']))
+        sender.start()
+        self.addCleanup(sender.join, 5)
+        sending.wait(5)
+        waiter = self._run_in_thread('ten-1', ['second'], errors)
+        self._wait_for_queue('ten-1', 1)
+        release.set()
+        waiter.join(5)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual([], errors)
+        self.rpc.run_tenant_cmds.assert_called_with('ten-1', ['second'])
+        self.assertEqual({}, self.batcher._queues)
+
+
+class SharedLockTestCase(base.BaseTestCase):
+
+    def test_shared_holders_run_together(self):
+        lock = arista.SharedLock()
+        with lock.shared():
+            with lock.shared():
+                self.assertEqual(2, lock._shared)
+        self.assertEqual(0, lock._shared)
+
+    def test_exclusive_waits_for_shared_holders(self):
+        lock = arista.SharedLock()
+        acquired = threading.Event()
+
+        def exclusive():
+            with lock.exclusive():
+                acquired.set()
+
+        with lock.shared():
+            thread = threading.Thread(target=exclusive)
+            thread.start()
+            self.assertFalse(acquired.wait(0.1))
+        thread.join(5)
+        self.assertTrue(acquired.is_set())
+
 
 class AristaRPCWrapperInvalidConfigTestCase(base.BaseTestCase):
     """Negative test cases to test the Arista Driver configuration."""
@@ -653,6 +866,25 @@ class RealNetStorageAristaDriverTestCase(base.BaseTestCase):
                          'There should be %d '
                          'VMs, not %d' % (expected_vms, provisioned_vms))
 
+    def test_create_port_postcommit_sends_tenant_cmds(self):
+        tenant_id = 'ten-1'
+        network_id = 'net1-id'
+        network_context = self._get_network_context(tenant_id,
+                                                    network_id,
+                                                    1001)
+        self.drv.create_network_precommit(network_context)
+        port_context = self._get_port_context(tenant_id, network_id,
+                                              'vm1', network_context)
+        port_context.current['name'] = 'port1'
+        self.drv.create_port_precommit(port_context)
+        self.fake_rpc.plug_port_cmds.return_value = ['cmd']
+
+        self.drv.create_port_postcommit(port_context)
+        self.fake_rpc.plug_port_cmds.assert_called_once_with(
+            'vm1', 'ubuntu1', 101, network_id, 'port1', 'compute')
+        self.fake_rpc.run_tenant_cmds.assert_called_once_with(tenant_id,
+                                                              ['cmd'])
+
     def _get_network_context(self, tenant_id, net_id, seg_id):
         network = {'id': net_id,
                    'tenant_id': tenant_id}
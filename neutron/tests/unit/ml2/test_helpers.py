@@ -0,0 +1,207 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+
+import mock
+from sqlalchemy.orm import query as sa_query
+
+from neutron.db import api as db
+from neutron.plugins.ml2.drivers import helpers
+from neutron.plugins.ml2.drivers import type_vlan
+from neutron.plugins.ml2.drivers import type_vxlan
+from neutron.tests import base
+
+
+class MergeRangesTestCase(base.BaseTestCase):
+
+    def test_merge_ranges(self):
+        self.assertEqual([(1, 20), (30, 40)],
+                         helpers.merge_ranges([(30, 40), (5, 20), (1, 10)]))
+
+    def test_merge_adjacent_ranges(self):
+        self.assertEqual([(1, 20)], helpers.merge_ranges([(11, 20), (1, 10)]))
+
+
+class SyncAllocationsTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(SyncAllocationsTestCase, self).setUp()
+        db.configure_db()
+        self.addCleanup(db.clear_db)
+        self.session = db.get_session()
+        mock.patch.object(helpers, 'SYNC_CHUNK_SIZE', 10).start()
+
+    def _sync(self, ranges, model=type_vxlan.VxlanAllocation,
+              column=type_vxlan.VxlanAllocation.vxlan_vni, **fields):
+        with self.session.begin(subtransactions=True):
+            return helpers.sync_allocations(self.session, model, column,
+                                            ranges, **fields)
+
+    def _vnis(self):
+        return sorted(alloc.vxlan_vni for alloc in
+                      self.session.query(type_vxlan.VxlanAllocation))
+
+    def _allocate(self, vni):
+        with self.session.begin(subtransactions=True):
+            self.session.query(type_vxlan.VxlanAllocation).filter_by(
+                vxlan_vni=vni).update({'allocated': True})
+
+    def test_sync_fills_ranges(self):
+        self.assertEqual((30, 0), self._sync([(1, 25), (20, 30)]))
+        self.assertEqual(range(1, 31), self._vnis())
+
+    def test_sync_is_noop_when_in_sync(self):
+        self._sync([(1, 25)])
+        with mock.patch.object(self.session, 'execute',
+                               wraps=self.session.execute) as execute:
+            self.assertEqual((0, 0), self._sync([(1, 25)]))
+        # Only the DELETE of stale rows, nothing is inserted
+        self.assertEqual(1, execute.call_count)
+
+    def test_sync_fills_holes(self):
+        self._sync([(1, 25)])
+        with self.session.begin(subtransactions=True):
+            self.session.query(type_vxlan.VxlanAllocation).filter(
+                type_vxlan.VxlanAllocation.vxlan_vni.in_([3, 17])).delete(
+                    synchronize_session=False)
+        self.assertEqual((2, 0), self._sync([(1, 25)]))
+        self.assertEqual(range(1, 26), self._vnis())
+
+    def test_sync_removes_unallocated_outside_ranges(self):
+        self._sync([(1, 10)])
+        self._allocate(2)
+        self.assertEqual((5, 4), self._sync([(6, 10), (11, 15)]))
+        self.assertEqual([2] + range(6, 16), self._vnis())
+
+    def test_sync_without_ranges(self):
+        self._sync([(1, 10)])
+        self._allocate(4)
+        self.assertEqual((0, 9), self._sync([]))
+        self.assertEqual([4], self._vnis())
+
+    def test_sync_restricted_to_fields(self):
+        model = type_vlan.VlanAllocation
+        self._sync([(1, 5)], model, model.vlan_id, physical_network='net1')
+        self._sync([(1, 5)], model, model.vlan_id, physical_network='net2')
+        self.assertEqual((0, 3), self._sync([(4, 5)], model, model.vlan_id,
+                                            physical_network='net1'))
+        allocs = self.session.query(model).all()
+        self.assertEqual([4, 5], sorted(a.vlan_id for a in allocs
+                                        if a.physical_network == 'net1'))
+        self.assertEqual(range(1, 6), sorted(a.vlan_id for a in allocs
+                                             if a.physical_network == 'net2'))
+
+
+class AllocateUnallocatedTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(AllocateUnallocatedTestCase, self).setUp()
+        db.configure_db()
+        self.addCleanup(db.clear_db)
+        self.session = db.get_session()
+        self.model = type_vxlan.VxlanAllocation
+        with self.session.begin(subtransactions=True):
+            helpers.sync_allocations(self.session, self.model,
+                                     self.model.vxlan_vni, [(1, 5)])
+
+    def _allocated(self):
+        return sorted(alloc.vxlan_vni for alloc in
+                      self.session.query(self.model).filter_by(
+                          allocated=True))
+
+    def test_allocate_all(self):
+        vnis = [helpers.allocate_unallocated(self.session,
+                                             self.model).vxlan_vni
+                for i in range(5)]
+        self.assertEqual(range(1, 6), sorted(vnis))
+        self.assertEqual(range(1, 6), self._allocated())
+        self.assertIsNone(helpers.allocate_unallocated(self.session,
+                                                       self.model))
+
+    def test_allocated_row_is_up_to_date(self):
+        alloc = helpers.allocate_unallocated(self.session, self.model)
+        self.assertTrue(alloc.allocated)
+
+    def test_allocate_with_filters(self):
+        model = type_vlan.VlanAllocation
+        with self.session.begin(subtransactions=True):
+            for physnet in ('net1', 'net2'):
+                helpers.sync_allocations(self.session, model, model.vlan_id,
+                                         [(1, 3)], physical_network=physnet)
+        alloc = helpers.allocate_unallocated(self.session, model,
+                                             physical_network='net2')
+        self.assertEqual('net2', alloc.physical_network)
+
+    def _lose_races(self, losses):
+        # Another allocation claims the chosen row before each of the
+        # first attempts
+        real_choice = helpers.random.choice
+        self.races = 0
+
+        def choice(candidates):
+            alloc = real_choice(candidates)
+            if self.races < losses:
+                self.races += 1
+                with self.session.begin(subtransactions=True):
+                    self.session.query(self.model).filter_by(
+                        vxlan_vni=alloc.vxlan_vni).update(
+                            {'allocated': True}, synchronize_session=False)
+            return alloc
+        return mock.patch.object(helpers.random, 'choice', side_effect=choice)
+
+    def test_retry_after_lost_race(self):
+        with self._lose_races(2):
+            alloc = helpers.allocate_unallocated(self.session, self.model)
+        self.assertEqual(2, self.races)
+        self.assertEqual(3, len(self._allocated()))
+        self.assertIn(alloc.vxlan_vni, self._allocated())
+
+    def test_retries_are_bounded(self):
+        with mock.patch.object(helpers, 'MAX_ALLOCATION_ATTEMPTS', 3):
+            with self._lose_races(3):
+                self.assertIsNone(
+                    helpers.allocate_unallocated(self.session, self.model))
+        self.assertEqual(3, len(self._allocated()))
+
+    def test_lost_rows_are_not_read_again(self):
+        # The rows claimed by others still look free, as in a REPEATABLE
+        # READ snapshot, so each lost row must be left out explicitly
+        real_update = sa_query.Query.update
+        real_choice = helpers.random.choice
+        chosen = []
+        seen = []
+
+        def update(query, values, *args, **kwargs):
+            if len(chosen) <= 4:
+                return 0
+            return real_update(query, values, *args, **kwargs)
+
+        def choice(candidates):
+            seen.append(set(alloc.vxlan_vni for alloc in candidates))
+            alloc = real_choice(candidates)
+            chosen.append(alloc.vxlan_vni)
+            return alloc
+
+        with contextlib.nested(
+            mock.patch.object(sa_query.Query, 'update', autospec=True,
+                              side_effect=update),
+            mock.patch.object(helpers.random, 'choice', side_effect=choice)
+        ):
+            alloc = helpers.allocate_unallocated(self.session, self.model)
+        self.assertEqual(range(1, 6), sorted(chosen))
+        self.assertEqual(chosen[-1], alloc.vxlan_vni)
+        for i, candidates in enumerate(seen):
+            self.assertFalse(candidates & set(chosen[:i]))
@@ -0,0 +1,265 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+
+import mock
+from oslo.config import cfg
+import stevedore
+
+from neutron import context
+from neutron.db import api as db
+from neutron.openstack.common import timeutils
+from neutron.plugins.ml2 import config  # noqa
+from neutron.plugins.ml2 import journal
+from neutron.plugins.ml2 import managers
+from neutron.plugins.ml2 import models
+from neutron.tests import base
+
+NETWORK = {'id': 'net-1', 'name': 'net'}
+SEGMENTS = [{'id': 'seg-1', 'network_type': 'vlan',
+             'physical_network': 'physnet1', 'segmentation_id': 10}]
+PORT = {'id': 'port-1', 'network_id': 'net-1',
+        'binding:host_id': 'host-1'}
+
+
+def _network_context(network=NETWORK, original=None):
+    ctx = mock.Mock(current=network, original=original,
+                    network_segments=SEGMENTS)
+    ctx._plugin_context = context.get_admin_context()
+    return ctx
+
+
+def _port_context(port=PORT, original=None):
+    ctx = mock.Mock(current=port, original=original,
+                    network=_network_context(),
+                    bound_segment=SEGMENTS[0],
+                    original_bound_segment=None,
+                    bound_driver='openvswitch',
+                    original_bound_driver=None)
+    ctx._plugin_context = context.get_admin_context()
+    return ctx
+
+
+class JournalTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(JournalTestCase, self).setUp()
+        db.configure_db()
+        self.addCleanup(db.clear_db)
+        self.session = db.get_session()
+        self.plugin = mock.patch('neutron.manager.NeutronManager.'
+                                 'get_plugin').start().return_value
+        self.driver = mock.Mock()
+        self.driver.name = 'odl'
+        self.journal = journal.PostcommitJournal({'odl': self.driver})
+
+    def _entries(self):
+        return (self.session.query(models.JournalEntry).
+                order_by(models.JournalEntry.id).all())
+
+    def test_record_port(self):
+        journal.record(_port_context(), 'create_port', ['odl', 'arista'])
+        entries = self._entries()
+        self.assertEqual(['odl', 'arista'], [e.driver for e in entries])
+        self.assertEqual('port-1', entries[0].resource_id)
+        self.assertEqual('net-1', entries[0].network_id)
+        self.assertEqual(journal.PENDING, entries[0].state)
+
+    def test_dispatch_rebuilds_context(self):
+        journal.record(_port_context(), 'update_port', ['odl'])
+        self.assertEqual(1, self.journal.process())
+        ctx = self.driver.obj.update_port_postcommit.call_args[0][0]
+        self.assertIsInstance(ctx, journal.PortContext)
+        self.assertEqual(PORT, ctx.current)
+        self.assertEqual(NETWORK, ctx.network.current)
+        self.assertEqual(SEGMENTS, ctx.network.network_segments)
+        self.assertEqual(SEGMENTS[0], ctx.bound_segment)
+        self.assertEqual('openvswitch', ctx.bound_driver)
+        self.assertIs(self.plugin, ctx._plugin)
+        self.assertEqual([], self._entries())
+
+    def test_host_agents(self):
+        journal.record(_port_context(), 'create_port', ['odl'])
+        self.journal.process()
+        ctx = self.driver.obj.create_port_postcommit.call_args[0][0]
+        ctx.host_agents('Open vSwitch agent')
+        self.plugin.get_agents.assert_called_once_with(
+            mock.ANY, filters={'agent_type': ['Open vSwitch agent'],
+                               'host': ['host-1']})
+
+    def test_calls_on_a_network_are_ordered(self):
+        journal.record(_network_context(), 'create_network', ['odl'])
+        journal.record(_port_context(), 'create_port', ['odl'])
+        other = dict(NETWORK, id='net-2')
+        journal.record(_network_context(other), 'create_network', ['odl'])
+
+        self.assertEqual(2, self.journal.process())
+        self.assertEqual(
+            [NETWORK, other],
+            [c[0][0].current for c in
+             self.driver.obj.create_network_postcommit.call_args_list])
+        self.assertFalse(self.driver.obj.create_port_postcommit.called)
+
+        self.assertEqual(1, self.journal.process())
+        self.assertTrue(self.driver.obj.create_port_postcommit.called)
+        self.assertEqual(0, self.journal.process())
+
+    def test_failed_call_is_retried_and_blocks_network(self):
+        self.driver.obj.create_network_postcommit.side_effect = Exception()
+        journal.record(_network_context(), 'create_network', ['odl'])
+        journal.record(_port_context(), 'create_port', ['odl'])
+        self.assertEqual(1, self.journal.process())
+        entry = self._entries()[0]
+        self.assertEqual(journal.PENDING, entry.state)
+        self.assertEqual(1, entry.retry_count)
+        self.assertTrue(entry.next_attempt > timeutils.utcnow())
+        # Backing off, and the port has to wait for its network
+        self.assertEqual(0, self.journal.process())
+        self.assertFalse(self.driver.obj.create_port_postcommit.called)
+
+        self.driver.obj.create_network_postcommit.side_effect = None
+        with mock.patch.object(timeutils, 'utcnow',
+                               return_value=entry.next_attempt):
+            self.assertEqual(1, self.journal.process())
+        self.assertEqual(1, self.journal.process())
+        self.assertTrue(self.driver.obj.create_port_postcommit.called)
+        self.assertEqual(1, self.journal.get_stats()['odl']['retried'])
+
+    def test_call_fails_after_max_retries(self):
+        self.journal.max_retries = 0
+        self.driver.obj.delete_network_postcommit.side_effect = Exception()
+        journal.record(_network_context(), 'delete_network', ['odl'])
+        journal.record(_network_context(), 'create_network', ['odl'])
+        self.assertEqual(1, self.journal.process())
+        self.assertEqual(journal.FAILED, self._entries()[0].state)
+        # Later calls on the network stay in order behind the failed one
+        self.assertEqual(0, self.journal.process())
+        self.assertFalse(self.driver.obj.create_network_postcommit.called)
+
+        with self.session.begin():
+            self.session.query(models.JournalEntry).filter_by(
+                state=journal.FAILED).delete()
+        self.assertEqual(1, self.journal.process())
+        self.assertTrue(self.driver.obj.create_network_postcommit.called)
+
+    def test_entry_claimed_elsewhere_is_skipped(self):
+        journal.record(_network_context(), 'create_network', ['odl'])
+        entry = self._entries()[0]
+        seen = mock.Mock(id=entry.id, state=entry.state,
+                         next_attempt=entry.next_attempt)
+        with self.session.begin():
+            self.session.query(models.JournalEntry).update(
+                {'state': journal.PROCESSING,
+                 'next_attempt': timeutils.utcnow() +
+                 datetime.timedelta(seconds=60)})
+        self.assertEqual(0, self.journal.process())
+        # Another server claimed the entry after this one saw it pending
+        self.assertEqual([], self.journal._claim(self.session, [seen],
+                                                 timeutils.utcnow()))
+
+    def test_stale_claim_is_dispatched_again(self):
+        journal.record(_network_context(), 'create_network', ['odl'])
+        with self.session.begin():
+            self.session.query(models.JournalEntry).update(
+                {'state': journal.PROCESSING,
+                 'next_attempt': timeutils.utcnow() -
+                 datetime.timedelta(seconds=1)})
+        self.assertEqual(1, self.journal.process())
+        self.assertTrue(self.driver.obj.create_network_postcommit.called)
+
+    def test_backed_off_network_does_not_hold_back_others(self):
+        self.journal.batch_size = 1
+        self.driver.obj.create_network_postcommit.side_effect = [
+            Exception(), None]
+        journal.record(_network_context(), 'create_network', ['odl'])
+        for i in range(10):
+            journal.record(_port_context(), 'create_port', ['odl'])
+        other = dict(NETWORK, id='net-2')
+        journal.record(_network_context(other), 'create_network', ['odl'])
+
+        self.assertEqual(1, self.journal.process())
+        # The entries queued behind the backed-off head are skipped
+        self.assertEqual(1, self.journal.process())
+        self.assertEqual(
+            other,
+            self.driver.obj.create_network_postcommit.call_args[0][0].current)
+
+    def test_batch_size(self):
+        self.journal.batch_size = 2
+        for i in range(3):
+            journal.record(_network_context(dict(NETWORK, id='net-%d' % i)),
+                           'create_network', ['odl'])
+        self.assertEqual(2, self.journal.process())
+        self.assertEqual(1, self.journal.process())
+
+    def test_get_stats(self):
+        journal.record(_network_context(), 'create_network', ['odl'])
+        journal.record(_port_context(), 'create_port', ['odl'])
+        stats = self.journal.get_stats()['odl']
+        self.assertEqual(2, stats['queue_depth'])
+        self.assertEqual(0, stats['dispatched'])
+        self.journal.process()
+        stats = self.journal.get_stats()['odl']
+        self.assertEqual(1, stats['queue_depth'])
+        self.assertEqual(1, stats['dispatched'])
+        self.assertEqual(0, stats['failed_entries'])
+
+
+class MechanismManagerJournalTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(MechanismManagerJournalTestCase, self).setUp()
+        cfg.CONF.set_override('async_postcommit_drivers', ['odl'], 'ml2')
+        self.addCleanup(cfg.CONF.reset)
+        mock.patch.object(stevedore.named.NamedExtensionManager,
+                          '__init__', return_value=None).start()
+        mock.patch.object(managers.MechanismManager,
+                          '_register_mechanisms').start()
+        mock.patch.object(managers.MechanismManager, 'names',
+                          return_value=['logger', 'odl']).start()
+        self.journal = mock.patch.object(journal,
+                                         'PostcommitJournal').start()
+        self.record = mock.patch.object(journal, 'record').start()
+        self.manager = managers.MechanismManager()
+        self.drivers = []
+        for name in ('logger', 'odl'):
+            driver = mock.Mock()
+            driver.name = name
+            driver.obj.native_bulk_support = True
+            self.manager.mech_drivers[name] = driver
+            self.manager.ordered_mech_drivers.append(driver)
+            self.drivers.append(driver)
+        self.manager.initialize()
+
+    def test_journal_started(self):
+        self.assertEqual(['odl'], self.manager.async_drivers)
+        self.journal.assert_called_once_with({'odl': self.drivers[1]})
+        self.journal.return_value.start.assert_called_once_with()
+
+    def test_precommit_is_journaled(self):
+        ctx = mock.Mock()
+        self.manager.create_port_precommit(ctx)
+        for driver in self.drivers:
+            driver.obj.create_port_precommit.assert_called_once_with(ctx)
+        self.record.assert_called_once_with(ctx, 'create_port', ['odl'])
+
+    def test_postcommit_skips_async_drivers(self):
+        ctx = mock.Mock()
+        self.manager.create_port_postcommit(ctx)
+        self.drivers[0].obj.create_port_postcommit.assert_called_once_with(
+            ctx)
+        self.assertFalse(self.drivers[1].obj.create_port_postcommit.called)
+        self.assertFalse(self.record.called)
@@ -14,6 +14,10 @@
 #    under the License.
 # @author: Kyle Mestery, Cisco Systems, Inc.
 
+import mock
+import requests
+
+from neutron.openstack.common import jsonutils
 from neutron.plugins.common import constants
 from neutron.plugins.ml2 import config as config
 from neutron.plugins.ml2 import driver_api as api
@@ -97,6 +101,147 @@ class OpenDayLightMechanismConfigTests(base.BaseTestCase):
         self._test_missing_config(password=None)
 
 
+class OpenDaylightFullSyncTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(OpenDaylightFullSyncTestCase, self).setUp()
+        config.cfg.CONF.set_override('url', 'http://127.0.0.1:9999', 'ml2_odl')
+        config.cfg.CONF.set_override('username', 'someuser', 'ml2_odl')
+        config.cfg.CONF.set_override('password', 'somepass', 'ml2_odl')
+        config.cfg.CONF.set_override('sync_page_size', 2, 'ml2_odl')
+        config.cfg.CONF.set_override('sync_batch_size', 2, 'ml2_odl')
+        self.addCleanup(config.cfg.CONF.reset)
+        self.mech = mechanism_odl.OpenDaylightMechanismDriver()
+        self.mech.initialize()
+        self.odl = {mechanism_odl.ODL_NETWORKS: [],
+                    mechanism_odl.ODL_SUBNETS: [],
+                    mechanism_odl.ODL_PORTS: []}
+        self.sent = []
+        mock.patch.object(self.mech, 'sendjson',
+                          side_effect=self._sendjson).start()
+        self.context = mock.Mock()
+        self.plugin = self.context._plugin
+        self.plugin.get_networks.return_value = []
+        self.plugin.get_subnets.return_value = []
+        self.plugin.get_ports.return_value = []
+        self.plugin.get_security_group.side_effect = (
+            lambda ctx, sg_id: {'id': sg_id})
+
+    def _sendjson(self, method, urlpath, obj, ignorecodes=[]):
+        if method != 'get':
+            self.sent.append((method, urlpath, obj))
+            return
+        collection, query = urlpath.split('?')
+        params = dict(p.split('=') for p in query.split('&'))
+        objs = self.odl[collection]
+        start = 0
+        if 'marker' in params:
+            start = [o['id'] for o in objs].index(params['marker']) + 1
+        page = objs[start:start + int(params['limit'])]
+        return mock.Mock(content=jsonutils.dumps({collection: page}))
+
+    def _networks(self, *ids):
+        return [{'id': i, 'name': 'net-%s' % i, 'tenant_id': 't',
+                 'admin_state_up': True, 'shared': False, 'status': 'ACTIVE',
+                 'subnets': []} for i in ids]
+
+    def test_get_resources_pages(self):
+        self.odl[mechanism_odl.ODL_NETWORKS] = self._networks(*'abcde')
+        resources = self.mech.get_resources(mechanism_odl.ODL_NETWORKS)
+        self.assertEqual(sorted('abcde'), sorted(resources))
+        self.assertEqual(3, self.mech.sendjson.call_count)
+
+    def test_get_resources_without_pagination(self):
+        # The limit and marker are ignored by Hydrogen
+        networks = self._networks(*'abcd')
+        self._sendjson = mock.Mock(return_value=mock.Mock(
+            content=jsonutils.dumps({'networks': networks})))
+        self.mech.sendjson.side_effect = self._sendjson
+        resources = self.mech.get_resources(mechanism_odl.ODL_NETWORKS)
+        self.assertEqual(sorted('abcd'), sorted(resources))
+        self.assertEqual(2, self._sendjson.call_count)
+
+    def test_sync_full_sends_only_differences(self):
+        self.odl[mechanism_odl.ODL_NETWORKS] = self._networks('a', 'b', 'x')
+        self.odl[mechanism_odl.ODL_NETWORKS][1]['name'] = 'old'
+        self.odl[mechanism_odl.ODL_PORTS] = [
+            {'id': 'p1', 'security_groups': ['sg1']},
+            {'id': 'p2', 'security_groups': []}]
+        self.plugin.get_networks.return_value = self._networks(*'abcde')
+        self.plugin.get_ports.return_value = [
+            {'id': 'p1', 'network_id': 'a', 'security_groups': ['sg1'],
+             'mac_address': 'fa:16:3e:00:00:01', 'status': 'DOWN'}]
+
+        self.mech.sync_full(self.context)
+
+        created = self._networks('c', 'd', 'e')
+        for net in created:
+            mechanism_odl.try_del(net, ['status', 'subnets'])
+        self.assertFalse(self.mech.out_of_sync)
+        self.assertEqual(
+            [('put', 'networks/b', {'network': {'name': 'net-b',
+                                                'admin_state_up': True,
+                                                'shared': False}}),
+             ('post', 'networks', {'networks': created[:2]}),
+             ('post', 'networks', {'network': created[2]}),
+             ('delete', 'ports/p2', None),
+             ('delete', 'networks/x', None)],
+            self.sent)
+
+    def test_sync_full_reads_odl_before_neutron(self):
+        # A network deleted from Neutron between the two reads is stale in
+        # ODL, not sent back to it
+        self.odl[mechanism_odl.ODL_NETWORKS] = self._networks('a', 'b')
+
+        def get_networks(dbcontext):
+            self.odl[mechanism_odl.ODL_NETWORKS] = self._networks('a')
+            return self._networks('a')
+        self.plugin.get_networks.side_effect = get_networks
+
+        self.mech.sync_full(self.context)
+
+        self.assertEqual([('delete', 'networks/b', None)], self.sent)
+
+    def test_synchronize_out_of_sync_schedules_full_sync(self):
+        self.mech.out_of_sync = True
+        with mock.patch.object(mechanism_odl.greenthread, 'spawn') as spawn:
+            self.mech.synchronize('create', mechanism_odl.ODL_NETWORKS,
+                                  self.context)
+            self.mech.synchronize('create', mechanism_odl.ODL_PORTS,
+                                  self.context)
+        spawn.assert_called_once_with(self.mech._full_sync_loop,
+                                      self.context)
+        self.assertFalse(self.sent)
+
+    def test_full_sync_runs_again_when_requested(self):
+        self.mech.out_of_sync = True
+        self.mech._resync_requested = True
+        calls = []
+
+        def sync_full(context):
+            calls.append(context)
+            if len(calls) == 1:
+                self.mech.schedule_full_sync(context)
+            self.mech.out_of_sync = False
+
+        with mock.patch.object(self.mech, 'sync_full',
+                               side_effect=sync_full):
+            self.mech._sync_thread = mock.Mock()
+            self.mech._full_sync_loop(self.context)
+        self.assertEqual(2, len(calls))
+        self.assertIsNone(self.mech._sync_thread)
+        self.assertFalse(self.mech.out_of_sync)
+
+    def test_full_sync_failure_stays_out_of_sync(self):
+        self.mech.out_of_sync = True
+        self.mech._resync_requested = True
+        with mock.patch.object(self.mech, 'sync_full',
+                               side_effect=requests.exceptions.HTTPError()):
+            self.mech._full_sync_loop(self.context)
+        self.assertTrue(self.mech.out_of_sync)
+        self.assertIsNone(self.mech._sync_thread)
+
+
 class OpenDaylightMechanismTestBasicGet(test_plugin.TestBasicGet,
                                         OpenDaylightTestCase):
     pass
@@ -13,13 +13,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
 import testtools
 import uuid
 import webob
 
+from neutron.common import constants
 from neutron.common import exceptions as exc
 from neutron import context
+from neutron.db import models_v2
 from neutron.extensions import multiprovidernet as mpnet
 from neutron.extensions import portbindings
 from neutron.extensions import providernet as pnet
@@ -27,6 +31,7 @@ from neutron import manager
 from neutron.plugins.ml2.common import exceptions as ml2_exc
 from neutron.plugins.ml2 import config
 from neutron.plugins.ml2 import driver_api
+from neutron.plugins.ml2 import models as ml2_models
 from neutron.plugins.ml2 import plugin as ml2_plugin
 from neutron.tests.unit import _test_extension_portbindings as test_bindings
 from neutron.tests.unit.ml2.drivers import mechanism_logger as mech_logger
@@ -104,6 +109,74 @@ class TestMl2NetworksV2(test_plugin.TestNetworksV2,
     pass
 
 
+class TestMl2BulkNetworkDelete(test_plugin.TestNetworksV2,
+                               Ml2PluginV2TestCase):
+
+    def setUp(self):
+        config.cfg.CONF.set_override('bulk_network_delete', True, 'ml2')
+        super(TestMl2BulkNetworkDelete, self).setUp()
+
+    def _create_dhcp_port(self, subnet):
+        return self._make_port(self.fmt, subnet['subnet']['network_id'],
+                               device_owner=constants.DEVICE_OWNER_DHCP,
+                               fixed_ips=[{'subnet_id':
+                                           subnet['subnet']['id']}])
+
+    def test_delete_network_in_one_transaction(self):
+        plugin = manager.NeutronManager.get_plugin()
+        with self.network(do_delete=False) as network:
+            with self.subnet(network=network, do_delete=False) as subnet:
+                port = self._create_dhcp_port(subnet)
+                with contextlib.nested(
+                    mock.patch.object(plugin, 'delete_port'),
+                    mock.patch.object(plugin, 'delete_subnet'),
+                    mock.patch.object(plugin.mechanism_manager,
+                                      'delete_port_postcommit'),
+                    mock.patch.object(plugin.mechanism_manager,
+                                      'delete_subnet_postcommit'),
+                    mock.patch.object(plugin.notifier,
+                                      'security_groups_provider_updated')
+                ) as (delete_port, delete_subnet, port_postcommit,
+                      subnet_postcommit, provider_updated):
+                    self._delete('networks', network['network']['id'])
+                self.assertFalse(delete_port.called)
+                self.assertFalse(delete_subnet.called)
+                self.assertEqual(
+                    port['port']['id'],
+                    port_postcommit.call_args[0][0].current['id'])
+                self.assertEqual(
+                    subnet['subnet']['id'],
+                    subnet_postcommit.call_args[0][0].current['id'])
+                provider_updated.assert_called_once_with(mock.ANY)
+                ctx = context.get_admin_context()
+                self.assertFalse(plugin.get_ports(ctx))
+                self.assertFalse(plugin.get_subnets(ctx))
+                self.assertFalse(ctx.session.query(
+                    models_v2.IPAllocation).count())
+                self.assertFalse(ctx.session.query(
+                    ml2_models.PortBinding).count())
+
+    def test_delete_network_with_tenant_port_fails(self):
+        with self.port() as port:
+            self._delete('networks', port['port']['network_id'],
+                         expected_code=webob.exc.HTTPConflict.code)
+
+    def test_delete_network_precommit_failure_rolls_back(self):
+        with self.network() as network:
+            with self.subnet(network=network) as subnet:
+                self._create_dhcp_port(subnet)
+                with mock.patch.object(
+                    mech_test.TestMechanismDriver,
+                    'delete_subnet_precommit',
+                    side_effect=ml2_exc.MechanismDriverError(
+                        method='delete_subnet_precommit')):
+                    self._delete('networks', network['network']['id'],
+                                 expected_code=500)
+                ports = self._list('ports')['ports']
+                self.assertEqual(1, len(ports))
+                self._delete('ports', ports[0]['id'])
+
+
 class TestMl2SubnetsV2(test_plugin.TestSubnetsV2,
                        Ml2PluginV2TestCase):
     pass
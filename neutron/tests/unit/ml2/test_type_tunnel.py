@@ -0,0 +1,174 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo.config import cfg
+
+from neutron.common import exceptions as exc
+from neutron.db import api as db
+from neutron.plugins.ml2.drivers import type_gre
+from neutron.plugins.ml2.drivers import type_tunnel
+from neutron.tests import base
+
+NUM_AGENTS = 200
+
+
+class FakeNotifier(type_tunnel.TunnelAgentRpcApiMixin):
+    """Agent notifier that records fanouts instead of sending them."""
+
+    topic = 'q-agent-notifier'
+
+    def __init__(self):
+        self.fanouts = []
+
+    def make_msg(self, method, **kwargs):
+        return {'method': method, 'args': kwargs}
+
+    def fanout_cast(self, context, msg, topic=None):
+        self.fanouts.append((topic, msg))
+
+
+class TunnelRpcCallbackTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(TunnelRpcCallbackTestCase, self).setUp()
+        db.configure_db()
+        self.addCleanup(db.clear_db)
+        self.driver = type_gre.GreTypeDriver()
+        self.get_endpoints = mock.patch.object(
+            self.driver, 'get_endpoints',
+            side_effect=self.driver.get_endpoints).start()
+        type_manager = mock.Mock()
+        type_manager.drivers = {'gre': mock.Mock(obj=self.driver)}
+        self.notifier = FakeNotifier()
+        self.callbacks = type_tunnel.TunnelRpcCallbackMixin(self.notifier,
+                                                            type_manager)
+        # Flush queued announcements when the test asks for it
+        self.spawn_after = mock.patch.object(type_tunnel.greenthread,
+                                             'spawn_after').start()
+
+    def _sync(self, tunnel_ip):
+        return self.callbacks.tunnel_sync(mock.Mock(), tunnel_ip=tunnel_ip,
+                                          tunnel_type='gre')
+
+    def _flush(self):
+        for call in self.spawn_after.call_args_list:
+            call[0][1]()
+        self.spawn_after.reset_mock()
+
+    def _announced(self):
+        return [msg['args']['tunnel_ip'] for _topic, msg in
+                self.notifier.fanouts]
+
+    def test_missing_tunnel_type(self):
+        self.assertRaises(exc.InvalidInput, self.callbacks.tunnel_sync,
+                          mock.Mock(), tunnel_ip='10.0.0.1')
+
+    def test_unsupported_tunnel_type(self):
+        self.assertRaises(exc.InvalidInput, self.callbacks.tunnel_sync,
+                          mock.Mock(), tunnel_ip='10.0.0.1',
+                          tunnel_type='vxlan')
+
+    def test_new_endpoint(self):
+        entry = self._sync('10.0.0.1')
+        self.assertEqual([{'ip_address': '10.0.0.1'}], entry['tunnels'])
+        self.assertEqual([], self.notifier.fanouts)
+        self._flush()
+        self.assertEqual(
+            [('q-agent-notifier-tunnel-update',
+              {'method': 'tunnel_update',
+               'args': {'tunnel_ip': '10.0.0.1', 'tunnel_type': 'gre'}})],
+            self.notifier.fanouts)
+
+    def test_known_endpoint_is_served_from_cache(self):
+        self._sync('10.0.0.1')
+        # The list is reloaded when another endpoint registers
+        self._sync('10.0.0.2')
+        self._flush()
+        self.get_endpoints.reset_mock()
+        entry = self._sync('10.0.0.1')
+        self.assertEqual(2, len(entry['tunnels']))
+        self.assertFalse(self.get_endpoints.called)
+        self.assertFalse(self.spawn_after.called)
+        self.assertEqual(['10.0.0.1', '10.0.0.2'], self._announced())
+
+    def test_cache_not_reloaded_since_last_sync_is_reloaded(self):
+        self._sync('10.0.0.1')
+        # Registered through another neutron server while the agent was
+        # down, the agent may have missed the announcement
+        self.driver.add_endpoint('10.0.0.2')
+        self.get_endpoints.reset_mock()
+        self.assertEqual(2, len(self._sync('10.0.0.1')['tunnels']))
+        self.assertEqual(1, self.get_endpoints.call_count)
+        self._flush()
+        self.assertEqual(['10.0.0.1'], self._announced())
+
+    def test_version_changes_with_endpoints(self):
+        self._sync('10.0.0.1')
+        cache = self.callbacks._endpoint_caches['gre']
+        version = cache.version
+        self._sync('10.0.0.1')
+        self.assertEqual(version, cache.version)
+        self._sync('10.0.0.2')
+        self.assertEqual(version + 1, cache.version)
+
+    def test_expired_cache_picks_up_other_servers(self):
+        self._sync('10.0.0.1')
+        self._sync('10.0.0.2')
+        # Registered through another neutron server
+        self.driver.add_endpoint('10.0.0.3')
+        self.assertEqual(2, len(self._sync('10.0.0.1')['tunnels']))
+        self.callbacks.endpoint_cache_ttl = -1
+        self.assertEqual(3, len(self._sync('10.0.0.2')['tunnels']))
+        self._flush()
+        self.assertEqual(['10.0.0.1', '10.0.0.2'], self._announced())
+
+    def test_cache_settings_are_configurable(self):
+        cfg.CONF.set_override('endpoint_cache_ttl', 10, 'ml2')
+        cfg.CONF.set_override('tunnel_update_delay', 3, 'ml2')
+        callbacks = type_tunnel.TunnelRpcCallbackMixin(self.notifier,
+                                                       mock.Mock())
+        self.assertEqual(10, callbacks.endpoint_cache_ttl)
+        self.assertEqual(3, callbacks.tunnel_update_delay)
+
+    def test_new_endpoints_are_coalesced(self):
+        for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+            self._sync(ip)
+        self.assertEqual(1, self.spawn_after.call_count)
+        self._flush()
+        self.assertEqual(['10.0.0.1', '10.0.0.2', '10.0.0.3'],
+                         self._announced())
+        self._sync('10.0.0.4')
+        self.assertEqual(1, self.spawn_after.call_count)
+
+    def test_scale_agent_restart(self):
+        ips = ['10.1.%d.%d' % (i // 250, i % 250 + 1)
+               for i in range(NUM_AGENTS)]
+        for ip in ips:
+            self._sync(ip)
+        self._flush()
+        self.assertEqual(ips, self._announced())
+        # One initial load, then one reload per registration
+        self.assertEqual(NUM_AGENTS + 1, self.get_endpoints.call_count)
+
+        # Every agent restarts: no fanout storm, and a single database
+        # read for the last agent, which synced after the last reload
+        self.get_endpoints.reset_mock()
+        for ip in ips:
+            entry = self._sync(ip)
+            self.assertEqual(NUM_AGENTS, len(entry['tunnels']))
+        self._flush()
+        self.assertEqual(1, self.get_endpoints.call_count)
+        self.assertEqual(NUM_AGENTS, len(self.notifier.fanouts))
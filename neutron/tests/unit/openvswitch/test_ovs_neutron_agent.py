@@ -784,31 +784,59 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                 {'type': p_const.TYPE_GRE, 'ip': 'remote_ip'})
             self.assertEqual(ofport, 0)
 
+    def test_setup_tunnel_ports(self):
+        self.agent.local_vlan_map = {
+            'net1': ovs_neutron_agent.LocalVLANMapping(
+                1, p_const.TYPE_VXLAN, None, 101),
+            'net2': ovs_neutron_agent.LocalVLANMapping(
+                2, p_const.TYPE_GRE, None, 102)}
+        remote_ips = {'vxlan-1': '10.0.0.1', 'vxlan-2': '10.0.0.2',
+                      'vxlan-3': '10.0.0.3'}
+        self.agent.tun_br.add_tunnel_ports.return_value = {
+            'vxlan-1': '5', 'vxlan-2': '6', 'vxlan-3': '-1'}
+        with mock.patch.object(ovs_neutron_agent.LOG, 'error') as log_error:
+            self.agent.setup_tunnel_ports(p_const.TYPE_VXLAN, remote_ips)
+        self.agent.tun_br.add_tunnel_ports.assert_called_once_with(
+            remote_ips, self.agent.local_ip, p_const.TYPE_VXLAN,
+            self.agent.vxlan_udp_port, self.agent.dont_fragment)
+        self.assertEqual(1, log_error.call_count)
+        self.assertEqual({'10.0.0.1': '5', '10.0.0.2': '6'},
+                         self.agent.tun_br_ofports[p_const.TYPE_VXLAN])
+        # A single flooding flow update for the VXLAN network, deferred
+        # with the flows of the new ports
+        tun_br = self.agent.tun_br
+        mod_flow_calls = [c for c in tun_br.method_calls
+                          if c[0] == 'mod_flow']
+        self.assertEqual(1, len(mod_flow_calls))
+        self.assertEqual(1, mod_flow_calls[0][2]['dl_vlan'])
+        self.assertEqual(2, tun_br.add_flow.call_count)
+        self.assertEqual('defer_apply_on', tun_br.method_calls[1][0])
+        self.assertEqual('defer_apply_off', tun_br.method_calls[-1][0])
+
     def test_tunnel_sync_with_ovs_plugin(self):
         fake_tunnel_details = {'tunnels': [{'id': '42',
                                             'ip_address': '100.101.102.103'}]}
         with contextlib.nested(
             mock.patch.object(self.agent.plugin_rpc, 'tunnel_sync',
                               return_value=fake_tunnel_details),
-            mock.patch.object(self.agent, 'setup_tunnel_port')
-        ) as (tunnel_sync_rpc_fn, setup_tunnel_port_fn):
+            mock.patch.object(self.agent, 'setup_tunnel_ports')
+        ) as (tunnel_sync_rpc_fn, setup_tunnel_ports_fn):
             self.agent.tunnel_types = ['gre']
             self.agent.tunnel_sync()
-            expected_calls = [mock.call('gre-42', '100.101.102.103', 'gre')]
-            setup_tunnel_port_fn.assert_has_calls(expected_calls)
+            setup_tunnel_ports_fn.assert_called_once_with(
+                'gre', {'gre-42': '100.101.102.103'})
 
     def test_tunnel_sync_with_ml2_plugin(self):
         fake_tunnel_details = {'tunnels': [{'ip_address': '100.101.31.15'}]}
         with contextlib.nested(
             mock.patch.object(self.agent.plugin_rpc, 'tunnel_sync',
                               return_value=fake_tunnel_details),
-            mock.patch.object(self.agent, 'setup_tunnel_port')
-        ) as (tunnel_sync_rpc_fn, setup_tunnel_port_fn):
+            mock.patch.object(self.agent, 'setup_tunnel_ports')
+        ) as (tunnel_sync_rpc_fn, setup_tunnel_ports_fn):
             self.agent.tunnel_types = ['vxlan']
             self.agent.tunnel_sync()
-            expected_calls = [mock.call('vxlan-64651f0f',
-                                        '100.101.31.15', 'vxlan')]
-            setup_tunnel_port_fn.assert_has_calls(expected_calls)
+            setup_tunnel_ports_fn.assert_called_once_with(
+                'vxlan', {'vxlan-64651f0f': '100.101.31.15'})
 
     def test_tunnel_sync_invalid_ip_address(self):
         fake_tunnel_details = {'tunnels': [{'ip_address': '300.300.300.300'},
@@ -816,13 +844,12 @@ class TestOvsNeutronAgent(base.BaseTestCase):
         with contextlib.nested(
             mock.patch.object(self.agent.plugin_rpc, 'tunnel_sync',
                               return_value=fake_tunnel_details),
-            mock.patch.object(self.agent, 'setup_tunnel_port')
-        ) as (tunnel_sync_rpc_fn, setup_tunnel_port_fn):
+            mock.patch.object(self.agent, 'setup_tunnel_ports')
+        ) as (tunnel_sync_rpc_fn, setup_tunnel_ports_fn):
             self.agent.tunnel_types = ['vxlan']
             self.agent.tunnel_sync()
-            setup_tunnel_port_fn.assert_called_once_with('vxlan-64646464',
-                                                         '100.100.100.100',
-                                                         'vxlan')
+            setup_tunnel_ports_fn.assert_called_once_with(
+                'vxlan', {'vxlan-64646464': '100.100.100.100'})
 
     def test_tunnel_update(self):
         kwargs = {'tunnel_ip': '10.10.10.10',
@@ -887,8 +914,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
 
         # Verify the second time through the loop we triggered an
         # OVS restart and re-setup the bridges
-        setup_int_br.assert_has_calls([mock.call()])
-        setup_phys_br.assert_has_calls([mock.call({})])
+        setup_int_br.assert_has_calls([mock.call(True)])
+        setup_phys_br.assert_has_calls([mock.call({}, True)])
 
 
 class AncillaryBridgesTest(base.BaseTestCase):
@@ -300,6 +300,65 @@ class TunnelTest(base.BaseTestCase):
                                           self.VETH_MTU)
         self._verify_mock_calls()
 
+    def test_construct_without_dropping_flows(self):
+        cfg.CONF.set_override('drop_flows_on_start', False, 'AGENT')
+        self.mock_int_bridge.get_port_ofport.return_value = self.TUN_OFPORT
+        self.mock_tun_bridge.get_port_ofport.return_value = self.INT_OFPORT
+
+        def replace(expected, old, new):
+            expected[expected.index(old)] = new
+
+        self.mock_int_bridge_expected.remove(
+            mock.call.delete_port('patch-tun'))
+        replace(self.mock_int_bridge_expected, mock.call.remove_all_flows(),
+                mock.call.start_flow_resync())
+        replace(self.mock_int_bridge_expected,
+                mock.call.add_patch_port('patch-tun', 'patch-int'),
+                mock.call.get_port_ofport('patch-tun'))
+        replace(self.mock_map_tun_bridge_expected,
+                mock.call.remove_all_flows(), mock.call.start_flow_resync())
+        replace(self.mock_tun_bridge_expected, mock.call.reset_bridge(),
+                mock.call.create())
+        replace(self.mock_tun_bridge_expected,
+                mock.call.add_patch_port('patch-int', 'patch-tun'),
+                mock.call.get_port_ofport('patch-int'))
+        replace(self.mock_tun_bridge_expected, mock.call.remove_all_flows(),
+                mock.call.start_flow_resync())
+        agent = ovs_neutron_agent.OVSNeutronAgent(self.INT_BRIDGE,
+                                                  self.TUN_BRIDGE,
+                                                  '10.0.0.1', self.NET_MAPPING,
+                                                  'sudo', 2, ['gre'],
+                                                  self.VETH_MTU)
+        self._verify_mock_calls()
+
+        agent.finish_flow_resync(tunnels_synced=False)
+        self.mock_int_bridge.finish_flow_resync.assert_called_once_with()
+        self.mock_map_tun_bridge.finish_flow_resync.assert_called_once_with()
+        self.assertFalse(self.mock_tun_bridge.finish_flow_resync.called)
+
+        agent.finish_flow_resync()
+        self.mock_tun_bridge.finish_flow_resync.assert_called_once_with()
+
+    def test_setup_bridges_after_ovs_restart_without_dropping_flows(self):
+        cfg.CONF.set_override('drop_flows_on_start', False, 'AGENT')
+        self.mock_int_bridge.get_port_ofport.return_value = self.TUN_OFPORT
+        self.mock_tun_bridge.get_port_ofport.return_value = self.INT_OFPORT
+        agent = ovs_neutron_agent.OVSNeutronAgent(self.INT_BRIDGE,
+                                                  self.TUN_BRIDGE,
+                                                  '10.0.0.1', self.NET_MAPPING,
+                                                  'sudo', 2, ['gre'],
+                                                  self.VETH_MTU)
+        for br in (self.mock_int_bridge, self.mock_map_tun_bridge,
+                   self.mock_tun_bridge):
+            br.reset_mock()
+        agent.setup_integration_br(ovs_restarted=True)
+        agent.setup_physical_bridges(self.NET_MAPPING, ovs_restarted=True)
+        agent.setup_tunnel_br(ovs_restarted=True)
+        for br in (self.mock_int_bridge, self.mock_map_tun_bridge,
+                   self.mock_tun_bridge):
+            br.reset_flow_cache.assert_called_once_with()
+            self.assertFalse(br.start_flow_resync.called)
+
     def test_provision_local_vlan(self):
         ofports = ','.join(TUN_OFPORTS[p_const.TYPE_GRE].values())
         self.mock_tun_bridge_expected += [
@@ -65,18 +65,70 @@ class TestManager(base.BaseTestCase):
             self.assertFalse(sync.called)
 
     def test_collect_stats(self):
+        self.driver_mock.get_stats.side_effect = lambda pool_id: {
+            'bytes_in': pool_id}
+        self.mgr.collect_stats(mock.Mock())
+        self.rpc_mock.update_pools_stats.assert_called_once_with(
+            {'1': {'bytes_in': '1'}, '2': {'bytes_in': '2'}})
+        self.assertFalse(self.rpc_mock.update_pool_stats.called)
+
+    def test_collect_stats_only_sends_changes(self):
+        stats = {'1': {'bytes_in': 1}, '2': {'bytes_in': 2}}
+        self.driver_mock.get_stats.side_effect = lambda pool_id: dict(
+            stats[pool_id])
+        self.mgr.collect_stats(mock.Mock())
+        self.rpc_mock.update_pools_stats.reset_mock()
+
+        self.mgr.collect_stats(mock.Mock())
+        self.assertFalse(self.rpc_mock.update_pools_stats.called)
+
+        stats['2']['bytes_in'] = 20
+        self.mgr.collect_stats(mock.Mock())
+        self.rpc_mock.update_pools_stats.assert_called_once_with(
+            {'2': {'bytes_in': 20}})
+
+    def test_collect_stats_resends_after_member_update(self):
+        self.driver_mock.get_stats.return_value = {
+            'members': {'id1': {'status': constants.INACTIVE}}}
+        self.mgr.collect_stats(mock.Mock())
+        # The agent writes ACTIVE while haproxy still sees the member down
+        self.mgr.update_member(mock.Mock(), {'id': 'id1'},
+                               {'id': 'id1', 'pool_id': '1'})
+        self.rpc_mock.update_pools_stats.reset_mock()
+
+        self.mgr.collect_stats(mock.Mock())
+        self.rpc_mock.update_pools_stats.assert_called_once_with(
+            {'1': {'members': {'id1': {'status': constants.INACTIVE}}}})
+
+    def test_collect_stats_resends_after_failure(self):
+        self.driver_mock.get_stats.return_value = {'bytes_in': 1}
+        self.rpc_mock.update_pools_stats.side_effect = Exception
+        self.mgr.collect_stats(mock.Mock())
+        self.assertTrue(self.mgr.needs_resync)
+        self.assertEqual({}, self.mgr.reported_stats)
+
+        self.rpc_mock.update_pools_stats.side_effect = None
+        self.mgr.collect_stats(mock.Mock())
+        self.assertEqual(2, self.rpc_mock.update_pools_stats.call_count)
+
+    def test_collect_stats_old_plugin(self):
+        self.driver_mock.get_stats.return_value = {'bytes_in': 1}
+        error = manager.n_rpc.RemoteError('UnsupportedVersion')
+        self.rpc_mock.update_pools_stats.side_effect = error
         self.mgr.collect_stats(mock.Mock())
         self.rpc_mock.update_pool_stats.assert_has_calls([
-            mock.call('1', mock.ANY),
-            mock.call('2', mock.ANY)
-        ])
+            mock.call('1', {'bytes_in': 1}),
+            mock.call('2', {'bytes_in': 1})
+        ], any_order=True)
+        self.assertFalse(self.mgr.batch_stats_supported)
+        self.assertFalse(self.mgr.needs_resync)
 
     def test_collect_stats_exception(self):
         self.driver_mock.get_stats.side_effect = Exception
 
         self.mgr.collect_stats(mock.Mock())
 
-        self.assertFalse(self.rpc_mock.called)
+        self.assertFalse(self.rpc_mock.update_pools_stats.called)
         self.assertTrue(self.mgr.needs_resync)
         self.assertTrue(self.log.exception.called)
 
@@ -53,8 +53,10 @@ class TestHaproxyCfg(base.BaseTestCase):
                          '\tgroup test_group',
                          '\tlog /dev/log local0',
                          '\tlog /dev/log local1 notice',
-                         '\tstats socket test_path mode 0666 level user']
-        opts = cfg._build_global(mock.Mock(), 'test_path', 'test_group')
+                         '\tstats socket test_path mode 0600 level admin '
+                         'uid 1000']
+        with mock.patch('os.geteuid', return_value=1000):
+            opts = cfg._build_global(mock.Mock(), 'test_path', 'test_group')
         self.assertEqual(expected_opts, list(opts))
 
     def test_build_defaults(self):
@@ -110,7 +112,7 @@ class TestHaproxyCfg(base.BaseTestCase):
                                     'protocol_port': 80,
                                     'weight': 1},
                                    {'status': 'PENDING_CREATE',
-                                    'admin_state_up': True,
+                                    'admin_state_up': False,
                                     'id': 'member3_id',
                                     'address': '10.0.0.5',
                                     'protocol_port': 80,
@@ -132,7 +134,7 @@ class TestHaproxyCfg(base.BaseTestCase):
                          '\tserver member2_id 10.0.0.4:80 weight 1 '
                          'check inter 3s fall 4 cookie 1',
                          '\tserver member3_id 10.0.0.5:80 weight 1 '
-                         'check inter 3s fall 4 cookie 2']
+                         'check inter 3s fall 4 cookie 2 disabled']
         opts = cfg._build_backend(test_config)
         self.assertEqual(expected_opts, list(opts))
 
@@ -471,7 +471,7 @@ class TestHaproxyNSDriver(base.BaseTestCase):
             self.assertFalse(exists.called)
 
     def test_refresh_device(self):
-        with mock.patch.object(self.driver, 'deploy_instance') as deploy:
+        with mock.patch.object(self.driver, '_deploy_instance') as deploy:
             pool_id = 'pool_id1'
             self.driver._refresh_device(pool_id)
             self.rpc_mock.get_logical_device.assert_called_once_with(pool_id)
@@ -527,6 +527,69 @@ class TestHaproxyNSDriver(base.BaseTestCase):
             self.driver.update_member({}, {'pool_id': '1'})
             refresh.assert_called_once_with('1')
 
+    def _test_update_member_runtime(self, member, response=''):
+        self.fake_config['members'] = [member]
+        self.rpc_mock.get_logical_device.return_value = self.fake_config
+        with contextlib.nested(
+            mock.patch.object(self.driver, 'exists', return_value=True),
+            mock.patch.object(self.driver, '_get_state_file_path'),
+            mock.patch.object(namespace_driver.hacfg, 'save_config'),
+            mock.patch.object(self.driver, '_refresh_device'),
+            mock.patch('socket.socket')
+        ) as (exists, gsp, save, refresh, socket):
+            gsp.side_effect = lambda x, y: y
+            sock = socket.return_value
+            sock.recv.side_effect = [response, '']
+            old_member = dict(member, weight=1, admin_state_up=True,
+                              status='ACTIVE')
+            self.driver.update_member(old_member, member)
+
+            save.assert_called_once_with('conf', self.fake_config, 'sock',
+                                         'test_group')
+            sock.connect.assert_called_once_with('sock')
+            return sock, refresh
+
+    def test_update_member_weight_runtime(self):
+        member = {'id': 'm1', 'pool_id': 'pool_id', 'weight': 5,
+                  'admin_state_up': True, 'status': 'PENDING_UPDATE'}
+        sock, refresh = self._test_update_member_runtime(member)
+        sock.sendall.assert_called_once_with(
+            'set weight pool_id/m1 5;enable server pool_id/m1\n')
+        self.assertFalse(refresh.called)
+
+    def test_update_member_admin_state_runtime(self):
+        member = {'id': 'm1', 'pool_id': 'pool_id', 'weight': 1,
+                  'admin_state_up': False, 'status': 'ACTIVE'}
+        sock, refresh = self._test_update_member_runtime(member)
+        sock.sendall.assert_called_once_with(
+            'set weight pool_id/m1 1;disable server pool_id/m1\n')
+        self.assertFalse(refresh.called)
+
+    def test_update_member_runtime_rejected(self):
+        member = {'id': 'm1', 'pool_id': 'pool_id', 'weight': 5,
+                  'admin_state_up': True, 'status': 'ACTIVE'}
+        sock, refresh = self._test_update_member_runtime(
+            member, response='No such server.\n')
+        refresh.assert_called_once_with('pool_id')
+
+    def test_update_member_address_reloads(self):
+        old_member = {'id': 'm1', 'pool_id': 'pool_id', 'weight': 1,
+                      'address': '10.0.0.1'}
+        member = dict(old_member, address='10.0.0.2', weight=2)
+        with contextlib.nested(
+            mock.patch.object(self.driver, '_refresh_device'),
+            mock.patch.object(self.driver, '_update_member_runtime')
+        ) as (refresh, runtime):
+            self.driver.update_member(old_member, member)
+            refresh.assert_called_once_with('pool_id')
+            self.assertFalse(runtime.called)
+
+    def test_update_member_runtime_not_deployed(self):
+        member = {'id': 'm1', 'pool_id': 'pool_id'}
+        with mock.patch.object(self.driver, 'exists', return_value=False):
+            self.assertFalse(self.driver._update_member_runtime(member))
+        self.assertFalse(self.rpc_mock.get_logical_device.called)
+
     def test_delete_member(self):
         with mock.patch.object(self.driver, '_refresh_device') as refresh:
             self.driver.delete_member({'pool_id': '1'})
@@ -49,6 +49,7 @@ class TestIPsecDeviceDriver(base.BaseTestCase):
             'neutron.services.vpn.device_drivers.ipsec.'
                 'OpenSwanProcess._gen_config_content',
             'shutil.rmtree',
+            'neutron.openstack.common.loopingcall.FixedIntervalLoopingCall',
         ]:
             mock.patch(klass).start()
         self.execute = mock.patch(
@@ -84,6 +85,21 @@ class TestIPsecDeviceDriver(base.BaseTestCase):
         process.disable.assert_called_once_with()
         self.assertNotIn(process_id, self.driver.processes)
 
+    def test_destroy_router_removes_installed_rules(self):
+        process_id = _uuid()
+        process = mock.Mock()
+        process.vpnservice = FAKE_VPN_SERVICE
+        self.driver.processes = {process_id: process}
+        # Rules installed for a previous configuration of the service
+        self.driver.nat_rules[process_id] = ['old rule']
+        self.driver.destroy_router(process_id)
+        self.assertEqual(
+            [mock.call.remove_nat_rule(process_id, 'POSTROUTING',
+                                       'old rule', top=True),
+             mock.call.iptables_apply(process_id)],
+            self.agent.mock_calls)
+        self.assertNotIn(process_id, self.driver.nat_rules)
+
     def test_sync_added(self):
         self.driver.agent_rpc.get_vpn_services_on_host.return_value = [
             FAKE_VPN_SERVICE]
@@ -254,3 +270,145 @@ class TestIPsecDeviceDriver(base.BaseTestCase):
         missing_conn = new_status['ipsec_site_connections'].get('20')
         self.assertIsNotNone(missing_conn)
         self.assertEqual(constants.DOWN, missing_conn['status'])
+
+    def test_sync_nat_unchanged(self):
+        self.driver.agent_rpc.get_vpn_services_on_host.return_value = [
+            copy.deepcopy(FAKE_VPN_SERVICE)]
+        with mock.patch.object(self.driver, 'ensure_process'):
+            self.driver.sync(mock.Mock(), [])
+            self.driver.sync(mock.Mock(), [])
+        self.assertEqual(4, self.agent.add_nat_rule.call_count)
+        self.assertFalse(self.agent.remove_nat_rule.called)
+        self.agent.iptables_apply.assert_called_once_with(FAKE_ROUTER_ID)
+
+    def test_sync_nat_changed(self):
+        vpnservice = copy.deepcopy(FAKE_VPN_SERVICE)
+        self.driver.agent_rpc.get_vpn_services_on_host.return_value = [
+            vpnservice]
+        with mock.patch.object(self.driver, 'ensure_process'):
+            self.driver.sync(mock.Mock(), [])
+            self.agent.reset_mock()
+            vpnservice['ipsec_site_connections'][1]['peer_cidrs'] = [
+                '40.0.0.0/24', '60.0.0.0/24']
+            self.driver.sync(mock.Mock(), [])
+        self.agent.assert_has_calls([
+            mock.call.remove_nat_rule(
+                FAKE_ROUTER_ID,
+                'POSTROUTING',
+                '-s 10.0.0.0/24 -d 50.0.0.0/24 -m policy '
+                '--dir out --pol ipsec -j ACCEPT ',
+                top=True),
+            mock.call.add_nat_rule(
+                FAKE_ROUTER_ID,
+                'POSTROUTING',
+                '-s 10.0.0.0/24 -d 60.0.0.0/24 -m policy '
+                '--dir out --pol ipsec -j ACCEPT ',
+                top=True),
+            mock.call.iptables_apply(FAKE_ROUTER_ID)])
+        self.assertEqual(1, self.agent.add_nat_rule.call_count)
+        self.assertEqual(1, self.agent.remove_nat_rule.call_count)
+
+    def _make_status_process(self, status, connection_status):
+        process = mock.Mock()
+        process.id = _uuid()
+        process.vpnservice = {'id': _uuid()}
+        process.status = status
+        process.updated_pending_status = False
+        process.connection_status = connection_status
+        self.driver.processes[process.id] = process
+        return process
+
+    def test_report_status_only_changed_connections(self):
+        process = self._make_status_process(
+            constants.ACTIVE,
+            {'10': {'status': constants.ACTIVE,
+                    'updated_pending_status': False},
+             '20': {'status': constants.ACTIVE,
+                    'updated_pending_status': False}})
+        context = mock.Mock()
+        self.driver.report_status(context)
+        self.driver.agent_rpc.reset_mock()
+        process.connection_status['20']['status'] = constants.DOWN
+        self.driver.report_status(context)
+        self.driver.agent_rpc.update_status.assert_called_once_with(
+            context,
+            [{'id': process.vpnservice['id'],
+              'status': constants.ACTIVE,
+              'updated_pending_status': False,
+              'ipsec_site_connections': {
+                  '20': {'status': constants.DOWN,
+                         'updated_pending_status': False}}}])
+
+    def test_report_status_unchanged(self):
+        self._make_status_process(
+            constants.ACTIVE,
+            {'10': {'status': constants.ACTIVE,
+                    'updated_pending_status': False}})
+        self.driver.report_status(mock.Mock())
+        self.driver.agent_rpc.reset_mock()
+        self.driver.report_status(mock.Mock())
+        self.assertFalse(self.driver.agent_rpc.update_status.called)
+
+    def test_report_status_polls_concurrently(self):
+        for i in range(3):
+            self._make_status_process(constants.DOWN, {})
+        with mock.patch('eventlet.GreenPool') as pool:
+            pool.return_value.imap.side_effect = map
+            self.driver.report_status(mock.Mock())
+        pool.assert_called_once_with(ipsec_driver.STATUS_POOL_SIZE)
+        self.assertEqual(3, len(
+            self.driver.agent_rpc.update_status.call_args[0][1]))
+
+
+class TestOpenSwanProcess(base.BaseTestCase):
+    def setUp(self):
+        super(TestOpenSwanProcess, self).setUp()
+        self.process = ipsec_driver.OpenSwanProcess(
+            mock.Mock(), 'sudo', FAKE_ROUTER_ID, None, 'qrouter-ns')
+        self.process.vpnservice = copy.deepcopy(FAKE_VPN_SERVICE)
+        for ipsec_site_conn in self.process.vpnservice[
+                'ipsec_site_connections']:
+            ipsec_site_conn.update(id=_uuid(),
+                                   status=constants.PENDING_CREATE)
+        for name in ('ensure_configs', 'start', 'restart', 'stop',
+                     'remove_config', 'get_status'):
+            mock.patch.object(self.process, name).start()
+        self.process.get_status.return_value = ''
+
+    def test_fingerprint_ignores_status(self):
+        fingerprint = self.process.config_fingerprint()
+        self.process.vpnservice['status'] = constants.ACTIVE
+        self.assertEqual(fingerprint, self.process.config_fingerprint())
+        self.process.vpnservice['subnet']['cidr'] = '10.1.0.0/24'
+        self.assertNotEqual(fingerprint, self.process.config_fingerprint())
+
+    def test_update_unchanged_skips_enable(self):
+        self.process.update()
+        self.assertEqual(1, self.process.ensure_configs.call_count)
+        self.process.update()
+        self.assertEqual(1, self.process.ensure_configs.call_count)
+        self.assertFalse(self.process.start.called)
+        self.assertEqual(constants.ACTIVE, self.process.vpnservice['status'])
+
+    def test_update_changed_restarts(self):
+        self.process.update()
+        self.process.vpnservice['subnet']['cidr'] = '10.1.0.0/24'
+        self.process.update()
+        self.assertEqual(2, self.process.ensure_configs.call_count)
+        self.process.restart.assert_called_with()
+
+    def test_update_not_running_restarts(self):
+        self.process.update()
+        self.process.get_status.side_effect = RuntimeError()
+        self.process.update()
+        self.assertEqual(2, self.process.ensure_configs.call_count)
+        self.process.start.assert_called_with()
+
+    def test_failed_enable_is_retried(self):
+        self.process.ensure_configs.side_effect = RuntimeError()
+        self.process.update()
+        self.assertIsNone(self.process.applied_fingerprint)
+        self.process.ensure_configs.side_effect = None
+        self.process.update()
+        self.assertEqual(2, self.process.ensure_configs.call_count)
+        self.assertIsNotNone(self.process.applied_fingerprint)
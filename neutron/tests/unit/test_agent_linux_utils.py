@@ -14,8 +14,10 @@
 
 import fixtures
 import mock
+from oslo.config import cfg
 import testtools
 
+from neutron.agent.common import config
 from neutron.agent.linux import utils
 from neutron.tests import base
 
@@ -111,6 +113,85 @@ class AgentUtilsExecuteTest(base.BaseTestCase):
                 self.assertTrue(log.debug.called)
 
 
+class AgentUtilsRootwrapDaemonTest(base.BaseTestCase):
+    def setUp(self):
+        super(AgentUtilsRootwrapDaemonTest, self).setUp()
+        config.register_root_helper(cfg.CONF)
+        cfg.CONF.set_override('root_helper_daemon',
+                              'sudo neutron-rootwrap-daemon rootwrap.conf',
+                              'AGENT')
+        self.addCleanup(cfg.CONF.reset)
+        self.client = mock.patch.object(utils.client, 'Client').start()
+        self.daemon = self.client.return_value
+        self.daemon.execute.return_value = (0, 'out', '')
+        mock.patch.object(utils, '_rootwrap_client', None).start()
+        mock.patch.object(utils, '_rootwrap_stats', None).start()
+        self.create_process = mock.patch.object(utils,
+                                                'create_process').start()
+
+    def test_execute_through_daemon(self):
+        self.assertEqual('out', utils.execute(['ip', 'link'], 'sudo'))
+        self.daemon.execute.assert_called_once_with(['ip', 'link'], None,
+                                                    None)
+        self.client.assert_called_once_with(
+            ['sudo', 'neutron-rootwrap-daemon', 'rootwrap.conf'])
+        self.assertFalse(self.create_process.called)
+
+    def test_client_is_shared(self):
+        utils.execute(['ip', 'link'], 'sudo')
+        utils.execute(['ip', 'addr'], 'sudo')
+        self.assertEqual(1, self.client.call_count)
+        self.assertEqual(2, self.daemon.execute.call_count)
+
+    def test_addl_env_and_process_input(self):
+        utils.execute(['dnsmasq'], 'sudo', process_input='data',
+                      addl_env={'FOO': 1})
+        self.daemon.execute.assert_called_once_with(
+            ['env', 'FOO=1', 'dnsmasq'], None, 'data')
+
+    def test_without_root_helper_runs_locally(self):
+        self.create_process.return_value = FakeCreateProcess(0), ['ls']
+        utils.execute(['ls'])
+        self.assertFalse(self.daemon.execute.called)
+
+    def test_exit_code_raises(self):
+        self.daemon.execute.return_value = (1, '', 'error')
+        self.assertRaises(RuntimeError, utils.execute, ['ip', 'link'],
+                          'sudo')
+        self.assertEqual('', utils.execute(['ip', 'link'], 'sudo',
+                                           check_exit_code=False))
+
+    def test_return_stderr(self):
+        self.daemon.execute.return_value = (0, 'out', 'err')
+        self.assertEqual(('out', 'err'),
+                         utils.execute(['ip', 'link'], 'sudo',
+                                       return_stderr=True))
+
+    def test_stats(self):
+        utils.execute(['ip', 'link'], 'sudo')
+        self.daemon.execute.side_effect = EOFError
+        self.assertRaises(EOFError, utils.execute, ['ip', 'link'], 'sudo')
+        stats = utils.get_rootwrap_daemon_stats()
+        self.assertEqual(2, stats['commands'])
+        self.assertEqual(1, stats['errors'])
+        self.assertLessEqual(stats['avg_latency'], stats['max_latency'])
+        self.assertIn('commands_per_second', stats)
+
+    def test_stats_logged_periodically(self):
+        with mock.patch.object(utils, 'ROOTWRAP_DAEMON_STATS_LOG_INTERVAL',
+                               2):
+            with mock.patch.object(utils, 'LOG') as log:
+                utils.execute(['ip', 'link'], 'sudo')
+                self.assertFalse(log.info.called)
+                utils.execute(['ip', 'link'], 'sudo')
+                self.assertEqual(1, log.info.call_count)
+
+    def test_reset_stats(self):
+        utils.execute(['ip', 'link'], 'sudo')
+        utils.reset_rootwrap_daemon_stats()
+        self.assertEqual(0, utils.get_rootwrap_daemon_stats()['commands'])
+
+
 class AgentUtilsGetInterfaceMAC(base.BaseTestCase):
     def test_get_interface_mac(self):
         expect_val = '01:02:03:04:05:06'
@@ -13,12 +13,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
+import eventlet
 import mock
 
 from neutron.agent.linux import interface
 from neutron.agent import netns_cleanup_util as util
 from neutron.tests import base
 
+real_sleep = eventlet.sleep
+
 
 class TestNetnsCleanup(base.BaseTestCase):
 
@@ -201,6 +206,7 @@ class TestNetnsCleanup(base.BaseTestCase):
             with mock.patch('eventlet.sleep') as eventlet_sleep:
                 conf = mock.Mock()
                 conf.force = False
+                conf.workers = 2
                 methods_to_mock = dict(
                     eligible_for_deletion=mock.DEFAULT,
                     destroy_namespace=mock.DEFAULT,
@@ -233,6 +239,7 @@ class TestNetnsCleanup(base.BaseTestCase):
             with mock.patch('eventlet.sleep') as eventlet_sleep:
                 conf = mock.Mock()
                 conf.force = False
+                conf.workers = 2
                 methods_to_mock = dict(
                     eligible_for_deletion=mock.DEFAULT,
                     destroy_namespace=mock.DEFAULT,
@@ -254,3 +261,37 @@ class TestNetnsCleanup(base.BaseTestCase):
                         self.assertFalse(mocks['destroy_namespace'].called)
 
                         self.assertFalse(eventlet_sleep.called)
+
+    def test_main_destroys_concurrently(self):
+        namespaces = ['ns%d' % i for i in range(4)]
+        conf = mock.Mock()
+        conf.force = False
+        conf.workers = 2
+        running = []
+        concurrency = []
+
+        def destroy(conf, namespace, force):
+            running.append(namespace)
+            concurrency.append(len(running))
+            real_sleep(0)
+            running.remove(namespace)
+
+        with contextlib.nested(
+            mock.patch('neutron.agent.linux.ip_lib.IPWrapper'),
+            mock.patch.object(util, 'setup_conf', return_value=conf),
+            mock.patch.object(util, 'eligible_for_deletion',
+                              return_value=True),
+            mock.patch.object(util, 'destroy_namespace',
+                              side_effect=destroy),
+            mock.patch.object(util.LOG, 'info'),
+            mock.patch('neutron.common.config.setup_logging')
+        ) as (ip_wrap, _conf, _eligible, _destroy, log_info, _log):
+            ip_wrap.get_namespaces.return_value = namespaces
+            with mock.patch.object(util.eventlet, 'sleep',
+                                   side_effect=lambda s: real_sleep(0)):
+                util.main()
+        self.assertEqual(2, max(concurrency))
+        self.assertEqual(4, len(concurrency))
+        self.assertEqual(
+            [{'count': i, 'total': 4} for i in range(1, 5)],
+            [c[0][1] for c in log_info.call_args_list[1:]])
@@ -76,16 +76,21 @@ class TestOVSCleanup(base.BaseTestCase):
 
     def test_delete_neutron_ports(self):
         ports = ['tap1234', 'tap5678', 'tap09ab']
-        port_found = [True, False, True]
+        devices = []
+        for name in ('lo', 'tap1234', 'tap09ab'):
+            device = mock.Mock()
+            device.name = name
+            devices.append(device)
         with contextlib.nested(
-            mock.patch.object(ip_lib, 'device_exists',
-                              side_effect=port_found),
+            mock.patch.object(ip_lib, 'IPWrapper'),
             mock.patch.object(ip_lib, 'IPDevice')
-        ) as (device_exists, ip_dev):
+        ) as (ip_wrap, ip_dev):
+            ip_wrap.return_value.get_devices.return_value = devices
             util.delete_neutron_ports(ports, 'dummy_sudo')
-            device_exists.assert_has_calls([mock.call(p) for p in ports])
+            ip_wrap.assert_called_once_with('dummy_sudo')
             ip_dev.assert_has_calls(
                 [mock.call('tap1234', 'dummy_sudo'),
                  mock.call().link.delete(),
                  mock.call('tap09ab', 'dummy_sudo'),
                  mock.call().link.delete()])
+            self.assertEqual(2, ip_dev.call_count)
@@ -47,6 +47,36 @@ class TestDhcpRpcCallbackMixin(base.BaseTestCase):
 
         self.assertEqual(len(self.log.mock_calls), 1)
 
+    def test_get_active_networks_info(self):
+        self.plugin.get_networks.return_value = [dict(id='a'), dict(id='b')]
+        self.plugin.get_ports.return_value = [dict(id='p1', network_id='a')]
+        self.plugin.get_subnets.return_value = [dict(id='s1',
+                                                     network_id='b')]
+
+        networks = self.callbacks.get_active_networks_info(mock.Mock(),
+                                                           host='host')
+
+        self.assertEqual([dict(id='a', subnets=[],
+                               ports=[dict(id='p1', network_id='a')]),
+                          dict(id='b', subnets=[dict(id='s1', network_id='b')],
+                               ports=[])],
+                         networks)
+        self.plugin.get_networks.assert_called_once_with(
+            mock.ANY, filters=dict(admin_state_up=[True]))
+
+    def test_get_active_networks_info_by_ids(self):
+        self.plugin.get_networks.return_value = [dict(id='b')]
+        self.plugin.get_ports.return_value = []
+        self.plugin.get_subnets.return_value = []
+
+        networks = self.callbacks.get_active_networks_info(
+            mock.Mock(), host='host', network_ids=['b'])
+
+        self.assertEqual([dict(id='b', subnets=[], ports=[])], networks)
+        self.plugin.get_networks.assert_called_once_with(
+            mock.ANY, filters=dict(id=['b'], admin_state_up=[True]))
+        self.assertTrue(self.plugin.get_ports.called)
+
     def _test__port_action_with_failures(self, exc=None, action=None):
         port = {
             'network_id': 'foo_network_id',
@@ -130,6 +130,7 @@ class TestDhcpAgent(base.BaseTestCase):
             'neutron.agent.dhcp_agent.importutils.import_class')
         self.driver = mock.Mock(name='driver')
         self.driver.existing_dhcp_networks.return_value = []
+        self.driver.lease_release_stats = {'released': 0, 'helper_calls': 0}
         self.driver_cls = self.driver_cls_p.start()
         self.driver_cls.return_value = self.driver
         self.mock_makedirs_p = mock.patch("os.makedirs")
@@ -167,6 +168,10 @@ class TestDhcpAgent(base.BaseTestCase):
                             [mock.call(mock.ANY),
                              mock.call().report_state(mock.ANY, mock.ANY,
                                                       mock.ANY)])
+                        configurations = agent_mgr.agent_state[
+                            'configurations']
+                        self.assertEqual({'released': 0, 'helper_calls': 0},
+                                         configurations['lease_releases'])
 
     def test_dhcp_agent_main_agent_manager(self):
         logging_str = 'neutron.agent.common.config.setup_logging'
@@ -243,6 +248,8 @@ class TestDhcpAgent(base.BaseTestCase):
     def _test_sync_state_helper(self, known_networks, active_networks):
         with mock.patch(DHCP_PLUGIN) as plug:
             mock_plugin = mock.Mock()
+            mock_plugin.get_active_network_ids.return_value = [
+                getattr(net, 'id', net) for net in active_networks]
             mock_plugin.get_active_networks_info.return_value = active_networks
             plug.return_value = mock_plugin
 
@@ -291,9 +298,84 @@ class TestDhcpAgent(base.BaseTestCase):
             self._test_sync_state_helper(known_networks, active_networks)
             w.assert_called_once_with()
 
+    def _test_sync_state_chunks(self, known_networks, active_networks,
+                                chunk_size, expected_chunks):
+        cfg.CONF.set_override('sync_chunk_size', chunk_size)
+        networks = dict((net_id, dhcp.NetModel(True, dict(id=net_id)))
+                        for net_id in active_networks)
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_network_ids.return_value = active_networks
+            mock_plugin.get_active_networks_info.side_effect = (
+                lambda network_ids=None: [networks[n] for n in network_ids])
+            plug.return_value = mock_plugin
+
+            dhcp_agt = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(dhcp_agt, 'cache') as cache:
+                cache.get_network_ids.return_value = known_networks
+                with mock.patch.object(
+                        dhcp_agt, 'safe_configure_dhcp_for_network') as conf:
+                    dhcp_agt.sync_state()
+
+            mock_plugin.get_active_networks_info.assert_has_calls(
+                [mock.call(network_ids=chunk) for chunk in expected_chunks])
+            self.assertEqual(
+                sorted(networks.values()),
+                sorted(c[0][0] for c in conf.call_args_list))
+            self.assertEqual(len(active_networks),
+                             dhcp_agt.sync_progress.done)
+
+    def test_sync_state_chunks(self):
+        self._test_sync_state_chunks([], ['a', 'b', 'c', 'd', 'e'], 2,
+                                     [['a', 'b'], ['c', 'd'], ['e']])
+
+    def test_sync_state_chunks_unknown_networks_first(self):
+        self._test_sync_state_chunks(['a', 'b'], ['a', 'b', 'c'], 2,
+                                     [['c', 'a'], ['b']])
+
+    def test_sync_state_chunks_old_server(self):
+        cfg.CONF.set_override('sync_chunk_size', 1)
+        active_networks = [dhcp.NetModel(True, dict(id='a')),
+                           dhcp.NetModel(True, dict(id='b'))]
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_network_ids.return_value = ['a', 'b']
+            # the server ignores network_ids and returns everything
+            mock_plugin.get_active_networks_info.return_value = (
+                active_networks)
+            plug.return_value = mock_plugin
+
+            dhcp_agt = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(
+                    dhcp_agt, 'safe_configure_dhcp_for_network') as conf:
+                dhcp_agt.sync_state()
+
+            self.assertEqual(
+                1, mock_plugin.get_active_networks_info.call_count)
+            self.assertEqual(2, conf.call_count)
+
+    def test_sync_state_without_chunks(self):
+        cfg.CONF.set_override('sync_chunk_size', 0)
+        active_networks = [dhcp.NetModel(True, dict(id='a'))]
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks_info.return_value = (
+                active_networks)
+            plug.return_value = mock_plugin
+
+            dhcp_agt = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(
+                    dhcp_agt, 'safe_configure_dhcp_for_network') as conf:
+                dhcp_agt.sync_state()
+
+            mock_plugin.get_active_networks_info.assert_called_once_with()
+            self.assertFalse(mock_plugin.get_active_network_ids.called)
+            conf.assert_called_once_with(active_networks[0])
+
     def test_sync_state_plugin_error(self):
         with mock.patch(DHCP_PLUGIN) as plug:
             mock_plugin = mock.Mock()
+            mock_plugin.get_active_network_ids.return_value = ['a']
             mock_plugin.get_active_networks_info.side_effect = Exception
             plug.return_value = mock_plugin
 
@@ -729,55 +811,73 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
             self.assertTrue(log.called)
             self.assertTrue(self.dhcp.schedule_resync.called)
 
+    def _cached_network(self, subnets, ports=None):
+        network = dhcp.NetModel(True, dict(id=fake_network.id,
+                                tenant_id=fake_network.tenant_id,
+                                admin_state_up=True,
+                                subnets=copy.deepcopy(subnets),
+                                ports=copy.deepcopy(ports or [fake_port1])))
+        self.cache_p.stop()
+        self.dhcp.cache = dhcp_agent.NetworkCache()
+        self.dhcp.cache.put(network)
+        return network
+
     def test_subnet_update_end(self):
-        payload = dict(subnet=dict(network_id=fake_network.id))
-        self.cache.get_network_by_id.return_value = fake_network
-        self.plugin.get_network_info.return_value = fake_network
+        network = self._cached_network([fake_subnet1, fake_subnet2])
+        subnet = dict(fake_subnet1, name='renamed')
+        payload = dict(subnet=subnet)
 
         self.dhcp.subnet_update_end(None, payload)
 
-        self.cache.assert_has_calls([mock.call.put(fake_network)])
+        self.assertFalse(self.plugin.get_network_info.called)
+        self.assertEqual(subnet, network.subnets[0])
+        self.assertEqual(2, len(network.subnets))
         self.call_driver.assert_called_once_with('reload_allocations',
-                                                 fake_network)
+                                                 network)
 
     def test_subnet_update_end_restart(self):
-        new_state = dhcp.NetModel(True, dict(id=fake_network.id,
-                                  tenant_id=fake_network.tenant_id,
-                                  admin_state_up=True,
-                                  subnets=[fake_subnet1, fake_subnet3],
-                                  ports=[fake_port1]))
-
-        payload = dict(subnet=dict(network_id=fake_network.id))
-        self.cache.get_network_by_id.return_value = fake_network
-        self.plugin.get_network_info.return_value = new_state
+        network = self._cached_network([fake_subnet1])
+        payload = dict(subnet=fake_subnet3)
 
         self.dhcp.subnet_update_end(None, payload)
 
-        self.cache.assert_has_calls([mock.call.put(new_state)])
-        self.call_driver.assert_called_once_with('restart',
-                                                 new_state)
+        self.assertFalse(self.plugin.get_network_info.called)
+        self.assertEqual([fake_subnet1, fake_subnet3], network.subnets)
+        self.assertEqual(network,
+                         self.dhcp.cache.get_network_by_subnet_id(
+                             fake_subnet3.id))
+        self.call_driver.assert_called_once_with('restart', network)
 
-    def test_subnet_update_end_delete_payload(self):
-        prev_state = dhcp.NetModel(True, dict(id=fake_network.id,
-                                   tenant_id=fake_network.tenant_id,
-                                   admin_state_up=True,
-                                   subnets=[fake_subnet1, fake_subnet3],
-                                   ports=[fake_port1]))
+    def test_subnet_update_end_uncached_network(self):
+        payload = dict(subnet=fake_subnet1)
+        self.cache.get_network_by_id.return_value = None
+
+        with mock.patch.object(self.dhcp, 'enable_dhcp_helper') as enable:
+            self.dhcp.subnet_update_end(None, payload)
+            enable.assert_called_once_with(fake_network.id)
+        self.assertFalse(self.cache.put_subnet.called)
+
+    def test_subnet_update_end_disable(self):
+        network = self._cached_network([fake_subnet1])
+        payload = dict(subnet=dict(fake_subnet1, enable_dhcp=False))
 
+        with mock.patch.object(self.dhcp, 'disable_dhcp_helper') as disable:
+            self.dhcp.subnet_update_end(None, payload)
+            disable.assert_called_once_with(network.id)
+        self.assertFalse(self.call_driver.called)
+
+    def test_subnet_update_end_delete_payload(self):
+        network = self._cached_network([fake_subnet1, fake_subnet3])
         payload = dict(subnet_id=fake_subnet1.id)
-        self.cache.get_network_by_subnet_id.return_value = prev_state
-        self.cache.get_network_by_id.return_value = prev_state
-        self.plugin.get_network_info.return_value = fake_network
 
         self.dhcp.subnet_delete_end(None, payload)
 
-        self.cache.assert_has_calls([
-            mock.call.get_network_by_subnet_id(
-                'bbbbbbbb-bbbb-bbbb-bbbbbbbbbbbb'),
-            mock.call.get_network_by_id('12345678-1234-5678-1234567890ab'),
-            mock.call.put(fake_network)])
-        self.call_driver.assert_called_once_with('restart',
-                                                 fake_network)
+        self.assertFalse(self.plugin.get_network_info.called)
+        self.assertEqual([fake_subnet3], network.subnets)
+        self.assertEqual([], network.ports[0].fixed_ips)
+        self.assertIsNone(
+            self.dhcp.cache.get_network_by_subnet_id(fake_subnet1.id))
+        self.call_driver.assert_called_once_with('restart', network)
 
     def test_port_update_end(self):
         payload = dict(port=fake_port2)
@@ -799,10 +899,26 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
         self.dhcp.port_update_end(None, payload)
         self.cache.assert_has_calls(
             [mock.call.get_network_by_id(fake_port1.network_id),
+             mock.call.get_network_by_subnet_id(fake_subnet1.id),
              mock.call.put_port(mock.ANY)])
         self.call_driver.assert_has_calls(
             [mock.call.call_driver('reload_allocations', fake_network)])
 
+    def test_port_update_end_unknown_subnet(self):
+        port = dict(fake_port2,
+                    fixed_ips=[dict(subnet_id=fake_subnet3.id,
+                                    ip_address='192.168.1.5')])
+        payload = dict(port=port)
+        self.cache.get_network_by_id.return_value = fake_network
+        self.cache.get_network_by_subnet_id.return_value = None
+
+        with mock.patch.object(self.dhcp,
+                               'refresh_dhcp_helper') as refresh:
+            self.dhcp.port_update_end(None, payload)
+            refresh.assert_called_once_with(fake_network.id)
+        self.assertFalse(self.cache.put_port.called)
+        self.assertFalse(self.call_driver.called)
+
     def test_port_delete_end(self):
         payload = dict(port_id=fake_port2.id)
         self.cache.get_network_by_id.return_value = fake_network
@@ -865,6 +981,17 @@ class TestDhcpPluginApiProxy(base.BaseTestCase):
         self.make_msg.assert_called_once_with('get_active_networks_info',
                                               host='foo')
 
+    def test_get_active_networks_info_by_ids(self):
+        self.proxy.get_active_networks_info(network_ids=['a'])
+        self.make_msg.assert_called_once_with('get_active_networks_info',
+                                              host='foo', network_ids=['a'])
+
+    def test_get_active_network_ids(self):
+        self.call.return_value = ['a']
+        self.assertEqual(['a'], self.proxy.get_active_network_ids())
+        self.make_msg.assert_called_once_with('get_active_networks',
+                                              host='foo')
+
     def test_create_dhcp_port(self):
         port_body = (
             {'port':
@@ -1033,6 +1160,41 @@ class TestNetworkCache(base.BaseTestCase):
         nc.put(fake_network)
         self.assertEqual(nc.get_port_by_id(fake_port1.id), fake_port1)
 
+    def test_get_port_by_id_after_update(self):
+        nc = dhcp_agent.NetworkCache()
+        nc.put(copy.deepcopy(fake_network))
+        updated_port = dhcp.DictModel(dict(fake_port1, device_id='new'))
+        nc.put_port(updated_port)
+        self.assertIs(updated_port, nc.get_port_by_id(fake_port1.id))
+        nc.remove_port(updated_port)
+        self.assertIsNone(nc.get_port_by_id(fake_port1.id))
+
+    def test_put_subnet(self):
+        fake_net = copy.deepcopy(fake_network)
+        nc = dhcp_agent.NetworkCache()
+        nc.put(fake_net)
+        nc.put_subnet(fake_subnet3)
+        self.assertEqual(fake_net, nc.get_network_by_subnet_id(
+            fake_subnet3.id))
+        self.assertEqual(3, len(fake_net.subnets))
+
+    def test_put_subnet_existing(self):
+        fake_net = copy.deepcopy(fake_network)
+        nc = dhcp_agent.NetworkCache()
+        nc.put(fake_net)
+        updated_subnet = dhcp.DictModel(dict(fake_subnet1, name='renamed'))
+        nc.put_subnet(updated_subnet)
+        self.assertEqual([updated_subnet, fake_subnet2], fake_net.subnets)
+
+    def test_remove_subnet(self):
+        fake_net = copy.deepcopy(fake_network)
+        nc = dhcp_agent.NetworkCache()
+        nc.put(fake_net)
+        nc.remove_subnet(fake_subnet1.id)
+        self.assertEqual([fake_subnet2], fake_net.subnets)
+        self.assertEqual({fake_subnet2.id: fake_net.id}, nc.subnet_lookup)
+        self.assertEqual([], fake_net.ports[0].fixed_ips)
+
 
 class FakePort1:
     id = 'eeeeeeee-eeee-eeee-eeee-eeeeeeeeeeee'
@@ -516,6 +516,34 @@ class IptablesManagerStateFulTestCase(base.BaseTestCase):
         self.assertRaises(LookupError, self.iptables.ipv4['filter'].add_rule,
                           'nonexistent', '-j DROP')
 
+    def test_update_rules_by_tag(self):
+        nat = self.iptables.ipv4['nat']
+        nat.add_rule('PREROUTING', '-d 1.1.1.1 -j DNAT --to 10.0.0.1',
+                     tag='fip')
+        nat.add_rule('PREROUTING', '-d 1.1.1.2 -j DNAT --to 10.0.0.2',
+                     tag='fip')
+        nat.add_rule('PREROUTING', '-d 1.1.1.2 -j DNAT --to 10.0.0.2')
+        kept = nat.rules[-3]
+
+        self.assertTrue(nat.update_rules_by_tag(
+            'fip', [('PREROUTING', '-d 1.1.1.1 -j DNAT --to 10.0.0.1'),
+                    ('OUTPUT', '-d 1.1.1.3 -j DNAT --to 10.0.0.3')]))
+        self.assertEqual(['-d 1.1.1.1 -j DNAT --to 10.0.0.1',
+                          '-d 1.1.1.3 -j DNAT --to 10.0.0.3'],
+                         [r.rule for r in nat.rules if r.tag == 'fip'])
+        self.assertIn(kept, nat.rules)
+        # The untagged copy of a removed rule is left alone
+        self.assertEqual(1, len([r for r in nat.rules if r.tag is None and
+                                 r.rule.startswith('-d 1.1.1.2')]))
+        self.assertFalse(nat.update_rules_by_tag(
+            'fip', [('OUTPUT', '-d 1.1.1.3 -j DNAT --to 10.0.0.3'),
+                    ('PREROUTING', '-d 1.1.1.1 -j DNAT --to 10.0.0.1')]))
+
+    def test_update_rules_by_tag_nonexistent_chain(self):
+        self.assertRaises(LookupError,
+                          self.iptables.ipv4['nat'].update_rules_by_tag,
+                          'fip', [('nonexistent', '-j DROP')])
+
     def test_remove_nonexistent_chain(self):
         with mock.patch.object(iptables_manager, "LOG") as log:
             self.iptables.ipv4['filter'].remove_chain('nonexistent')
@@ -440,6 +440,114 @@ class TestBasicRouterOperations(base.BaseTestCase):
         self.assertFalse(agent.process_router_floating_ip_addresses.called)
         self.assertFalse(agent.process_router_floating_ip_nat_rules.called)
 
+    def test_router_fingerprints_ignore_order_and_status(self):
+        router = self._prepare_router_data(num_internal_ports=2)
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        fingerprints = ri.compute_fingerprints()
+        self.assertEqual(set(['gw_port', 'interfaces', 'floatingips',
+                              'routes', 'other']), set(fingerprints))
+
+        router2 = copy.deepcopy(router)
+        router2[l3_constants.INTERFACE_KEY].reverse()
+        router2['status'] = 'ACTIVE'
+        router2['gw_port']['status'] = 'DOWN'
+        ri.router = router2
+        self.assertEqual(fingerprints, ri.compute_fingerprints())
+
+        router2['routes'] = [{'destination': '8.8.8.0/24',
+                              'nexthop': '35.4.0.10'}]
+        new_fingerprints = ri.compute_fingerprints()
+        self.assertEqual(['routes'],
+                         [k for k in fingerprints
+                          if fingerprints[k] != new_fingerprints[k]])
+
+    def test_process_router_if_changed(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = self._prepare_router_data()
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        sections = []
+        with mock.patch.object(agent, 'process_router') as process:
+            process.side_effect = lambda ri: sections.append(
+                ri.changed_sections)
+            agent._process_router_if_changed(ri)
+            ri.router = copy.deepcopy(router)
+            agent._process_router_if_changed(ri)
+            router = copy.deepcopy(router)
+            router[l3_constants.FLOATINGIP_KEY] = [
+                {'id': _uuid(),
+                 'floating_ip_address': '8.8.8.8',
+                 'fixed_ip_address': '7.7.7.7',
+                 'port_id': _uuid()}]
+            ri.router = router
+            agent._process_router_if_changed(ri)
+
+        self.assertEqual([None, set(['floatingips'])], sections)
+        self.assertIsNone(ri.changed_sections)
+        self.assertEqual({'processed': 2, 'skipped': 1}, agent.router_stats)
+
+    def test_full_sync_processes_unchanged_routers(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = 'aaa'
+        router = {'id': _uuid(),
+                  'routes': [],
+                  'admin_state_up': True,
+                  'external_gateway_info': {'network_id': 'aaa'}}
+        with mock.patch.object(agent, 'process_router') as process:
+            agent._process_routers([router])
+            agent._process_routers([copy.deepcopy(router)])
+            self.assertEqual(1, process.call_count)
+            agent._process_routers([copy.deepcopy(router)],
+                                   all_routers=True)
+            self.assertEqual(2, process.call_count)
+        self.assertIsNone(process.call_args[0][0].changed_sections)
+
+    def test_process_router_if_changed_retries_after_failure(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = self._prepare_router_data()
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        with mock.patch.object(agent, 'process_router') as process:
+            process.side_effect = RuntimeError()
+            self.assertRaises(RuntimeError,
+                              agent._process_router_if_changed, ri)
+            process.side_effect = None
+            agent._process_router_if_changed(ri)
+            self.assertEqual(2, process.call_count)
+        self.assertTrue(ri.fingerprints)
+
+    def test_process_router_only_floatingips_changed(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent.process_router_floating_ip_addresses = mock.Mock(
+            return_value={})
+        agent.process_router_floating_ip_nat_rules = mock.Mock()
+        agent.external_gateway_added = mock.Mock()
+        agent._get_existing_devices = mock.Mock(return_value=[])
+        router = self._prepare_router_data()
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        agent.process_router(ri)
+        self.assertEqual(1, agent.external_gateway_added.call_count)
+        self.assertEqual(1, agent._get_existing_devices.call_count)
+
+        ri.router = copy.deepcopy(router)
+        ri.changed_sections = set(['floatingips'])
+        with mock.patch.object(agent, '_handle_router_snat_rules') as snat:
+            agent.process_router(ri)
+        self.assertFalse(snat.called)
+        self.assertEqual(1, agent.external_gateway_added.call_count)
+        self.assertEqual(1, agent._get_existing_devices.call_count)
+        self.assertEqual(2,
+                         agent.process_router_floating_ip_nat_rules.call_count)
+
+        ri.changed_sections = set(['routes'])
+        agent.process_router(ri)
+        self.assertEqual(2,
+                         agent.process_router_floating_ip_nat_rules.call_count)
+        self.assertEqual(
+            2, self.plugin_api.update_floatingip_statuses.call_count)
+
     @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
     def test_process_router_floating_ip_addresses_add(self, IPDevice):
         fip_id = _uuid()
@@ -461,7 +569,7 @@ class TestBasicRouterOperations(base.BaseTestCase):
             ri, {'id': _uuid()})
         self.assertEqual({fip_id: l3_constants.FLOATINGIP_STATUS_ACTIVE},
                          fip_statuses)
-        device.addr.add.assert_called_once_with(4, '15.1.2.3/32', '15.1.2.3')
+        device.addr.add_batch.assert_called_once_with(['15.1.2.3/32'])
 
     def test_process_router_floating_ip_nat_rules_add(self):
         fip = {
@@ -478,10 +586,8 @@ class TestBasicRouterOperations(base.BaseTestCase):
         agent.process_router_floating_ip_nat_rules(ri)
 
         nat = ri.iptables_manager.ipv4['nat']
-        nat.clear_rules_by_tag.assert_called_once_with('floating_ip')
         rules = agent.floating_forward_rules('15.1.2.3', '192.168.0.1')
-        for chain, rule in rules:
-            nat.add_rule.assert_any_call(chain, rule, tag='floating_ip')
+        nat.update_rules_by_tag.assert_called_once_with('floating_ip', rules)
 
     @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
     def test_process_router_floating_ip_addresses_remove(self, IPDevice):
@@ -496,7 +602,7 @@ class TestBasicRouterOperations(base.BaseTestCase):
         fip_statuses = agent.process_router_floating_ip_addresses(
             ri, {'id': _uuid()})
         self.assertEqual({}, fip_statuses)
-        device.addr.delete.assert_called_once_with(4, '15.1.2.3/32')
+        device.addr.delete_batch.assert_called_once_with(['15.1.2.3/32'])
 
     def test_process_router_floating_ip_nat_rules_remove(self):
         ri = mock.MagicMock()
@@ -507,8 +613,7 @@ class TestBasicRouterOperations(base.BaseTestCase):
         agent.process_router_floating_ip_nat_rules(ri)
 
         nat = ri.iptables_manager.ipv4['nat']
-        nat = ri.iptables_manager.ipv4['nat`']
-        nat.clear_rules_by_tag.assert_called_once_with('floating_ip')
+        nat.update_rules_by_tag.assert_called_once_with('floating_ip', [])
 
     @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
     def test_process_router_floating_ip_addresses_remap(self, IPDevice):
@@ -532,8 +637,8 @@ class TestBasicRouterOperations(base.BaseTestCase):
         self.assertEqual({fip_id: l3_constants.FLOATINGIP_STATUS_ACTIVE},
                          fip_statuses)
 
-        self.assertFalse(device.addr.add.called)
-        self.assertFalse(device.addr.delete.called)
+        self.assertFalse(device.addr.add_batch.called)
+        self.assertFalse(device.addr.delete_batch.called)
 
     @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
     def test_process_router_with_disabled_floating_ip(self, IPDevice):
@@ -558,7 +663,8 @@ class TestBasicRouterOperations(base.BaseTestCase):
     @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
     def test_process_router_floating_ip_with_device_add_error(self, IPDevice):
         IPDevice.return_value = device = mock.Mock()
-        device.addr.add.side_effect = processutils.ProcessExecutionError
+        device.addr.add_batch.side_effect = (
+            processutils.ProcessExecutionError)
         device.addr.list.return_value = []
         fip_id = _uuid()
         fip = {
@@ -577,6 +683,54 @@ class TestBasicRouterOperations(base.BaseTestCase):
         self.assertEqual({fip_id: l3_constants.FLOATINGIP_STATUS_ERROR},
                          fip_statuses)
 
+    @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
+    def test_process_router_floating_ip_addresses_batch(self, IPDevice):
+        fips = [{'id': _uuid(), 'port_id': _uuid(),
+                 'floating_ip_address': '15.1.2.%d' % i,
+                 'fixed_ip_address': '192.168.0.%d' % i}
+                for i in range(1, 4)]
+        IPDevice.return_value = device = mock.Mock()
+        # .2 is already configured, .3 fails to be added
+        device.addr.list.side_effect = [
+            [{'cidr': '15.1.2.2/32'}, {'cidr': '15.1.2.9/32'},
+             {'cidr': '19.4.4.4/24'}],
+            [{'cidr': '15.1.2.1/32'}, {'cidr': '15.1.2.2/32'},
+             {'cidr': '15.1.2.9/32'}, {'cidr': '19.4.4.4/24'}]]
+        device.addr.add_batch.side_effect = RuntimeError
+        ri = mock.MagicMock()
+        ri.router.get.return_value = fips
+
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        with mock.patch.object(agent,
+                               '_send_gratuitous_arp_packets') as garp:
+            fip_statuses = agent.process_router_floating_ip_addresses(
+                ri, {'id': _uuid()})
+
+        self.assertEqual({fips[0]['id']: l3_constants.FLOATINGIP_STATUS_ACTIVE,
+                          fips[1]['id']: l3_constants.FLOATINGIP_STATUS_ACTIVE,
+                          fips[2]['id']: l3_constants.FLOATINGIP_STATUS_ERROR},
+                         fip_statuses)
+        device.addr.add_batch.assert_called_once_with(
+            ['15.1.2.1/32', '15.1.2.3/32'])
+        device.addr.delete_batch.assert_called_once_with(['15.1.2.9/32'])
+        garp.assert_called_once_with(ri, mock.ANY, ['15.1.2.1'])
+
+    def test_send_gratuitous_arp_packets(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        ri = mock.Mock()
+        with contextlib.nested(
+            mock.patch.object(agent, '_arping'),
+            mock.patch('eventlet.spawn_n', side_effect=lambda f: f()),
+            mock.patch.object(agent, '_garp_pool')
+        ) as (arping, spawn_n, pool):
+            agent._send_gratuitous_arp_packets(ri, 'qg-1',
+                                               ['1.1.1.1', '1.1.1.2'])
+            agent._send_gratuitous_arp_packets(ri, 'qg-1', [])
+        self.assertEqual(1, spawn_n.call_count)
+        pool.spawn_n.assert_has_calls([
+            mock.call(arping, ri, 'qg-1', '1.1.1.1'),
+            mock.call(arping, ri, 'qg-1', '1.1.1.2')])
+
     def test_process_router_snat_disabled(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         router = self._prepare_router_data(enable_snat=True)
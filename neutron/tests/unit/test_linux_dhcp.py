@@ -682,6 +682,12 @@ class TestDhcpLocalProcess(TestBase):
 
 
 class TestDnsmasq(TestBase):
+    def setUp(self):
+        super(TestDnsmasq, self).setUp()
+        mock.patch.dict(dhcp.Dnsmasq._host_leases, clear=True).start()
+        mock.patch.dict(dhcp.Dnsmasq.lease_release_stats,
+                        {'released': 0, 'helper_calls': 0}).start()
+
     def _test_spawn(self, extra_options, network=FakeDualNetwork(),
                     max_leases=16777216, lease_duration=86400):
         def mock_get_conf_file_name(kind, ensure_conf_dir=False):
@@ -1168,14 +1174,12 @@ tag:tag0,option:router""".lstrip()
         old_leases = set([(ip1, mac1), (ip2, mac2)])
         dnsmasq._read_hosts_file_leases = mock.Mock(return_value=old_leases)
         dnsmasq._output_hosts_file = mock.Mock()
-        dnsmasq._release_lease = mock.Mock()
+        dnsmasq._release_leases = mock.Mock()
         dnsmasq.network.ports = []
 
         dnsmasq._release_unused_leases()
 
-        dnsmasq._release_lease.assert_has_calls([mock.call(mac1, ip1),
-                                                 mock.call(mac2, ip2)],
-                                                any_order=True)
+        dnsmasq._release_leases.assert_called_once_with(old_leases)
 
     def test_release_unused_leases_one_lease(self):
         dnsmasq = dhcp.Dnsmasq(self.conf, FakeDualNetwork())
@@ -1188,13 +1192,90 @@ tag:tag0,option:router""".lstrip()
         old_leases = set([(ip1, mac1), (ip2, mac2)])
         dnsmasq._read_hosts_file_leases = mock.Mock(return_value=old_leases)
         dnsmasq._output_hosts_file = mock.Mock()
-        dnsmasq._release_lease = mock.Mock()
+        dnsmasq._release_leases = mock.Mock()
         dnsmasq.network.ports = [FakePort1()]
 
         dnsmasq._release_unused_leases()
 
-        dnsmasq._release_lease.assert_has_calls([mock.call(mac2, ip2)],
-                                                any_order=True)
+        dnsmasq._release_leases.assert_called_once_with(set([(ip2, mac2)]))
+
+    def test_release_unused_leases_none_stale(self):
+        dnsmasq = dhcp.Dnsmasq(self.conf, FakeDualNetwork())
+        dnsmasq._read_hosts_file_leases = mock.Mock(return_value=set())
+        dnsmasq._release_leases = mock.Mock()
+
+        dnsmasq._release_unused_leases()
+
+        self.assertFalse(dnsmasq._release_leases.called)
+
+    def test_release_unused_leases_from_previous_hosts(self):
+        network = FakeDualNetwork()
+        dhcp.Dnsmasq._host_leases[network.id] = set(
+            [('192.168.0.3', '00:00:80:cc:bb:aa')])
+        dnsmasq = dhcp.Dnsmasq(self.conf, network)
+        dnsmasq._read_hosts_file_leases = mock.Mock()
+        dnsmasq._release_leases = mock.Mock()
+
+        dnsmasq._release_unused_leases()
+
+        self.assertFalse(dnsmasq._read_hosts_file_leases.called)
+        dnsmasq._release_leases.assert_called_once_with(
+            set([('192.168.0.3', '00:00:80:cc:bb:aa')]))
+
+    def test_release_leases(self):
+        network = FakeDualNetwork()
+        dnsmasq = dhcp.Dnsmasq(self.conf, network)
+        dnsmasq.RELEASES_PER_CALL = 2
+        dhcp_port = mock.Mock(device_id='dhcp-device',
+                              fixed_ips=[FakeIPAllocation(
+                                  '192.168.0.2',
+                                  'dddddddd-dddd-dddd-dddd-dddddddddddd')])
+        network.ports = [dhcp_port]
+        dnsmasq.device_manager.get_device_id.return_value = 'dhcp-device'
+        leases = set([('192.168.0.3', '00:00:80:aa:bb:01'),
+                      ('192.168.0.4', '00:00:80:aa:bb:02'),
+                      ('192.168.0.5', '00:00:80:aa:bb:03'),
+                      ('10.0.0.5', '00:00:80:aa:bb:04'),
+                      ('fdca:3ba5:a17a:4ba3::5', '00:00:80:aa:bb:05')])
+
+        with mock.patch.object(dhcp.Dnsmasq, 'interface_name') as ifname:
+            ifname.__get__ = mock.Mock(return_value='tap0')
+            dnsmasq._release_leases(leases)
+
+        exp_cmd = ['ip', 'netns', 'exec', 'qdhcp-ns',
+                   'neutron-dhcp-release', 'tap0']
+        self.execute.assert_has_calls([
+            mock.call(exp_cmd + ['192.168.0.3,00:00:80:aa:bb:01,192.168.0.2',
+                                 '192.168.0.4,00:00:80:aa:bb:02,192.168.0.2'],
+                      root_helper='sudo', check_exit_code=True),
+            mock.call(exp_cmd + ['192.168.0.5,00:00:80:aa:bb:03,192.168.0.2'],
+                      root_helper='sudo', check_exit_code=True)])
+        self.assertEqual(2, self.execute.call_count)
+        self.assertEqual({'released': 3, 'helper_calls': 2},
+                         dhcp.Dnsmasq.lease_release_stats)
+
+    def test_dhcp_server_ips_from_device(self):
+        network = FakeDualNetwork()
+        dnsmasq = dhcp.Dnsmasq(self.conf, network)
+        with mock.patch.object(dnsmasq,
+                               '_make_subnet_interface_ip_map') as ip_map:
+            ip_map.return_value = {
+                'dddddddd-dddd-dddd-dddd-dddddddddddd': '192.168.0.2'}
+            self.assertEqual({'192.168.0.0/24': '192.168.0.2'},
+                             dnsmasq._dhcp_server_ips())
+
+    def test_output_hosts_file_keeps_leases(self):
+        network = FakeV4Network()
+        dm = dhcp.Dnsmasq(self.conf, network)
+        with mock.patch.object(dm, 'get_conf_file_name') as conf_fn:
+            conf_fn.return_value = '/foo/host'
+            dm._output_hosts_file()
+        self.assertEqual(set([('192.168.0.2', '00:00:80:aa:bb:cc')]),
+                         dhcp.Dnsmasq._host_leases[network.id])
+
+        with mock.patch('shutil.rmtree'):
+            dm._remove_config_files()
+        self.assertNotIn(network.id, dhcp.Dnsmasq._host_leases)
 
     def test_read_hosts_file_leases(self):
         filename = '/path/to/file'
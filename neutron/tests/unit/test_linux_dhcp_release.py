@@ -0,0 +1,65 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+
+import mock
+
+from neutron.agent.linux import dhcp_release
+from neutron.agent.linux import dhcp_server
+from neutron.tests import base
+
+LEASES = [['192.168.0.3', 'fa:16:3e:00:00:01', '192.168.0.2'],
+          ['192.168.0.4', 'fa:16:3e:00:00:02', '192.168.0.2']]
+
+
+class TestDhcpRelease(base.BaseTestCase):
+    def setUp(self):
+        super(TestDhcpRelease, self).setUp()
+        self.socket = mock.patch('socket.socket').start().return_value
+
+    def test_release_leases(self):
+        self.assertEqual([], dhcp_release.release_leases('tap0', LEASES))
+        self.socket.setsockopt.assert_called_once_with(
+            socket.SOL_SOCKET, dhcp_server.SO_BINDTODEVICE, 'tap0\0')
+        self.assertEqual(2, self.socket.sendto.call_count)
+        packet, address = self.socket.sendto.call_args[0]
+        self.assertEqual(('192.168.0.2', 67), address)
+        request = dhcp_server.parse_packet(packet)
+        self.assertEqual('fa:16:3e:00:00:02', request.mac_address)
+        self.assertEqual(dhcp_server.DHCPRELEASE, request.message_type)
+        self.socket.close.assert_called_once_with()
+
+    def test_release_leases_failure(self):
+        self.socket.sendto.side_effect = [socket.error(), None]
+        self.assertEqual([tuple(LEASES[0])],
+                         dhcp_release.release_leases('tap0', LEASES))
+        self.assertEqual(2, self.socket.sendto.call_count)
+
+    def test_main(self):
+        argv = ['neutron-dhcp-release', 'tap0'] + [','.join(l)
+                                                   for l in LEASES]
+        with mock.patch('sys.argv', argv):
+            with mock.patch.object(dhcp_release, 'release_leases',
+                                   return_value=[]) as release:
+                dhcp_release.main()
+                release.assert_called_once_with('tap0', LEASES)
+
+    def test_main_bad_arguments(self):
+        for argv in (['neutron-dhcp-release', 'tap0'],
+                     ['neutron-dhcp-release', 'tap0', '192.168.0.3']):
+            with mock.patch('sys.argv', argv):
+                with mock.patch('sys.stderr'):
+                    self.assertRaises(SystemExit, dhcp_release.main)
@@ -0,0 +1,508 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import copy
+import os
+import socket
+import struct
+
+import fixtures
+import mock
+from oslo.config import cfg
+
+from neutron.agent.common import config
+from neutron.agent.linux import dhcp
+from neutron.agent.linux import dhcp_server
+from neutron.common import config as base_config
+from neutron.common import constants
+from neutron.openstack.common import jsonutils
+from neutron.tests import base
+
+MAC = 'fa:16:3e:00:00:01'
+NETWORK_ID = 'aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa'
+SUBNET_ID = 'dddddddd-dddd-dddd-dddd-dddddddddddd'
+
+TABLE = {'id': NETWORK_ID,
+         'namespace': 'qdhcp-ns',
+         'interface': 'tap0',
+         'lease_time': 600,
+         'domain': 'openstacklocal',
+         'subnets': [{'id': SUBNET_ID,
+                      'cidr': '192.168.0.0/24',
+                      'server_ip': '192.168.0.2',
+                      'gateway_ip': '192.168.0.1',
+                      'dns_servers': ['8.8.8.8'],
+                      'routes': []}],
+         'hosts': [[MAC, '192.168.0.3', SUBNET_ID, 'host-192-168-0-3']]}
+
+
+def make_request(message_type, mac=MAC, ciaddr='0.0.0.0', giaddr='0.0.0.0',
+                 **options):
+    chaddr = ''.join(chr(int(b, 16)) for b in mac.split(':'))
+    data = dhcp_server.HEADER.pack(
+        dhcp_server.BOOTREQUEST, 1, 6, 0, 0x1234, 0, 0x8000,
+        socket.inet_aton(ciaddr), dhcp_server.ZERO_IP, dhcp_server.ZERO_IP,
+        socket.inet_aton(giaddr), chaddr.ljust(16, '\x00'), '\x00' * 64,
+        '\x00' * 128, dhcp_server.MAGIC_COOKIE)
+    data += dhcp_server._option(dhcp_server.OPT_MESSAGE_TYPE,
+                                chr(message_type))
+    for code, value in options.items():
+        data += dhcp_server._option(int(code[3:]), value)
+    return data + chr(dhcp_server.OPT_END)
+
+
+def parse_reply(data):
+    fields = dhcp_server.HEADER.unpack_from(data)
+    options = {}
+    i = dhcp_server.HEADER.size
+    while ord(data[i]) != dhcp_server.OPT_END:
+        length = ord(data[i + 1])
+        options[ord(data[i])] = data[i + 2:i + 2 + length]
+        i += 2 + length
+    return fields, options
+
+
+class TestParsePacket(base.BaseTestCase):
+    def test_parse(self):
+        request = dhcp_server.parse_packet(make_request(
+            dhcp_server.DHCPREQUEST,
+            opt50=socket.inet_aton('192.168.0.3')))
+        self.assertEqual(MAC, request.mac_address)
+        self.assertEqual(dhcp_server.DHCPREQUEST, request.message_type)
+        self.assertEqual(0x1234, request.xid)
+        self.assertEqual(socket.inet_aton('192.168.0.3'),
+                         request.options[dhcp_server.OPT_REQUESTED_IP])
+
+    def test_too_short(self):
+        self.assertRaises(ValueError, dhcp_server.parse_packet, 'x' * 10)
+
+    def test_not_a_request(self):
+        data = make_request(dhcp_server.DHCPDISCOVER)
+        data = chr(dhcp_server.BOOTREPLY) + data[1:]
+        self.assertRaises(ValueError, dhcp_server.parse_packet, data)
+
+    def test_truncated_option(self):
+        data = make_request(dhcp_server.DHCPDISCOVER)[:-1] + '\x0c'
+        self.assertRaises(ValueError, dhcp_server.parse_packet, data)
+
+    def test_build_release(self):
+        request = dhcp_server.parse_packet(dhcp_server.build_release(
+            '192.168.0.3', MAC, '192.168.0.2', xid=7))
+        self.assertEqual(MAC, request.mac_address)
+        self.assertEqual(7, request.xid)
+        self.assertEqual(dhcp_server.DHCPRELEASE, request.message_type)
+        self.assertEqual(socket.inet_aton('192.168.0.3'), request.ciaddr)
+        self.assertEqual(socket.inet_aton('192.168.0.2'),
+                         request.options[dhcp_server.OPT_SERVER_ID])
+
+    def test_pack_routes(self):
+        self.assertEqual(
+            '\x20\xa9\xfe\xa9\xfe\xc0\xa8\x00\x02'
+            '\x00\xc0\xa8\x00\x01'
+            '\x18\x0a\x01\x02\xc0\xa8\x00\x01',
+            dhcp_server._pack_routes([('169.254.169.254/32', '192.168.0.2'),
+                                      ('0.0.0.0/0', '192.168.0.1'),
+                                      ('10.1.2.0/24', '192.168.0.1')]))
+
+
+class TestNetworkTable(base.BaseTestCase):
+    def setUp(self):
+        super(TestNetworkTable, self).setUp()
+        self.table = dhcp_server.NetworkTable(copy.deepcopy(TABLE))
+
+    def _handle(self, message_type, **kwargs):
+        request = dhcp_server.parse_packet(make_request(message_type,
+                                                        **kwargs))
+        return self.table.handle(request)
+
+    def test_discover(self):
+        reply, address = self._handle(dhcp_server.DHCPDISCOVER)
+        self.assertEqual(('255.255.255.255', 68), address)
+        fields, options = parse_reply(reply)
+        self.assertEqual(dhcp_server.BOOTREPLY, fields[0])
+        self.assertEqual(0x1234, fields[4])
+        self.assertEqual(socket.inet_aton('192.168.0.3'), fields[8])
+        self.assertEqual(chr(dhcp_server.DHCPOFFER),
+                         options[dhcp_server.OPT_MESSAGE_TYPE])
+        self.assertEqual(socket.inet_aton('192.168.0.2'),
+                         options[dhcp_server.OPT_SERVER_ID])
+        self.assertEqual(socket.inet_aton('255.255.255.0'),
+                         options[dhcp_server.OPT_SUBNET_MASK])
+        self.assertEqual(socket.inet_aton('192.168.0.1'),
+                         options[dhcp_server.OPT_ROUTER])
+        self.assertEqual(socket.inet_aton('8.8.8.8'),
+                         options[dhcp_server.OPT_DNS_SERVERS])
+        self.assertEqual(struct.pack('!I', 600),
+                         options[dhcp_server.OPT_LEASE_TIME])
+        self.assertEqual(struct.pack('!I', 300),
+                         options[dhcp_server.OPT_RENEWAL_TIME])
+        self.assertEqual('host-192-168-0-3',
+                         options[dhcp_server.OPT_HOSTNAME])
+        self.assertEqual('openstacklocal',
+                         options[dhcp_server.OPT_DOMAIN_NAME])
+
+    def test_unknown_client_is_ignored(self):
+        self.assertIsNone(self._handle(dhcp_server.DHCPDISCOVER,
+                                       mac='fa:16:3e:00:00:99'))
+
+    def test_request(self):
+        reply, address = self._handle(
+            dhcp_server.DHCPREQUEST,
+            opt50=socket.inet_aton('192.168.0.3'),
+            opt54=socket.inet_aton('192.168.0.2'))
+        fields, options = parse_reply(reply)
+        self.assertEqual(chr(dhcp_server.DHCPACK),
+                         options[dhcp_server.OPT_MESSAGE_TYPE])
+        self.assertEqual(socket.inet_aton('192.168.0.3'), fields[8])
+
+    def test_renew_is_unicast(self):
+        reply, address = self._handle(dhcp_server.DHCPREQUEST,
+                                      ciaddr='192.168.0.3')
+        self.assertEqual(('192.168.0.3', 68), address)
+
+    def test_relayed_request(self):
+        reply, address = self._handle(dhcp_server.DHCPDISCOVER,
+                                      giaddr='10.0.0.1')
+        self.assertEqual(('10.0.0.1', 67), address)
+
+    def test_request_for_other_server(self):
+        self.assertIsNone(self._handle(
+            dhcp_server.DHCPREQUEST,
+            opt50=socket.inet_aton('192.168.0.3'),
+            opt54=socket.inet_aton('192.168.0.4')))
+
+    def test_request_wrong_address(self):
+        reply, address = self._handle(
+            dhcp_server.DHCPREQUEST,
+            opt50=socket.inet_aton('192.168.0.9'))
+        self.assertEqual(('255.255.255.255', 68), address)
+        fields, options = parse_reply(reply)
+        self.assertEqual(chr(dhcp_server.DHCPNAK),
+                         options[dhcp_server.OPT_MESSAGE_TYPE])
+        self.assertEqual(dhcp_server.ZERO_IP, fields[8])
+
+    def test_inform(self):
+        reply, address = self._handle(dhcp_server.DHCPINFORM,
+                                      ciaddr='192.168.0.3')
+        self.assertEqual(('192.168.0.3', 68), address)
+        fields, options = parse_reply(reply)
+        self.assertEqual(chr(dhcp_server.DHCPACK),
+                         options[dhcp_server.OPT_MESSAGE_TYPE])
+        self.assertEqual(dhcp_server.ZERO_IP, fields[8])
+
+    def test_release_is_ignored(self):
+        self.assertIsNone(self._handle(dhcp_server.DHCPRELEASE,
+                                       ciaddr='192.168.0.3'))
+
+    def test_infinite_lease(self):
+        data = copy.deepcopy(TABLE)
+        data['lease_time'] = -1
+        self.table = dhcp_server.NetworkTable(data)
+        reply, address = self._handle(dhcp_server.DHCPDISCOVER)
+        fields, options = parse_reply(reply)
+        self.assertEqual(struct.pack('!I', dhcp_server.INFINITE_LEASE),
+                         options[dhcp_server.OPT_LEASE_TIME])
+        self.assertNotIn(dhcp_server.OPT_RENEWAL_TIME, options)
+
+    def test_subnet_without_server_ip_is_not_served(self):
+        data = copy.deepcopy(TABLE)
+        data['subnets'][0]['server_ip'] = None
+        self.table = dhcp_server.NetworkTable(data)
+        self.assertEqual({}, self.table.hosts)
+
+
+class TestDhcpServer(base.BaseTestCase):
+    def setUp(self):
+        super(TestDhcpServer, self).setUp()
+        self.open_socket = mock.Mock()
+        self.server = dhcp_server.DhcpServer(self.open_socket)
+        self.spawn = mock.patch.object(self.server._pool, 'spawn').start()
+
+    def test_set_network(self):
+        self.assertEqual({'interface': 'tap0'},
+                         self.server.set_network(copy.deepcopy(TABLE)))
+        self.open_socket.assert_called_once_with('tap0', 'qdhcp-ns')
+        self.assertEqual([NETWORK_ID], self.server.list_networks())
+
+    def test_update_keeps_socket_and_server_ip(self):
+        self.server.set_network(copy.deepcopy(TABLE))
+        update = copy.deepcopy(TABLE)
+        del update['interface']
+        del update['namespace']
+        update['subnets'][0]['server_ip'] = None
+        self.server.set_network(update)
+        self.assertEqual(1, self.open_socket.call_count)
+        self.assertEqual('192.168.0.2',
+                         self.server.networks[NETWORK_ID].server_ip(
+                             SUBNET_ID))
+        self.assertEqual({'interface': 'tap0', 'namespace': 'qdhcp-ns'},
+                         self.server.get_network(NETWORK_ID))
+
+    def test_interface_change_reopens_socket(self):
+        self.server.set_network(copy.deepcopy(TABLE))
+        update = copy.deepcopy(TABLE)
+        update['interface'] = 'tap1'
+        self.server.set_network(update)
+        self.open_socket.return_value.close.assert_called_once_with()
+        self.spawn.return_value.kill.assert_called_once_with()
+        self.open_socket.assert_called_with('tap1', 'qdhcp-ns')
+
+    def test_remove_network(self):
+        self.server.set_network(copy.deepcopy(TABLE))
+        self.assertEqual({'interface': 'tap0'},
+                         self.server.remove_network(NETWORK_ID))
+        self.open_socket.return_value.close.assert_called_once_with()
+        self.assertIsNone(self.server.remove_network(NETWORK_ID))
+        self.assertIsNone(self.server.get_network(NETWORK_ID))
+
+    def test_handle_command(self):
+        self.server.set_network(copy.deepcopy(TABLE))
+        self.assertEqual([NETWORK_ID], self.server.handle_command(
+            {'command': 'list_networks'}))
+        self.assertRaises(ValueError, self.server.handle_command,
+                          {'command': 'reboot'})
+
+    def test_handle_connection(self):
+        conn = mock.Mock()
+        conn.makefile.return_value.readline.return_value = jsonutils.dumps(
+            {'command': 'get_network', 'network_id': NETWORK_ID})
+        self.server._handle_connection(conn)
+        conn.sendall.assert_called_once_with('{"result": null}\n')
+        conn.close.assert_called_once_with()
+
+    def test_handle_connection_error(self):
+        conn = mock.Mock()
+        conn.makefile.return_value.readline.return_value = jsonutils.dumps(
+            {'command': 'reboot'})
+        self.server._handle_connection(conn)
+        self.assertIn('error', jsonutils.loads(conn.sendall.call_args[0][0]))
+
+    def test_serve(self):
+        self.server.set_network(copy.deepcopy(TABLE))
+        sock = mock.Mock()
+        sock.recvfrom.side_effect = [
+            ('garbage', ('0.0.0.0', 68)),
+            (make_request(dhcp_server.DHCPDISCOVER), ('0.0.0.0', 68)),
+            socket.error()]
+        self.assertRaises(socket.error, self.server._serve, NETWORK_ID, sock)
+        self.assertEqual(1, sock.sendto.call_count)
+        self.assertEqual(('255.255.255.255', 68),
+                         sock.sendto.call_args[0][1])
+
+    def test_serve_control_refuses_to_unlink_other_files(self):
+        path = self.useFixture(fixtures.TempDir()).join('server_sock')
+        open(path, 'w').close()
+        with mock.patch.object(dhcp_server.eventlet, 'listen') as listen:
+            self.assertRaises(RuntimeError, self.server.serve_control, path)
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(listen.called)
+
+    def test_serve_control_replaces_stale_socket(self):
+        path = self.useFixture(fixtures.TempDir()).join('server_sock')
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        with contextlib.nested(
+            mock.patch.object(dhcp_server.eventlet, 'listen',
+                              side_effect=socket.error),
+            mock.patch('os.lchown')
+        ) as (listen, lchown):
+            self.assertRaises(socket.error, self.server.serve_control, path,
+                              1000)
+        self.assertFalse(os.path.lexists(path))
+
+    def test_check_socket_path(self):
+        dhcp_server.check_socket_path('/var/lib/neutron/dhcp/server_sock',
+                                      '/var/lib/neutron')
+        for path in ('/etc/passwd', '/var/lib/neutron/server_sock',
+                     '/var/lib/neutron/dhcp/../server_sock',
+                     '/var/lib/neutron/dhcp/sub/server_sock'):
+            self.assertRaises(ValueError, dhcp_server.check_socket_path,
+                              path, '/var/lib/neutron')
+
+
+class TestSharedDhcpServer(base.BaseTestCase):
+    def setUp(self):
+        super(TestSharedDhcpServer, self).setUp()
+        self.conf = config.setup_conf()
+        self.conf.register_opts(base_config.core_opts)
+        self.conf.register_opts(dhcp.OPTS)
+        self.conf.register_opts(dhcp_server.OPTS)
+        self.conf.register_opt(cfg.BoolOpt('enable_isolated_metadata',
+                                           default=False))
+        self.conf.set_override('dhcp_lease_duration', 600)
+        self.mgr = mock.patch('neutron.agent.linux.dhcp.'
+                              'DeviceManager').start().return_value
+        self.mgr.get_device_id.return_value = 'dhcp-device'
+        self.mgr.setup.return_value = 'tap0'
+        self.call = mock.patch.object(dhcp_server, '_call').start()
+        self.network = dhcp.NetModel(True, {
+            'id': NETWORK_ID,
+            'subnets': [{'id': SUBNET_ID, 'ip_version': 4,
+                         'cidr': '192.168.0.0/24', 'enable_dhcp': True,
+                         'gateway_ip': '192.168.0.1', 'host_routes': [],
+                         'dns_nameservers': []},
+                        {'id': 'v6-subnet', 'ip_version': 6,
+                         'cidr': 'fd00::/64', 'enable_dhcp': True,
+                         'gateway_ip': 'fd00::1', 'host_routes': [],
+                         'dns_nameservers': []}],
+            'ports': [{'id': 'dhcp-port', 'device_id': 'dhcp-device',
+                       'device_owner': constants.DEVICE_OWNER_DHCP,
+                       'mac_address': 'fa:16:3e:00:00:02',
+                       'fixed_ips': [{'subnet_id': SUBNET_ID,
+                                      'ip_address': '192.168.0.2'}]},
+                      {'id': 'vm-port', 'device_id': 'vm',
+                       'device_owner': 'compute:nova',
+                       'mac_address': MAC,
+                       'fixed_ips': [{'subnet_id': SUBNET_ID,
+                                      'ip_address': '192.168.0.3'},
+                                     {'subnet_id': 'v6-subnet',
+                                      'ip_address': 'fd00::3'}]}]})
+        self.driver = dhcp_server.SharedDhcpServer(self.conf, self.network)
+
+    def test_table(self):
+        self.conf.set_override('dhcp_server_dns_servers', ['8.8.4.4'])
+        table = self.driver._table('tap0')
+        self.assertEqual('tap0', table['interface'])
+        self.assertEqual('qdhcp-%s' % NETWORK_ID, table['namespace'])
+        self.assertEqual(600, table['lease_time'])
+        self.assertEqual([{'id': SUBNET_ID,
+                           'cidr': '192.168.0.0/24',
+                           'server_ip': '192.168.0.2',
+                           'gateway_ip': '192.168.0.1',
+                           'dns_servers': ['8.8.4.4'],
+                           'routes': []}], table['subnets'])
+        self.assertEqual(
+            [('fa:16:3e:00:00:02', '192.168.0.2', SUBNET_ID,
+              'host-192-168-0-2'),
+             (MAC, '192.168.0.3', SUBNET_ID, 'host-192-168-0-3')],
+            table['hosts'])
+        # The table has to be something the server can load
+        dhcp_server.NetworkTable(jsonutils.loads(jsonutils.dumps(table)))
+
+    def test_table_routes(self):
+        self.conf.set_override('enable_isolated_metadata', True)
+        self.network.subnets[0].gateway_ip = None
+        self.network.subnets[0].host_routes = [
+            dhcp.DictModel({'destination': '0.0.0.0/0',
+                            'nexthop': '192.168.0.254'}),
+            dhcp.DictModel({'destination': '10.0.0.0/8',
+                            'nexthop': '192.168.0.253'})]
+        subnet = self.driver._table()['subnets'][0]
+        self.assertEqual('192.168.0.254', subnet['gateway_ip'])
+        self.assertEqual([('10.0.0.0/8', '192.168.0.253'),
+                          ('169.254.169.254/32', '192.168.0.2'),
+                          ('0.0.0.0/0', '192.168.0.254')], subnet['routes'])
+
+    def test_server_ips_from_device(self):
+        self.network.ports.pop(0)
+        with mock.patch.object(dhcp_server.ip_lib, 'IPDevice') as device:
+            device.return_value.addr.list.return_value = [
+                {'cidr': '192.168.0.5/24'}, {'cidr': 'fd00::5/64'}]
+            self.assertEqual({SUBNET_ID: '192.168.0.5',
+                              'v6-subnet': 'fd00::5'},
+                             self.driver._server_ips('tap0'))
+            self.assertEqual({}, self.driver._server_ips())
+
+    def test_enable(self):
+        with mock.patch.object(self.driver, '_ensure_server') as ensure:
+            self.driver.enable()
+            ensure.assert_called_once_with()
+        self.mgr.setup.assert_called_once_with(self.network)
+        self.call.assert_called_once_with(self.conf, 'set_network',
+                                          network=mock.ANY)
+        self.assertEqual('tap0', self.call.call_args[1]['network'][
+            'interface'])
+
+    def test_enable_no_dhcp(self):
+        for subnet in self.network.subnets:
+            subnet.enable_dhcp = False
+        with mock.patch.object(self.driver, '_ensure_server') as ensure:
+            self.driver.enable()
+            self.assertFalse(ensure.called)
+        self.assertFalse(self.call.called)
+
+    def test_disable(self):
+        self.call.return_value = {'interface': 'tap0'}
+        self.driver.disable()
+        self.call.assert_called_once_with(self.conf, 'remove_network',
+                                          network_id=NETWORK_ID)
+        self.mgr.destroy.assert_called_once_with(self.network, 'tap0')
+
+    def test_disable_retain_port(self):
+        self.call.return_value = {'interface': 'tap0'}
+        self.driver.disable(retain_port=True)
+        self.assertFalse(self.mgr.destroy.called)
+
+    def test_disable_server_not_running(self):
+        self.call.side_effect = socket.error()
+        self.driver.disable()
+        self.assertFalse(self.mgr.destroy.called)
+
+    def test_reload_allocations(self):
+        self.call.return_value = {'interface': 'tap0'}
+        self.driver.reload_allocations()
+        table = self.call.call_args[1]['network']
+        self.assertNotIn('interface', table)
+        self.mgr.update.assert_called_once_with(self.network, 'tap0')
+
+    def test_reload_allocations_no_dhcp(self):
+        for subnet in self.network.subnets:
+            subnet.enable_dhcp = False
+        with mock.patch.object(self.driver, 'disable') as disable:
+            self.driver.reload_allocations()
+            disable.assert_called_once_with()
+        self.assertFalse(self.call.called)
+
+    def test_active(self):
+        self.call.return_value = {'interface': 'tap0'}
+        self.assertTrue(self.driver.active)
+        self.call.return_value = None
+        self.assertFalse(self.driver.active)
+        self.call.side_effect = socket.error()
+        self.assertFalse(self.driver.active)
+
+    def test_existing_dhcp_networks(self):
+        self.call.return_value = [NETWORK_ID]
+        self.assertEqual(
+            [NETWORK_ID],
+            dhcp_server.SharedDhcpServer.existing_dhcp_networks(self.conf,
+                                                                None))
+        self.call.side_effect = socket.error()
+        self.assertEqual(
+            [], dhcp_server.SharedDhcpServer.existing_dhcp_networks(
+                self.conf, None))
+
+    def _patch_process(self):
+        return contextlib.nested(
+            mock.patch.object(dhcp_server.external_process,
+                              'ProcessManager'),
+            mock.patch('os.path.exists'))
+
+    def test_ensure_server(self):
+        with self._patch_process() as (pm, exists):
+            pm.return_value.active = False
+            exists.side_effect = [False, True]
+            self.driver._ensure_server()
+            cmd = pm.return_value.enable.call_args[0][0]('pidfile')
+            self.assertEqual(['neutron-dhcp-server', '--pid_file=pidfile'],
+                             cmd[:2])
+
+    def test_ensure_server_running(self):
+        with self._patch_process() as (pm, exists):
+            pm.return_value.active = True
+            self.driver._ensure_server()
+            self.assertFalse(pm.return_value.enable.called)
@@ -14,8 +14,10 @@
 #    under the License.
 
 import mock
+from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import netlink_lib
 from neutron.common import exceptions
 from neutron.tests import base
 
@@ -501,6 +503,7 @@ class TestIPCmdBase(base.BaseTestCase):
         self.parent = mock.Mock()
         self.parent.name = 'eth0'
         self.parent.root_helper = 'sudo'
+        self.parent.netlink = None
 
     def _assert_call(self, options, args):
         self.parent.assert_has_calls([
@@ -615,6 +618,23 @@ class TestIpAddrCommand(TestIPCmdBase):
         self._assert_sudo([4],
                           ('del', '192.168.45.100/24', 'dev', 'tap0'))
 
+    def test_add_batch(self):
+        self.addr_cmd.add_batch(['172.24.4.3/32', '172.24.4.4/32'])
+        self._assert_sudo([4], ('add', '172.24.4.3/32', 'brd', '172.24.4.3',
+                                'scope', 'global', 'dev', 'tap0'))
+        self._assert_sudo([4], ('add', '172.24.4.4/32', 'brd', '172.24.4.4',
+                                'scope', 'global', 'dev', 'tap0'))
+
+    def test_add_batch_tries_all(self):
+        self.parent._as_root.side_effect = [RuntimeError('exists'), None]
+        self.assertRaises(RuntimeError, self.addr_cmd.add_batch,
+                          ['172.24.4.3/32', '172.24.4.4/32'])
+        self.assertEqual(2, self.parent._as_root.call_count)
+
+    def test_delete_batch(self):
+        self.addr_cmd.delete_batch(['172.24.4.3/32'])
+        self._assert_sudo([4], ('del', '172.24.4.3/32', 'dev', 'tap0'))
+
     def test_flush(self):
         self.addr_cmd.flush()
         self._assert_sudo([], ('flush', 'tap0'))
@@ -856,3 +876,82 @@ class TestIpNeighCommand(TestIPCmdBase):
         self.neigh_cmd.delete(4, '192.168.45.100', 'cc:dd:ee:ff:ab:cd')
         self._assert_sudo([4], ('del', '192.168.45.100', 'lladdr',
                                 'cc:dd:ee:ff:ab:cd', 'dev', 'tap0'))
+
+
+class TestNetlinkBackend(base.BaseTestCase):
+    def setUp(self):
+        super(TestNetlinkBackend, self).setUp()
+        cfg.CONF.register_opts(ip_lib.OPTS)
+        cfg.CONF.set_override('ip_lib_backend', 'netlink')
+        self.addCleanup(cfg.CONF.reset)
+        self.netlink = mock.Mock()
+        mock.patch.object(netlink_lib, 'get_backend',
+                          return_value=self.netlink).start()
+        self.execute = mock.patch('neutron.agent.linux.utils.execute').start()
+
+    def test_cli_backend_by_default(self):
+        cfg.CONF.clear_override('ip_lib_backend')
+        self.assertIsNone(ip_lib.IPWrapper('sudo').netlink)
+
+    def test_get_devices(self):
+        self.netlink.get_device_names.return_value = ['lo', 'qr-1']
+        retval = ip_lib.IPWrapper('sudo', 'ns').get_devices(
+            exclude_loopback=True)
+        self.assertEqual([ip_lib.IPDevice('qr-1', 'sudo', 'ns')], retval)
+        self.netlink.get_device_names.assert_called_once_with('ns')
+        self.assertFalse(self.execute.called)
+
+    def test_device_exists(self):
+        self.netlink.get_link_attributes.return_value = {
+            'link/ether': 'cc:dd:ee:ff:ab:cd'}
+        self.assertTrue(ip_lib.device_exists('eth0', 'sudo', 'ns'))
+        self.netlink.get_link_attributes.assert_called_once_with('eth0', 'ns')
+        self.assertFalse(self.execute.called)
+
+    def test_device_exists_not_found(self):
+        self.netlink.get_link_attributes.side_effect = RuntimeError
+        self.assertFalse(ip_lib.device_exists('eth0', 'sudo', 'ns'))
+
+    def test_ensure_device_is_ready(self):
+        self.assertTrue(ip_lib.ensure_device_is_ready('eth0', 'sudo', 'ns'))
+        self.netlink.set_link_state.assert_called_once_with('eth0', 'up',
+                                                            'ns')
+        self.assertFalse(self.execute.called)
+
+    def test_addr_add_and_delete(self):
+        device = ip_lib.IPDevice('eth0', 'sudo', 'ns')
+        device.addr.add(4, '10.0.0.1/24', '10.0.0.255')
+        device.addr.delete(4, '10.0.0.1/24')
+        self.netlink.assert_has_calls([
+            mock.call.add_address('eth0', '10.0.0.1/24', '10.0.0.255',
+                                  'global', 'ns'),
+            mock.call.delete_address('eth0', '10.0.0.1/24', 'ns')])
+        self.assertFalse(self.execute.called)
+
+    def test_addr_add_batch_tries_all(self):
+        self.netlink.add_address.side_effect = [RuntimeError('exists'), None]
+        device = ip_lib.IPDevice('qg-1', 'sudo', 'ns')
+        self.assertRaises(RuntimeError, device.addr.add_batch,
+                          ['1.1.1.1/32', '1.1.1.2/32'])
+        self.netlink.add_address.assert_has_calls([
+            mock.call('qg-1', '1.1.1.1/32', '1.1.1.1', 'global', 'ns'),
+            mock.call('qg-1', '1.1.1.2/32', '1.1.1.2', 'global', 'ns')])
+        self.assertFalse(self.execute.called)
+
+    def test_addr_list_permanent(self):
+        device = ip_lib.IPDevice('eth0', 'sudo', 'ns')
+        device.addr.list(scope='global', filters=['permanent'])
+        self.netlink.list_addresses.assert_called_once_with(
+            'eth0', 'ns', scope='global', to=None, permanent_only=True)
+
+    def test_addr_list_unsupported_filter_uses_cli(self):
+        self.execute.return_value = ADDR_SAMPLE
+        device = ip_lib.IPDevice('eth0', 'sudo', 'ns')
+        device.addr.list(filters=['secondary'])
+        self.assertFalse(self.netlink.list_addresses.called)
+        self.assertTrue(self.execute.called)
+
+    def test_netns_delete_releases_helper(self):
+        ip_lib.IPWrapper('sudo').netns.delete('ns')
+        self.netlink.release.assert_called_once_with('ns')
+        self.assertTrue(self.execute.called)
@@ -0,0 +1,205 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.agent.linux import netlink_lib
+from neutron.tests import base
+
+
+class FakeMsg(dict):
+    def __init__(self, attrs, **fields):
+        super(FakeMsg, self).__init__(**fields)
+        self.attrs = attrs
+
+    def get_attr(self, name):
+        return self.attrs.get(name)
+
+
+LINK = FakeMsg({'IFLA_IFNAME': 'qr-1',
+                'IFLA_ADDRESS': 'fa:16:3e:00:00:01',
+                'IFLA_OPERSTATE': 6,
+                'IFLA_MTU': 1500,
+                'IFLA_QDISC': 'noqueue',
+                'IFLA_TXQLEN': 0},
+               index=7)
+
+ADDRS = [
+    FakeMsg({'IFA_ADDRESS': '10.0.0.1', 'IFA_BROADCAST': '10.0.0.255'},
+            family=2, prefixlen=24, scope=0, flags=0x80),
+    FakeMsg({'IFA_ADDRESS': '172.24.4.3'},
+            family=2, prefixlen=24, scope=0, flags=0x80),
+    FakeMsg({'IFA_ADDRESS': 'fe80::f816:3eff:fe00:1'},
+            family=10, prefixlen=64, scope=253, flags=0x80),
+    FakeMsg({'IFA_ADDRESS': '2001:db8::5'},
+            family=10, prefixlen=64, scope=0, flags=0)]
+
+
+class TestGetBackend(base.BaseTestCase):
+    def setUp(self):
+        super(TestGetBackend, self).setUp()
+        mock.patch.object(netlink_lib, '_backend', None).start()
+
+    def test_without_pyroute2(self):
+        with mock.patch.object(netlink_lib, 'pyroute2', None):
+            self.assertIsNone(netlink_lib.get_backend())
+
+    def test_not_root(self):
+        with mock.patch.object(netlink_lib, 'pyroute2', mock.Mock()):
+            with mock.patch('os.geteuid', return_value=1000):
+                self.assertIsNone(netlink_lib.get_backend())
+
+    def test_shared_backend(self):
+        with mock.patch.object(netlink_lib, 'pyroute2', mock.Mock()):
+            with mock.patch('os.geteuid', return_value=0):
+                backend = netlink_lib.get_backend()
+                self.assertIsInstance(backend, netlink_lib.NetlinkBackend)
+                self.assertIs(backend, netlink_lib.get_backend())
+
+
+class TestNetlinkBackend(base.BaseTestCase):
+    def setUp(self):
+        super(TestNetlinkBackend, self).setUp()
+        self.pyroute2 = mock.patch.object(netlink_lib, 'pyroute2').start()
+        self.ipr = self.pyroute2.IPRoute.return_value
+        self.netns = self.pyroute2.NetNS.return_value
+        self.netns.link_lookup.return_value = [7]
+        self.backend = netlink_lib.NetlinkBackend()
+
+    def test_socket_is_reused_per_namespace(self):
+        self.backend.set_link_state('qr-1', 'up', 'ns')
+        self.backend.set_link_state('qr-1', 'down', 'ns')
+        self.pyroute2.NetNS.assert_called_once_with('ns')
+        self.assertFalse(self.pyroute2.IPRoute.called)
+        self.netns.link.assert_has_calls([
+            mock.call('set', index=7, state='up'),
+            mock.call('set', index=7, state='down')])
+
+    def test_root_namespace_uses_iproute(self):
+        self.ipr.get_links.return_value = [LINK]
+        self.assertEqual(['qr-1'], self.backend.get_device_names())
+        self.assertFalse(self.pyroute2.NetNS.called)
+
+    def test_release(self):
+        self.backend.get_device_names('ns')
+        self.backend.release('ns')
+        self.netns.close.assert_called_once_with()
+        self.backend.get_device_names('ns')
+        self.assertEqual(2, self.pyroute2.NetNS.call_count)
+
+    def test_least_recently_used_helpers_are_closed(self):
+        helpers = {}
+        self.pyroute2.NetNS.side_effect = lambda ns: helpers.setdefault(
+            ns, mock.Mock(**{'get_links.return_value': []}))
+        with mock.patch.object(netlink_lib, 'MAX_NAMESPACE_HELPERS', 2):
+            self.backend.get_device_names('ns-1')
+            self.backend.get_device_names('ns-2')
+            self.backend.get_device_names('ns-1')
+            self.backend.get_device_names('ns-3')
+        helpers['ns-2'].close.assert_called_once_with()
+        self.assertFalse(helpers['ns-1'].close.called)
+        self.assertEqual(['ns-1', 'ns-3'], list(self.backend._sockets))
+
+    def test_idle_helpers_are_closed(self):
+        with mock.patch('time.time', return_value=100):
+            self.backend.get_device_names('ns')
+        with mock.patch('time.time',
+                        return_value=100 + netlink_lib.HELPER_IDLE_TIMEOUT):
+            self.backend.get_device_names()
+        self.netns.close.assert_called_once_with()
+        self.assertEqual([None], list(self.backend._sockets))
+
+    def test_helper_in_use_is_not_closed(self):
+        with mock.patch('time.time', return_value=100):
+            self.backend.get_device_names('ns')
+        sem = self.backend._semaphore('ns')
+        sem.acquire()
+        self.addCleanup(sem.release)
+        with mock.patch('time.time',
+                        return_value=100 + netlink_lib.HELPER_IDLE_TIMEOUT):
+            self.backend.get_device_names()
+        self.assertFalse(self.netns.close.called)
+
+    def test_calls_in_a_namespace_are_serialized(self):
+        def get_links():
+            self.assertFalse(self.backend._semaphore('ns').acquire(False))
+            return []
+        self.netns.get_links.side_effect = get_links
+        self.backend.get_device_names('ns')
+        self.assertTrue(self.backend._semaphore('ns').acquire(False))
+
+    def test_failure_raises_runtime_error_and_reconnects(self):
+        self.netns.get_links.side_effect = OSError('gone')
+        self.assertRaises(RuntimeError, self.backend.get_device_names, 'ns')
+        self.netns.close.assert_called_once_with()
+        self.assertRaises(RuntimeError, self.backend.get_device_names, 'ns')
+        self.assertEqual(2, self.pyroute2.NetNS.call_count)
+
+    def test_missing_device(self):
+        self.netns.link_lookup.return_value = []
+        self.assertRaises(RuntimeError, self.backend.get_link_attributes,
+                          'qr-2', 'ns')
+
+    def test_get_link_attributes(self):
+        self.netns.get_links.return_value = [LINK]
+        self.assertEqual({'link/ether': 'fa:16:3e:00:00:01',
+                          'state': 'UP',
+                          'mtu': 1500,
+                          'qdisc': 'noqueue',
+                          'qlen': 0},
+                         self.backend.get_link_attributes('qr-1', 'ns'))
+        self.netns.get_links.assert_called_once_with(7)
+
+    def test_list_addresses(self):
+        self.netns.get_addr.return_value = ADDRS
+        retval = self.backend.list_addresses('qr-1', 'ns')
+        self.assertEqual([dict(cidr='10.0.0.1/24', broadcast='10.0.0.255',
+                               scope='global', ip_version=4, dynamic=False),
+                          dict(cidr='172.24.4.3/24', broadcast='172.24.4.255',
+                               scope='global', ip_version=4, dynamic=False),
+                          dict(cidr='fe80::f816:3eff:fe00:1/64',
+                               broadcast='::', scope='link', ip_version=6,
+                               dynamic=False),
+                          dict(cidr='2001:db8::5/64', broadcast='::',
+                               scope='global', ip_version=6, dynamic=True)],
+                         retval)
+        self.netns.get_addr.assert_called_once_with(index=7)
+
+    def test_list_addresses_filtered(self):
+        self.netns.get_addr.return_value = ADDRS
+        retval = self.backend.list_addresses('qr-1', 'ns', scope='global',
+                                             permanent_only=True)
+        self.assertEqual(['10.0.0.1/24', '172.24.4.3/24'],
+                         [a['cidr'] for a in retval])
+        retval = self.backend.list_addresses('qr-1', 'ns', to='172.24.4.3')
+        self.assertEqual(['172.24.4.3/24'], [a['cidr'] for a in retval])
+
+    def test_add_address(self):
+        self.backend.add_address('qr-1', '10.0.0.1/24', '10.0.0.255',
+                                 namespace='ns')
+        self.netns.addr.assert_called_once_with(
+            'add', index=7, address='10.0.0.1', mask=24, scope=0,
+            broadcast='10.0.0.255')
+
+    def test_add_address_v6_ignores_broadcast(self):
+        self.backend.add_address('qr-1', '2001:db8::1/64', '::',
+                                 namespace='ns')
+        self.netns.addr.assert_called_once_with(
+            'add', index=7, address='2001:db8::1', mask=64, scope=0)
+
+    def test_delete_address(self):
+        self.backend.delete_address('qr-1', '10.0.0.1/24', 'ns')
+        self.netns.addr.assert_called_once_with(
+            'delete', index=7, address='10.0.0.1', mask=24)
@@ -0,0 +1,92 @@
+# Copyright (c) 2014 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.cmd import usage_audit
+from neutron.common import exceptions as n_exc
+from neutron.tests import base
+
+
+class FakeGetter(object):
+    def __init__(self, ids):
+        self.ids = sorted(ids)
+        self.calls = []
+
+    def __call__(self, context, sorts=None, limit=None, marker=None):
+        self.calls.append(marker)
+        start = 0
+        if marker is not None:
+            if marker not in self.ids:
+                raise n_exc.NotFound()
+            start = self.ids.index(marker) + 1
+        return [{'id': i} for i in self.ids[start:start + limit]]
+
+
+class TestIterResources(base.BaseTestCase):
+
+    def _ids(self, getter, page_size=2):
+        return [r['id'] for r in
+                usage_audit.iter_resources(mock.Mock(), getter, page_size)]
+
+    def test_pages(self):
+        getter = FakeGetter('abcde')
+        self.assertEqual(list('abcde'), self._ids(getter))
+        self.assertEqual([None, 'b', 'd'], getter.calls)
+
+    def test_full_last_page(self):
+        getter = FakeGetter('abcd')
+        self.assertEqual(list('abcd'), self._ids(getter))
+        self.assertEqual([None, 'b', 'd'], getter.calls)
+
+    def test_marker_deleted(self):
+        getter = FakeGetter('abcdefg')
+        resources = usage_audit.iter_resources(mock.Mock(), getter, 3)
+        seen = [next(resources)['id'] for i in range(3)]
+        getter.ids.remove('c')
+        seen.extend(r['id'] for r in resources)
+        self.assertEqual(list('abcdefg'), seen)
+        self.assertEqual([None, 'c', 'b', 'f'], getter.calls)
+
+
+class TestAuditNotifier(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestAuditNotifier, self).setUp()
+        self.notifier = mock.Mock()
+        self.context = mock.Mock()
+
+    def test_single_resource_payload(self):
+        audit = usage_audit.AuditNotifier(self.context, self.notifier, 1, 0)
+        self.assertEqual(2, audit.audit('port', [{'id': 'a'}, {'id': 'b'}]))
+        self.notifier.info.assert_has_calls([
+            mock.call(self.context, 'port.exists', {'port': {'id': 'a'}}),
+            mock.call(self.context, 'port.exists', {'port': {'id': 'b'}})])
+
+    def test_batches(self):
+        audit = usage_audit.AuditNotifier(self.context, self.notifier, 2, 0)
+        ports = [{'id': i} for i in 'abc']
+        self.assertEqual(3, audit.audit('port', iter(ports)))
+        self.notifier.info.assert_has_calls([
+            mock.call(self.context, 'port.exists', {'ports': ports[:2]}),
+            mock.call(self.context, 'port.exists', {'ports': ports[2:]})])
+        self.assertEqual(2, audit.notifications)
+
+    def test_rate_limit(self):
+        audit = usage_audit.AuditNotifier(self.context, self.notifier, 1, 4)
+        with mock.patch.object(usage_audit.time, 'time', return_value=10):
+            with mock.patch.object(usage_audit.time, 'sleep') as sleep:
+                audit.audit('network', [{'id': 'a'}, {'id': 'b'}])
+        sleep.assert_called_once_with(0.25)
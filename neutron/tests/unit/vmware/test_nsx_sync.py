@@ -15,6 +15,7 @@
 #
 
 import contextlib
+import datetime
 import time
 
 import mock
@@ -27,11 +28,13 @@ from neutron import context
 from neutron.extensions import l3
 from neutron.openstack.common import jsonutils as json
 from neutron.openstack.common import log
+from neutron.openstack.common import timeutils
 from neutron.plugins.vmware.api_client import client
 from neutron.plugins.vmware.api_client import exception as api_exc
 from neutron.plugins.vmware.api_client import version
 from neutron.plugins.vmware.common import sync
 from neutron.plugins.vmware.dbexts import db
+from neutron.plugins.vmware.dbexts import models
 from neutron.plugins.vmware import nsx_cluster as cluster
 from neutron.plugins.vmware import nsxlib
 from neutron.plugins.vmware import plugin
@@ -716,3 +719,120 @@ class SyncTestCase(base.BaseTestCase):
             self.assertEqual(
                 min(64, 2 ** i),
                 self._plugin._synchronizer._synchronize_state(sp))
+
+    def test_resync_updates_only_changed_status(self):
+        ctx = context.get_admin_context()
+        with self._populate_data(ctx):
+            sp = sync.SyncParameters(100)
+            self._plugin._synchronizer._synchronize_state(sp)
+            with mock.patch.object(self._plugin._synchronizer,
+                                   '_update_status') as update_status:
+                self._plugin._synchronizer._synchronize_state(sp)
+            for call in update_status.call_args_list:
+                self.assertEqual({}, call[0][2])
+
+    def test_full_scan_fetches_resources_missing_from_cache(self):
+        ctx = context.get_admin_context()
+        with self._populate_data(ctx):
+            # The cache is empty, e.g. resources were created after it
+            # was filled
+            synchronizer = self._plugin._synchronizer
+            synchronizer._synchronize_lswitches(ctx, [], scan_missing=True)
+            synchronizer._synchronize_lrouters(ctx, [], scan_missing=True)
+            synchronizer._synchronize_lswitchports(ctx, [],
+                                                   scan_missing=True)
+            for net in self._plugin.get_networks(ctx):
+                self.assertEqual(constants.NET_STATUS_ACTIVE, net['status'])
+            for router in self._plugin.get_routers(ctx):
+                self.assertEqual(constants.NET_STATUS_ACTIVE,
+                                 router['status'])
+            for port in self._plugin.get_ports(ctx):
+                self.assertEqual(constants.PORT_STATUS_ACTIVE,
+                                 port['status'])
+            self.assertTrue(synchronizer._nsx_cache.get_lswitches())
+
+    def _enable_leases(self):
+        self._plugin._synchronizer._use_leases = True
+
+        def delete_leases():
+            ctx = context.get_admin_context()
+            ctx.session.query(models.NsxSyncLease).delete()
+        self.addCleanup(delete_leases)
+
+    def test_sync_with_leases_takes_one_shard_per_run(self):
+        self._enable_leases()
+        ctx = context.get_admin_context()
+        with self._populate_data(ctx):
+            sp = sync.SyncParameters(100)
+            self._plugin._synchronizer._synchronize_state(sp)
+            self.assertEqual(set(['lswitches']), sp.shards)
+            self._plugin._synchronizer._synchronize_state(sp)
+            self.assertEqual(set(['lswitches', 'lrouters']), sp.shards)
+            # Once every lease is held the sync reaches all resources
+            self._test_sync(
+                constants.NET_STATUS_DOWN, constants.PORT_STATUS_DOWN,
+                constants.NET_STATUS_DOWN, self._action_callback_status_down,
+                sp=sp)
+            self.assertEqual(set(['lswitches', 'lrouters', 'lswitchports']),
+                             sp.shards)
+
+    def test_sync_with_leases_skips_shards_held_elsewhere(self):
+        self._enable_leases()
+        ctx = context.get_admin_context()
+        now = timeutils.utcnow()
+        for shard in ('lswitches', 'lswitchports'):
+            db.acquire_sync_lease(ctx.session, shard, 'other',
+                                  now + datetime.timedelta(hours=1), now)
+        with self._populate_data(ctx):
+            # Ports are created DOWN and no one here is syncing them
+            self._test_sync(
+                constants.NET_STATUS_ACTIVE, constants.PORT_STATUS_DOWN,
+                constants.NET_STATUS_DOWN, self._action_callback_status_down)
+            self.assertFalse(self._plugin._synchronizer._nsx_cache.
+                             get_lswitches())
+
+    def test_sync_with_leases_none_available(self):
+        self._enable_leases()
+        ctx = context.get_admin_context()
+        now = timeutils.utcnow()
+        for shard, _cursor in sync.SYNC_SHARDS:
+            db.acquire_sync_lease(ctx.session, shard, 'other',
+                                  now + datetime.timedelta(hours=1), now)
+        sp = sync.SyncParameters(100)
+        with mock.patch.object(self._plugin._synchronizer,
+                               '_fetch_nsx_data_chunk') as fetch:
+            self.assertEqual(
+                self._plugin._synchronizer._sync_interval,
+                self._plugin._synchronizer._synchronize_state(sp))
+        self.assertFalse(fetch.called)
+
+    def test_sync_lease_lost_clears_cache(self):
+        self._enable_leases()
+        ctx = context.get_admin_context()
+        with self._populate_data(ctx):
+            sp = sync.SyncParameters(100)
+            self._plugin._synchronizer._synchronize_state(sp)
+            nsx_cache = self._plugin._synchronizer._nsx_cache
+            self.assertTrue(nsx_cache.get_lswitches())
+            ctx.session.query(models.NsxSyncLease).update(
+                {'holder': 'other'})
+            self._plugin._synchronizer._synchronize_state(sp)
+            self.assertEqual(set(['lrouters']), sp.shards)
+            self.assertFalse(nsx_cache.get_lswitches())
+
+    def test_acquire_and_renew_sync_lease(self):
+        self._enable_leases()
+        session = context.get_admin_context().session
+        now = timeutils.utcnow()
+        later = now + datetime.timedelta(seconds=30)
+        self.assertTrue(db.acquire_sync_lease(session, 'lrouters', 'a',
+                                              later, now))
+        self.assertFalse(db.acquire_sync_lease(session, 'lrouters', 'b',
+                                               later, now))
+        self.assertTrue(db.renew_sync_lease(session, 'lrouters', 'a', later))
+        self.assertFalse(db.renew_sync_lease(session, 'lrouters', 'b', later))
+        # Expired leases can be taken over
+        self.assertTrue(db.acquire_sync_lease(
+            session, 'lrouters', 'b', later + datetime.timedelta(seconds=30),
+            later + datetime.timedelta(seconds=1)))
+        self.assertFalse(db.renew_sync_lease(session, 'lrouters', 'a', later))
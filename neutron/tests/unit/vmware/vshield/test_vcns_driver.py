@@ -200,6 +200,59 @@ class VcnsDriverTaskManagerTestCase(base.BaseTestCase):
             task.wait(ts_const.TaskState.RESULT)
             self.assertTrue(task.userdata['result'])
 
+    def test_task_manager_limits_concurrent_callbacks(self):
+        running = {'now': 0, 'max': 0}
+
+        def _exec(task):
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+            greenthread.sleep(0.01)
+            running['now'] -= 1
+            return ts_const.TaskStatus.COMPLETED
+
+        manager = ts.TaskManager(workers=2).start(100)
+        self.addCleanup(manager.stop)
+        tasks = [ts.Task('name', 'res-%d' % i, _exec) for i in range(6)]
+        for task in tasks:
+            manager.add(task)
+        for task in tasks:
+            task.wait(ts_const.TaskState.RESULT)
+            self.assertEqual(ts_const.TaskStatus.COMPLETED, task.status)
+        self.assertEqual(2, running['max'])
+
+    def test_task_manager_failed_task_does_not_block_resource(self):
+        def _exec(task):
+            return ts_const.TaskStatus.COMPLETED
+
+        tasks = [ts.Task('name', 'res', _exec) for i in range(2)]
+        # Processing the first task raises outside of its callbacks
+        tasks[0]._start = mock.Mock(side_effect=Exception('boom'))
+        for task in tasks:
+            self.manager.add(task)
+        for task in tasks:
+            task.wait(ts_const.TaskState.RESULT)
+        self.assertEqual(ts_const.TaskStatus.ERROR, tasks[0].status)
+        self.assertEqual(ts_const.TaskStatus.COMPLETED, tasks[1].status)
+        self.assertFalse(self.manager.has_pending_task())
+
+    def test_task_manager_stats(self):
+        def _deploy(task):
+            return ts_const.TaskStatus.PENDING
+
+        def _status(task):
+            return ts_const.TaskStatus.COMPLETED
+
+        tasks = [ts.Task('name', 'res', _deploy, _status) for i in range(3)]
+        for task in tasks:
+            self.manager.add(task)
+        self.assertEqual(3, self.manager.get_stats()['deploy']['queue_depth'])
+        tasks[-1].wait(ts_const.TaskState.RESULT)
+        stats = self.manager.get_stats()['deploy']
+        self.assertEqual(0, stats['queue_depth'])
+        self.assertEqual(3, stats['completed'])
+        self.assertTrue(stats['wait_time'] > 0)
+        self.assertTrue(stats['execution_time'] > 0)
+
     def _test_task_manager_stop(self, exec_wait=False, result_wait=False,
                                 stop_wait=0):
         def _exec(task):